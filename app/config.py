@@ -31,6 +31,25 @@ class AppConfig:
     env: str = os.getenv("APP_ENV", "dev")
     app_title: str = os.getenv("APP_TITLE", "PySide6 Framework")
     model_server_url: str = MODEL_SERVER_URL
+    # 模型存储后端：http经远程模型服务读写；local直接读写本机的模型目录（单机部署时不经过HTTP）
+    model_storage_backend: str = os.getenv("MODEL_STORAGE_BACKEND", "http")
+    # local后端的模型目录，为空时与remote_model_server.py相同（MODEL_SERVER_BASE_PATH或项目下的models）
+    model_storage_local_path: str = os.getenv("MODEL_STORAGE_LOCAL_PATH", "")
+    # 分块上传时压缩可压缩类型的模型文件（慢速网络收益明显，千兆局域网可关闭以节省CPU）
+    model_transfer_compression: bool = os.getenv("MODEL_TRANSFER_COMPRESSION", "1") == "1"
+    # 传输管理器（TransferManager）同时进行的上传/下载数，其余排队
+    model_transfer_workers: int = int(os.getenv("MODEL_TRANSFER_WORKERS", "3"))
+    # 保存已有模型的新版本时只上传变化的块（rsync式增量）
+    model_delta_upload: bool = os.getenv("MODEL_DELTA_UPLOAD", "1") == "1"
+    # 模型服务的连接池大小（每个主机的keep-alive连接数）和幂等请求的重试次数
+    model_server_pool_size: int = int(os.getenv("MODEL_SERVER_POOL_SIZE", "16"))
+    model_server_max_retries: int = int(os.getenv("MODEL_SERVER_MAX_RETRIES", "3"))
+    # 异步客户端（AsyncModelStorageService）每个主机同时打开的连接数
+    model_server_async_connections: int = int(os.getenv("MODEL_SERVER_ASYNC_CONNECTIONS", "64"))
+    # 已下载模型的本地缓存目录和容量上限（字节，0表示不缓存），超出时淘汰最久未使用的模型
+    model_cache_dir: str = os.getenv("MODEL_CACHE_DIR",
+                                     os.path.join(os.path.expanduser("~"), ".cache", "pyside6_framework", "models"))
+    model_cache_bytes: int = int(os.getenv("MODEL_CACHE_BYTES", str(10 * 1024 ** 3)))
     engine: sqlalchemy.Engine = None
     tunnel: SSHTunnelForwarder = None
 
@@ -3,7 +3,7 @@ from __future__ import annotations
 from datetime import datetime
 from typing import List, Optional
 
-from sqlalchemy import String, Integer, DateTime, ForeignKey, Boolean, BigInteger
+from sqlalchemy import String, Integer, DateTime, ForeignKey, Boolean, BigInteger, UniqueConstraint
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 
 from app.db.base import Base
@@ -41,8 +41,27 @@ class Model(Base, TimestampMixin):
     description: Mapped[Optional[str]] = mapped_column(String(512))
     file_path: Mapped[str] = mapped_column(String(256), nullable=False)  # 服务器上的文件路径
     file_size: Mapped[int] = mapped_column(BigInteger, nullable=False, default=0)
+    sha256: Mapped[Optional[str]] = mapped_column(String(64))  # 文件内容的SHA-256，下载时校验
+    version: Mapped[Optional[int]] = mapped_column(Integer)  # 最新版本号（服务器分配），启用版本之前的记录为空
     is_public: Mapped[bool] = mapped_column(Boolean, default=False, nullable=False)
     owner_id: Mapped[int] = mapped_column(Integer, ForeignKey("user.id"), nullable=False)
     
     # 关系
-    owner: Mapped["User"] = relationship(back_populates="models")
\ No newline at end of file
+    owner: Mapped["User"] = relationship(back_populates="models")
+    versions: Mapped[List["ModelVersion"]] = relationship(back_populates="model", cascade="all, delete-orphan",
+                                                          order_by="ModelVersion.version.desc()")
+
+
+class ModelVersion(Base):
+    """模型文件的不可变版本，version_path指向的内容永远不变"""
+    __tablename__ = "model_version"
+    __table_args__ = (UniqueConstraint("model_id", "version"),)
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
+    model_id: Mapped[int] = mapped_column(Integer, ForeignKey("model.id", ondelete="CASCADE"), nullable=False)
+    version: Mapped[int] = mapped_column(Integer, nullable=False)
+    version_path: Mapped[str] = mapped_column(String(280), nullable=False)  # <file_path>@v<version>
+    file_size: Mapped[int] = mapped_column(BigInteger, nullable=False, default=0)
+    sha256: Mapped[Optional[str]] = mapped_column(String(64))
+    created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow, nullable=False)
+
+    model: Mapped["Model"] = relationship(back_populates="versions")
\ No newline at end of file
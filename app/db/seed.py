@@ -2,7 +2,7 @@ from __future__ import annotations
 
 from typing import List
 
-from sqlalchemy import select
+from sqlalchemy import inspect, select, text
 from app.db.base import Base, engine, session_scope
 from app.db.models import User,  Menu
 from app.services.auth import hash_password
@@ -13,10 +13,21 @@ def init_db() -> None:
     from app.db.base import init_database
     db_engine = init_database()
     Base.metadata.create_all(bind=db_engine)
+    migrate_columns(db_engine)
     # # 创建初始数据
     # seed_admin()
 
 
+def migrate_columns(db_engine) -> None:
+    """create_all不会给已存在的表加列，这里补上后来新增的可空列"""
+    columns = {column["name"] for column in inspect(db_engine).get_columns("model")}
+    with db_engine.begin() as conn:
+        if "sha256" not in columns:
+            conn.execute(text("ALTER TABLE model ADD COLUMN sha256 VARCHAR(64)"))
+        if "version" not in columns:
+            conn.execute(text("ALTER TABLE model ADD COLUMN version INTEGER"))
+
+
 # def seed_admin() -> None:
     # with session_scope() as s:
     #     # 角色
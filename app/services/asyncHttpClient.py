@@ -0,0 +1,407 @@
+from __future__ import annotations
+
+import asyncio
+import http.client
+import io
+import json as jsonlib
+import ssl
+import time
+from typing import AsyncIterator, Dict, Iterable, List, Optional, Tuple, Union
+from urllib.parse import urlencode, urlsplit
+
+from app.services.httpClient import (QUERY_TIMEOUT, RETRY_BACKOFF_BASE, RETRY_BACKOFF_MAX, RETRY_STATUSES,
+                                     backoff_delay)
+
+DEFAULT_CONNECTION_LIMIT = 64  # 每个主机同时打开的连接数上限，超出的请求排队等待
+DEFAULT_MAX_RETRIES = 3
+KEEPALIVE_IDLE_TIMEOUT = 4.0  # 空闲连接的最长复用时间（小于服务器的keep-alive超时）
+READ_CHUNK_SIZE = 256 * 1024
+MAX_HEADER_SIZE = 64 * 1024
+
+Timeout = Union[float, Tuple[float, float]]
+Body = Union[bytes, bytearray, memoryview, Iterable, AsyncIterator, None]
+
+
+class HttpProtocolError(ConnectionError):
+    """服务器响应不符合HTTP/1.1格式或连接提前关闭"""
+
+
+def _split_timeout(timeout: Timeout) -> Tuple[float, float]:
+    """(连接超时, 读取超时)，与requests的timeout参数含义相同"""
+    if isinstance(timeout, tuple):
+        return timeout
+    return timeout, timeout
+
+
+class _Connection:
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.reader = reader
+        self.writer = writer
+        self.idle_since = time.monotonic()
+        self.expired = False
+
+    async def timed(self, coro, timeout: float):
+        """
+        带超时等待一次读写
+
+        超时时中止连接，使等待中的读写立即失败，再抛出asyncio.TimeoutError。
+        不使用asyncio.wait_for：数据已在缓冲区时读操作立即完成，wait_for会吞掉同时发生的任务取消。
+        """
+        handle = asyncio.get_running_loop().call_later(timeout, self._expire)
+        try:
+            result = await coro
+        except (OSError, asyncio.IncompleteReadError):
+            if self.expired:
+                raise asyncio.TimeoutError() from None
+            raise
+        finally:
+            handle.cancel()
+        if self.expired:
+            raise asyncio.TimeoutError()
+        return result
+
+    def _expire(self) -> None:
+        self.expired = True
+        self.writer.transport.abort()
+
+    def usable(self) -> bool:
+        """空闲连接仍可复用：服务器未关闭且空闲时间未超过KEEPALIVE_IDLE_TIMEOUT"""
+        return (not self.reader.at_eof() and not self.writer.is_closing()
+                and time.monotonic() - self.idle_since < KEEPALIVE_IDLE_TIMEOUT)
+
+    def close(self) -> None:
+        self.writer.close()
+
+
+class _HostPool:
+    """同一主机的空闲连接和连接数限制（在事件循环中创建）"""
+
+    def __init__(self, limit: int):
+        self.slots = asyncio.Semaphore(limit)
+        self.idle: List[_Connection] = []
+
+
+class AsyncResponse:
+    """
+    流式响应
+
+    响应体通过iter_chunks()逐块读取，读完后连接放回连接池；未读完就release()时关闭连接。
+    """
+
+    def __init__(self, pool: _HostPool, conn: _Connection, method: str, status: int, reason: str,
+                 headers: http.client.HTTPMessage, read_timeout: float):
+        self._pool = pool
+        self._conn: Optional[_Connection] = conn
+        self.status_code = status
+        self.reason = reason
+        self.headers = headers
+        self._read_timeout = read_timeout
+        self._keep_alive = headers.get('Connection', '').lower() != 'close'
+        self._chunked = 'chunked' in headers.get('Transfer-Encoding', '').lower()
+        length = headers.get('Content-Length')
+        self._remaining: Optional[int] = int(length) if length is not None and not self._chunked else None
+        if method == 'HEAD' or status in (204, 304) or 100 <= status < 200:
+            self._remaining = 0
+            self._chunked = False
+        if self._remaining is None and not self._chunked:
+            self._keep_alive = False  # 以关闭连接表示结束的响应体
+        self._content: Optional[bytes] = None
+        if self._remaining == 0:
+            self._content = b''
+            self._finish()
+
+    async def __aenter__(self) -> "AsyncResponse":
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        self.release()
+
+    async def _read(self, coro):
+        return await self._conn.timed(coro, self._read_timeout)
+
+    async def iter_chunks(self, chunk_size: int = READ_CHUNK_SIZE) -> AsyncIterator[bytes]:
+        """逐块读取响应体"""
+        if self._content is not None:
+            if self._content:
+                yield self._content
+            return
+        try:
+            reader = self._conn.reader if self._conn else None
+            while reader is not None:
+                if self._chunked:
+                    line = await self._read(reader.readline())
+                    if not line:
+                        raise HttpProtocolError("连接在分块响应结束前关闭")
+                    size = int(line.split(b';', 1)[0].strip() or b'0', 16)
+                    if size == 0:
+                        while (await self._read(reader.readline())) not in (b'\r\n', b'\n', b''):
+                            pass  # 丢弃trailer
+                        break
+                    remaining = size
+                    while remaining:
+                        block = await self._read(reader.read(min(chunk_size, remaining)))
+                        if not block:
+                            raise HttpProtocolError("连接在分块响应结束前关闭")
+                        remaining -= len(block)
+                        yield block
+                    await self._read(reader.readexactly(2))
+                elif self._remaining is not None:
+                    if self._remaining == 0:
+                        break
+                    block = await self._read(reader.read(min(chunk_size, self._remaining)))
+                    if not block:
+                        raise HttpProtocolError("连接在响应体结束前关闭")
+                    self._remaining -= len(block)
+                    yield block
+                else:
+                    block = await self._read(reader.read(chunk_size))
+                    if not block:
+                        break
+                    yield block
+            self._finish()
+        finally:
+            self.release()
+
+    async def read(self) -> bytes:
+        """读取完整的响应体（只用于小响应）"""
+        if self._content is None:
+            self._content = b''.join([block async for block in self.iter_chunks()])
+        return self._content
+
+    async def json(self):
+        return jsonlib.loads(await self.read())
+
+    async def text(self) -> str:
+        return (await self.read()).decode('utf-8', errors='replace')
+
+    def _finish(self) -> None:
+        """响应体已读完：可保持的连接放回连接池"""
+        if self._conn is None:
+            return
+        conn, self._conn = self._conn, None
+        if self._keep_alive:
+            conn.idle_since = time.monotonic()
+            self._pool.idle.append(conn)
+        else:
+            conn.close()
+        self._pool.slots.release()
+
+    def release(self) -> None:
+        """释放连接：响应体未读完时关闭连接（不为复用而读完大文件）"""
+        if self._conn is None:
+            return
+        conn, self._conn = self._conn, None
+        conn.close()
+        self._pool.slots.release()
+
+
+class AsyncHttpClient:
+    """
+    基于asyncio的HTTP/1.1客户端
+
+    同一事件循环中的并发请求共享每个主机的keep-alive连接池，同时打开的连接数不超过limit_per_host，
+    其余请求排队等待空闲连接；成百上千个传输在一个线程中进行，不需要为每个请求创建线程。
+
+    请求体为bytes时带Content-Length发送，为（同步或异步）迭代器时以分块传输编码流式发送；
+    响应体通过AsyncResponse.iter_chunks()流式读取。与PooledHttpClient一样，只有声明为幂等的请求
+    在连接失败、超时或网关错误时退避重试。取消请求所在的任务时关闭其连接，不会放回连接池。
+    """
+
+    def __init__(self, limit_per_host: int = DEFAULT_CONNECTION_LIMIT, max_retries: int = DEFAULT_MAX_RETRIES):
+        """
+        Args:
+            limit_per_host: 每个主机同时打开的连接数上限
+            max_retries: 幂等请求的最大重试次数
+        """
+        self.limit_per_host = limit_per_host
+        self.max_retries = max_retries
+        self._pools: Dict[tuple, _HostPool] = {}
+        self._counts: Dict[str, int] = {'requests': 0, 'connections': 0, 'retries': 0, 'errors': 0}
+        self._ssl_context: Optional[ssl.SSLContext] = None
+
+    def stats(self) -> Dict[str, int]:
+        """连接统计，字段与PooledHttpClient.stats()相同"""
+        counts = dict(self._counts)
+        counts['reused'] = max(0, counts['requests'] - counts['connections'])
+        return counts
+
+    def _pool(self, key: tuple) -> _HostPool:
+        pool = self._pools.get(key)
+        if pool is None:
+            pool = self._pools[key] = _HostPool(self.limit_per_host)
+        return pool
+
+    async def _connect(self, scheme: str, host: str, port: int, connect_timeout: float) -> _Connection:
+        ssl_context = None
+        if scheme == 'https':
+            if self._ssl_context is None:
+                self._ssl_context = ssl.create_default_context()
+            ssl_context = self._ssl_context
+        reader, writer = await asyncio.wait_for(
+            asyncio.open_connection(host, port, ssl=ssl_context, limit=MAX_HEADER_SIZE), connect_timeout)
+        self._counts['connections'] += 1
+        return _Connection(reader, writer)
+
+    async def request(self, method: str, url: str, params: Optional[dict] = None, json=None, data: Body = None,
+                      headers: Optional[Dict[str, str]] = None, timeout: Timeout = QUERY_TIMEOUT,
+                      idempotent: bool = False) -> AsyncResponse:
+        """
+        发送请求并读取响应头
+
+        Args:
+            method: HTTP方法
+            url: 地址
+            params: 查询参数
+            json: JSON请求体
+            data: 请求体：bytes或字节块的（异步）迭代器
+            headers: 额外的请求头
+            timeout: 连接超时与读取超时（单个数值时两者相同）
+            idempotent: 请求可以安全地重复发送，失败时自动重试
+
+        Returns:
+            响应（调用方负责读完响应体或release()）
+
+        Raises:
+            OSError, asyncio.TimeoutError: 请求失败（幂等请求为重试用完后）
+        """
+        headers = dict(headers or {})
+        if json is not None:
+            data = jsonlib.dumps(json).encode()
+            headers.setdefault('Content-Type', 'application/json')
+        if params:
+            url = f"{url}{'&' if '?' in url else '?'}{urlencode(params)}"
+        attempt = 0
+        while True:
+            try:
+                response = await self._send(method, url, data, headers, timeout)
+            except (OSError, asyncio.TimeoutError):
+                if not idempotent or attempt >= self.max_retries:
+                    self._counts['errors'] += 1
+                    raise
+                delay = backoff_delay(attempt, None, RETRY_BACKOFF_BASE, RETRY_BACKOFF_MAX)
+            else:
+                if not idempotent or response.status_code not in RETRY_STATUSES or attempt >= self.max_retries:
+                    return response
+                delay = backoff_delay(attempt, response.headers.get('Retry-After'),
+                                      RETRY_BACKOFF_BASE, RETRY_BACKOFF_MAX)
+                response.release()
+            attempt += 1
+            self._counts['retries'] += 1
+            await asyncio.sleep(delay)
+
+    async def _send(self, method: str, url: str, data: Body, headers: Dict[str, str],
+                    timeout: Timeout) -> AsyncResponse:
+        parts = urlsplit(url)
+        scheme = parts.scheme or 'http'
+        host = parts.hostname or 'localhost'
+        port = parts.port or (443 if scheme == 'https' else 80)
+        target = parts.path or '/'
+        if parts.query:
+            target += '?' + parts.query
+        connect_timeout, read_timeout = _split_timeout(timeout)
+        replayable = data is None or isinstance(data, (bytes, bytearray, memoryview))
+
+        pool = self._pool((scheme, host, port))
+        await pool.slots.acquire()
+        conn = None
+        try:
+            while True:
+                reused = False
+                while pool.idle:
+                    candidate = pool.idle.pop()
+                    if candidate.usable():
+                        conn, reused = candidate, True
+                        break
+                    candidate.close()
+                if conn is None:
+                    conn = await self._connect(scheme, host, port, connect_timeout)
+                self._counts['requests'] += 1
+                try:
+                    await self._write_request(conn, method, target, parts.netloc, headers, data, read_timeout)
+                    status, reason, response_headers = await conn.timed(
+                        self._read_head(conn.reader), read_timeout)
+                    break
+                except (ConnectionError, asyncio.IncompleteReadError):
+                    # 复用的连接可能刚被服务器关闭：请求体可以重发时换新连接重试一次
+                    conn.close()
+                    conn = None
+                    if not (reused and replayable):
+                        raise
+            return AsyncResponse(pool, conn, method, status, reason, response_headers, read_timeout)
+        except BaseException:
+            if conn is not None:
+                conn.close()
+            pool.slots.release()
+            raise
+
+    @staticmethod
+    async def _write_request(conn: _Connection, method: str, target: str, host: str,
+                             headers: Dict[str, str], data: Body, timeout: float) -> None:
+        lines = [f"{method} {target} HTTP/1.1", f"Host: {host}"]
+        names = {name.lower() for name in headers}
+        if 'accept-encoding' not in names:
+            lines.append("Accept-Encoding: identity")
+        streaming = data is not None and not isinstance(data, (bytes, bytearray, memoryview))
+        if streaming:
+            lines.append("Transfer-Encoding: chunked")
+        elif data is not None or method in ('POST', 'PUT'):
+            lines.append(f"Content-Length: {len(data) if data is not None else 0}")
+        lines.extend(f"{name}: {value}" for name, value in headers.items())
+        writer = conn.writer
+        writer.write(("\r\n".join(lines) + "\r\n\r\n").encode('latin-1'))
+        if not streaming:
+            if data:
+                writer.write(data)
+            await conn.timed(writer.drain(), timeout)
+            return
+
+        async def send_chunk(block) -> None:
+            if len(block):
+                writer.write(f"{len(block):x}\r\n".encode())
+                writer.write(block)
+                writer.write(b"\r\n")
+                await conn.timed(writer.drain(), timeout)
+
+        if hasattr(data, '__aiter__'):
+            async for block in data:
+                await send_chunk(block)
+        else:
+            for block in data:
+                await send_chunk(block)
+        writer.write(b"0\r\n\r\n")
+        await conn.timed(writer.drain(), timeout)
+
+    @staticmethod
+    async def _read_head(reader: asyncio.StreamReader) -> Tuple[int, str, http.client.HTTPMessage]:
+        while True:
+            try:
+                head = await reader.readuntil(b"\r\n\r\n")
+            except asyncio.LimitOverrunError as e:
+                raise HttpProtocolError("响应头过大") from e
+            status_line, _, header_block = head.partition(b"\r\n")
+            try:
+                version, status, *reason = status_line.decode('latin-1').split(' ', 2)
+                status = int(status)
+            except ValueError as e:
+                raise HttpProtocolError(f"无效的状态行: {status_line!r}") from e
+            if not version.startswith('HTTP/'):
+                raise HttpProtocolError(f"无效的状态行: {status_line!r}")
+            if status != 100:  # 跳过100 Continue
+                return status, reason[0] if reason else '', http.client.parse_headers(io.BytesIO(header_block))
+
+    async def get(self, url: str, **kwargs) -> AsyncResponse:
+        """GET总是幂等的"""
+        return await self.request('GET', url, idempotent=True, **kwargs)
+
+    async def post(self, url: str, idempotent: bool = False, **kwargs) -> AsyncResponse:
+        return await self.request('POST', url, idempotent=idempotent, **kwargs)
+
+    async def delete(self, url: str, **kwargs) -> AsyncResponse:
+        """按路径删除是幂等的"""
+        return await self.request('DELETE', url, idempotent=True, **kwargs)
+
+    async def close(self) -> None:
+        """关闭所有空闲连接"""
+        for pool in self._pools.values():
+            while pool.idle:
+                pool.idle.pop().close()
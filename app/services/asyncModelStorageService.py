@@ -0,0 +1,494 @@
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import os
+import threading
+import uuid
+from concurrent.futures import CancelledError, TimeoutError as FutureTimeoutError
+from typing import AsyncIterator, Awaitable, Callable, Dict, List, Optional, Sequence, Tuple, Union
+
+from app.config import config
+from app.db.models import User
+from app.services.asyncHttpClient import AsyncHttpClient, AsyncResponse
+from app.services.httpClient import QUERY_TIMEOUT, TRANSFER_TIMEOUT, backoff_delay
+from app.services.modelStorageService import (BUSY_BACKOFF_BASE, BUSY_BACKOFF_MAX, BUSY_MAX_RETRIES,
+                                              HASH_PRECHECK_MIN_SIZE, LIST_PAGE_SIZE, ModelData, ModelDataStream,
+                                              _multipart_head, _multipart_tail, _sha256_file)
+from app.services.rangeDownloader import WRITE_BUFFER_SIZE, ChecksumError, ProgressCallback, _durable_replace, _Progress
+
+UploadResult = Tuple[bool, str, str, str, Optional[int]]
+AsyncModelData = Union[ModelData, ModelDataStream, AsyncIterator]
+
+
+class _AsyncModelData:
+    """
+    待上传的模型内容（异步读取）
+
+    内存中的数据直接按块发送；文件对象和同步迭代器在线程池中读取下一块，不阻塞事件循环；
+    异步迭代器的块原样发送。读完后size和sha256为整个内容的大小和摘要。
+    """
+
+    def __init__(self, data: AsyncModelData):
+        self.stream: Optional[ModelDataStream] = None
+        self._aiterator: Optional[AsyncIterator] = None
+        if hasattr(data, '__aiter__'):
+            self._aiterator = data
+        else:
+            self.stream = data if isinstance(data, ModelDataStream) else ModelDataStream(data)
+        self.consumed = False
+        self._size = 0
+        self._digest = hashlib.sha256()
+
+    @property
+    def restartable(self) -> bool:
+        return self.stream is not None and self.stream.restartable
+
+    @property
+    def length(self) -> Optional[int]:
+        return self.stream.length if self.stream is not None else None
+
+    @property
+    def size(self) -> int:
+        return self.stream.size if self.stream is not None else self._size
+
+    @property
+    def sha256(self) -> str:
+        return self.stream.sha256 if self.stream is not None else self._digest.hexdigest()
+
+    async def __aiter__(self):
+        if self.consumed and not self.restartable:
+            raise ValueError("模型数据流已被读取，无法重新发送")
+        self.consumed = True
+        if self.stream is None:
+            async for block in self._aiterator:
+                if len(block):
+                    self._size += len(block)
+                    self._digest.update(block)
+                    yield block
+            return
+        chunks = iter(self.stream)
+        if self.stream.buffer is not None:
+            for block in chunks:
+                yield block
+            return
+        loop = asyncio.get_running_loop()
+        while True:
+            block = await loop.run_in_executor(None, next, chunks, None)
+            if block is None:
+                break
+            yield block
+
+
+async def _iter_multipart_async(boundary: str, fields: Dict[str, str], filename: str,
+                                data: _AsyncModelData) -> AsyncIterator:
+    """与_iter_multipart相同的请求体，文件内容异步读取"""
+    yield _multipart_head(boundary, fields, filename)
+    async for block in data:
+        yield block
+    yield _multipart_tail(boundary, {'sha256': data.sha256})
+
+
+def _open_part_file(part_path: str):
+    os.makedirs(os.path.dirname(os.path.abspath(part_path)), exist_ok=True)
+    return open(part_path, 'wb')
+
+
+def _remove_part_file(part_path: str) -> None:
+    if os.path.exists(part_path):
+        os.remove(part_path)
+
+
+class AsyncModelStorageService:
+    """
+    基于asyncio的远程模型存储服务
+
+    与RemoteModelStorageService的上传、下载、删除、列表接口含义和返回值相同，方法为协程。
+    所有请求共享AsyncHttpClient的连接池（每个主机的连接数不超过MODEL_SERVER_ASYNC_CONNECTIONS），
+    一个事件循环中可以同时进行成百上千个传输；上传以分块传输编码流式发送，下载边接收边写入磁盘，
+    内存中只有当前块。取消任务即取消传输：下载的临时文件被删除，目标文件不变。
+
+    实例及其连接池属于创建后第一次使用它的事件循环，不能在多个事件循环之间共享。
+    """
+
+    def __init__(self, limit_per_host: Optional[int] = None):
+        """
+        Args:
+            limit_per_host: 同时打开的连接数上限（默认MODEL_SERVER_ASYNC_CONNECTIONS）
+        """
+        self.remote_server_url = config.model_server_url.rstrip('/')
+        self.http = AsyncHttpClient(limit_per_host=limit_per_host or config.model_server_async_connections,
+                                    max_retries=config.model_server_max_retries)
+
+    async def __aenter__(self) -> "AsyncModelStorageService":
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        await self.close()
+
+    async def close(self) -> None:
+        await self.http.close()
+
+    def connection_stats(self) -> Dict[str, int]:
+        """连接池统计：请求数、新建连接数、复用连接的请求数、重试次数、失败数"""
+        return self.http.stats()
+
+    @staticmethod
+    async def _send_with_backoff(send: Callable[[], Awaitable[AsyncResponse]]) -> AsyncResponse:
+        """发送上传请求，服务器繁忙（429/503）时退避后重试，send每次调用都重新构造请求体"""
+        for attempt in range(BUSY_MAX_RETRIES + 1):
+            response = await send()
+            if response.status_code not in (429, 503) or attempt == BUSY_MAX_RETRIES:
+                return response
+            delay = backoff_delay(attempt, response.headers.get('Retry-After'), BUSY_BACKOFF_BASE, BUSY_BACKOFF_MAX)
+            response.release()
+            await asyncio.sleep(delay)
+        return response
+
+    async def _upload_result(self, user: User, response: AsyncResponse, digest: str) -> UploadResult:
+        """解析上传接口的响应，并核对服务器接收时计算的SHA-256与本地内容一致"""
+        async with response:
+            if response.status_code == 200:
+                result = await response.json()
+                if not result.get('success'):
+                    return False, "", result.get('error', 'Unknown error'), "", None
+                server_path = result.get('server_path', '')
+                server_digest = result.get('sha256') or digest
+                if server_digest != digest:
+                    await self.delete_model_file(user, server_path)
+                    return False, "", f"上传内容校验失败: 本地SHA-256 {digest}, 服务器 {server_digest}", "", None
+                return True, server_path, "", server_digest, result.get('version')
+            if response.status_code == 422:
+                result = await response.json()
+                if result.get('checksum_mismatch'):
+                    return False, "", f"上传内容在传输中损坏（SHA-256不一致）: {result.get('error')}", "", None
+            return False, "", f"HTTP {response.status_code}: {await response.text()}", "", None
+
+    async def _upload_by_hash(self, user: User, model_name: str, sub_directory: str,
+                              digest: str, size: int) -> Optional[Tuple[str, Optional[int]]]:
+        """按内容摘要秒传，服务器没有相同内容时返回None"""
+        try:
+            async with await self.http.post(
+                f"{self.remote_server_url}/models/upload/by-hash",
+                json={
+                    'username': user.username,
+                    'model_name': model_name,
+                    'sub_directory': sub_directory,
+                    'sha256': digest,
+                    'size': size
+                },
+                idempotent=True,
+                timeout=QUERY_TIMEOUT
+            ) as response:
+                if response.status_code == 200:
+                    result = await response.json()
+                    if result.get('success'):
+                        return result.get('server_path', ''), result.get('version')
+        except (OSError, asyncio.TimeoutError, ValueError):
+            pass
+        return None
+
+    async def save_model_file(self, user: User, model_name: str, model_data: AsyncModelData,
+                              sub_directory: str = "") -> UploadResult:
+        """
+        保存模型文件到远程服务器（以分块传输编码流式上传，SHA-256随发送计算并由服务器校验）
+
+        Args:
+            user: 用户对象
+            model_name: 模型名称
+            model_data: bytes/bytearray/memoryview、文件对象、字节块的同步或异步迭代器、ModelDataStream
+            sub_directory: 子目录（可选）
+
+        Returns:
+            Tuple[是否成功, 服务器路径, 错误信息, 内容的SHA-256, 版本号]
+        """
+        try:
+            data = _AsyncModelData(model_data)
+            buffer = data.stream.buffer if data.stream is not None else None
+            if buffer is not None and len(buffer) >= HASH_PRECHECK_MIN_SIZE:
+                digest = hashlib.sha256(buffer).hexdigest()
+                linked = await self._upload_by_hash(user, model_name, sub_directory, digest, len(buffer))
+                if linked is not None:
+                    return True, linked[0], "", digest, linked[1]
+            return await self._upload_stream(user, model_name, data, sub_directory)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            return False, "", str(e), "", None
+
+    async def _upload_stream(self, user: User, model_name: str, data: _AsyncModelData,
+                             sub_directory: str) -> UploadResult:
+        fields = {
+            'username': user.username,
+            'model_name': model_name,
+            'sub_directory': sub_directory
+        }
+        params = dict(fields)  # 服务器据此在接收文件前检查配额
+        if data.length is not None:
+            params['size'] = data.length
+        boundary = uuid.uuid4().hex
+
+        async def send():
+            if data.consumed and not data.restartable:
+                raise Exception("服务器繁忙，模型数据流只能读取一次，无法重试")
+            return await self.http.post(
+                f"{self.remote_server_url}/models/upload",
+                data=_iter_multipart_async(boundary, fields, model_name, data),
+                headers={'Content-Type': f'multipart/form-data; boundary={boundary}'},
+                params=params,
+                timeout=TRANSFER_TIMEOUT
+            )
+
+        response = await self._send_with_backoff(send)
+        return await self._upload_result(user, response, data.sha256)
+
+    async def upload_model_file(self, user: User, local_file_path: str, model_name: str = None,
+                                sub_directory: str = "") -> UploadResult:
+        """
+        上传本地模型文件到远程服务器（摘要在线程池中计算，服务器已有相同内容时秒传）
+
+        Returns:
+            Tuple[是否成功, 服务器路径, 错误信息, 内容的SHA-256, 版本号]
+        """
+        try:
+            if not os.path.exists(local_file_path):
+                return False, "", "本地文件不存在", "", None
+            if model_name is None:
+                model_name = os.path.basename(local_file_path)
+
+            file_size = os.path.getsize(local_file_path)
+            if file_size >= HASH_PRECHECK_MIN_SIZE:
+                digest = await asyncio.get_running_loop().run_in_executor(None, _sha256_file, local_file_path)
+                linked = await self._upload_by_hash(user, model_name, sub_directory, digest, file_size)
+                if linked is not None:
+                    return True, linked[0], "", digest, linked[1]
+
+            with open(local_file_path, 'rb') as f:
+                return await self._upload_stream(user, model_name, _AsyncModelData(f), sub_directory)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            return False, "", str(e), "", None
+
+    async def download_model_file(self, user: User, server_relative_path: str, local_file_path: str,
+                                  expected_sha256: Optional[str] = None,
+                                  progress: Optional[ProgressCallback] = None) -> bool:
+        """
+        从远程服务器下载模型文件
+
+        内容边接收边写入目标旁边的临时文件并计算SHA-256，与expected_sha256（未提供时为服务器声明的摘要）
+        一致时fsync后原子地替换目标文件。取消任务时删除临时文件并抛出CancelledError。
+
+        Args:
+            user: 用户对象
+            server_relative_path: 服务器上的相对路径
+            local_file_path: 本地保存路径
+            expected_sha256: 预期的内容SHA-256（可选）
+            progress: 进度回调 progress(已下载字节数, 总字节数, 字节/秒)，在事件循环中调用
+
+        Returns:
+            是否下载成功
+        """
+        loop = asyncio.get_running_loop()
+        part_path = f"{local_file_path}.{uuid.uuid4().hex}.part"
+        try:
+            async with await self.http.get(
+                f"{self.remote_server_url}/models/download",
+                params={'username': user.username, 'server_path': server_relative_path},
+                timeout=TRANSFER_TIMEOUT
+            ) as response:
+                if response.status_code != 200:
+                    return False
+                length = response.headers.get('Content-Length')
+                reporter = _Progress(progress, int(length) if length is not None else None)
+                expected = expected_sha256 or response.headers.get('X-Content-SHA256')
+                digest = hashlib.sha256()
+                # 文件操作都在线程池中进行，磁盘慢时不阻塞事件循环中的其他传输；
+                # 每块的写入与接收下一块重叠，同一时刻只有一个写入在进行
+                part_file = await loop.run_in_executor(None, _open_part_file, part_path)
+                writing = None
+                try:
+                    async for block in response.iter_chunks(WRITE_BUFFER_SIZE):
+                        if writing is not None:
+                            await writing
+                        writing = loop.run_in_executor(None, part_file.write, block)
+                        digest.update(block)
+                        reporter.add(len(block))
+                    if writing is not None:
+                        await writing
+                finally:
+                    if writing is not None and not writing.done():
+                        await asyncio.wait([writing])
+                    await loop.run_in_executor(None, part_file.close)
+                reporter.add(0, force=True)
+            if expected and digest.hexdigest() != expected:
+                raise ChecksumError(f"下载内容校验失败: 预期SHA-256 {expected}, 实际 {digest.hexdigest()}")
+            await loop.run_in_executor(None, _durable_replace, part_path, local_file_path)
+            return True
+        except ChecksumError as e:
+            print(f"Warning: {e}")
+            return False
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            return False
+        finally:
+            await loop.run_in_executor(None, _remove_part_file, part_path)
+
+    async def delete_model_file(self, user: User, server_relative_path: str) -> bool:
+        """删除远程服务器上的模型文件，返回是否删除成功"""
+        try:
+            async with await self.http.delete(
+                f"{self.remote_server_url}/models/delete",
+                json={'username': user.username, 'server_path': server_relative_path},
+                timeout=QUERY_TIMEOUT
+            ) as response:
+                if response.status_code == 200:
+                    return (await response.json()).get('success', False)
+                return False
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            return False
+
+    async def list_user_files_page(self, user: User, sub_directory: str = "", prefix: str = "",
+                                   sort: str = "path", descending: bool = False, limit: int = LIST_PAGE_SIZE,
+                                   cursor: Optional[str] = None) -> Tuple[list, Optional[str]]:
+        """
+        分页列出用户的模型文件
+
+        Returns:
+            Tuple[文件列表, 下一页游标（没有更多时为None）]
+        """
+        async with await self.http.post(
+            f"{self.remote_server_url}/models/list",
+            json={
+                'username': user.username,
+                'sub_directory': sub_directory,
+                'prefix': prefix,
+                'sort': sort,
+                'order': 'desc' if descending else 'asc',
+                'limit': limit,
+                'cursor': cursor
+            },
+            idempotent=True,
+            timeout=QUERY_TIMEOUT
+        ) as response:
+            if response.status_code != 200:
+                raise Exception(f"HTTP {response.status_code}: {await response.text()}")
+            result = await response.json()
+        if not result.get('success'):
+            raise Exception(result.get('error', 'Unknown error'))
+        return result.get('files', []), result.get('next_cursor')
+
+    async def list_user_files(self, user: User, sub_directory: str = "", prefix: str = "") -> list:
+        """列出用户的所有模型文件（按页拉取），服务器不可用时返回空列表"""
+        try:
+            files, cursor = await self.list_user_files_page(user, sub_directory, prefix)
+            while cursor:
+                page, cursor = await self.list_user_files_page(user, sub_directory, prefix, cursor=cursor)
+                files.extend(page)
+            return files
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            return []
+
+
+class SyncModelStorageClient:
+    """
+    AsyncModelStorageService的同步封装
+
+    在后台线程中运行一个事件循环，同步方法把协程提交到该循环并等待结果；
+    upload_model_files/download_model_files在同一个循环中并发执行，多个传输只占用这一个线程。
+    传输方法接受cancel事件，set()后取消对应的任务，方法返回失败结果。
+    """
+
+    def __init__(self, limit_per_host: Optional[int] = None):
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name="model-storage-loop", daemon=True)
+        self._thread.start()
+        self.service = AsyncModelStorageService(limit_per_host)
+
+    def _run(self, coro: Awaitable, cancel: Optional[threading.Event] = None):
+        future = asyncio.run_coroutine_threadsafe(coro, self._loop)
+        if cancel is None:
+            return future.result()
+        while True:
+            try:
+                return future.result(timeout=0.1)
+            except FutureTimeoutError:
+                if cancel.is_set():
+                    future.cancel()
+
+    def connection_stats(self) -> Dict[str, int]:
+        return self.service.connection_stats()
+
+    def save_model_file(self, user: User, model_name: str, model_data: Union[ModelData, ModelDataStream],
+                        sub_directory: str = "", cancel: Optional[threading.Event] = None) -> UploadResult:
+        try:
+            return self._run(self.service.save_model_file(user, model_name, model_data, sub_directory), cancel)
+        except CancelledError:
+            return False, "", "上传已取消", "", None
+
+    def upload_model_file(self, user: User, local_file_path: str, model_name: str = None,
+                          sub_directory: str = "", cancel: Optional[threading.Event] = None) -> UploadResult:
+        try:
+            return self._run(self.service.upload_model_file(user, local_file_path, model_name, sub_directory),
+                             cancel)
+        except CancelledError:
+            return False, "", "上传已取消", "", None
+
+    def download_model_file(self, user: User, server_relative_path: str, local_file_path: str,
+                            expected_sha256: Optional[str] = None, progress: Optional[ProgressCallback] = None,
+                            cancel: Optional[threading.Event] = None) -> bool:
+        try:
+            return self._run(self.service.download_model_file(
+                user, server_relative_path, local_file_path, expected_sha256, progress), cancel)
+        except CancelledError:
+            return False
+
+    def delete_model_file(self, user: User, server_relative_path: str) -> bool:
+        return self._run(self.service.delete_model_file(user, server_relative_path))
+
+    def list_user_files(self, user: User, sub_directory: str = "", prefix: str = "") -> list:
+        return self._run(self.service.list_user_files(user, sub_directory, prefix))
+
+    def upload_model_files(self, user: User, local_file_paths: Sequence[str], sub_directory: str = "",
+                           cancel: Optional[threading.Event] = None) -> List[UploadResult]:
+        """并发上传多个本地文件，返回与输入顺序一致的上传结果"""
+        async def upload_all():
+            return await asyncio.gather(*(self.service.upload_model_file(user, path, sub_directory=sub_directory)
+                                          for path in local_file_paths))
+        try:
+            return self._run(upload_all(), cancel)
+        except CancelledError:
+            return [(False, "", "上传已取消", "", None)] * len(local_file_paths)
+
+    def download_model_files(self, user: User, items: Sequence[Tuple[str, str]],
+                             cancel: Optional[threading.Event] = None) -> List[bool]:
+        """
+        并发下载多个文件
+
+        Args:
+            items: [(服务器路径, 本地保存路径)]
+
+        Returns:
+            与输入顺序一致的是否成功
+        """
+        async def download_all():
+            return await asyncio.gather(*(self.service.download_model_file(user, server_path, local_path)
+                                          for server_path, local_path in items))
+        try:
+            return self._run(download_all(), cancel)
+        except CancelledError:
+            return [False] * len(items)
+
+    def close(self) -> None:
+        """关闭连接并停止后台事件循环"""
+        if self._loop.is_closed():
+            return
+        self._run(self.service.close())
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._loop.close()
@@ -0,0 +1,129 @@
+from __future__ import annotations
+
+import hashlib
+import zlib
+from typing import Dict, List, Optional, Tuple
+
+ADLER_MOD = 65521
+
+
+def _strong_checksum(block) -> str:
+    return hashlib.blake2b(block, digest_size=16).hexdigest()
+
+
+class DeltaEncoder:
+    """
+    根据服务器返回的分块签名计算增量（rsync算法的客户端部分）
+
+    在块对齐的位置按哈希查找相同的块（块在文件中移动了位置也能找到）；
+    从匹配转为不匹配时，在其后两个块的范围内逐字节滚动Adler-32重新对齐，
+    以处理文件头部插入或删除少量字节导致后续内容整体偏移的情况。
+    逐字节滚动在Python中较慢，只在这种转折处进行，完全改变的文件不会逐字节扫描。
+    """
+
+    def __init__(self, signatures: List[list], block_size: int, base_size: int):
+        """
+        Args:
+            signatures: 基准文件每块的[弱校验, 强校验]
+            block_size: 块大小
+            base_size: 基准文件大小（最后一块可能较短）
+        """
+        self.block_size = block_size
+        self._index: Dict[int, List[Tuple[str, int]]] = {}
+        for i, (weak, strong) in enumerate(signatures):
+            self._index.setdefault(weak, []).append((strong, i))
+        self._last_length = base_size - (len(signatures) - 1) * block_size if signatures else 0
+
+    def _lookup(self, weak: int, block) -> Optional[int]:
+        candidates = self._index.get(weak)
+        if not candidates:
+            return None
+        strong = _strong_checksum(block)
+        for candidate, index in candidates:
+            if candidate == strong:
+                return index
+        return None
+
+    def _resync(self, data: memoryview, start: int) -> Optional[Tuple[int, int]]:
+        """
+        从start+1开始滚动查找匹配块，返回(位置, 块号)
+
+        start所在块中插入k字节后，下一个原有块出现在start + n + k，因此查找两个块的范围，
+        可以处理小于一个块的插入/删除。
+        """
+        n = self.block_size
+        end = min(start + 2 * n, len(data) - n)
+        if start >= end:
+            return None
+        checksum = zlib.adler32(data[start:start + n])
+        a, b = checksum & 0xffff, checksum >> 16
+        for q in range(start + 1, end + 1):
+            out_byte, in_byte = data[q - 1], data[q + n - 1]
+            a = (a - out_byte + in_byte) % ADLER_MOD
+            b = (b - n * out_byte - 1 + a) % ADLER_MOD
+            weak = (b << 16) | a
+            if weak in self._index:
+                index = self._lookup(weak, data[q:q + n])
+                if index is not None:
+                    return q, index
+        return None
+
+    def encode(self, data) -> Tuple[list, List[memoryview], int]:
+        """
+        计算新数据相对基准的增量
+
+        Returns:
+            Tuple[重建指令, 字面数据片段, 字面数据总字节数]
+        """
+        data = memoryview(data)
+        n = self.block_size
+        ops: list = []
+        literals: List[memoryview] = []
+        literal_bytes = 0
+
+        def add_literal(start: int, end: int):
+            nonlocal literal_bytes
+            if end <= start:
+                return
+            literals.append(data[start:end])
+            literal_bytes += end - start
+            if ops and ops[-1][0] == "l":
+                ops[-1][1] += end - start
+            else:
+                ops.append(["l", end - start])
+
+        def add_copy(index: int):
+            if ops and ops[-1][0] == "c" and ops[-1][1] + ops[-1][2] == index:
+                ops[-1][2] += 1
+            else:
+                ops.append(["c", index, 1])
+
+        pos = literal_start = 0
+        matched = True
+        while pos + n <= len(data):
+            block = data[pos:pos + n]
+            index = self._lookup(zlib.adler32(block), block)
+            if index is None and matched:
+                found = self._resync(data, pos)
+                if found is not None:
+                    pos, index = found
+            if index is None:
+                matched = False
+                pos += n
+                continue
+            add_literal(literal_start, pos)
+            add_copy(index)
+            pos += n
+            literal_start = pos
+            matched = True
+
+        # 尾部不足一块：可能与基准的最后一块相同
+        tail = data[pos:]
+        if len(tail) and len(tail) == self._last_length != n:
+            index = self._lookup(zlib.adler32(tail), tail)
+            if index is not None:
+                add_literal(literal_start, pos)
+                add_copy(index)
+                literal_start = len(data)
+        add_literal(literal_start, len(data))
+        return ops, literals, literal_bytes
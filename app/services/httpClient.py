@@ -0,0 +1,173 @@
+from __future__ import annotations
+
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from typing import Callable, Dict, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+DEFAULT_POOL_SIZE = 16  # 每个主机保留的keep-alive连接数（不小于并行下载的连接数）
+DEFAULT_MAX_RETRIES = 3
+# 连接超时与读取超时分开：服务器不可达时几秒内失败，读取超时按操作类型设置（两次收到数据之间的最长间隔）
+CONNECT_TIMEOUT = 5
+QUERY_TIMEOUT = (CONNECT_TIMEOUT, 30)  # 列表、用量、版本、删除等元数据请求
+BATCH_TIMEOUT = (CONNECT_TIMEOUT, 300)  # 批量接口，服务器逐项处理后才返回
+TRANSFER_TIMEOUT = (CONNECT_TIMEOUT, 300)  # 上传/下载，上传完成后服务器还要校验、入库
+# 幂等请求遇到网关错误/服务器繁忙时重试
+RETRY_STATUSES = (429, 502, 503, 504)
+RETRY_BACKOFF_BASE = 0.5
+RETRY_BACKOFF_MAX = 10.0
+
+
+def retry_after_seconds(value: Optional[str]) -> float:
+    """解析Retry-After（秒数或HTTP日期），无法解析时返回0"""
+    if not value:
+        return 0.0
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def backoff_delay(attempt: int, retry_after: Optional[str], base: float, cap: float) -> float:
+    """第attempt次重试前的等待时间：Retry-After + [0, min(cap, base*2^attempt)) 的随机抖动"""
+    jitter = random.uniform(0, min(cap, base * 2 ** attempt))
+    return retry_after_seconds(retry_after) + jitter
+
+
+def _counting_pool(base: type, on_new_connection: Callable[[], None]) -> type:
+    """创建新连接时回调的连接池类"""
+
+    class _CountingPool(base):
+        def _new_conn(self):
+            on_new_connection()
+            return super()._new_conn()
+
+    return _CountingPool
+
+
+class _CountingAdapter(HTTPAdapter):
+    """统计实际发出的请求数和新建的连接数"""
+
+    def __init__(self, client: "PooledHttpClient", **kwargs):
+        self._client = client
+        super().__init__(**kwargs)
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        on_new_connection = self._client._counter('connections')
+        self.poolmanager.pool_classes_by_scheme = {
+            'http': _counting_pool(HTTPConnectionPool, on_new_connection),
+            'https': _counting_pool(HTTPSConnectionPool, on_new_connection),
+        }
+
+    def send(self, request, **kwargs):
+        self._client._counter('requests')()
+        return super().send(request, **kwargs)
+
+
+class PooledHttpClient:
+    """
+    共享连接池的HTTP客户端
+
+    所有请求通过同一个requests.Session发送，同一主机的连接在请求之间保持keep-alive，
+    连续的列表、删除、查询不再每次都建立TCP连接。Session可以在多个线程中共享
+    （并行分段下载的各个线程从同一个池中取连接）。
+
+    只有调用方声明为幂等的请求会在连接失败、超时或网关错误时按指数退避自动重试；
+    上传等非幂等请求失败后直接返回或抛出，由调用方决定如何重试。
+    """
+
+    def __init__(self, pool_size: int = DEFAULT_POOL_SIZE, max_retries: int = DEFAULT_MAX_RETRIES):
+        """
+        Args:
+            pool_size: 每个主机保留的连接数
+            max_retries: 幂等请求的最大重试次数
+        """
+        self.max_retries = max_retries
+        self._lock = threading.Lock()
+        self._counts: Dict[str, int] = {'requests': 0, 'connections': 0, 'retries': 0, 'errors': 0}
+        self.session = requests.Session()
+        adapter = _CountingAdapter(self, pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def _counter(self, name: str) -> Callable[[], None]:
+        def increment():
+            with self._lock:
+                self._counts[name] += 1
+        return increment
+
+    def stats(self) -> Dict[str, int]:
+        """
+        连接统计
+
+        Returns:
+            {'requests': 发出的请求数（含重试）, 'connections': 新建的连接数,
+             'reused': 复用已有连接的请求数, 'retries': 重试次数, 'errors': 重试后仍失败的请求数}
+        """
+        with self._lock:
+            counts = dict(self._counts)
+        counts['reused'] = max(0, counts['requests'] - counts['connections'])
+        return counts
+
+    def request(self, method: str, url: str, idempotent: bool = False, **kwargs) -> requests.Response:
+        """
+        发送请求
+
+        Args:
+            method: HTTP方法
+            url: 地址
+            idempotent: 请求可以安全地重复发送（查询、删除等），失败时自动重试
+            **kwargs: 传给requests的参数，timeout默认为QUERY_TIMEOUT
+
+        Returns:
+            响应（重试用完后为最后一次的响应）
+
+        Raises:
+            requests.RequestException: 请求失败（幂等请求为重试用完后）
+        """
+        kwargs.setdefault('timeout', QUERY_TIMEOUT)
+        attempt = 0
+        while True:
+            try:
+                response = self.session.request(method, url, **kwargs)
+            except (requests.ConnectionError, requests.Timeout):
+                if not idempotent or attempt >= self.max_retries:
+                    self._counter('errors')()
+                    raise
+                delay = backoff_delay(attempt, None, RETRY_BACKOFF_BASE, RETRY_BACKOFF_MAX)
+            else:
+                if not idempotent or response.status_code not in RETRY_STATUSES or attempt >= self.max_retries:
+                    return response
+                delay = backoff_delay(attempt, response.headers.get('Retry-After'),
+                                      RETRY_BACKOFF_BASE, RETRY_BACKOFF_MAX)
+                response.close()
+            attempt += 1
+            self._counter('retries')()
+            time.sleep(delay)
+
+    def get(self, url: str, **kwargs) -> requests.Response:
+        """GET总是幂等的"""
+        return self.request('GET', url, idempotent=True, **kwargs)
+
+    def post(self, url: str, idempotent: bool = False, **kwargs) -> requests.Response:
+        return self.request('POST', url, idempotent=idempotent, **kwargs)
+
+    def put(self, url: str, idempotent: bool = False, **kwargs) -> requests.Response:
+        return self.request('PUT', url, idempotent=idempotent, **kwargs)
+
+    def delete(self, url: str, **kwargs) -> requests.Response:
+        """按路径删除是幂等的（再次删除只是返回不存在）"""
+        return self.request('DELETE', url, idempotent=True, **kwargs)
+
+    def close(self) -> None:
+        self.session.close()
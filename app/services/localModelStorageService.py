@@ -0,0 +1,487 @@
+from __future__ import annotations
+
+import errno
+import hashlib
+import os
+import threading
+import time
+from pathlib import Path
+from typing import BinaryIO, Callable, Dict, List, Optional, Tuple, Union
+
+from app.db.models import User
+from app.services.modelStorageService import (CHANGES_PAGE_SIZE, LIST_PAGE_SIZE, ModelData, ModelDataStream,
+                                              _sha256_file, _UploadProgress)
+from app.services.rangeDownloader import (WRITE_BUFFER_SIZE, ChecksumError, DownloadCancelled, ProgressCallback,
+                                          _durable_replace, _Progress)
+from app.services.storageBackend import StorageBackend, UploadResult
+from model_server.compression import open_decompressing_reader
+from model_server.repository import ModelRepository
+from model_server.versions import version_path
+
+COPY_BLOCK_SIZE = 16 * 1024 * 1024  # 每次系统调用复制的字节数，之间检查取消和报告进度
+OPEN_MAX_ATTEMPTS = 3  # 打开文件时恰好被覆盖的重试次数
+MAX_CHANGE_WAIT = 30  # 与服务器一致的变更长轮询上限（秒）
+# 内核内复制不可用（跨文件系统、文件系统或系统不支持）时换用下一种方式
+_FALLBACK_ERRNOS = {errno.EXDEV, errno.ENOSYS, errno.EINVAL, errno.EOPNOTSUPP, errno.ENOTSUP, errno.ENOTSOCK}
+
+
+def _copy_file(src: BinaryIO, dst: BinaryIO, size: int, on_copied: Callable[[int], None]) -> str:
+    """
+    把src的前size字节复制到dst的相同位置（都以buffering=0打开）
+
+    依次尝试copy_file_range（内核内复制，XFS/btrfs等支持reflink的文件系统上只共享数据块，
+    NFS/SMB上由服务器端完成）、sendfile（内核内复制）和普通读写，某种方式不可用时
+    从已复制的位置换用下一种。每复制一块调用on_copied(字节数)，回调抛出异常时中止复制。
+
+    Returns:
+        最后使用的方式 copy_file_range/sendfile/read
+    """
+    copied = 0
+    methods = [name for name in ('copy_file_range', 'sendfile') if hasattr(os, name)] + ['read']
+    for method in methods:
+        try:
+            while copied < size:
+                count = min(COPY_BLOCK_SIZE, size - copied)
+                if method == 'copy_file_range':
+                    n = os.copy_file_range(src.fileno(), dst.fileno(), count, copied, copied)
+                elif method == 'sendfile':
+                    dst.seek(copied)
+                    n = os.sendfile(dst.fileno(), src.fileno(), copied, count)
+                else:
+                    src.seek(copied)
+                    dst.seek(copied)
+                    n = _write_all(dst, src.read(min(count, WRITE_BUFFER_SIZE)))
+                if not n:
+                    raise EOFError("源文件在复制过程中被截断")
+                copied += n
+                on_copied(n)
+            return method
+        except OSError as e:
+            if method == 'read' or e.errno not in _FALLBACK_ERRNOS:
+                raise
+    return 'read'
+
+
+def _write_all(dst: BinaryIO, data: bytes) -> int:
+    """无缓冲的文件可能只写入一部分，写完为止"""
+    view = memoryview(data)
+    while view:
+        view = view[dst.write(view):]
+    return len(data)
+
+
+class LocalModelStorageService(StorageBackend):
+    """
+    本地文件系统存储后端
+
+    单机部署时模型目录就在本机，直接通过ModelRepository读写（与远程模型服务使用同一套
+    去重存储、文件索引、版本和配额逻辑，配置同样来自MODEL_SERVER_*环境变量），
+    内容不经过HTTP和Flask。服务器可以同时运行，各索引都是SQLite，并发写入在事务中完成。
+
+    复制不经过用户态缓冲区：
+    - 保存本地文件时先计算SHA-256，已有相同内容时目标路径直接硬链接到已有的blob，不复制数据；
+      没有时用copy_file_range/sendfile复制到存储的临时文件，再由去重存储重命名收入并硬链接到用户路径。
+      源文件在复制期间被修改（大小或修改时间变化）时放弃保存。
+    - 下载时用copy_file_range/sendfile复制到目标旁边的.part文件，fsync后原子替换；
+      压缩存储的内容边读边解压。下载结果不与存储共享inode（不使用硬链接），
+      以免调用方原地修改下载的文件时破坏存储中被多个路径共享的内容。
+    """
+
+    def __init__(self, base_path: Optional[str] = None, repository: Optional[ModelRepository] = None):
+        """
+        Args:
+            base_path: 模型目录（可选，默认与remote_model_server.py相同）
+            repository: 已打开的模型目录（可选，提供时忽略base_path）
+        """
+        self.repository = repository or ModelRepository.from_env(Path(base_path) if base_path else None)
+
+    # ---- 保存 ----
+
+    def _target_path(self, user: User, model_name: str, sub_directory: str) -> Path:
+        target_path = self.repository.resolve_target_path(user.username, sub_directory, model_name)
+        if target_path is None:
+            raise PermissionError("Access denied")
+        return target_path
+
+    def _store_temp(self, tmp_path: Path, target_path: Path, digest: str, size: int) -> UploadResult:
+        relative_path, version = self.repository.store_file(tmp_path, target_path, digest, size)
+        return True, relative_path, "", digest, version
+
+    def _link_existing(self, target_path: Path, digest: str, size: int) -> Optional[UploadResult]:
+        """已有相同内容时让目标路径硬链接到它（秒传），没有时返回None"""
+        if not self.repository.blob_store.has(digest, size):
+            return None
+        try:
+            relative_path, version = self.repository.link_existing(digest, size, target_path)
+        except FileNotFoundError:
+            # 判断存在之后内容恰好被删除
+            return None
+        return True, relative_path, "", digest, version
+
+    def save_model_file(self, user: User, model_name: str, model_data: Union[ModelData, ModelDataStream],
+                        sub_directory: str = "", base_server_path: Optional[str] = None) -> UploadResult:
+        """
+        保存模型数据
+
+        内存中的数据先按SHA-256查找已有内容；其他数据按块写入存储的临时文件，同时计算SHA-256。
+        base_server_path（增量上传的基准）在本地不需要，忽略。
+
+        Returns:
+            Tuple[是否成功, 服务器路径, 错误信息, 内容的SHA-256, 版本号]
+        """
+        tmp_path = None
+        try:
+            target_path = self._target_path(user, model_name, sub_directory)
+            stream = model_data if isinstance(model_data, ModelDataStream) else ModelDataStream(model_data)
+            if stream.buffer is not None:
+                linked = self._link_existing(target_path, hashlib.sha256(stream.buffer).hexdigest(),
+                                             len(stream.buffer))
+                if linked is not None:
+                    return linked
+
+            tmp_path = self.repository.blob_store.new_temp_path()
+            with open(tmp_path, 'wb') as f:
+                for block in stream:
+                    f.write(block)
+            return self._store_temp(tmp_path, target_path, stream.sha256, stream.size)
+        except Exception as e:
+            return False, "", str(e), "", None
+        finally:
+            if tmp_path is not None and tmp_path.exists():
+                tmp_path.unlink()
+
+    def upload_model_file(self, user: User, local_file_path: str, model_name: str = None, sub_directory: str = "",
+                          progress: Optional[ProgressCallback] = None,
+                          cancel: Optional[threading.Event] = None) -> UploadResult:
+        """
+        保存本地文件：已有相同内容时硬链接，否则在内核内复制到存储
+
+        Returns:
+            Tuple[是否成功, 服务器路径, 错误信息, 内容的SHA-256, 版本号]
+        """
+        tmp_path = None
+        try:
+            if not os.path.exists(local_file_path):
+                return False, "", "本地文件不存在", "", None
+            if model_name is None:
+                model_name = os.path.basename(local_file_path)
+            target_path = self._target_path(user, model_name, sub_directory)
+
+            before = os.stat(local_file_path)
+            tracker = _UploadProgress(progress, cancel, before.st_size)
+            tracker.check_cancelled()
+            digest = _sha256_file(local_file_path)
+            linked = self._link_existing(target_path, digest, before.st_size)
+            if linked is not None:
+                tracker.rewind(before.st_size)
+                tracker.finish()
+                return linked
+
+            tmp_path = self.repository.blob_store.new_temp_path()
+            with open(local_file_path, 'rb', buffering=0) as src, open(tmp_path, 'wb', buffering=0) as dst:
+                _copy_file(src, dst, before.st_size, tracker)
+            after = os.stat(local_file_path)
+            if (after.st_size, after.st_mtime_ns) != (before.st_size, before.st_mtime_ns):
+                return False, "", "本地文件在保存过程中被修改", "", None
+            tracker.finish()
+            return self._store_temp(tmp_path, target_path, digest, before.st_size)
+        except Exception as e:
+            return False, "", str(e), "", None
+        finally:
+            if tmp_path is not None and tmp_path.exists():
+                tmp_path.unlink()
+
+    def upload_model_files(self, user: User, local_file_paths: List[str],
+                           sub_directory: str = "") -> List[UploadResult]:
+        """批量保存本地文件（使用文件名作为模型名称），结果与local_file_paths一一对应"""
+        return [self.upload_model_file(user, local_file_path, sub_directory=sub_directory)
+                for local_file_path in local_file_paths]
+
+    # ---- 下载 ----
+
+    def _resolve(self, user: User, server_relative_path: str) -> Optional[Path]:
+        """server_path（含版本路径）对应的文件，越权或不存在时返回None"""
+        resolved = self.repository.resolve_version(user.username, server_relative_path)
+        if resolved is not None:
+            file_path = resolved[0]
+        else:
+            file_path = self.repository.resolve_server_path(user.username, server_relative_path)
+        return file_path if file_path is not None and file_path.is_file() else None
+
+    def _open(self, file_path: Path) -> Tuple[BinaryIO, Tuple[Optional[str], int, Optional[str]]]:
+        """
+        打开文件并读取其(摘要, 逻辑大小, 存储编码)
+
+        文件被覆盖时用户路径会被替换为新内容的链接，已打开的仍是旧内容；
+        打开后路径仍指向同一文件才说明读取的摘要与打开的内容一致，否则重新打开。
+        """
+        relative_path = self.repository.relative_path(file_path)
+        for _ in range(OPEN_MAX_ATTEMPTS):
+            src = open(file_path, 'rb', buffering=0)
+            try:
+                info = self.repository.blob_store.describe(relative_path)
+                if os.path.samestat(os.fstat(src.fileno()), os.stat(file_path)):
+                    # 去重存储之前的文件没有记录摘要
+                    return src, info or (None, os.fstat(src.fileno()).st_size, None)
+            except BaseException:
+                src.close()
+                raise
+            src.close()
+        raise OSError(f"文件正在被频繁覆盖: {relative_path}")
+
+    def _export(self, file_path: Path, local_file_path: str, expected_sha256: Optional[str] = None,
+                progress: Optional[ProgressCallback] = None, cancel: Optional[threading.Event] = None) -> None:
+        """
+        把模型目录中的文件复制到local_file_path（先写.part，fsync后原子替换）
+
+        Raises:
+            ChecksumError: 内容与expected_sha256不一致
+            DownloadCancelled: 已取消
+        """
+        local_dir = os.path.dirname(os.path.abspath(local_file_path))
+        os.makedirs(local_dir, exist_ok=True)
+        part_path = local_file_path + '.part'
+        tracker = None
+        try:
+            src, (digest, size, encoding) = self._open(file_path)
+            with src:
+                if expected_sha256 and digest and digest != expected_sha256.lower():
+                    raise ChecksumError(f"SHA-256校验失败: 期望 {expected_sha256}, 实际 {digest}")
+                tracker = _Progress(progress, size)
+
+                def on_copied(amount: int) -> None:
+                    if cancel is not None and cancel.is_set():
+                        raise DownloadCancelled("下载已取消")
+                    tracker.add(amount)
+
+                on_copied(0)
+                with open(part_path, 'wb', buffering=0) as dst:
+                    if encoding is None:
+                        _copy_file(src, dst, size, on_copied)
+                    else:
+                        reader = open_decompressing_reader(src, encoding)
+                        while True:
+                            block = reader.read(WRITE_BUFFER_SIZE)
+                            if not block:
+                                break
+                            on_copied(_write_all(dst, block))
+
+            if digest is None and expected_sha256:
+                actual = _sha256_file(part_path)
+                if actual != expected_sha256.lower():
+                    raise ChecksumError(f"SHA-256校验失败: 期望 {expected_sha256}, 实际 {actual}")
+            _durable_replace(part_path, local_file_path)
+            tracker.add(0, force=True)
+            if digest:
+                # 供分层存储按最近使用时间迁移
+                self.repository.blob_store.touch({digest: time.time()})
+        finally:
+            if os.path.exists(part_path):
+                os.remove(part_path)
+
+    def download_model_file(self, user: User, server_relative_path: str, local_file_path: str,
+                            expected_sha256: Optional[str] = None, progress: Optional[ProgressCallback] = None,
+                            cancel: Optional[threading.Event] = None) -> bool:
+        """
+        复制模型文件到local_file_path
+
+        Returns:
+            是否成功（取消时返回False）
+        """
+        try:
+            file_path = self._resolve(user, server_relative_path)
+            if file_path is None:
+                return False
+            self._export(file_path, local_file_path, expected_sha256, progress, cancel)
+            return True
+        except ChecksumError as e:
+            print(f"Warning: {e}")
+            return False
+        except DownloadCancelled:
+            return False
+        except Exception:
+            return False
+
+    def download_directory(self, user: User, sub_directory: str, local_dir: str) -> Tuple[bool, List[str], str]:
+        """
+        复制整个子目录到 local_dir/<子目录名>/（sub_directory为空时为用户名）
+
+        Returns:
+            Tuple[是否成功, 已写入的本地文件列表, 错误信息]
+        """
+        extracted: List[str] = []
+        try:
+            base_path = self.repository.base_path
+            user_path = (base_path / user.username).resolve()
+            dir_path = (user_path / sub_directory.strip('/')).resolve()
+            if dir_path != user_path and user_path not in dir_path.parents:
+                return False, extracted, "Access denied"
+            if not dir_path.is_dir():
+                return False, extracted, "Directory not found"
+            sub_directory = str(dir_path.relative_to(user_path)) if dir_path != user_path else ''
+            dir_prefix = Path(user.username) / sub_directory if sub_directory else Path(user.username)
+
+            root = Path(os.path.abspath(local_dir)) / dir_path.name
+            cursor = None
+            while True:
+                records, cursor = self.repository.catalog.list_files(
+                    user.username, sub_directory=sub_directory, limit=LIST_PAGE_SIZE, cursor=cursor)
+                for record in records:
+                    local_path = str(root / Path(record['path']).relative_to(dir_prefix))
+                    self._export(base_path / record['path'], local_path)
+                    extracted.append(local_path)
+                if not cursor:
+                    return True, extracted, ""
+        except Exception as e:
+            return False, extracted, str(e)
+
+    def content_unchanged(self, user: User, server_relative_path: str, sha256: str) -> Optional[bool]:
+        """
+        文件内容是否仍为sha256（读取去重存储记录的摘要，不读取内容）
+
+        Returns:
+            True 未变化，False 已变化或不存在
+        """
+        file_path = self._resolve(user, server_relative_path)
+        if file_path is None:
+            return False
+        info = self.repository.blob_store.describe(self.repository.relative_path(file_path))
+        digest = info[0] if info else _sha256_file(str(file_path))
+        return digest == sha256
+
+    # ---- 删除 ----
+
+    def delete_model_file(self, user: User, server_relative_path: str) -> bool:
+        """删除文件及其所有版本"""
+        try:
+            file_path = self.repository.resolve_server_path(user.username, server_relative_path)
+            if file_path is None or not file_path.is_file():
+                return False
+            return self.repository.remove_file(file_path)
+        except Exception:
+            return False
+
+    def delete_model_files(self, user: User, server_relative_paths: List[str]) -> Dict[str, bool]:
+        """批量删除（索引更新各在一个事务中完成），返回{服务器路径: 是否删除成功}"""
+        deleted = {path: False for path in server_relative_paths}
+        try:
+            to_remove = []
+            for server_path in dict.fromkeys(server_relative_paths):
+                file_path = self.repository.resolve_server_path(user.username, server_path)
+                if file_path is not None and file_path.is_file():
+                    to_remove.append((server_path, file_path))
+            existed = self.repository.remove_files([file_path for _, file_path in to_remove])
+            for (server_path, _), removed in zip(to_remove, existed):
+                deleted[server_path] = removed
+        except Exception:
+            pass
+        return deleted
+
+    # ---- 查询 ----
+
+    def stat_model_files(self, user: User, server_relative_paths: List[str]) -> Dict[str, Optional[dict]]:
+        """
+        批量查询文件信息（查询文件索引）
+
+        Returns:
+            {服务器路径: {name, size, modified, sha256}}，文件不存在时为None
+        """
+        stats: Dict[str, Optional[dict]] = {}
+        allowed = {}
+        for server_path in server_relative_paths:
+            resolved = self.repository.resolve_version(user.username, server_path)
+            if resolved is not None:
+                item = self.repository.stat_version(server_path, *resolved)
+                stats[server_path] = {key: item[key] for key in ('name', 'size', 'modified', 'sha256')} \
+                    if item['exists'] else None
+                continue
+            file_path = self.repository.resolve_server_path(user.username, server_path)
+            if file_path is None:
+                stats[server_path] = None
+            else:
+                allowed[server_path] = self.repository.relative_path(file_path)
+        records = self.repository.catalog.get_many(list(set(allowed.values())))
+        for server_path, relative_path in allowed.items():
+            record = records.get(relative_path)
+            stats[server_path] = {key: record[key] for key in ('name', 'size', 'modified', 'sha256')} \
+                if record else None
+        return stats
+
+    def get_storage_usage(self, user: User) -> Optional[dict]:
+        """{'bytes', 'files', 'quota_bytes', 'quota_files'}（配额为None表示不限制）；失败时返回None"""
+        try:
+            usage = self.repository.catalog.usage(user.username)
+            max_bytes, max_files = self.repository.quota.limits(user.username)
+            return {'bytes': usage['bytes'], 'files': usage['files'],
+                    'quota_bytes': max_bytes, 'quota_files': max_files}
+        except Exception:
+            return None
+
+    def list_model_versions(self, user: User, server_relative_path: str,
+                            limit: Optional[int] = None) -> Optional[List[dict]]:
+        """文件的版本（从新到旧）[{'version', 'version_path', 'sha256', 'size', 'created'}]；不存在时返回None"""
+        try:
+            file_path = self.repository.resolve_server_path(user.username, server_relative_path)
+            if file_path is None:
+                return None
+            relative_path = self.repository.relative_path(file_path)
+            records = self.repository.versions.list(relative_path, limit=limit)
+            if not records:
+                return None
+            for record in records:
+                record['version_path'] = version_path(relative_path, record['version'])
+            return records
+        except Exception:
+            return None
+
+    def get_changes(self, user: User, since: Optional[int] = None, wait: float = 0,
+                    limit: int = CHANGES_PAGE_SIZE) -> Optional[dict]:
+        """
+        序号since之后的变更，没有时最多等待wait秒（上限与服务器相同）
+
+        Returns:
+            {'changes', 'next_seq', 'reset', 'retry_after'}；since为None时只返回当前最新序号；失败时返回None
+        """
+        try:
+            catalog = self.repository.catalog
+            if since is None:
+                return {'changes': [], 'next_seq': catalog.latest_seq(), 'reset': False, 'retry_after': None}
+            changes, next_seq, reset = catalog.changes_since(user.username, since, limit)
+            deadline = time.monotonic() + min(max(wait, 0.0), MAX_CHANGE_WAIT)
+            # 其他用户的写入也会唤醒等待，查询后没有本用户的变更则继续等到超时
+            while not changes and not reset and time.monotonic() < deadline:
+                if catalog.wait_for_change(deadline - time.monotonic()):
+                    changes, next_seq, reset = catalog.changes_since(user.username, since, limit)
+            return {'changes': changes, 'next_seq': next_seq, 'reset': reset, 'retry_after': None}
+        except Exception:
+            return None
+
+    def list_user_files_page(self, user: User, sub_directory: str = "", prefix: str = "",
+                             sort: str = "path", descending: bool = False, limit: int = LIST_PAGE_SIZE,
+                             cursor: Optional[str] = None) -> Tuple[list, Optional[str]]:
+        """
+        分页列出文件[{name, path, size, modified}]
+
+        Returns:
+            Tuple[文件列表, 下一页游标（没有更多时为None）]
+
+        Raises:
+            CatalogError: 参数或游标无效
+        """
+        files, next_cursor = self.repository.catalog.list_files(
+            user.username, sub_directory=sub_directory, prefix=prefix, sort=sort, descending=descending,
+            limit=limit, cursor=cursor)
+        return [{key: f[key] for key in ('name', 'path', 'size', 'modified')} for f in files], next_cursor
+
+    def list_user_files(self, user: User, sub_directory: str = "", prefix: str = "") -> list:
+        """列出所有文件（按页查询索引），失败时返回空列表"""
+        try:
+            files, cursor = [], None
+            while True:
+                page, cursor = self.list_user_files_page(user, sub_directory=sub_directory, prefix=prefix,
+                                                         cursor=cursor)
+                files.extend(page)
+                if not cursor:
+                    return files
+        except Exception:
+            return []
@@ -0,0 +1,292 @@
+from __future__ import annotations
+
+import hashlib
+import os
+import shutil
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Optional
+
+from app.config import config
+from app.services.storageBackend import LOCAL_BACKEND
+from model_server.db import connect, transaction
+
+COPY_BUFFER_SIZE = 1024 * 1024
+FICLONE = 0x40049409  # Linux ioctl：在支持的文件系统（btrfs、XFS等）上创建写时复制的副本
+
+
+def _reflink(src: str, dst: str) -> bool:
+    """尝试以写时复制方式复制文件（不占用额外空间、不读取内容），不支持时返回False"""
+    try:
+        import fcntl
+    except ImportError:
+        return False
+    try:
+        with open(src, 'rb') as source, open(dst, 'wb') as target:
+            fcntl.ioctl(target.fileno(), FICLONE, source.fileno())
+        return True
+    except OSError:
+        if os.path.exists(dst):
+            os.remove(dst)
+        return False
+
+
+def _copy_hashed(src: str, dst: str) -> str:
+    """复制文件并返回内容的SHA-256"""
+    digest = hashlib.sha256()
+    with open(src, 'rb') as source, open(dst, 'wb') as target:
+        while True:
+            block = source.read(COPY_BUFFER_SIZE)
+            if not block:
+                break
+            digest.update(block)
+            target.write(block)
+        target.flush()
+        os.fsync(target.fileno())
+    return digest.hexdigest()
+
+
+def _place(src: str, dst: str) -> str:
+    """
+    把src放到dst：依次尝试写时复制、硬链接、复制，先写到dst旁边的临时文件再原子替换
+
+    Returns:
+        使用的方式 reflink/hardlink/copy
+    """
+    tmp_path = f"{dst}.{uuid.uuid4().hex}.tmp"
+    try:
+        if _reflink(src, tmp_path):
+            method = 'reflink'
+        else:
+            try:
+                os.link(src, tmp_path)
+                method = 'hardlink'
+            except OSError:
+                shutil.copyfile(src, tmp_path)
+                method = 'copy'
+        os.replace(tmp_path, dst)
+        return method
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+class ModelCache:
+    """
+    已下载模型的本地内容缓存
+
+    按内容SHA-256保存（同一内容只保存一份，不同模型/版本的相同内容共用），
+    模型记录中有摘要时直接按摘要命中，不访问服务器；没有摘要的旧记录按模型ID记录缓存的摘要，
+    命中前用条件请求向服务器确认内容未变化。
+
+    命中时按写时复制、硬链接、复制的顺序放到目标路径。缓存文件与用户文件可能是硬链接，
+    用户原地修改了文件时大小或修改时间会变化，命中前比较这两项，不一致的条目直接丢弃。
+
+    索引保存在SQLite中：写入时先落盘文件再提交索引，淘汰时先提交索引再删除文件，
+    启动时清理崩溃遗留的没有索引的文件和没有文件的索引。总大小超过预算时按最近使用时间淘汰。
+    """
+
+    def __init__(self, root: str, max_bytes: int):
+        """
+        Args:
+            root: 缓存目录
+            max_bytes: 缓存总大小上限（字节）
+        """
+        self.root = os.path.abspath(root)
+        self.max_bytes = max_bytes
+        self._objects = os.path.join(self.root, 'objects')
+        self._db_path = os.path.join(self.root, 'index.db')
+        self._lock = threading.Lock()
+        os.makedirs(self._objects, exist_ok=True)
+
+        conn = self._connect()
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+        finally:
+            conn.close()
+        with transaction(self._connect) as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS entry ("
+                " sha256 TEXT PRIMARY KEY,"
+                " size INTEGER NOT NULL,"
+                " mtime_ns INTEGER NOT NULL,"
+                " accessed REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS ix_entry_accessed ON entry (accessed)")
+            # 没有摘要的模型记录：模型ID -> 缓存内容的摘要
+            conn.execute("CREATE TABLE IF NOT EXISTS alias (key TEXT PRIMARY KEY, sha256 TEXT NOT NULL)")
+        self._sweep()
+
+    def _connect(self) -> sqlite3.Connection:
+        return connect(self._db_path)
+
+    def object_path(self, sha256: str) -> str:
+        return os.path.join(self._objects, sha256[:2], sha256)
+
+    def _sweep(self) -> None:
+        """清理崩溃遗留的临时文件、没有索引的文件和文件已丢失的索引"""
+        with transaction(self._connect) as conn:
+            indexed = {row[0] for row in conn.execute("SELECT sha256 FROM entry")}
+            for sha256 in list(indexed):
+                if not os.path.isfile(self.object_path(sha256)):
+                    self._forget(conn, sha256)
+                    indexed.discard(sha256)
+        for directory, _, filenames in os.walk(self._objects):
+            for filename in filenames:
+                if filename not in indexed:
+                    os.remove(os.path.join(directory, filename))
+
+    @staticmethod
+    def _forget(conn: sqlite3.Connection, sha256: str) -> None:
+        conn.execute("DELETE FROM entry WHERE sha256 = ?", (sha256,))
+        conn.execute("DELETE FROM alias WHERE sha256 = ?", (sha256,))
+
+    def lookup_alias(self, key: str) -> Optional[str]:
+        """没有摘要的模型记录上次缓存的内容摘要"""
+        conn = self._connect()
+        try:
+            row = conn.execute("SELECT sha256 FROM alias WHERE key = ?", (key,)).fetchone()
+        finally:
+            conn.close()
+        return row[0] if row else None
+
+    def fetch(self, sha256: str, local_file_path: str) -> bool:
+        """
+        缓存中有该内容时放到local_file_path（不访问网络）
+
+        Returns:
+            是否命中
+        """
+        path = self.object_path(sha256)
+        with self._lock:
+            conn = self._connect()
+            try:
+                row = conn.execute("SELECT size, mtime_ns FROM entry WHERE sha256 = ?", (sha256,)).fetchone()
+            finally:
+                conn.close()
+            if row is None:
+                return False
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                stat = None
+            if stat is None or (stat.st_size, stat.st_mtime_ns) != tuple(row):
+                # 文件丢失或被原地修改（硬链接的另一端被写入）
+                self._evict(sha256)
+                return False
+
+            if os.path.abspath(local_file_path) != path:
+                local_dir = os.path.dirname(os.path.abspath(local_file_path))
+                os.makedirs(local_dir, exist_ok=True)
+                _place(path, local_file_path)
+            with transaction(self._connect) as conn:
+                conn.execute("UPDATE entry SET accessed = ? WHERE sha256 = ?", (time.time(), sha256))
+            return True
+
+    def store(self, local_file_path: str, sha256: Optional[str] = None, alias: Optional[str] = None) -> str:
+        """
+        把下载好的文件加入缓存，超出预算时淘汰最久未使用的内容
+
+        Args:
+            local_file_path: 已下载的文件
+            sha256: 文件内容的SHA-256（下载时已校验），None时复制过程中计算
+            alias: 没有摘要的模型记录的键（如模型ID），之后可按该键查询摘要
+
+        Returns:
+            内容的SHA-256
+        """
+        size = os.path.getsize(local_file_path)
+        if size > self.max_bytes:
+            return sha256 or ""
+        with self._lock:
+            tmp_path = os.path.join(self._objects, f"{uuid.uuid4().hex}.tmp")
+            try:
+                if sha256 is not None:
+                    if not _reflink(local_file_path, tmp_path):
+                        try:
+                            os.link(local_file_path, tmp_path)
+                        except OSError:
+                            _copy_hashed(local_file_path, tmp_path)
+                else:
+                    sha256 = _copy_hashed(local_file_path, tmp_path)
+                path = self.object_path(sha256)
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                os.replace(tmp_path, path)
+            finally:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+
+            stat = os.stat(path)
+            with transaction(self._connect) as conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO entry (sha256, size, mtime_ns, accessed) VALUES (?, ?, ?, ?)",
+                    (sha256, stat.st_size, stat.st_mtime_ns, time.time())
+                )
+                if alias is not None:
+                    conn.execute("INSERT OR REPLACE INTO alias (key, sha256) VALUES (?, ?)", (alias, sha256))
+            self._evict_to_budget(keep=sha256)
+            return sha256
+
+    def _evict(self, sha256: str) -> None:
+        with transaction(self._connect) as conn:
+            self._forget(conn, sha256)
+        try:
+            os.remove(self.object_path(sha256))
+        except FileNotFoundError:
+            pass
+
+    def _evict_to_budget(self, keep: Optional[str] = None) -> None:
+        conn = self._connect()
+        try:
+            total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM entry").fetchone()[0]
+            candidates = conn.execute("SELECT sha256, size FROM entry ORDER BY accessed").fetchall() \
+                if total > self.max_bytes else []
+        finally:
+            conn.close()
+        for sha256, size in candidates:
+            if total <= self.max_bytes:
+                break
+            if sha256 == keep:
+                continue
+            self._evict(sha256)
+            total -= size
+
+    def usage(self) -> dict:
+        """{'bytes': 缓存总大小, 'entries': 内容数}"""
+        conn = self._connect()
+        try:
+            total, count = conn.execute("SELECT COALESCE(SUM(size), 0), COUNT(*) FROM entry").fetchone()
+        finally:
+            conn.close()
+        return {'bytes': total, 'entries': count}
+
+    def clear(self) -> None:
+        with self._lock:
+            conn = self._connect()
+            try:
+                shas = [row[0] for row in conn.execute("SELECT sha256 FROM entry")]
+            finally:
+                conn.close()
+            for sha256 in shas:
+                self._evict(sha256)
+
+
+_model_cache: Optional[ModelCache] = None
+_model_cache_lock = threading.Lock()
+
+
+def get_model_cache() -> Optional[ModelCache]:
+    """
+    全局的模型缓存（首次使用时创建）
+
+    MODEL_CACHE_BYTES=0时不启用，返回None；使用本地存储后端时模型目录就在本机，也不需要缓存
+    """
+    global _model_cache
+    if not config.model_cache_bytes or config.model_storage_backend == LOCAL_BACKEND:
+        return None
+    with _model_cache_lock:
+        if _model_cache is None:
+            _model_cache = ModelCache(config.model_cache_dir, config.model_cache_bytes)
+        return _model_cache
@@ -0,0 +1,274 @@
+from __future__ import annotations
+
+import argparse
+import time
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from typing import Iterator, List, Optional, Sequence, Tuple
+
+from sqlalchemy import and_, delete, or_, select
+
+from app.db.base import session_scope
+from app.db.models import Model, User
+from app.services.modelStorageService import LIST_PAGE_SIZE, model_storage_service
+
+DB_PAGE_SIZE = 1000
+FIX_BATCH_SIZE = 100
+ORPHAN_MIN_AGE = 3600  # 秒；更新的文件/记录可能属于进行中的上传，不视为孤儿
+REPORT_SAMPLE_LIMIT = 1000
+# 与服务器索引（SQLite BINARY）一致的按码点排序的排序规则
+BINARY_COLLATIONS = {'mysql': 'utf8mb4_bin', 'mariadb': 'utf8mb4_bin', 'sqlite': 'BINARY', 'postgresql': 'C'}
+
+
+class ReconcileError(Exception):
+    """对账无法继续（如两侧排序规则不一致）"""
+
+
+@dataclass
+class ReconcileReport:
+    """对账结果，孤儿明细最多保留REPORT_SAMPLE_LIMIT条"""
+    dry_run: bool = True
+    users: int = 0
+    db_rows: int = 0
+    server_files: int = 0
+    server_orphans: int = 0  # 服务器上没有模型记录的文件
+    db_orphans: int = 0  # 服务器上文件已不存在的模型记录
+    skipped_recent: int = 0
+    fixed_server: int = 0
+    fixed_db: int = 0
+    server_orphan_paths: List[str] = field(default_factory=list)
+    db_orphan_ids: List[int] = field(default_factory=list)
+    errors: List[str] = field(default_factory=list)
+
+
+class _RateLimiter:
+    """限制每秒修复的条目数，rate为None时不限制"""
+
+    def __init__(self, rate: Optional[float]):
+        self.rate = rate
+        self._start = time.monotonic()
+        self._count = 0
+
+    def acquire(self, n: int) -> None:
+        if not self.rate:
+            return
+        self._count += n
+        delay = self._count / self.rate - (time.monotonic() - self._start)
+        if delay > 0:
+            time.sleep(delay)
+
+
+class ModelReconciler:
+    """
+    模型记录与服务器存储的对账
+
+    逐个用户把Model表（按file_path排序分页查询）和服务器文件索引（/models/list按path分页）
+    当作两个有序流做归并，内存占用只与页大小有关，与记录和文件数量无关：
+    只在服务器上的文件是上传成功但建记录失败（或删除记录时远程删除失败）留下的孤儿，
+    只在表中的记录指向已不存在的文件。
+
+    默认只报告；修复时分批删除服务器文件/模型记录，可限制每秒修复的条目数。
+    最近ORPHAN_MIN_AGE秒内出现的文件和记录跳过，避免与进行中的上传冲突。
+    只对照Model表中存在的用户，已删除用户在服务器上的目录不在对账范围内。
+    """
+
+    def __init__(self, storage=model_storage_service, page_size: int = LIST_PAGE_SIZE,
+                 batch_size: int = FIX_BATCH_SIZE, min_age: float = ORPHAN_MIN_AGE,
+                 max_fixes_per_second: Optional[float] = None):
+        """
+        Args:
+            storage: 模型存储后端（默认为按配置选择的后端）
+            page_size: 服务器列表每页数量
+            batch_size: 每批修复的条目数
+            min_age: 孤儿的最小存在时间（秒）
+            max_fixes_per_second: 每秒最多修复的条目数（None表示不限制）
+        """
+        self.storage = storage
+        self.page_size = page_size
+        self.batch_size = batch_size
+        self.min_age = min_age
+        self.max_fixes_per_second = max_fixes_per_second
+
+    @staticmethod
+    def _binary_path(session):
+        dialect = session.get_bind().dialect.name
+        collation = BINARY_COLLATIONS.get(dialect)
+        if collation is None:
+            raise ReconcileError(f"不支持的数据库类型: {dialect}")
+        return Model.file_path.collate(collation)
+
+    def _iter_users(self, usernames: Optional[Sequence[str]]) -> Iterator[User]:
+        last_id = 0
+        while True:
+            with session_scope() as session:
+                query = select(User).where(User.id > last_id).order_by(User.id).limit(DB_PAGE_SIZE)
+                if usernames:
+                    query = query.where(User.username.in_(list(usernames)))
+                users = session.scalars(query).all()
+            if not users:
+                return
+            yield from users
+            last_id = users[-1].id
+
+    def _iter_db_rows(self, user_id: int) -> Iterator[Tuple[str, int, datetime]]:
+        """按file_path（码点顺序）分页返回用户的(file_path, id, updated_at)"""
+        last: Optional[Tuple[str, int]] = None
+        while True:
+            with session_scope() as session:
+                path = self._binary_path(session)
+                query = (select(Model.file_path, Model.id, Model.updated_at)
+                         .where(Model.owner_id == user_id)
+                         .order_by(path, Model.id)
+                         .limit(DB_PAGE_SIZE))
+                if last is not None:
+                    query = query.where(or_(path > last[0], and_(path == last[0], Model.id > last[1])))
+                rows = session.execute(query).all()
+            if not rows:
+                return
+            yield from rows
+            last = (rows[-1][0], rows[-1][1])
+
+    def _iter_server_files(self, user: User) -> Iterator[dict]:
+        cursor = None
+        while True:
+            files, cursor = self.storage.list_user_files_page(user, sort='path', limit=self.page_size, cursor=cursor)
+            yield from files
+            if not cursor:
+                return
+
+    @staticmethod
+    def _ordered(items: Iterator, key, source: str) -> Iterator:
+        """检查流按码点升序，排序规则不一致时停止对账而不是误判孤儿"""
+        previous = None
+        for item in items:
+            value = key(item)
+            if previous is not None and value < previous:
+                raise ReconcileError(f"{source}未按路径排序: {previous!r} > {value!r}")
+            previous = value
+            yield item
+
+    def run(self, dry_run: bool = True, fix_server: bool = True, fix_db: bool = True,
+            usernames: Optional[Sequence[str]] = None) -> ReconcileReport:
+        """
+        执行对账
+
+        Args:
+            dry_run: 只报告不修复
+            fix_server: 修复时删除服务器上的孤儿文件
+            fix_db: 修复时删除指向不存在文件的模型记录
+            usernames: 只对账这些用户（默认全部）
+
+        Returns:
+            对账结果
+        """
+        report = ReconcileReport(dry_run=dry_run)
+        limiter = _RateLimiter(self.max_fixes_per_second)
+        for user in self._iter_users(usernames):
+            report.users += 1
+            try:
+                self._reconcile_user(user, report, limiter,
+                                     fix_server=fix_server and not dry_run, fix_db=fix_db and not dry_run)
+            except ReconcileError:
+                raise
+            except Exception as e:
+                # 列表请求失败时跳过该用户，不能把未列出的文件当作不存在
+                report.errors.append(f"{user.username}: {e}")
+        return report
+
+    def _reconcile_user(self, user: User, report: ReconcileReport, limiter: _RateLimiter,
+                        fix_server: bool, fix_db: bool) -> None:
+        cutoff = time.time() - self.min_age
+        db_cutoff = datetime.utcnow() - timedelta(seconds=self.min_age)
+        server_batch: List[str] = []
+        db_batch: List[int] = []
+
+        db_rows = self._ordered(self._iter_db_rows(user.id), lambda row: row[0], "模型记录")
+        files = self._ordered(self._iter_server_files(user), lambda f: f['path'], "服务器文件列表")
+        row = next(db_rows, None)
+        file = next(files, None)
+        while row is not None or file is not None:
+            if file is None or (row is not None and row[0] < file['path']):
+                report.db_rows += 1
+                if row[2] > db_cutoff:
+                    report.skipped_recent += 1
+                else:
+                    report.db_orphans += 1
+                    if len(report.db_orphan_ids) < REPORT_SAMPLE_LIMIT:
+                        report.db_orphan_ids.append(row[1])
+                    if fix_db:
+                        db_batch.append(row[1])
+                        if len(db_batch) >= self.batch_size:
+                            self._delete_rows(db_batch, report, limiter)
+                row = next(db_rows, None)
+            elif row is None or file['path'] < row[0]:
+                report.server_files += 1
+                if file['modified'] > cutoff:
+                    report.skipped_recent += 1
+                else:
+                    report.server_orphans += 1
+                    if len(report.server_orphan_paths) < REPORT_SAMPLE_LIMIT:
+                        report.server_orphan_paths.append(file['path'])
+                    if fix_server:
+                        server_batch.append(file['path'])
+                        if len(server_batch) >= self.batch_size:
+                            self._delete_files(user, server_batch, report, limiter)
+                file = next(files, None)
+            else:
+                # 同一文件可能被多条记录引用
+                path = file['path']
+                report.server_files += 1
+                while row is not None and row[0] == path:
+                    report.db_rows += 1
+                    row = next(db_rows, None)
+                file = next(files, None)
+
+        if server_batch:
+            self._delete_files(user, server_batch, report, limiter)
+        if db_batch:
+            self._delete_rows(db_batch, report, limiter)
+
+    def _delete_files(self, user: User, paths: List[str], report: ReconcileReport, limiter: _RateLimiter) -> None:
+        limiter.acquire(len(paths))
+        deleted = self.storage.delete_model_files(user, paths)
+        report.fixed_server += sum(1 for ok in deleted.values() if ok)
+        failed = [path for path, ok in deleted.items() if not ok]
+        if failed:
+            report.errors.append(f"{user.username}: 删除 {len(failed)} 个服务器文件失败，如 {failed[0]}")
+        paths.clear()
+
+    def _delete_rows(self, ids: List[int], report: ReconcileReport, limiter: _RateLimiter) -> None:
+        limiter.acquire(len(ids))
+        with session_scope() as session:
+            result = session.execute(delete(Model).where(Model.id.in_(ids)))
+        report.fixed_db += result.rowcount
+        ids.clear()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="模型记录与服务器存储对账")
+    parser.add_argument('--fix', action='store_true', help="修复孤儿（默认只报告）")
+    parser.add_argument('--side', choices=['both', 'server', 'db'], default='both',
+                        help="修复哪一侧：server删除孤儿文件，db删除孤儿记录")
+    parser.add_argument('--rate', type=float, default=None, help="每秒最多修复的条目数")
+    parser.add_argument('--min-age', type=float, default=ORPHAN_MIN_AGE, help="孤儿的最小存在时间（秒）")
+    parser.add_argument('--user', action='append', dest='usernames', help="只对账指定用户（可重复）")
+    args = parser.parse_args()
+
+    reconciler = ModelReconciler(min_age=args.min_age, max_fixes_per_second=args.rate)
+    report = reconciler.run(dry_run=not args.fix, fix_server=args.side in ('both', 'server'),
+                            fix_db=args.side in ('both', 'db'), usernames=args.usernames)
+    print(f"用户: {report.users}, 模型记录: {report.db_rows}, 服务器文件: {report.server_files}")
+    print(f"服务器孤儿文件: {report.server_orphans}, 孤儿记录: {report.db_orphans}, "
+          f"跳过较新的: {report.skipped_recent}")
+    if not report.dry_run:
+        print(f"已删除文件: {report.fixed_server}, 已删除记录: {report.fixed_db}")
+    for path in report.server_orphan_paths:
+        print(f"  [server] {path}")
+    for model_id in report.db_orphan_ids:
+        print(f"  [db] model id={model_id}")
+    for error in report.errors:
+        print(f"  [error] {error}")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,9 +1,14 @@
 from __future__ import annotations
+import os
+import threading
 from typing import List, Optional
 from sqlalchemy.orm import Session
 from sqlalchemy import select
-from app.db.models import Model, User
-from app.services.modelStorageService import model_storage_service
+from app.db.models import Model, ModelVersion, User
+from app.services.modelCache import get_model_cache
+from app.services.modelStorageService import ModelData, ModelDataStream, model_storage_service
+from app.services.rangeDownloader import ProgressCallback
+from model_server.versions import version_path
 
 
 def list_user_models(session: Session, user_id: int) -> List[Model]:
@@ -22,22 +27,63 @@ def get_model_by_id(session: Session, model_id: int) -> Optional[Model]:
 
 
 def create_model(session: Session, name: str, owner_id: int, file_path: str, 
-                 file_size: int = 0, description: str = None, is_public: bool = False) -> Model:
-    """创建新模型记录"""
+                 file_size: int = 0, description: str = None, is_public: bool = False,
+                 sha256: str = None, version: int = None) -> Model:
+    """创建新模型记录（version为服务器分配的版本号，同时记录该版本）"""
     model = Model(
         name=name,
         owner_id=owner_id,
         file_path=file_path,
         file_size=file_size,
+        sha256=sha256,
+        version=version,
         description=description,
         is_public=is_public
     )
+    if version is not None:
+        model.versions.append(_new_version(file_path, version, file_size, sha256))
     session.add(model)
     session.commit()
     session.refresh(model)
     return model
 
 
+def _new_version(file_path: str, version: int, file_size: int, sha256: Optional[str]) -> ModelVersion:
+    return ModelVersion(version=version, version_path=version_path(file_path, version),
+                        file_size=file_size, sha256=sha256)
+
+
+def _save_model_record(session: Session, user: User, model_name: str, server_path: str, file_size: int,
+                       description: Optional[str], sha256: str, version: Optional[int]) -> Model:
+    """
+    上传后记录模型：同一服务器路径已有模型记录时追加一个版本并更新为最新版本，否则新建记录
+    """
+    model = session.scalars(
+        select(Model).where(Model.owner_id == user.id, Model.file_path == server_path).order_by(Model.id.desc())
+    ).first() if version is not None else None
+    if model is None:
+        return create_model(session=session, name=model_name, owner_id=user.id, file_path=server_path,
+                            file_size=file_size, description=description, sha256=sha256, version=version)
+
+    if not any(v.version == version for v in model.versions):
+        model.versions.append(_new_version(server_path, version, file_size, sha256))
+    model.version = version
+    model.file_size = file_size
+    model.sha256 = sha256
+    if description is not None:
+        model.description = description
+    session.commit()
+    session.refresh(model)
+    return model
+
+
+def list_model_versions(session: Session, model_id: int) -> List[ModelVersion]:
+    """列出模型的版本（从新到旧）"""
+    return session.scalars(
+        select(ModelVersion).where(ModelVersion.model_id == model_id).order_by(ModelVersion.version.desc())
+    ).all()
+
+
 def update_model(session: Session, model_id: int, **kwargs) -> Optional[Model]:
     """更新模型信息"""
     model = session.get(Model, model_id)
@@ -65,7 +111,9 @@ def delete_model(session: Session, model_id: int) -> bool:
         user = user_session.get(User, model.owner_id)
         if user:
             try:
-                model_storage_service.delete_model_file(user, model.file_path)
+                if not model_storage_service.delete_model_file(user, model.file_path):
+                    # 留下的孤儿文件由 python -m app.services.modelReconciler --fix 清理
+                    print(f"Warning: Failed to delete model file from remote server: {model.file_path}")
             except Exception as e:
                 print(f"Warning: Failed to delete model file from remote server: {e}")
     
@@ -86,45 +134,44 @@ def toggle_model_visibility(session: Session, model_id: int) -> Optional[bool]:
     return model.is_public
 
 
-def save_trained_model(session: Session, user: User, model_name: str, model_data: bytes, 
-                      sub_directory: str = "", description: str = None) -> Optional[Model]:
+def save_trained_model(session: Session, user: User, model_name: str, model_data: ModelData, 
+                      sub_directory: str = "", description: str = None,
+                      base_server_path: Optional[str] = None) -> Optional[Model]:
     """
     保存训练好的模型
+
+    同名模型再次保存时服务器生成新版本，旧版本仍可按版本下载。
+    模型数据可以是文件对象或字节块的迭代器（如边序列化边产生的块），流式上传，不需要先整体放入内存。
     
     Args:
         session: 数据库会话
         user: 用户对象
         model_name: 模型名称
-        model_data: 模型数据
+        model_data: 模型数据：bytes/bytearray/memoryview、文件对象或字节块的迭代器
         sub_directory: 子目录
         description: 模型描述
+        base_server_path: 上一版本的服务器路径，只上传与它不同的块（默认为同名模型的当前文件）
         
     Returns:
         Model对象或None
     """
-    # 保存到远程服务器
-    success, server_path, error = model_storage_service.save_model_file(
-        user, model_name, model_data, sub_directory)
+    # 保存到远程服务器，文件大小在发送过程中累计
+    stream = ModelDataStream(model_data)
+    success, server_path, error, sha256, version = model_storage_service.save_model_file(
+        user, model_name, stream, sub_directory, base_server_path=base_server_path)
     
     if not success:
         raise Exception(f"保存模型文件失败: {error}")
         
-    # 创建数据库记录
-    model = create_model(
-        session=session,
-        name=model_name,
-        owner_id=user.id,
-        file_path=server_path,
-        file_size=len(model_data),
-        description=description
-    )
-    
-    return model
+    # 创建数据库记录（已有记录时追加版本）
+    return _save_model_record(session, user, model_name, server_path, stream.size,
+                              description, sha256, version)
 
 
 def upload_model_file(session: Session, user: User, local_file_path: str,
                      model_name: str = None, sub_directory: str = "", 
-                     description: str = None) -> Optional[Model]:
+                     description: str = None, progress: Optional[ProgressCallback] = None,
+                     cancel: Optional[threading.Event] = None) -> Optional[Model]:
     """
     上传模型文件
     
@@ -135,13 +182,15 @@ def upload_model_file(session: Session, user: User, local_file_path: str,
         model_name: 模型名称
         sub_directory: 子目录
         description: 模型描述
+        progress: 进度回调 progress(已上传字节数, 总字节数, 字节/秒)，在上传线程中调用
+        cancel: 取消事件，set()后尽快停止上传（抛出异常，不创建记录）
         
     Returns:
         Model对象或None
     """
     # 上传到远程服务器
-    success, server_path, error = model_storage_service.upload_model_file(
-        user, local_file_path, model_name, sub_directory)
+    success, server_path, error, sha256, version = model_storage_service.upload_model_file(
+        user, local_file_path, model_name, sub_directory, progress=progress, cancel=cancel)
 
     if not success:
         print(error)
@@ -155,28 +204,28 @@ def upload_model_file(session: Session, user: User, local_file_path: str,
     if model_name is None:
         model_name = os.path.basename(local_file_path)
         
-    # 创建数据库记录
-    model = create_model(
-        session=session,
-        name=model_name,
-        owner_id=user.id,
-        file_path=server_path,
-        file_size=file_size,
-        description=description
-    )
-    
-    return model
+    # 创建数据库记录（已有记录时追加版本）
+    return _save_model_record(session, user, model_name, server_path, file_size,
+                              description, sha256, version)
 
 
-def download_model_file(session: Session, user: User, model_id: int, local_file_path: str) -> bool:
+def download_model_file(session: Session, user: User, model_id: int, local_file_path: str,
+                        version: Optional[int] = None, progress: Optional[ProgressCallback] = None,
+                        cancel: Optional[threading.Event] = None) -> bool:
     """
-    下载模型文件
+    下载模型文件（按模型记录中的SHA-256校验下载内容）
+
+    有版本号时按不可变的版本路径下载，本地已是该版本时不会重新下载。
+    下载过的内容保存在本地缓存（ModelCache）中，再次下载同一内容时从缓存复制，不访问网络。
     
     Args:
         session: 数据库会话
         user: 用户对象
         model_id: 模型ID
         local_file_path: 本地保存路径
+        version: 版本号（可选，默认为模型记录的最新版本）
+        progress: 进度回调 progress(已下载字节数, 总字节数, 字节/秒)，在下载线程中调用
+        cancel: 取消事件，set()后尽快停止下载
         
     Returns:
         是否下载成功
@@ -184,9 +233,54 @@ def download_model_file(session: Session, user: User, model_id: int, local_file_
     model = session.get(Model, model_id)
     if not model:
         return False
+
+    server_path, sha256 = model.file_path, model.sha256
+    version = model.version if version is None else version
+    if version is not None:
+        server_path = version_path(model.file_path, version)
+        record = session.scalar(
+            select(ModelVersion).where(ModelVersion.model_id == model.id, ModelVersion.version == version))
+        sha256 = record.sha256 if record else (sha256 if version == model.version else None)
         
+    # 本地缓存命中时不下载：有摘要时直接按摘要取出，没有摘要的旧记录先向服务器确认内容未变化
+    cache = get_model_cache()
+    alias = None if sha256 else f"{server_path}#{model.id}"
     try:
-        return model_storage_service.download_model_file(user, model.file_path, local_file_path)
+        cached_sha256 = (sha256 or cache.lookup_alias(alias)) if cache is not None else None
+        if cached_sha256 and (sha256 or model_storage_service.content_unchanged(user, server_path, cached_sha256)) \
+                and cache.fetch(cached_sha256, local_file_path):
+            if progress is not None:
+                size = os.path.getsize(local_file_path)
+                progress(size, size, 0.0)
+            return True
+    except Exception as e:
+        print(f"Warning: Model cache unavailable: {e}")
+        cache = None
+
+    try:
+        if not model_storage_service.download_model_file(user, server_path, local_file_path,
+                                                         expected_sha256=sha256, progress=progress, cancel=cancel):
+            return False
     except Exception as e:
         print(f"Warning: Failed to download model file: {e}")
-        return False
\ No newline at end of file
+        return False
+
+    if cache is not None:
+        try:
+            cache.store(local_file_path, sha256=sha256, alias=alias)
+        except Exception as e:
+            print(f"Warning: Failed to cache model file: {e}")
+    return True
+
+
+def get_storage_usage(user: User) -> Optional[dict]:
+    """
+    获取用户在远程服务器上的存储用量（服务器增量维护，不遍历目录）
+
+    Args:
+        user: 用户对象
+
+    Returns:
+        {'bytes', 'files', 'quota_bytes', 'quota_files'}，服务器不可用时返回None
+    """
+    return model_storage_service.get_storage_usage(user)
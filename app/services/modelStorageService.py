@@ -1,114 +1,718 @@
 from __future__ import annotations
+import hashlib
 import os
+import tarfile
+import threading
+import time
+import uuid
+import zlib
 import requests
-from pathlib import Path
-from typing import Optional, Tuple
+from contextlib import ExitStack
+from typing import BinaryIO, Callable, Dict, Iterable, Iterator, List, Optional, Tuple, Union
+from urllib3.fields import RequestField
 from app.db.models import User
 from app.config import config
+from app.services.rangeDownloader import (ChecksumError, DownloadCancelled, ProgressCallback, RangeDownloader,
+                                          _Progress)
+from app.services.httpClient import (BATCH_TIMEOUT, CONNECT_TIMEOUT, QUERY_TIMEOUT, TRANSFER_TIMEOUT,
+                                     PooledHttpClient, backoff_delay, retry_after_seconds)
+from app.services.deltaEncoder import DeltaEncoder
+from app.services.storageBackend import HTTP_BACKEND, LOCAL_BACKEND, StorageBackend
+# 可压缩类型和版本路径的格式与服务器使用同一份定义
+from model_server.compression import is_compressible
+from model_server.versions import parse_version_path
 import json
 
+try:
+    import zstandard
+except ImportError:  # zstd为可选依赖，不可用时用gzip压缩分块
+    zstandard = None
 
-class RemoteModelStorageService:
+# 超过该大小的文件走分块上传协议，失败后只需补传缺失的分块
+CHUNKED_UPLOAD_THRESHOLD = 64 * 1024 * 1024
+UPLOAD_CHUNK_SIZE = 64 * 1024 * 1024
+UPLOAD_CHUNK_MAX_ROUNDS = 5  # 补传缺失分块的最大轮数
+# 不小于该大小的文件上传前先按SHA-256询问服务器，已有相同内容时跳过传输
+HASH_PRECHECK_MIN_SIZE = 1024 * 1024
+HASH_BUFFER_SIZE = 1024 * 1024
+UPLOAD_STREAM_CHUNK_SIZE = 1024 * 1024  # 流式上传时每次从文件对象读取的大小
+LIST_PAGE_SIZE = 1000  # /models/list 每页数量（服务器上限）
+CHANGES_PAGE_SIZE = 1000  # /models/changes 每次最多返回的变更数（服务器上限）
+# 不小于该大小的模型保存新版本时先尝试增量上传（只传与上一版本不同的块）
+DELTA_UPLOAD_MIN_SIZE = 4 * 1024 * 1024
+DELTA_BLOCK_SIZE = 256 * 1024
+DELTA_MAX_LITERAL_RATIO = 0.8  # 变化超过该比例时直接完整上传
+BATCH_MAX_ITEMS = 5000  # 批量删除/查询每个请求的条目数
+# 批量上传只打包小文件（请求体在内存中构造），大文件仍逐个上传以使用秒传和分块续传
+BATCH_UPLOAD_MAX_ITEMS = 1000
+BATCH_UPLOAD_MAX_BYTES = 32 * 1024 * 1024
+# 服务器繁忙（429/503）时的退避重试：等待Retry-After再加上指数增长的随机抖动，
+# 避免同时被拒绝的大量客户端在同一时刻重试
+BUSY_MAX_RETRIES = 8
+BUSY_BACKOFF_BASE = 1.0
+BUSY_BACKOFF_MAX = 60.0
+
+
+def is_version_path(server_path: str) -> bool:
+    return parse_version_path(server_path) is not None
+
+
+def _sha256_file(path: str) -> str:
+    """计算本地文件的SHA-256"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        while True:
+            block = f.read(HASH_BUFFER_SIZE)
+            if not block:
+                break
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class _FileSlice:
     """
-    远程模型存储服务，处理模型文件在远程服务器上的存储
+    文件的一个只读片段，作为requests的请求体时按块流式发送，
+    不需要把整个分块读入内存
+    """
+
+    def __init__(self, path: str, offset: int, length: int, block_size: int = 1024 * 1024,
+                 on_read: Optional[Callable[[int], None]] = None):
+        self._file = open(path, 'rb')
+        self._file.seek(offset)
+        self._remaining = length
+        self._length = length
+        self._block_size = block_size
+        self._on_read = on_read  # 每次读出后以字节数回调（上传进度），回调抛出异常时中止发送
+
+    def __len__(self) -> int:
+        return self._length
+
+    def read(self, size: int = -1) -> bytes:
+        if self._remaining <= 0:
+            return b""
+        if size is None or size < 0 or size > self._remaining:
+            size = self._remaining
+        data = self._file.read(size)
+        self._remaining -= len(data)
+        if self._on_read is not None:
+            self._on_read(len(data))
+        return data
+
+    def __iter__(self):
+        while True:
+            block = self.read(self._block_size)
+            if not block:
+                break
+            yield block
+
+    def close(self) -> None:
+        self._file.close()
+
+
+class UploadCancelled(Exception):
+    """上传被取消"""
+
+
+class _UploadProgress:
+    """
+    上传进度与取消：请求体每读出一块时报告进度，取消事件set()后在下一次读取时抛出UploadCancelled中止请求
+
+    重发请求体（服务器繁忙重试、补传分块）前用rewind回到发送前的进度。
+    """
+
+    def __init__(self, progress: Optional[ProgressCallback], cancel: Optional[threading.Event],
+                 total: Optional[int], done: int = 0):
+        self._progress = _Progress(progress, total, done)
+        self._cancel = cancel
+
+    @property
+    def done(self) -> int:
+        return self._progress.done
+
+    def check_cancelled(self) -> None:
+        if self._cancel is not None and self._cancel.is_set():
+            raise UploadCancelled("上传已取消")
+
+    def __call__(self, amount: int) -> None:
+        self.check_cancelled()
+        self._progress.add(amount)
+
+    def rewind(self, done: int) -> None:
+        self._progress.add(done - self._progress.done)
+
+    def finish(self) -> None:
+        self._progress.add(0, force=True)
+
+
+# save_model_file可以接受的模型内容：内存中的数据、文件对象（read()）或字节块的迭代器
+ModelData = Union[bytes, bytearray, memoryview, BinaryIO, Iterable[bytes]]
+
+
+class ModelDataStream:
+    """
+    待上传的模型内容，按块读出并同时累计大小和SHA-256
+
+    内存中的数据按memoryview切片发送，不复制；文件对象每次读取UPLOAD_STREAM_CHUNK_SIZE；
+    迭代器的块原样发送。上传时内存中只有当前块，读完后size和sha256即为整个内容的大小和摘要。
+    内存中的数据和可seek的文件对象可以重新读取（服务器繁忙时重试），迭代器只能读取一次。
+    """
+
+    def __init__(self, data: ModelData, chunk_size: int = UPLOAD_STREAM_CHUNK_SIZE):
+        self.buffer: Optional[memoryview] = None
+        self._file = None
+        self._iterator: Optional[Iterator] = None
+        self._start: Optional[int] = None
+        self.chunk_size = chunk_size
+        if isinstance(data, (bytes, bytearray, memoryview)):
+            self.buffer = memoryview(data).cast('B')
+        elif hasattr(data, 'read'):
+            self._file = data
+            try:
+                self._start = data.tell() if data.seekable() else None
+            except (AttributeError, OSError):
+                self._start = None
+        else:
+            self._iterator = iter(data)
+        self.consumed = False
+        self._size = 0
+        self._digest = hashlib.sha256()
+
+    @property
+    def restartable(self) -> bool:
+        return self.buffer is not None or self._start is not None
+
+    @property
+    def length(self) -> Optional[int]:
+        """读取前已知的大小（内存中的数据、普通文件），未知时为None"""
+        if self.buffer is not None:
+            return len(self.buffer)
+        if self._file is not None and self._start is not None:
+            try:
+                return os.fstat(self._file.fileno()).st_size - self._start
+            except (AttributeError, OSError, ValueError):
+                return None
+        return None
+
+    @property
+    def size(self) -> int:
+        """已读出的字节数（内存中的数据总是其长度）"""
+        return len(self.buffer) if self.buffer is not None else self._size
+
+    @property
+    def sha256(self) -> str:
+        """已读出内容的SHA-256"""
+        return self._digest.hexdigest()
+
+    def _chunks(self) -> Iterator:
+        if self.buffer is not None:
+            for offset in range(0, len(self.buffer), self.chunk_size):
+                yield self.buffer[offset:offset + self.chunk_size]
+        elif self._file is not None:
+            while True:
+                block = self._file.read(self.chunk_size)
+                if not block:
+                    break
+                yield block
+        else:
+            for block in self._iterator:
+                yield memoryview(block).cast('B') if isinstance(block, memoryview) else block
+
+    def __iter__(self):
+        if self.consumed:
+            if not self.restartable:
+                raise ValueError("模型数据流已被读取，无法重新发送")
+            if self._file is not None:
+                self._file.seek(self._start)
+        self.consumed = True
+        self._size = 0
+        self._digest = hashlib.sha256()
+        for block in self._chunks():
+            if not len(block):
+                continue
+            self._size += len(block)
+            self._digest.update(block)
+            yield block
+
+
+def _multipart_field(boundary: str, name: str, value: str) -> bytes:
+    field = RequestField(name=name, data=value)
+    field.make_multipart()
+    return f"--{boundary}\r\n".encode() + field.render_headers().encode() + str(value).encode() + b"\r\n"
+
+
+def _multipart_head(boundary: str, fields: Dict[str, str], filename: str) -> bytes:
+    """multipart/form-data请求体中文件内容之前的部分：普通字段和文件部分的头"""
+    file_field = RequestField(name='file', data=b"", filename=filename)
+    file_field.make_multipart(content_type='application/octet-stream')
+    return b"".join(_multipart_field(boundary, name, value) for name, value in fields.items()) \
+        + f"--{boundary}\r\n".encode() + file_field.render_headers().encode()
+
+
+def _multipart_tail(boundary: str, trailing: Dict[str, str]) -> bytes:
+    """文件内容之后的部分：读完文件后才能确定的字段（如SHA-256）和结束边界"""
+    return b"\r\n" + b"".join(_multipart_field(boundary, name, value) for name, value in trailing.items()) \
+        + f"--{boundary}--\r\n".encode()
+
+
+def _iter_multipart(boundary: str, fields: Dict[str, str], filename: str, stream: ModelDataStream,
+                    trailing: Callable[[], Dict[str, str]]) -> Iterator:
+    """
+    流式生成multipart/form-data请求体：普通字段、文件内容，最后是读完文件后才能确定的字段（如SHA-256）
+
+    服务器解析完整个请求体后才读取表单字段，放在文件之后的字段同样可以读到。
+    """
+    yield _multipart_head(boundary, fields, filename)
+    yield from stream
+    yield _multipart_tail(boundary, trailing())
+
+
+def _choose_chunk_encoding(local_file_path: str, server_encodings: list) -> Optional[str]:
+    """选择分块的传输编码，不压缩时返回None"""
+    if not config.model_transfer_compression:
+        return None
+    if not is_compressible(local_file_path):
+        return None
+    if zstandard is not None and 'zstd' in server_encodings:
+        return 'zstd'
+    if 'gzip' in server_encodings:
+        return 'gzip'
+    return None
+
+
+def _iter_compressed(body: _FileSlice, encoding: str):
+    """边读边压缩分块（请求以chunked编码发送，不需要预先知道压缩后的长度）"""
+    if encoding == 'zstd':
+        compressor = zstandard.ZstdCompressor(level=3).compressobj()
+    else:
+        compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    for block in body:
+        data = compressor.compress(block)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+class RemoteModelStorageService(StorageBackend):
+    """
+    远程模型存储服务，处理模型文件在远程服务器上的存储（HTTP存储后端）
     """
     
-    def __init__(self):
+    def __init__(self, server_url: Optional[str] = None):
         """
         初始化远程模型存储服务
+
+        Args:
+            server_url: 模型服务地址（可选，默认config.model_server_url）
+        """
+        self.remote_server_url = (server_url or config.model_server_url).rstrip('/')
+        # 共享连接池：同一主机的请求复用keep-alive连接，幂等请求失败时自动重试
+        self.http = PooledHttpClient(pool_size=config.model_server_pool_size,
+                                     max_retries=config.model_server_max_retries)
+        # 条件请求的校验器：再次下载未变化的文件、刷新未变化的列表时服务器返回304
+        # {(用户名, 服务器路径, 本地路径): (ETag, Last-Modified, 本地大小, 本地mtime_ns)}
+        self._download_validators: Dict[tuple, tuple] = {}
+        # {(用户名, 子目录, 前缀): (第一页的ETag, 完整文件列表)}
+        self._list_cache: Dict[tuple, tuple] = {}
+        self._validators_lock = threading.Lock()
+
+    def connection_stats(self) -> Dict[str, int]:
+        """连接池统计：请求数、新建连接数、复用连接的请求数、重试次数、失败数"""
+        return self.http.stats()
+
+    @staticmethod
+    def _send_with_backoff(send: Callable[[], requests.Response]) -> requests.Response:
+        """
+        发送上传请求，服务器繁忙（429/503）时退避后重试
+
+        send每次调用都要重新构造请求体（文件对象、生成器在发送后已被读完）。
+        重试次数用完后返回最后一次的响应。
+        """
+        for attempt in range(BUSY_MAX_RETRIES + 1):
+            response = send()
+            if response.status_code not in (429, 503) or attempt == BUSY_MAX_RETRIES:
+                return response
+            delay = backoff_delay(attempt, response.headers.get('Retry-After'), BUSY_BACKOFF_BASE, BUSY_BACKOFF_MAX)
+            response.close()
+            time.sleep(delay)
+        return response
+
+    def _upload_result(self, user: User, response: requests.Response,
+                       digest: str) -> Tuple[bool, str, str, str, Optional[int]]:
+        """
+        解析上传接口的响应，并核对服务器接收时计算的SHA-256与本地内容一致
+
+        Returns:
+            Tuple[是否成功, 服务器路径, 错误信息, SHA-256, 版本号]
+        """
+        if response.status_code == 200:
+            result = response.json()
+            if not result.get('success'):
+                return False, "", result.get('error', 'Unknown error'), "", None
+            server_path = result.get('server_path', '')
+            server_digest = result.get('sha256') or digest
+            if server_digest != digest:
+                # 服务器没有校验声明的摘要时由客户端发现损坏，不保留损坏的文件
+                self.delete_model_file(user, server_path)
+                return False, "", f"上传内容校验失败: 本地SHA-256 {digest}, 服务器 {server_digest}", "", None
+            return True, server_path, "", server_digest, result.get('version')
+        if response.status_code == 422 and response.json().get('checksum_mismatch'):
+            return False, "", f"上传内容在传输中损坏（SHA-256不一致）: {response.json().get('error')}", "", None
+        return False, "", f"HTTP {response.status_code}: {response.text}", "", None
+
+    def _upload_by_hash(self, user: User, model_name: str, sub_directory: str,
+                        digest: str, size: int) -> Optional[Tuple[str, Optional[int]]]:
         """
-        self.remote_server_url = config.model_server_url.rstrip('/')
+        按内容摘要秒传
+
+        Returns:
+            服务器已有相同内容时返回(server_path, 版本号)，否则返回None（需正常上传）
+        """
+        try:
+            response = self.http.post(
+                f"{self.remote_server_url}/models/upload/by-hash",
+                json={
+                    'username': user.username,
+                    'model_name': model_name,
+                    'sub_directory': sub_directory,
+                    'sha256': digest,
+                    'size': size
+                },
+                idempotent=True,  # 同一内容重复链接到同一路径结果不变
+                timeout=QUERY_TIMEOUT
+            )
+            if response.status_code == 200:
+                result = response.json()
+                if result.get('success'):
+                    return result.get('server_path', ''), result.get('version')
+        except requests.RequestException:
+            pass
+        return None
         
-    def save_model_file(self, user: User, model_name: str, model_data: bytes, 
-                       sub_directory: str = "") -> Tuple[bool, str, str]:
+    def _upload_delta(self, user: User, model_name: str, model_data: memoryview, sub_directory: str,
+                      digest: str, base_server_path: str) -> Optional[Tuple[bool, str, str, str, Optional[int]]]:
+        """
+        相对服务器上的已有文件增量上传
+
+        Returns:
+            上传结果；基准不存在、已变化或变化太多时返回None（需完整上传）
+        """
+        try:
+            response = self.http.get(
+                f"{self.remote_server_url}/models/delta/signatures",
+                params={
+                    'username': user.username,
+                    'server_path': base_server_path,
+                    'block_size': DELTA_BLOCK_SIZE
+                },
+                timeout=TRANSFER_TIMEOUT
+            )
+            if response.status_code != 200:
+                return None
+            base = response.json()
+            if not base.get('success'):
+                return None
+
+            encoder = DeltaEncoder(base['blocks'], base['block_size'], base['size'])
+            ops, literals, literal_bytes = encoder.encode(model_data)
+            if literal_bytes > len(model_data) * DELTA_MAX_LITERAL_RATIO:
+                return None
+
+            recipe = {
+                'username': user.username,
+                'model_name': model_name,
+                'sub_directory': sub_directory,
+                'base_path': base_server_path,
+                'base_sha256': base['sha256'],
+                'block_size': base['block_size'],
+                'size': len(model_data),
+                'sha256': digest,
+                'ops': ops
+            }
+            literal_data = b''.join(literals)
+            response = self._send_with_backoff(lambda: self.http.post(
+                f"{self.remote_server_url}/models/upload/delta",
+                data={'recipe': json.dumps(recipe)},
+                files={'literals': ('literals', literal_data)},
+                params={'username': user.username},  # 服务器据此做每用户的准入控制
+                timeout=TRANSFER_TIMEOUT
+            ))
+            if response.status_code in (409, 422):
+                # 基准在获取签名后被修改，或重建结果不一致
+                return None
+            return self._upload_result(user, response, digest)
+        except requests.RequestException:
+            return None
+
+    def save_model_file(self, user: User, model_name: str, model_data: Union[ModelData, ModelDataStream],
+                        sub_directory: str = "",
+                        base_server_path: Optional[str] = None) -> Tuple[bool, str, str, str, Optional[int]]:
         """
         保存模型文件到远程服务器
+
+        模型数据以分块传输编码流式上传，内存中只保留当前块；SHA-256随发送计算，
+        放在请求体末尾由服务器校验。内存中的数据先按SHA-256尝试秒传和增量上传。
         
         Args:
             user: 用户对象
             model_name: 模型名称
-            model_data: 模型数据
+            model_data: 模型数据：bytes/bytearray/memoryview、文件对象、字节块的迭代器或ModelDataStream
+                （调用方传入ModelDataStream时，上传后可以从中读取大小）
             sub_directory: 子目录（可选）
+            base_server_path: 增量上传的基准文件（可选，默认为目标路径上的上一版本）
             
         Returns:
-            Tuple[是否成功, 服务器路径, 错误信息]
+            Tuple[是否成功, 服务器路径, 错误信息, 内容的SHA-256, 版本号]
         """
         try:
-            # 构建请求数据
-            files = {'file': (model_name, model_data)}
+            stream = model_data if isinstance(model_data, ModelDataStream) else ModelDataStream(model_data)
+            model_data = stream.buffer
+            if model_data is not None and len(model_data) >= HASH_PRECHECK_MIN_SIZE:
+                digest = hashlib.sha256(model_data).hexdigest()
+                linked = self._upload_by_hash(user, model_name, sub_directory, digest, len(model_data))
+                if linked is not None:
+                    return True, linked[0], "", digest, linked[1]
+
+                if config.model_delta_upload and len(model_data) >= DELTA_UPLOAD_MIN_SIZE:
+                    if base_server_path is None:
+                        base_server_path = '/'.join(
+                            part for part in (user.username, sub_directory.strip('/'), model_name) if part)
+                    result = self._upload_delta(user, model_name, model_data, sub_directory,
+                                                digest, base_server_path)
+                    if result is not None:
+                        return result
+
             data = {
                 'username': user.username,
                 'model_name': model_name,
                 'sub_directory': sub_directory
             }
-            
-            # 发送POST请求到远程服务器
-            response = requests.post(
-                f"{self.remote_server_url}/models/upload",
-                files=files,
-                data=data,
-                timeout=300  # 5分钟超时
-            )
-            
-            if response.status_code == 200:
-                result = response.json()
-                if result.get('success'):
-                    return True, result.get('server_path', ''), ""
-                else:
-                    return False, "", result.get('error', 'Unknown error')
-            else:
-                return False, "", f"HTTP {response.status_code}: {response.text}"
+            params = dict(data)  # 服务器据此在接收文件前检查配额
+            if stream.length is not None:
+                params['size'] = stream.length
+            boundary = uuid.uuid4().hex
+
+            def send():
+                if stream.consumed and not stream.restartable:
+                    raise Exception("服务器繁忙，模型数据流只能读取一次，无法重试")
+                return self.http.post(
+                    f"{self.remote_server_url}/models/upload",
+                    # 服务器接收时按末尾的sha256校验，不一致则不保存
+                    data=_iter_multipart(boundary, data, model_name, stream, lambda: {'sha256': stream.sha256}),
+                    headers={'Content-Type': f'multipart/form-data; boundary={boundary}'},
+                    params=params,
+                    timeout=TRANSFER_TIMEOUT
+                )
+
+            response = self._send_with_backoff(send)
+            return self._upload_result(user, response, stream.sha256)
         except Exception as e:
-            return False, "", str(e)
+            return False, "", str(e), "", None
             
     def upload_model_file(self, user: User, local_file_path: str, 
-                         model_name: str = None, sub_directory: str = "") -> Tuple[bool, str, str]:
+                         model_name: str = None, sub_directory: str = "",
+                         progress: Optional[ProgressCallback] = None,
+                         cancel: Optional[threading.Event] = None) -> Tuple[bool, str, str, str, Optional[int]]:
         """
         上传本地模型文件到远程服务器
+
+        文件内容从磁盘流式发送，不读入内存。
         
         Args:
             user: 用户对象
             local_file_path: 本地文件路径
             model_name: 模型名称（可选，默认使用文件名）
             sub_directory: 子目录（可选）
+            progress: 进度回调 progress(已上传字节数, 总字节数, 字节/秒)，在上传线程中调用
+            cancel: 取消事件，set()后尽快停止上传（分块上传已完成的分块保留，再次上传时续传）
             
         Returns:
-            Tuple[是否成功, 服务器路径, 错误信息]
+            Tuple[是否成功, 服务器路径, 错误信息, 内容的SHA-256, 版本号]
         """
         try:
             if not os.path.exists(local_file_path):
-                return False, "", "本地文件不存在"
+                return False, "", "本地文件不存在", "", None
                 
             if model_name is None:
                 model_name = os.path.basename(local_file_path)
+
+            # 本地摘要只计算一次：用于秒传查询，也随上传声明给服务器校验
+            file_size = os.path.getsize(local_file_path)
+            digest = _sha256_file(local_file_path)
+            tracker = _UploadProgress(progress, cancel, file_size)
+            tracker.check_cancelled()
+            if file_size >= HASH_PRECHECK_MIN_SIZE:
+                linked = self._upload_by_hash(user, model_name, sub_directory, digest, file_size)
+                if linked is not None:
+                    tracker.rewind(file_size)
+                    tracker.finish()
+                    return True, linked[0], "", digest, linked[1]
+
+            # 大文件使用可续传的分块上传
+            if file_size >= CHUNKED_UPLOAD_THRESHOLD:
+                return self.upload_model_file_chunked(user, local_file_path, model_name, sub_directory,
+                                                      sha256=digest, progress=progress, cancel=cancel)
                 
             # 发送文件到远程服务器
-            with open(local_file_path, 'rb') as f:
-                files = {'file': (model_name, f)}
-                data = {
+            data = {
+                'username': user.username,
+                'model_name': model_name,
+                'sub_directory': sub_directory
+            }
+            params = {**data, 'size': file_size}  # 服务器据此在接收文件前检查配额
+            boundary = uuid.uuid4().hex
+
+            def send():
+                tracker.rewind(0)
+                body = _FileSlice(local_file_path, 0, file_size, block_size=UPLOAD_STREAM_CHUNK_SIZE,
+                                  on_read=tracker)
+                try:
+                    return self.http.post(
+                        f"{self.remote_server_url}/models/upload",
+                        # 服务器接收时按sha256校验，不一致则不保存
+                        data=_iter_multipart(boundary, data, model_name, ModelDataStream(body),
+                                             lambda: {'sha256': digest}),
+                        headers={'Content-Type': f'multipart/form-data; boundary={boundary}'},
+                        params=params,
+                        timeout=TRANSFER_TIMEOUT
+                    )
+                finally:
+                    body.close()
+
+            response = self._send_with_backoff(send)
+            tracker.finish()
+            return self._upload_result(user, response, digest)
+        except Exception as e:
+            return False, "", str(e), "", None
+            
+    def upload_model_file_chunked(self, user: User, local_file_path: str, model_name: str = None,
+                                  sub_directory: str = "", chunk_size: int = UPLOAD_CHUNK_SIZE,
+                                  sha256: Optional[str] = None, progress: Optional[ProgressCallback] = None,
+                                  cancel: Optional[threading.Event] = None
+                                  ) -> Tuple[bool, str, str, str, Optional[int]]:
+        """
+        分块上传本地模型文件
+
+        以文件路径、大小和修改时间作为resume_key创建会话，中断后再次调用会复用
+        服务器上的会话，只补传服务器还没有的分块。
+
+        Args:
+            user: 用户对象
+            local_file_path: 本地文件路径
+            model_name: 模型名称（可选，默认使用文件名）
+            sub_directory: 子目录（可选）
+            chunk_size: 分块大小
+            sha256: 本地文件的SHA-256（可选，未提供时先计算），提交时服务器据此校验
+            progress: 进度回调 progress(已上传字节数, 总字节数, 字节/秒)，服务器已有的分块计为已上传
+            cancel: 取消事件，set()后在当前块读完时停止，已上传的分块保留在服务器的会话中
+
+        Returns:
+            Tuple[是否成功, 服务器路径, 错误信息, 内容的SHA-256, 版本号]
+        """
+        try:
+            if not os.path.exists(local_file_path):
+                return False, "", "本地文件不存在", "", None
+
+            if model_name is None:
+                model_name = os.path.basename(local_file_path)
+            if sha256 is None:
+                sha256 = _sha256_file(local_file_path)
+
+            stat = os.stat(local_file_path)
+            resume_key = f"{os.path.abspath(local_file_path)}:{stat.st_size}:{stat.st_mtime_ns}"
+
+            # 创建（或恢复）上传会话
+            response = self.http.post(
+                f"{self.remote_server_url}/models/upload/sessions",
+                json={
                     'username': user.username,
                     'model_name': model_name,
-                    'sub_directory': sub_directory
-                }
-                
-                response = requests.post(
-                    f"{self.remote_server_url}/models/upload",
-                    files=files,
-                    data=data,
-                    timeout=300  # 5分钟超时
+                    'sub_directory': sub_directory,
+                    'total_size': stat.st_size,
+                    'chunk_size': chunk_size,
+                    'resume_key': resume_key
+                },
+                idempotent=True,  # 相同resume_key复用已有会话
+                timeout=QUERY_TIMEOUT
+            )
+            if response.status_code != 200:
+                return False, "", f"HTTP {response.status_code}: {response.text}", "", None
+            session = response.json()
+            if not session.get('success'):
+                return False, "", session.get('error', 'Unknown error'), "", None
+
+            session_id = session['session_id']
+            chunk_size = session['chunk_size']
+            received = set(session.get('received', []))
+            chunk_count = session['chunk_count']
+            encoding = _choose_chunk_encoding(local_file_path, session.get('accept_encodings', []))
+
+            def chunk_length(index: int) -> int:
+                return min(chunk_size, stat.st_size - index * chunk_size)
+
+            tracker = _UploadProgress(progress, cancel, stat.st_size,
+                                      done=sum(chunk_length(index) for index in received))
+
+            last_error = ""
+            for _ in range(UPLOAD_CHUNK_MAX_ROUNDS):
+                missing = [i for i in range(chunk_count) if i not in received]
+                if not missing:
+                    break
+
+                headers = {'Content-Type': 'application/octet-stream'}
+                if encoding:
+                    headers['Content-Encoding'] = encoding
+                for index in missing:
+                    chunk_start = tracker.done
+
+                    def send_chunk(index=index):
+                        tracker.rewind(chunk_start)
+                        body = _FileSlice(local_file_path, index * chunk_size, chunk_length(index),
+                                          on_read=tracker)
+                        try:
+                            return self.http.put(
+                                f"{self.remote_server_url}/models/upload/sessions/{session_id}/chunks/{index}",
+                                params={'username': user.username},
+                                data=_iter_compressed(body, encoding) if encoding else body,
+                                headers=headers,
+                                timeout=TRANSFER_TIMEOUT
+                            )
+                        finally:
+                            body.close()
+
+                    try:
+                        response = self._send_with_backoff(send_chunk)
+                        if response.status_code != 200:
+                            last_error = f"HTTP {response.status_code}: {response.text}"
+                            tracker.rewind(chunk_start)
+                    except requests.RequestException as e:
+                        last_error = str(e)
+                        tracker.rewind(chunk_start)
+
+                # 以服务器记录为准重新计算缺失分块
+                response = self.http.get(
+                    f"{self.remote_server_url}/models/upload/sessions/{session_id}",
+                    params={'username': user.username},
+                    timeout=QUERY_TIMEOUT
                 )
-                
-            if response.status_code == 200:
-                result = response.json()
-                if result.get('success'):
-                    return True, result.get('server_path', ''), ""
-                else:
-                    return False, "", result.get('error', 'Unknown error')
+                if response.status_code != 200:
+                    return False, "", f"HTTP {response.status_code}: {response.text}", "", None
+                received = set(response.json().get('received', []))
             else:
-                return False, "", f"HTTP {response.status_code}: {response.text}"
+                if len(received) < chunk_count:
+                    return False, "", f"分块上传未完成: {last_error}", "", None
+
+            # 提交会话（服务器用声明的SHA-256校验拼接结果）
+            tracker.check_cancelled()
+            tracker.finish()
+            response = self.http.post(
+                f"{self.remote_server_url}/models/upload/sessions/{session_id}/commit",
+                json={'username': user.username, 'sha256': sha256},
+                timeout=TRANSFER_TIMEOUT
+            )
+            return self._upload_result(user, response, sha256)
         except Exception as e:
-            return False, "", str(e)
-            
+            return False, "", str(e), "", None
+
     def delete_model_file(self, user: User, server_relative_path: str) -> bool:
         """
         删除远程服务器上的模型文件
@@ -122,13 +726,13 @@ class RemoteModelStorageService:
         """
         try:
             # 发送删除请求到远程服务器
-            response = requests.delete(
+            response = self.http.delete(
                 f"{self.remote_server_url}/models/delete",
                 json={
                     'username': user.username,
                     'server_path': server_relative_path
                 },
-                timeout=60
+                timeout=QUERY_TIMEOUT
             )
             
             if response.status_code == 200:
@@ -139,64 +743,598 @@ class RemoteModelStorageService:
             return False
             
     def download_model_file(self, user: User, server_relative_path: str, 
-                           local_file_path: str) -> bool:
+                           local_file_path: str, expected_sha256: Optional[str] = None,
+                           progress: Optional[ProgressCallback] = None,
+                           cancel: Optional[threading.Event] = None) -> bool:
         """
         从远程服务器下载模型文件
+
+        内容分块流式写入目标旁边的.part文件，完成并fsync后原子地重命名，内存占用与文件大小无关。
+        下载时边写入边计算SHA-256，与expected_sha256（未提供时为服务器声明的摘要）不一致时
+        视为传输损坏，不替换本地文件。
+
+        版本路径（model_server.versions.version_path）的内容不会变化：本地文件是本进程上次下载的结果，
+        或与expected_sha256一致时直接使用，不请求服务器。
         
         Args:
             user: 用户对象
             server_relative_path: 服务器上的相对路径
             local_file_path: 本地保存路径
+            expected_sha256: 预期的内容SHA-256（可选，如模型记录中保存的摘要）
+            progress: 进度回调 progress(已下载字节数, 总字节数, 字节/秒)，在下载线程中调用
+            cancel: 取消事件，set()后尽快停止下载（已完成的分段保留，再次下载可续传）
             
         Returns:
-            是否下载成功
+            是否下载成功（取消时返回False）
         """
         try:
-            # 发送下载请求到远程服务器
-            response = requests.post(
+            # 本地文件仍是上次下载的版本时带上校验器，远程未变化则不重新下载
+            key = (user.username, server_relative_path, os.path.abspath(local_file_path))
+            with self._validators_lock:
+                validators = self._download_validators.get(key)
+            etag = last_modified = None
+            if validators and os.path.isfile(local_file_path):
+                stat = os.stat(local_file_path)
+                if validators[2:] == (stat.st_size, stat.st_mtime_ns):
+                    etag, last_modified = validators[:2]
+            if is_version_path(server_relative_path):
+                if etag is not None or last_modified is not None:
+                    return True
+                if expected_sha256 and os.path.isfile(local_file_path) \
+                        and _sha256_file(local_file_path) == expected_sha256:
+                    return True
+
+            os.makedirs(os.path.dirname(os.path.abspath(local_file_path)), exist_ok=True)
+            # 多个Range请求并行下载到预分配的.part文件，中断后再次调用可续传
+            downloader = RangeDownloader(
                 f"{self.remote_server_url}/models/download",
-                json={
+                params={
                     'username': user.username,
                     'server_path': server_relative_path
                 },
-                timeout=300  # 5分钟超时
+                timeout=TRANSFER_TIMEOUT,
+                session=self.http.session  # 分段请求自带重试，直接使用共享连接池的会话
             )
-            
-            if response.status_code == 200:
-                # 保存文件到本地
-                with open(local_file_path, 'wb') as f:
-                    f.write(response.content)
-                return True
+            downloader.download(local_file_path, etag=etag, last_modified=last_modified,
+                                expected_sha256=expected_sha256, progress=progress, cancel=cancel)
+
+            if downloader.etag or downloader.last_modified:
+                stat = os.stat(local_file_path)
+                with self._validators_lock:
+                    self._download_validators[key] = (downloader.etag, downloader.last_modified,
+                                                      stat.st_size, stat.st_mtime_ns)
+            return True
+        except ChecksumError as e:
+            print(f"Warning: {e}")
+            return False
+        except DownloadCancelled:
             return False
         except Exception:
             return False
             
-    def list_user_files(self, user: User) -> list:
+    def content_unchanged(self, user: User, server_relative_path: str, sha256: str) -> Optional[bool]:
+        """
+        用条件请求确认远程文件内容仍为sha256（不传输内容）
+
+        ETag是内容的SHA-256，HEAD请求带If-None-Match并只接受原始编码，未变化时服务器返回304。
+
+        Returns:
+            True 未变化，False 已变化或不存在，None 服务器不可用
         """
-        列出用户的所有模型文件
+        try:
+            response = self.http.request(
+                'HEAD',
+                f"{self.remote_server_url}/models/download",
+                idempotent=True,
+                params={'username': user.username, 'server_path': server_relative_path},
+                headers={'If-None-Match': f'"{sha256}"', 'Accept-Encoding': 'identity'}
+            )
+        except requests.RequestException:
+            return None
+        if response.status_code == 304:
+            return True
+        if response.status_code == 200:
+            return response.headers.get('X-Content-SHA256') == sha256
+        return False if response.status_code == 404 else None
+
+    def _post_batch(self, route: str, user: User, server_paths: List[str]) -> List[dict]:
+        """按BATCH_MAX_ITEMS分组调用批量接口，返回按顺序合并的逐项结果"""
+        results = []
+        for i in range(0, len(server_paths), BATCH_MAX_ITEMS):
+            response = self.http.post(
+                f"{self.remote_server_url}{route}",
+                json={'username': user.username, 'server_paths': server_paths[i:i + BATCH_MAX_ITEMS]},
+                idempotent=True,  # 批量删除和查询都可以安全地重复发送
+                timeout=BATCH_TIMEOUT
+            )
+            if response.status_code != 200:
+                raise Exception(f"HTTP {response.status_code}: {response.text}")
+            result = response.json()
+            if not result.get('success'):
+                raise Exception(result.get('error', 'Unknown error'))
+            results.extend(result.get('results', []))
+        return results
+
+    def delete_model_files(self, user: User, server_relative_paths: List[str]) -> Dict[str, bool]:
+        """
+        批量删除远程服务器上的模型文件
+
+        Args:
+            user: 用户对象
+            server_relative_paths: 服务器上的相对路径列表
+
+        Returns:
+            {服务器路径: 是否删除成功}；请求失败的条目为False
+        """
+        deleted = {path: False for path in server_relative_paths}
+        try:
+            for item in self._post_batch('/models/batch/delete', user, list(server_relative_paths)):
+                deleted[item['server_path']] = item.get('success', False)
+        except Exception:
+            pass
+        return deleted
+
+    def stat_model_files(self, user: User, server_relative_paths: List[str]) -> Dict[str, Optional[dict]]:
+        """
+        批量查询远程模型文件信息
+
+        Args:
+            user: 用户对象
+            server_relative_paths: 服务器上的相对路径列表
+
+        Returns:
+            {服务器路径: {name, size, modified, sha256}}，文件不存在时为None
+
+        Raises:
+            Exception: 请求失败
+        """
+        stats = {}
+        for item in self._post_batch('/models/batch/stat', user, list(server_relative_paths)):
+            if item.get('exists'):
+                stats[item['server_path']] = {
+                    'name': item['name'],
+                    'size': item['size'],
+                    'modified': item['modified'],
+                    'sha256': item.get('sha256')
+                }
+            else:
+                stats[item['server_path']] = None
+        return stats
+
+    def upload_model_files(self, user: User, local_file_paths: List[str],
+                           sub_directory: str = "") -> List[Tuple[bool, str, str, str, Optional[int]]]:
+        """
+        批量上传本地模型文件（使用文件名作为模型名称）
+
+        小文件打包成批量请求上传，大文件逐个走upload_model_file。
+
+        Args:
+            user: 用户对象
+            local_file_paths: 本地文件路径列表
+            sub_directory: 子目录（可选）
+
+        Returns:
+            与local_file_paths一一对应的[(是否成功, 服务器路径, 错误信息, SHA-256, 版本号)]
+        """
+        results: List[Optional[Tuple[bool, str, str, str, Optional[int]]]] = [None] * len(local_file_paths)
+        batch: List[int] = []
+        batch_bytes = 0
+
+        for i, local_file_path in enumerate(local_file_paths):
+            if not os.path.isfile(local_file_path):
+                results[i] = (False, "", "本地文件不存在", "", None)
+                continue
+            file_size = os.path.getsize(local_file_path)
+            if file_size >= HASH_PRECHECK_MIN_SIZE:
+                results[i] = self.upload_model_file(user, local_file_path, sub_directory=sub_directory)
+                continue
+            if batch and (len(batch) >= BATCH_UPLOAD_MAX_ITEMS or batch_bytes + file_size > BATCH_UPLOAD_MAX_BYTES):
+                self._upload_batch(user, local_file_paths, batch, sub_directory, results)
+                batch, batch_bytes = [], 0
+            batch.append(i)
+            batch_bytes += file_size
+
+        if batch:
+            self._upload_batch(user, local_file_paths, batch, sub_directory, results)
+        return results
+
+    def _upload_batch(self, user: User, local_file_paths: List[str], indexes: List[int],
+                      sub_directory: str, results: list) -> None:
+        """用一个请求上传local_file_paths中indexes对应的文件，结果写入results"""
+        try:
+            names = [os.path.basename(local_file_paths[i]) for i in indexes]
+            digests = [_sha256_file(local_file_paths[i]) for i in indexes]
+
+            def send():
+                with ExitStack() as stack:
+                    files = [('files', (name, stack.enter_context(open(local_file_paths[i], 'rb'))))
+                             for i, name in zip(indexes, names)]
+                    return self.http.post(
+                        f"{self.remote_server_url}/models/batch/upload",
+                        files=files,
+                        data={
+                            'username': user.username,
+                            'sub_directory': sub_directory,
+                            'model_names': names,
+                            'sha256': digests
+                        },
+                        params={'username': user.username},
+                        timeout=TRANSFER_TIMEOUT
+                    )
+
+            response = self._send_with_backoff(send)
+            if response.status_code != 200:
+                raise Exception(f"HTTP {response.status_code}: {response.text}")
+            result = response.json()
+            if not result.get('success'):
+                raise Exception(result.get('error', 'Unknown error'))
+            for i, digest, item in zip(indexes, digests, result.get('results', [])):
+                if item.get('success') and item.get('sha256', digest) == digest:
+                    results[i] = (True, item.get('server_path', ''), "", digest, item.get('version'))
+                elif item.get('success'):
+                    self.delete_model_file(user, item.get('server_path', ''))
+                    results[i] = (False, "", f"上传内容校验失败: 本地SHA-256 {digest}, 服务器 {item['sha256']}",
+                                  "", None)
+                else:
+                    results[i] = (False, "", item.get('error', 'Unknown error'), "", None)
+        except Exception as e:
+            for i in indexes:
+                results[i] = (False, "", str(e), "", None)
+
+    def get_storage_usage(self, user: User) -> Optional[dict]:
+        """
+        查询用户在服务器上的存储用量和配额
+
+        Args:
+            user: 用户对象
+
+        Returns:
+            {'bytes', 'files', 'quota_bytes', 'quota_files'}（配额为None表示不限制）；失败时返回None
+        """
+        try:
+            response = self.http.get(
+                f"{self.remote_server_url}/models/usage",
+                params={'username': user.username},
+                timeout=QUERY_TIMEOUT
+            )
+            if response.status_code != 200:
+                return None
+            result = response.json()
+            if not result.get('success'):
+                return None
+            return {key: result.get(key) for key in ('bytes', 'files', 'quota_bytes', 'quota_files')}
+        except Exception:
+            return None
+
+    def list_model_versions(self, user: User, server_relative_path: str,
+                            limit: Optional[int] = None) -> Optional[List[dict]]:
+        """
+        查询服务器上文件的版本（从新到旧），limit=1即为最新版本
+
+        Args:
+            user: 用户对象
+            server_relative_path: 服务器上的相对路径
+            limit: 最多返回的版本数（可选）
+
+        Returns:
+            [{'version', 'version_path', 'sha256', 'size', 'created'}]；文件不存在或失败时返回None
+        """
+        try:
+            params = {'username': user.username, 'server_path': server_relative_path}
+            if limit is not None:
+                params['limit'] = limit
+            response = self.http.get(f"{self.remote_server_url}/models/versions", params=params)
+            if response.status_code != 200:
+                return None
+            result = response.json()
+            if not result.get('success'):
+                return None
+            return result.get('versions', [])
+        except Exception:
+            return None
+
+    def get_changes(self, user: User, since: Optional[int] = None, wait: float = 0,
+                    limit: int = CHANGES_PAGE_SIZE) -> Optional[dict]:
+        """
+        查询用户文件在序号since之后的变更
+
+        Args:
+            user: 用户对象
+            since: 已处理到的序号，None表示只查询当前最新序号
+            wait: 没有新变更时服务器最多等待的秒数（长轮询，服务器上限30秒）
+            limit: 最多返回的变更数
+
+        Returns:
+            {'changes': [{'seq', 'op', 'path', 'name', ...}], 'next_seq', 'reset', 'retry_after'}，
+            op为upsert（带size/modified/sha256）或delete；reset为True时需要全量重新列出；
+            retry_after为服务器等待的请求过多而未等待时建议的轮询间隔（秒），否则为None。失败时返回None
+        """
+        try:
+            params = {'username': user.username, 'limit': limit, 'wait': wait}
+            if since is not None:
+                params['since'] = since
+            response = self.http.get(f"{self.remote_server_url}/models/changes", params=params,
+                                     timeout=(CONNECT_TIMEOUT, wait + QUERY_TIMEOUT[1]))
+            if response.status_code != 200:
+                return None
+            result = response.json()
+            if not result.get('success'):
+                return None
+            retry_after = response.headers.get('Retry-After')
+            return {
+                'changes': result.get('changes', []),
+                'next_seq': result['next_seq'],
+                'reset': bool(result.get('reset')),
+                'retry_after': retry_after_seconds(retry_after) if retry_after else None
+            }
+        except Exception:
+            return None
+
+    def download_directory(self, user: User, sub_directory: str,
+                           local_dir: str) -> Tuple[bool, List[str], str]:
+        """
+        以一个tar流下载整个子目录，边下载边解包
+
+        归档内的路径以子目录名开头（sub_directory为空时为用户名），
+        即 sub_directory="exp/run42" 会解包到 local_dir/run42/ 下。
+
+        Args:
+            user: 用户对象
+            sub_directory: 服务器上的子目录，空字符串表示用户的全部文件
+            local_dir: 本地目标目录
+
+        Returns:
+            Tuple[是否成功, 已解包的本地文件列表, 错误信息]
+        """
+        extracted: List[str] = []
+        try:
+            root = os.path.abspath(local_dir)
+            with self.http.get(
+                f"{self.remote_server_url}/models/archive",
+                params={'username': user.username, 'sub_directory': sub_directory, 'format': 'tar'},
+                stream=True,
+                timeout=TRANSFER_TIMEOUT
+            ) as response:
+                if response.status_code != 200:
+                    return False, extracted, f"HTTP {response.status_code}: {response.text}"
+                response.raw.decode_content = True
+
+                # "r|" 顺序读取流，不需要seek，也不会缓存整个归档
+                with tarfile.open(fileobj=response.raw, mode='r|') as archive:
+                    for member in archive:
+                        if not member.isfile():
+                            continue
+                        local_path = os.path.abspath(os.path.join(root, *member.name.split('/')))
+                        if os.path.commonpath([root, local_path]) != root:
+                            return False, extracted, f"归档中的路径不安全: {member.name}"
+                        os.makedirs(os.path.dirname(local_path), exist_ok=True)
+
+                        part_path = local_path + '.part'
+                        source = archive.extractfile(member)
+                        with open(part_path, 'wb') as f:
+                            while True:
+                                block = source.read(HASH_BUFFER_SIZE)
+                                if not block:
+                                    break
+                                f.write(block)
+                        os.replace(part_path, local_path)
+                        extracted.append(local_path)
+            return True, extracted, ""
+        except Exception as e:
+            return False, extracted, str(e)
+
+    def list_user_files_page(self, user: User, sub_directory: str = "", prefix: str = "",
+                             sort: str = "path", descending: bool = False,
+                             limit: int = LIST_PAGE_SIZE,
+                             cursor: Optional[str] = None) -> Tuple[list, Optional[str]]:
+        """
+        分页列出用户的模型文件
+
+        Args:
+            user: 用户对象
+            sub_directory: 只列出该子目录下的文件
+            prefix: 文件名前缀
+            sort: 排序列 path/name/size/modified
+            descending: 是否降序
+            limit: 每页数量
+            cursor: 上一页返回的游标
+
+        Returns:
+            Tuple[文件列表, 下一页游标（没有更多时为None）]
+        """
+        files, next_cursor, _ = self._list_page(user, sub_directory, prefix, sort, descending, limit, cursor)
+        return files, next_cursor
+
+    def _list_page(self, user: User, sub_directory: str, prefix: str, sort: str, descending: bool,
+                   limit: int, cursor: Optional[str],
+                   etag: Optional[str] = None) -> Tuple[Optional[list], Optional[str], Optional[str]]:
+        """
+        请求一页文件列表
+
+        Returns:
+            Tuple[文件列表, 下一页游标, ETag]；带etag且列表未变化（304）时文件列表为None
+        """
+        response = self.http.post(
+            f"{self.remote_server_url}/models/list",
+            json={
+                'username': user.username,
+                'sub_directory': sub_directory,
+                'prefix': prefix,
+                'sort': sort,
+                'order': 'desc' if descending else 'asc',
+                'limit': limit,
+                'cursor': cursor
+            },
+            headers={'If-None-Match': etag} if etag else None,
+            idempotent=True,
+            timeout=QUERY_TIMEOUT
+        )
+        if response.status_code == 304:
+            return None, None, etag
+        if response.status_code != 200:
+            raise Exception(f"HTTP {response.status_code}: {response.text}")
+        result = response.json()
+        if not result.get('success'):
+            raise Exception(result.get('error', 'Unknown error'))
+        return result.get('files', []), result.get('next_cursor'), response.headers.get('ETag')
+
+    def list_user_files(self, user: User, sub_directory: str = "", prefix: str = "") -> list:
+        """
+        列出用户的所有模型文件（按页拉取）
         
         Args:
             user: 用户对象
+            sub_directory: 只列出该子目录下的文件（可选）
+            prefix: 文件名前缀（可选）
             
         Returns:
             文件列表
         """
         try:
-            # 发送请求到远程服务器获取文件列表
-            response = requests.post(
-                f"{self.remote_server_url}/models/list",
-                json={'username': user.username},
-                timeout=60
-            )
-            
-            if response.status_code == 200:
-                result = response.json()
-                if result.get('success'):
-                    return result.get('files', [])
-            return []
+            # 第一页的ETag随用户任何文件变化而改变，第一页未变化即整个列表未变化
+            key = (user.username, sub_directory, prefix)
+            with self._validators_lock:
+                cached = self._list_cache.get(key)
+
+            page, cursor, etag = self._list_page(user, sub_directory, prefix, 'path', False,
+                                                 LIST_PAGE_SIZE, None, etag=cached[0] if cached else None)
+            if page is None:
+                return list(cached[1])
+
+            files = list(page)
+            while cursor:
+                page, cursor = self.list_user_files_page(
+                    user, sub_directory=sub_directory, prefix=prefix, cursor=cursor)
+                files.extend(page)
+
+            if etag:
+                with self._validators_lock:
+                    self._list_cache[key] = (etag, files)
+            return list(files)
         except Exception:
             return []
 
 
+class ModelListMirror:
+    """
+    服务器文件列表的本地镜像
+
+    首次同步时全量列出文件并记下变更序号，之后只拉取该序号之后的变更应用到本地，
+    不再重复列出整个目录；服务器要求重新同步（变更已过期或索引被重建）时自动全量列出。
+    """
+
+    def __init__(self, service: StorageBackend, user: User, sub_directory: str = ""):
+        """
+        Args:
+            service: 模型存储后端
+            user: 用户对象
+            sub_directory: 只镜像该子目录下的文件
+        """
+        self.service = service
+        self.user = user
+        self.sub_directory = sub_directory.replace('\\', '/').strip('/')
+        # server_path由服务器按自身的路径分隔符拼接（Windows上为反斜杠），比较前统一成'/'
+        self._prefix = '/'.join(filter(None, (user.username, self.sub_directory))) + '/'
+        self.seq: Optional[int] = None
+        self._files: Dict[str, dict] = {}
+        self._lock = threading.Lock()
+
+    def files(self) -> List[dict]:
+        """当前镜像的文件列表（按路径排序）"""
+        with self._lock:
+            return [dict(self._files[path]) for path in sorted(self._files)]
+
+    def get(self, server_path: str) -> Optional[dict]:
+        with self._lock:
+            record = self._files.get(server_path)
+            return dict(record) if record else None
+
+    def sync(self, wait: float = 0) -> Optional[List[dict]]:
+        """
+        同步到服务器的最新状态
+
+        Args:
+            wait: 没有新变更时最多等待的秒数（长轮询），0表示立即返回
+
+        Returns:
+            本次应用到镜像的变更（全量重新同步时为新旧列表的差异）；失败时返回None
+        """
+        if self.seq is None:
+            return self._resync()
+        applied = []
+        while True:
+            result = self.service.get_changes(self.user, since=self.seq, wait=wait)
+            if result is None:
+                return None
+            if result['reset']:
+                return self._resync()
+            with self._lock:
+                for change in result['changes']:
+                    if self._in_scope(change['path']):
+                        self._apply(change)
+                        applied.append(change)
+                self.seq = result['next_seq']
+            if len(result['changes']) < CHANGES_PAGE_SIZE:
+                break
+            wait = 0  # 还有更多变更，继续拉取
+        if not applied and wait > 0 and result['retry_after']:
+            # 服务器没有等待，按建议的间隔等待后再返回，避免调用方立即重试
+            time.sleep(result['retry_after'])
+        return applied
+
+    def _in_scope(self, server_path: str) -> bool:
+        return server_path.replace('\\', '/').startswith(self._prefix)
+
+    def _apply(self, change: dict) -> None:
+        if change['op'] == 'delete':
+            self._files.pop(change['path'], None)
+        else:
+            self._files[change['path']] = {key: change.get(key) for key in
+                                           ('name', 'path', 'size', 'modified', 'sha256')}
+
+    def _resync(self) -> Optional[List[dict]]:
+        # 先取序号再列出：列出期间发生的变更会在下次同步时重放，按路径应用是幂等的
+        result = self.service.get_changes(self.user)
+        if result is None:
+            return None
+        files: Dict[str, dict] = {}
+        try:
+            cursor = None
+            while True:
+                page, cursor = self.service.list_user_files_page(self.user, sub_directory=self.sub_directory,
+                                                                 cursor=cursor)
+                files.update((f['path'], dict(f)) for f in page)
+                if not cursor:
+                    break
+        except Exception:
+            return None
+
+        with self._lock:
+            old, self._files = self._files, files
+            self.seq = result['next_seq']
+        changes = [{'op': 'delete', 'path': path, 'name': record['name']}
+                   for path, record in old.items() if path not in files]
+        changes.extend(dict(record, op='upsert') for path, record in files.items()
+                       if old.get(path, {}).get('modified') != record['modified']
+                       or old.get(path, {}).get('size') != record['size'])
+        return changes
+
+
+def create_storage_backend(backend: Optional[str] = None) -> StorageBackend:
+    """
+    按配置创建模型存储后端
+
+    Args:
+        backend: http（经远程模型服务）或local（直接读写本机的模型目录），默认config.model_storage_backend
+    """
+    backend = backend or config.model_storage_backend
+    if backend == HTTP_BACKEND:
+        return RemoteModelStorageService()
+    if backend == LOCAL_BACKEND:
+        from app.services.localModelStorageService import LocalModelStorageService
+        return LocalModelStorageService(config.model_storage_local_path or None)
+    raise ValueError(f"Unknown model storage backend: {backend}")
+
+
 # 全局实例
-model_storage_service = RemoteModelStorageService()
\ No newline at end of file
+model_storage_service = create_storage_backend()
\ No newline at end of file
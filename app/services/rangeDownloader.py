@@ -0,0 +1,373 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Callable, Optional, Tuple, Union
+
+import requests
+
+DOWNLOAD_WORKERS = 4  # 同时进行的Range请求数量
+DOWNLOAD_SEGMENT_SIZE = 8 * 1024 * 1024  # 每个分段的大小
+SEGMENT_MAX_RETRIES = 3
+WRITE_BUFFER_SIZE = 1024 * 1024
+PROGRESS_INTERVAL = 0.2  # 进度回调的最小间隔（秒）
+
+# progress(已下载字节数, 总字节数（未知时为None）, 本次下载的平均速度 字节/秒)
+ProgressCallback = Callable[[int, Optional[int], float], None]
+
+
+class DownloadError(Exception):
+    """下载失败，已完成的分段会保留在.part文件中供下次续传"""
+
+
+class ChecksumError(DownloadError):
+    """下载结果的SHA-256与预期不一致（.part文件已删除，再次下载会从头开始）"""
+
+
+class DownloadCancelled(DownloadError):
+    """下载被取消，已完成的分段保留在.part文件中，再次下载可续传"""
+
+
+def discard_partial_download(local_file_path: str) -> None:
+    """删除下载到local_file_path时保留的.part文件和续传记录（放弃续传）"""
+    part_path = local_file_path + '.part'
+    for path in (part_path, part_path + '.json'):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+def _durable_replace(src: str, dst: str) -> None:
+    """把src的内容刷到磁盘后原子地重命名为dst，并同步所在目录（断电后不会出现内容不完整的目标文件）"""
+    with open(src, 'ab') as f:
+        os.fsync(f.fileno())
+    os.replace(src, dst)
+    if os.name == 'posix':
+        fd = os.open(os.path.dirname(os.path.abspath(dst)), os.O_RDONLY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+
+class _Progress:
+    """多个分段线程共享的进度，按PROGRESS_INTERVAL节流回调"""
+
+    def __init__(self, callback: Optional[ProgressCallback], total: Optional[int], done: int = 0):
+        self._callback = callback
+        self.total = total
+        self.done = done
+        self._initial = done
+        self._started = time.monotonic()
+        self._reported = 0.0
+        self._lock = threading.Lock()
+
+    def add(self, amount: int, force: bool = False) -> None:
+        if self._callback is None:
+            return
+        with self._lock:
+            self.done += amount
+            now = time.monotonic()
+            if not force and now - self._reported < PROGRESS_INTERVAL:
+                return
+            self._reported = now
+            # 在锁内回调，保证各线程报告的进度单调
+            rate = (self.done - self._initial) / max(now - self._started, 1e-6)
+            self._callback(self.done, self.total, rate)
+
+
+class RangeDownloader:
+    """
+    并行分段下载器
+
+    通过多个并发的HTTP Range请求把文件下载到预分配的 <目标>.part 文件，
+    已完成的分段记录在 <目标>.part.json 中。下载中断后再次调用会跳过已完成的分段，
+    全部完成后原子地重命名为目标文件。服务器不支持Range时退化为单连接流式下载。
+
+    服务器返回ETag时，分段请求带If-Range，远程文件在续传期间被替换时不会拼接出新旧混合的文件；
+    传入上次的ETag/Last-Modified时服务器可以返回304跳过下载。
+
+    下载过程中同时计算SHA-256，与调用方给出的摘要（或服务器的X-Content-SHA256）比较：
+    单连接下载边写入边计算；并行分段下载时，主线程在分段完成后按顺序把连续完成的分段
+    从刚写入的.part文件（仍在页缓存中）读出计算，与其余分段的网络传输同时进行。
+
+    内容按WRITE_BUFFER_SIZE的块写入磁盘，内存占用与文件大小无关；重命名前先fsync。
+    下载时可以传入进度回调（在下载线程中调用）和取消事件，取消在写完当前块后生效。
+    """
+
+    def __init__(self, url: str, params: Optional[dict] = None,
+                 workers: int = DOWNLOAD_WORKERS,
+                 segment_size: int = DOWNLOAD_SEGMENT_SIZE,
+                 timeout: Union[float, Tuple[float, float]] = 300,
+                 session: Optional[requests.Session] = None):
+        """
+        Args:
+            url: 下载地址
+            params: 查询参数
+            workers: 并发连接数
+            segment_size: 分段大小
+            timeout: 单个请求的超时时间（秒），或(连接超时, 读取超时)
+            session: 发送请求的会话（共享连接池），None表示每个请求单独建立连接
+        """
+        self.url = url
+        self.params = params or {}
+        self.workers = max(1, workers)
+        self.segment_size = segment_size
+        self.timeout = timeout
+        self._http = session or requests
+        self._progress = _Progress(None, None)
+        self._cancel: Optional[threading.Event] = None
+        self._state_lock = threading.Lock()
+        # 最近一次探测得到的校验器
+        self.etag: Optional[str] = None
+        self.last_modified: Optional[str] = None
+        # 服务器声明的内容SHA-256，以及最近一次下载实际计算得到的SHA-256
+        self.content_sha256: Optional[str] = None
+        self.sha256: Optional[str] = None
+
+    def _probe(self, etag: Optional[str] = None,
+               last_modified: Optional[str] = None) -> Tuple[Optional[int], Optional[requests.Response]]:
+        """
+        探测文件大小和Range支持
+
+        Returns:
+            Tuple[文件大小, 完整响应]；服务器支持Range时完整响应为None，
+            不支持时返回已打开的200响应供直接流式写入；未修改（304）时两者都为None
+        """
+        headers = {'Range': 'bytes=0-0'}
+        if etag:
+            headers['If-None-Match'] = etag
+        if last_modified:
+            headers['If-Modified-Since'] = last_modified
+        response = self._http.get(self.url, params=self.params, headers=headers,
+                                stream=True, timeout=self.timeout)
+        if response.status_code == 304:
+            response.close()
+            self.etag = response.headers.get('ETag', etag)
+            self.last_modified = response.headers.get('Last-Modified', last_modified)
+            return None, None
+        self.etag = response.headers.get('ETag')
+        self.last_modified = response.headers.get('Last-Modified')
+        self.content_sha256 = response.headers.get('X-Content-SHA256')
+        if response.status_code == 206:
+            response.close()
+            return int(response.headers['Content-Range'].rsplit('/', 1)[1]), None
+        if response.status_code == 416:
+            # 空文件无法满足任何Range
+            response.close()
+            return int(response.headers.get('Content-Range', 'bytes */0').rsplit('/', 1)[1]), None
+        if response.status_code == 200:
+            # 包括服务器压缩存储的文件：不支持Range，整体以Content-Encoding发送，iter_content自动解压
+            return None, response
+        response.close()
+        raise DownloadError(f"HTTP {response.status_code}: {response.text}")
+
+    @staticmethod
+    def _load_state(state_path: str) -> dict:
+        try:
+            with open(state_path, 'r', encoding='utf8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    @staticmethod
+    def _save_state(state_path: str, state: dict) -> None:
+        tmp_path = state_path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf8') as f:
+            json.dump(state, f)
+        os.replace(tmp_path, state_path)
+
+    def _check_cancelled(self) -> None:
+        if self._cancel is not None and self._cancel.is_set():
+            raise DownloadCancelled("下载已取消")
+
+    def _download_whole(self, response: requests.Response, part_path: str) -> str:
+        """服务器不支持Range时单连接流式写入，返回写入内容的SHA-256"""
+        digest = hashlib.sha256()
+        try:
+            with response, open(part_path, 'wb') as f:
+                for block in response.iter_content(WRITE_BUFFER_SIZE):
+                    self._check_cancelled()
+                    f.write(block)
+                    digest.update(block)
+                    self._progress.add(len(block))
+        except DownloadCancelled:
+            # 整体下载无法续传
+            os.remove(part_path)
+            raise
+        return digest.hexdigest()
+
+    def _hash_completed(self, part_file, digest, next_index: int, done: set, file_size: int) -> int:
+        """
+        从next_index开始，把连续已完成的分段按顺序读出并计算摘要
+
+        Returns:
+            下一个待计算的分段序号
+        """
+        while next_index in done:
+            start = next_index * self.segment_size
+            remaining = min(self.segment_size, file_size - start)
+            part_file.seek(start)
+            while remaining > 0:
+                block = part_file.read(min(WRITE_BUFFER_SIZE, remaining))
+                if not block:
+                    raise DownloadError("分段数据不完整")
+                digest.update(block)
+                remaining -= len(block)
+            next_index += 1
+        return next_index
+
+    def _verify(self, actual: str, expected: Optional[str], part_path: str, state_path: str) -> None:
+        """
+        校验下载结果，不一致时删除.part文件和续传记录
+
+        Raises:
+            ChecksumError: 摘要不一致
+        """
+        self.sha256 = actual
+        if not expected or expected.lower() == actual:
+            return
+        for path in (part_path, state_path):
+            if os.path.exists(path):
+                os.remove(path)
+        raise ChecksumError(f"SHA-256校验失败: 期望 {expected}, 实际 {actual}")
+
+    def _fetch_segment(self, part_path: str, start: int, end: int) -> None:
+        """下载[start, end)区间并写入.part文件的对应偏移"""
+        last_error = None
+        for _ in range(SEGMENT_MAX_RETRIES):
+            self._check_cancelled()
+            written = 0
+            try:
+                headers = {'Range': f'bytes={start}-{end - 1}'}
+                if self.etag and not self.etag.startswith('W/'):
+                    # 文件已变化时服务器返回200而不是206，本分段失败
+                    headers['If-Range'] = self.etag
+                with self._http.get(self.url, params=self.params, headers=headers,
+                                  stream=True, timeout=self.timeout) as response:
+                    if response.status_code != 206:
+                        raise DownloadError(f"HTTP {response.status_code}: 服务器未返回分段内容")
+                    content_range = response.headers.get('Content-Range', '')
+                    if not content_range.startswith(f'bytes {start}-'):
+                        raise DownloadError(f"分段范围不匹配: {content_range}")
+
+                    with open(part_path, 'r+b') as f:
+                        f.seek(start)
+                        for block in response.iter_content(WRITE_BUFFER_SIZE):
+                            self._check_cancelled()
+                            f.write(block)
+                            written += len(block)
+                            self._progress.add(len(block))
+                    if written != end - start:
+                        raise DownloadError(f"分段不完整: 期望 {end - start} 字节, 实际 {written} 字节")
+                return
+            except DownloadCancelled:
+                raise
+            except (requests.RequestException, DownloadError) as e:
+                last_error = e
+                # 重试的分段从头写入，撤回已计入进度的字节
+                self._progress.add(-written)
+        raise DownloadError(f"分段 {start}-{end - 1} 下载失败: {last_error}")
+
+    def download(self, local_file_path: str, etag: Optional[str] = None,
+                 last_modified: Optional[str] = None, expected_sha256: Optional[str] = None,
+                 progress: Optional[ProgressCallback] = None,
+                 cancel: Optional[threading.Event] = None) -> bool:
+        """
+        下载到本地文件，可重复调用以续传
+
+        Args:
+            local_file_path: 本地保存路径
+            etag: 本地文件对应的ETag（可选）
+            last_modified: 本地文件对应的Last-Modified（可选）
+            expected_sha256: 预期的内容SHA-256（可选，默认使用服务器返回的X-Content-SHA256）
+            progress: 进度回调 progress(已下载字节数, 总字节数, 字节/秒)，在下载线程中调用
+            cancel: 取消事件，set()后下载在写完当前块后抛出DownloadCancelled
+
+        Returns:
+            是否下载了文件；远程文件未修改（304）时返回False，本地文件保持不变
+
+        Raises:
+            ChecksumError: 下载结果与预期的SHA-256不一致（目标文件不会被替换）
+            DownloadCancelled: 下载被取消（已完成的分段会保留）
+            DownloadError: 下载失败（已完成的分段会保留）
+        """
+        part_path = local_file_path + '.part'
+        state_path = part_path + '.json'
+
+        self.sha256 = None
+        self._cancel = cancel
+        self._check_cancelled()
+        file_size, whole_response = self._probe(etag, last_modified)
+        if file_size is None and whole_response is None:
+            return False
+        expected_sha256 = expected_sha256 or self.content_sha256
+        if whole_response is not None:
+            # 压缩传输时Content-Length是压缩后的大小，与写入的字节数不可比
+            length = whole_response.headers.get('Content-Length')
+            total = int(length) if length and not whole_response.headers.get('Content-Encoding') else None
+            self._progress = _Progress(progress, total)
+            actual = self._download_whole(whole_response, part_path)
+            self._verify(actual, expected_sha256, part_path, state_path)
+            _durable_replace(part_path, local_file_path)
+            self._progress.add(0, force=True)
+            return True
+
+        # 续传：只有远程文件大小、ETag和.part文件都与记录一致时才复用已完成的分段
+        state = self._load_state(state_path)
+        if (state.get('size') == file_size and state.get('segment_size') == self.segment_size
+                and state.get('etag') == self.etag
+                and os.path.exists(part_path) and os.path.getsize(part_path) == file_size):
+            done = set(state.get('done', []))
+        else:
+            done = set()
+            with open(part_path, 'wb') as f:
+                f.truncate(file_size)
+            state = {'size': file_size, 'segment_size': self.segment_size, 'etag': self.etag, 'done': []}
+            self._save_state(state_path, state)
+
+        segment_count = (file_size + self.segment_size - 1) // self.segment_size
+        pending = [i for i in range(segment_count) if i not in done]
+        resumed = sum(min(self.segment_size, file_size - i * self.segment_size) for i in done)
+        self._progress = _Progress(progress, file_size, resumed)
+
+        errors = []
+        digest = hashlib.sha256()
+        hashed = 0
+        with ThreadPoolExecutor(max_workers=self.workers) as executor, open(part_path, 'rb') as part_file:
+            futures = {}
+            for index in pending:
+                start = index * self.segment_size
+                end = min(start + self.segment_size, file_size)
+                futures[executor.submit(self._fetch_segment, part_path, start, end)] = index
+
+            # 续传时之前完成的分段先计算
+            hashed = self._hash_completed(part_file, digest, hashed, done, file_size)
+            for future in as_completed(futures):
+                try:
+                    future.result()
+                except Exception as e:
+                    errors.append(e)
+                    continue
+                with self._state_lock:
+                    done.add(futures[future])
+                    state['done'] = sorted(done)
+                    self._save_state(state_path, state)
+                if not errors:
+                    hashed = self._hash_completed(part_file, digest, hashed, done, file_size)
+
+        if errors:
+            if any(isinstance(e, DownloadCancelled) for e in errors):
+                raise DownloadCancelled("下载已取消，可重新下载以续传")
+            raise DownloadError(f"{len(errors)} 个分段下载失败，可重新下载以续传: {errors[0]}")
+
+        self._verify(digest.hexdigest(), expected_sha256, part_path, state_path)
+        _durable_replace(part_path, local_file_path)
+        os.remove(state_path)
+        self._progress.add(0, force=True)
+        return True
@@ -0,0 +1,139 @@
+from __future__ import annotations
+
+import threading
+from abc import ABC, abstractmethod
+from typing import TYPE_CHECKING, Dict, List, Optional, Tuple, Union
+
+from app.db.models import User
+from app.services.rangeDownloader import ProgressCallback
+
+if TYPE_CHECKING:
+    from app.services.modelStorageService import ModelData, ModelDataStream, ModelListMirror
+
+# 保存/上传的结果：(是否成功, 服务器路径, 错误信息, 内容的SHA-256, 版本号)
+UploadResult = Tuple[bool, str, str, str, Optional[int]]
+
+# model_storage_backend的取值
+HTTP_BACKEND = 'http'
+LOCAL_BACKEND = 'local'
+
+
+class StorageBackend(ABC):
+    """
+    模型存储后端接口
+
+    modelService、ModelReconciler等调用方只依赖这里的方法，由model_storage_backend配置选择实现：
+    http为RemoteModelStorageService（经远程模型服务读写），local为LocalModelStorageService
+    （单机部署时直接读写本机的模型目录，不经过HTTP）。两种实现的路径、版本、去重、配额和变更记录
+    语义相同（tests/test_storage_backends.py对两种实现执行同一组测试），
+    python -m app.services.storageBackendBenchmark 比较两者的吞吐量。
+
+    server_path是相对模型根目录的路径（<用户名>/<子目录>/<文件名>），
+    model_server.versions.version_path(server_path, 版本号)为内容不变的版本路径，可用于下载和查询。
+    """
+
+    @abstractmethod
+    def save_model_file(self, user: User, model_name: str, model_data: Union["ModelData", "ModelDataStream"],
+                        sub_directory: str = "", base_server_path: Optional[str] = None) -> UploadResult:
+        """
+        保存内存中的数据、文件对象或字节块迭代器
+
+        Args:
+            base_server_path: 增量上传的基准文件（可选，只有需要经网络传输的后端使用）
+        """
+
+    @abstractmethod
+    def upload_model_file(self, user: User, local_file_path: str, model_name: str = None, sub_directory: str = "",
+                          progress: Optional[ProgressCallback] = None,
+                          cancel: Optional[threading.Event] = None) -> UploadResult:
+        """保存本地文件（model_name默认为文件名），取消时返回失败"""
+
+    @abstractmethod
+    def upload_model_files(self, user: User, local_file_paths: List[str],
+                           sub_directory: str = "") -> List[UploadResult]:
+        """批量保存本地文件（使用文件名作为模型名称），结果与local_file_paths一一对应"""
+
+    @abstractmethod
+    def download_model_file(self, user: User, server_relative_path: str, local_file_path: str,
+                            expected_sha256: Optional[str] = None, progress: Optional[ProgressCallback] = None,
+                            cancel: Optional[threading.Event] = None) -> bool:
+        """
+        下载到local_file_path（完成后原子替换），内容与expected_sha256不一致时不替换本地文件
+
+        Returns:
+            是否下载成功（取消时返回False）
+        """
+
+    @abstractmethod
+    def download_directory(self, user: User, sub_directory: str, local_dir: str) -> Tuple[bool, List[str], str]:
+        """
+        下载整个子目录到 local_dir/<子目录名>/（sub_directory为空时为用户名）
+
+        Returns:
+            Tuple[是否成功, 已写入的本地文件列表, 错误信息]
+        """
+
+    @abstractmethod
+    def content_unchanged(self, user: User, server_relative_path: str, sha256: str) -> Optional[bool]:
+        """
+        文件内容是否仍为sha256（不传输内容）
+
+        Returns:
+            True 未变化，False 已变化或不存在，None 存储不可用
+        """
+
+    @abstractmethod
+    def delete_model_file(self, user: User, server_relative_path: str) -> bool:
+        """删除文件及其所有版本"""
+
+    @abstractmethod
+    def delete_model_files(self, user: User, server_relative_paths: List[str]) -> Dict[str, bool]:
+        """批量删除，返回{服务器路径: 是否删除成功}"""
+
+    @abstractmethod
+    def stat_model_files(self, user: User, server_relative_paths: List[str]) -> Dict[str, Optional[dict]]:
+        """
+        批量查询文件信息
+
+        Returns:
+            {服务器路径: {name, size, modified, sha256}}，文件不存在时为None
+        """
+
+    @abstractmethod
+    def get_storage_usage(self, user: User) -> Optional[dict]:
+        """{'bytes', 'files', 'quota_bytes', 'quota_files'}（配额为None表示不限制）；失败时返回None"""
+
+    @abstractmethod
+    def list_model_versions(self, user: User, server_relative_path: str,
+                            limit: Optional[int] = None) -> Optional[List[dict]]:
+        """文件的版本（从新到旧）[{'version', 'version_path', 'sha256', 'size', 'created'}]；不存在时返回None"""
+
+    @abstractmethod
+    def get_changes(self, user: User, since: Optional[int] = None, wait: float = 0,
+                    limit: int = 1000) -> Optional[dict]:
+        """
+        序号since之后的变更
+
+        Returns:
+            {'changes', 'next_seq', 'reset', 'retry_after'}；since为None时只返回当前最新序号；失败时返回None
+        """
+
+    @abstractmethod
+    def list_user_files_page(self, user: User, sub_directory: str = "", prefix: str = "",
+                             sort: str = "path", descending: bool = False, limit: int = 1000,
+                             cursor: Optional[str] = None) -> Tuple[list, Optional[str]]:
+        """
+        分页列出文件[{name, path, size, modified}]
+
+        Returns:
+            Tuple[文件列表, 下一页游标（没有更多时为None）]
+        """
+
+    @abstractmethod
+    def list_user_files(self, user: User, sub_directory: str = "", prefix: str = "") -> list:
+        """列出所有文件，失败时返回空列表"""
+
+    def mirror(self, user: User, sub_directory: str = "") -> "ModelListMirror":
+        """创建用户文件列表（或其中一个子目录）的本地镜像，调用sync()同步"""
+        from app.services.modelStorageService import ModelListMirror
+        return ModelListMirror(self, user, sub_directory)
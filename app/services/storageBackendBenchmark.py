@@ -0,0 +1,119 @@
+"""
+模型存储后端的吞吐量基准
+
+对http（在临时目录上启动remote_model_server.py）和local（直接读写另一个临时模型目录）两种后端
+测量并发上传和下载的吞吐量（两种后端的一致性测试见tests/test_storage_backends.py）：
+
+    poetry run python -m app.services.storageBackendBenchmark --size-mb 64 --concurrency 8
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, Tuple
+
+from app.db.models import User
+from app.services.localModelStorageService import LocalModelStorageService
+from app.services.modelStorageService import RemoteModelStorageService
+from app.services.storageBackend import HTTP_BACKEND, LOCAL_BACKEND, StorageBackend
+from model_server.benchmark import _start_server, _stop_server
+
+BENCH_USER = "backend_bench"
+
+
+def _write(path: str, data: bytes) -> str:
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(data)
+    return path
+
+
+def run_benchmark(backend: StorageBackend, work_dir: str, user: User, size_mb: int, concurrency: int,
+                  rounds: int) -> Dict[str, float]:
+    """
+    并发上传concurrency个本地文件，再把每个文件下载rounds轮（每轮下载到不同的本地路径）
+
+    Returns:
+        {'upload': MB/s, 'download': MB/s}
+    """
+    sources = []
+    for i in range(concurrency):
+        # 每个文件内容不同，避免被去重存储合并
+        sources.append(_write(os.path.join(work_dir, "bench", "src", f"bench_{i}.bin"),
+                              os.urandom(size_mb * 1024 * 1024)))
+
+    def upload(path: str) -> str:
+        success, server_path, error, _, _ = backend.upload_model_file(user, path, sub_directory="bench")
+        if not success:
+            raise RuntimeError(error)
+        return server_path
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        server_paths = list(executor.map(upload, sources))
+    upload_elapsed = time.perf_counter() - start
+
+    def download(job: Tuple[int, str]) -> int:
+        index, server_path = job
+        local_path = os.path.join(work_dir, "bench", "dst", str(index), os.path.basename(server_path))
+        if not backend.download_model_file(user, server_path, local_path):
+            raise RuntimeError(f"下载失败: {server_path}")
+        return os.path.getsize(local_path)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        jobs = list(enumerate(server_paths * rounds))
+        total_bytes = sum(executor.map(download, jobs))
+    download_elapsed = time.perf_counter() - start
+
+    return {
+        "upload": size_mb * concurrency / upload_elapsed,
+        "download": total_bytes / (1024 * 1024) / download_elapsed,
+    }
+
+
+def run_backend(name: str, args: argparse.Namespace) -> Dict[str, float]:
+    """在临时目录上创建后端并执行基准测试"""
+    user = User(username=BENCH_USER)
+    with tempfile.TemporaryDirectory(prefix=f"storage-bench-{name}-") as tmp_dir:
+        models_path = Path(tmp_dir) / "models"
+        process = None
+        try:
+            if name == HTTP_BACKEND:
+                process = _start_server(args.mode, args.port, models_path, args.workers, args.threads)
+                backend = RemoteModelStorageService(f"http://127.0.0.1:{args.port}")
+            elif name == LOCAL_BACKEND:
+                backend = LocalModelStorageService(str(models_path))
+            else:
+                raise ValueError(f"Unknown model storage backend: {name}")
+            return run_benchmark(backend, tmp_dir, user, args.size_mb, args.concurrency, args.rounds)
+        finally:
+            if process is not None:
+                _stop_server(process)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="模型存储后端的上传/下载吞吐量对比")
+    parser.add_argument("--backends", default=f"{HTTP_BACKEND},{LOCAL_BACKEND}", help="要测试的后端，逗号分隔")
+    parser.add_argument("--size-mb", type=int, default=64, help="每个文件的大小（MB）")
+    parser.add_argument("--concurrency", type=int, default=8, help="并发上传/下载数")
+    parser.add_argument("--rounds", type=int, default=3, help="每个文件下载的轮数")
+    parser.add_argument("--mode", default="prod", choices=["dev", "prod"], help="http后端的服务模式")
+    parser.add_argument("--workers", type=int, default=4, help="prod模式worker进程数")
+    parser.add_argument("--threads", type=int, default=8, help="prod模式每个worker的线程数")
+    parser.add_argument("--port", type=int, default=18775)
+    args = parser.parse_args()
+
+    throughput = {name: run_backend(name, args) for name in args.backends.split(",")}
+    print(f"{'后端':<8}{'上传 MB/s':>14}{'下载 MB/s':>14}")
+    for name, result in throughput.items():
+        print(f"{name:<8}{result['upload']:>14.1f}{result['download']:>14.1f}")
+
+
+if __name__ == "__main__":
+    main()
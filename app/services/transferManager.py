@@ -0,0 +1,355 @@
+from __future__ import annotations
+
+import heapq
+import itertools
+import threading
+import time
+from dataclasses import dataclass, field, replace
+from typing import Callable, Dict, List, Optional
+
+from PySide6.QtCore import QObject, Signal
+
+from app.config import config
+from app.db.base import session_scope
+from app.db.models import User
+from app.services.modelService import download_model_file, upload_model_file
+from app.services.rangeDownloader import discard_partial_download
+
+# 传输状态
+QUEUED = 'queued'
+RUNNING = 'running'
+PAUSED = 'paused'
+FAILED = 'failed'
+DONE = 'done'
+CANCELLED = 'cancelled'
+
+# 优先级：数值大的先执行，同一优先级按加入顺序
+PRIORITY_LOW = -10
+PRIORITY_NORMAL = 0
+PRIORITY_HIGH = 10
+
+
+@dataclass
+class Transfer:
+    """一个上传或下载任务的状态（信号中传递的是副本）"""
+    id: int
+    kind: str  # 'upload' / 'download'
+    name: str
+    local_file_path: str
+    priority: int = PRIORITY_NORMAL
+    state: str = QUEUED
+    done: int = 0
+    total: Optional[int] = None
+    rate: float = 0.0  # 字节/秒
+    error: str = ""
+    model_id: Optional[int] = None  # 下载的模型；上传完成后为新建/更新的模型
+    attempts: int = 0
+    created: float = field(default_factory=time.time)
+    finished: Optional[float] = None
+
+    @property
+    def active(self) -> bool:
+        return self.state in (QUEUED, RUNNING)
+
+
+class TransferManager(QObject):
+    """
+    模型文件的上传/下载队列，使用单例模式
+
+    任务按优先级排队，由model_transfer_workers个后台线程执行（调用modelService的上传/下载，
+    与在页面中直接操作一样创建模型记录、使用本地缓存）。每个任务的状态为
+    queued/running/paused/failed/done/cancelled，可以暂停、继续、取消和重试：
+    暂停和取消都会中止正在进行的传输，暂停的任务继续时重新排队，下载从已完成的分段续传，
+    大文件上传只补传服务器还没有的分块；取消的下载删除保留的.part文件和续传记录，重试时从头下载。
+
+    状态和进度通过Qt信号发出（在工作线程中emit，界面线程中的槽以排队连接接收），
+    任何页面都可以订阅；所有进行中任务的速度之和通过throughput_changed发出。
+    """
+
+    transfer_added = Signal(object)  # Transfer
+    transfer_changed = Signal(object)  # Transfer，状态变化时发出
+    transfer_progress = Signal(int, object, object, float)  # 任务ID, 已传输字节数, 总字节数, 字节/秒
+    throughput_changed = Signal(float)  # 所有进行中任务的速度之和（字节/秒）
+
+    _instance = None
+
+    @classmethod
+    def get_instance(cls) -> "TransferManager":
+        """获取单例实例（在界面线程中首次调用）"""
+        if cls._instance is None:
+            cls._instance = cls()
+        return cls._instance
+
+    def __init__(self, max_workers: Optional[int] = None, parent=None):
+        """
+        Args:
+            max_workers: 同时进行的传输数（默认model_transfer_workers）
+        """
+        super().__init__(parent)
+        self.max_workers = max(1, max_workers or config.model_transfer_workers)
+        self._transfers: Dict[int, Transfer] = {}
+        self._jobs: Dict[int, Callable] = {}
+        self._cancel_events: Dict[int, threading.Event] = {}
+        self._pause_requested: set = set()
+        # 堆中的条目 (-优先级, 入队序号, 任务ID)；任务被暂停/取消/调整优先级后旧条目按序号作废
+        self._queue: List[tuple] = []
+        self._queue_seq: Dict[int, int] = {}
+        self._ids = itertools.count(1)
+        self._seq = itertools.count()
+        self._condition = threading.Condition()
+        self._workers: List[threading.Thread] = []
+        self._shutdown = False
+
+    # ---- 提交任务 ----
+
+    def download(self, user: User, model_id: int, name: str, local_file_path: str,
+                 version: Optional[int] = None, priority: int = PRIORITY_NORMAL) -> int:
+        """
+        加入下载任务
+
+        Args:
+            user: 用户对象
+            model_id: 模型ID
+            name: 显示的名称
+            local_file_path: 本地保存路径
+            version: 版本号（可选，默认最新版本）
+            priority: 优先级
+
+        Returns:
+            任务ID
+        """
+        def job(transfer: Transfer, progress, cancel) -> None:
+            with session_scope() as session:
+                if not download_model_file(session, user, model_id, local_file_path, version=version,
+                                           progress=progress, cancel=cancel):
+                    raise Exception("下载失败")
+
+        return self._submit(Transfer(0, 'download', name, local_file_path, priority, model_id=model_id), job)
+
+    def upload(self, user: User, local_file_path: str, model_name: Optional[str] = None, sub_directory: str = "",
+               description: Optional[str] = None, priority: int = PRIORITY_NORMAL) -> int:
+        """
+        加入上传任务（完成后创建或更新模型记录，模型ID保存在Transfer.model_id）
+
+        Returns:
+            任务ID
+        """
+        def job(transfer: Transfer, progress, cancel) -> None:
+            with session_scope() as session:
+                model = upload_model_file(session, user, local_file_path, model_name=model_name,
+                                          sub_directory=sub_directory, description=description,
+                                          progress=progress, cancel=cancel)
+                transfer.model_id = model.id if model is not None else None
+
+        name = model_name or local_file_path.replace('\\', '/').rsplit('/', 1)[-1]
+        return self._submit(Transfer(0, 'upload', name, local_file_path, priority), job)
+
+    def _submit(self, transfer: Transfer, job: Callable) -> int:
+        with self._condition:
+            transfer.id = next(self._ids)
+            self._transfers[transfer.id] = transfer
+            self._jobs[transfer.id] = job
+            self._enqueue(transfer)
+            self._start_workers()
+            snapshot = replace(transfer)
+        self.transfer_added.emit(snapshot)
+        return transfer.id
+
+    def _enqueue(self, transfer: Transfer) -> None:
+        """在持有锁时调用"""
+        transfer.state = QUEUED
+        seq = next(self._seq)
+        self._queue_seq[transfer.id] = seq
+        heapq.heappush(self._queue, (-transfer.priority, seq, transfer.id))
+        self._condition.notify()
+
+    def _start_workers(self) -> None:
+        while len(self._workers) < self.max_workers:
+            worker = threading.Thread(target=self._work, name=f"transfer-{len(self._workers)}", daemon=True)
+            self._workers.append(worker)
+            worker.start()
+
+    # ---- 控制 ----
+
+    def cancel(self, transfer_id: int) -> bool:
+        """取消排队、暂停或进行中的任务"""
+        return self._stop(transfer_id, CANCELLED)
+
+    def pause(self, transfer_id: int) -> bool:
+        """暂停排队或进行中的任务（进行中的传输被中止，继续时续传）"""
+        return self._stop(transfer_id, PAUSED)
+
+    def _stop(self, transfer_id: int, state: str) -> bool:
+        with self._condition:
+            transfer = self._transfers.get(transfer_id)
+            if transfer is None:
+                return False
+            if transfer.state == RUNNING:
+                # 工作线程在传输中止后设置最终状态
+                if state == PAUSED:
+                    self._pause_requested.add(transfer_id)
+                else:
+                    self._pause_requested.discard(transfer_id)
+                self._cancel_events[transfer_id].set()
+                return True
+            if transfer.state not in (QUEUED, PAUSED) or transfer.state == state:
+                return False
+            self._queue_seq.pop(transfer_id, None)
+            transfer.state = state
+            transfer.rate = 0.0
+            if state == CANCELLED:
+                transfer.finished = time.time()
+                # 暂停的下载可能留有已完成的分段；在锁内删除，不会删掉随后重试的任务新写的文件
+                self._discard_partial(transfer)
+            snapshot = replace(transfer)
+        self.transfer_changed.emit(snapshot)
+        return True
+
+    def resume(self, transfer_id: int) -> bool:
+        """继续暂停的任务（重新排队）"""
+        return self._requeue(transfer_id, (PAUSED,))
+
+    def retry(self, transfer_id: int) -> bool:
+        """重试失败或已取消的任务"""
+        return self._requeue(transfer_id, (FAILED, CANCELLED))
+
+    def _requeue(self, transfer_id: int, states: tuple) -> bool:
+        with self._condition:
+            transfer = self._transfers.get(transfer_id)
+            if transfer is None or transfer.state not in states:
+                return False
+            transfer.error = ""
+            transfer.finished = None
+            self._enqueue(transfer)
+            self._start_workers()
+            snapshot = replace(transfer)
+        self.transfer_changed.emit(snapshot)
+        return True
+
+    def set_priority(self, transfer_id: int, priority: int) -> bool:
+        """调整任务的优先级（排队中的任务按新优先级重新排序）"""
+        with self._condition:
+            transfer = self._transfers.get(transfer_id)
+            if transfer is None:
+                return False
+            transfer.priority = priority
+            if transfer.state == QUEUED:
+                self._enqueue(transfer)
+            snapshot = replace(transfer)
+        self.transfer_changed.emit(snapshot)
+        return True
+
+    def clear_finished(self) -> None:
+        """移除已完成、失败和已取消的任务（失败的下载不再重试，一并删除续传文件）"""
+        with self._condition:
+            removed = [t for t in self._transfers.values() if t.state in (DONE, FAILED, CANCELLED)]
+            for transfer in removed:
+                del self._transfers[transfer.id]
+                self._jobs.pop(transfer.id, None)
+        for transfer in removed:
+            if transfer.state != DONE:
+                self._discard_partial(transfer)
+
+    @staticmethod
+    def _discard_partial(transfer: Transfer) -> None:
+        """删除下载任务保留的.part文件和续传记录（只有暂停的任务需要续传）"""
+        if transfer.kind != 'download':
+            return
+        try:
+            discard_partial_download(transfer.local_file_path)
+        except OSError as e:
+            print(f"Warning: Failed to remove partial download: {e}")
+
+    # ---- 查询 ----
+
+    def get(self, transfer_id: int) -> Optional[Transfer]:
+        with self._condition:
+            transfer = self._transfers.get(transfer_id)
+            return replace(transfer) if transfer is not None else None
+
+    def transfers(self) -> List[Transfer]:
+        """所有任务（按加入顺序）"""
+        with self._condition:
+            return [replace(t) for t in self._transfers.values()]
+
+    def throughput(self) -> float:
+        """所有进行中任务的速度之和（字节/秒）"""
+        with self._condition:
+            return sum(t.rate for t in self._transfers.values() if t.state == RUNNING)
+
+    # ---- 工作线程 ----
+
+    def _next(self) -> Optional[Transfer]:
+        """取出优先级最高的排队任务，没有时等待；关闭时返回None"""
+        with self._condition:
+            while not self._shutdown:
+                while self._queue:
+                    _, seq, transfer_id = heapq.heappop(self._queue)
+                    transfer = self._transfers.get(transfer_id)
+                    if transfer is None or transfer.state != QUEUED or self._queue_seq.get(transfer_id) != seq:
+                        continue  # 已作废的条目
+                    del self._queue_seq[transfer_id]
+                    transfer.state = RUNNING
+                    transfer.attempts += 1
+                    transfer.rate = 0.0
+                    self._cancel_events[transfer_id] = threading.Event()
+                    self._pause_requested.discard(transfer_id)
+                    return transfer
+                self._condition.wait()
+            return None
+
+    def _work(self) -> None:
+        while True:
+            transfer = self._next()
+            if transfer is None:
+                return
+            self.transfer_changed.emit(self.get(transfer.id))
+            cancel = self._cancel_events[transfer.id]
+
+            def progress(done, total, rate, transfer_id=transfer.id):
+                with self._condition:
+                    current = self._transfers.get(transfer_id)
+                    if current is None:
+                        return
+                    current.done, current.total, current.rate = done, total, rate
+                    throughput = sum(t.rate for t in self._transfers.values() if t.state == RUNNING)
+                self.transfer_progress.emit(transfer_id, done, total, rate)
+                self.throughput_changed.emit(throughput)
+
+            error = ""
+            try:
+                self._jobs[transfer.id](transfer, progress, cancel)
+            except Exception as e:
+                error = str(e)
+
+            with self._condition:
+                if cancel.is_set():
+                    state = PAUSED if transfer.id in self._pause_requested else CANCELLED
+                else:
+                    state = FAILED if error else DONE
+                transfer.state = state
+                transfer.error = error if state == FAILED else ""
+                transfer.rate = 0.0
+                if state != PAUSED:
+                    transfer.finished = time.time()
+                self._pause_requested.discard(transfer.id)
+                self._cancel_events.pop(transfer.id, None)
+                if state == CANCELLED:
+                    self._discard_partial(transfer)
+                snapshot = replace(transfer)
+                throughput = sum(t.rate for t in self._transfers.values() if t.state == RUNNING)
+            self.transfer_changed.emit(snapshot)
+            self.throughput_changed.emit(throughput)
+
+    def shutdown(self, cancel_running: bool = True) -> None:
+        """停止工作线程（退出程序前调用），进行中的传输被中止，可在下次启动后重新下载/上传时续传"""
+        with self._condition:
+            self._shutdown = True
+            if cancel_running:
+                for transfer_id, event in self._cancel_events.items():
+                    self._pause_requested.add(transfer_id)
+                    event.set()
+            self._condition.notify_all()
+            workers = list(self._workers)
+        for worker in workers:
+            worker.join()
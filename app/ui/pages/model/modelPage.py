@@ -1,20 +1,23 @@
 from __future__ import annotations
 
 from functools import partial
-from typing import Dict, List
+from typing import Dict, List, Optional
 
 from PySide6.QtWidgets import (QTableWidgetItem, QWidget, QVBoxLayout, QHBoxLayout,
                                QLabel, QPushButton, QTreeWidget, QTreeWidgetItem,
                                QInputDialog, QMessageBox, QHeaderView, QFileDialog)
 from qfluentwidgets import (TableWidget, PrimaryPushButton, InfoBar,
-                            InfoBarPosition, LineEdit, ToolButton)
+                            InfoBarPosition, LineEdit, ToolButton, ProgressBar)
 from qfluentwidgets import FluentIcon
 
 from app.db.base import session_scope
 from app.db.models import User
 from app.services.modelService import (list_user_models, delete_model,
                                        toggle_model_visibility, save_trained_model,
-                                       upload_model_file, download_model_file)
+                                       get_storage_usage)
+from app.services.modelStorageService import ModelData
+from app.services import transferManager
+from app.services.transferManager import Transfer, TransferManager
 from app.services.user_manager import UserManager
 
 
@@ -30,9 +33,21 @@ class ModelPage(QWidget):
     5. 提供接口：当用户在模型训练完成后将模型保存在自己目录下
     """
 
+    TRANSFER_STATE_NAMES = {
+        transferManager.QUEUED: "排队中",
+        transferManager.RUNNING: "进行中",
+        transferManager.PAUSED: "已暂停",
+        transferManager.FAILED: "失败",
+        transferManager.DONE: "已完成",
+        transferManager.CANCELLED: "已取消",
+    }
+
     def __init__(self, parent=None):
         super().__init__(parent)
         self.selected_item = None
+        # 上传/下载在传输管理器中排队执行，页面只订阅其信号显示状态
+        self.transfer_manager = TransferManager.get_instance()
+        self._transfer_rows: Dict[int, int] = {}  # 任务ID -> 传输列表中的行
 
         # 从全局用户管理器获取当前用户
         user_manager = UserManager.get_instance()
@@ -44,6 +59,13 @@ class ModelPage(QWidget):
         self.setObjectName("ModelDomainPage")
         self.init_ui()
 
+        self.transfer_manager.transfer_added.connect(self._on_transfer_changed)
+        self.transfer_manager.transfer_changed.connect(self._on_transfer_changed)
+        self.transfer_manager.transfer_progress.connect(self._on_transfer_progress)
+        self.transfer_manager.throughput_changed.connect(self._on_throughput_changed)
+        for transfer in self.transfer_manager.transfers():
+            self._render_transfer(transfer)
+
     def _on_user_changed(self, user: User):
         """当用户变更时调用"""
         self.current_user = user
@@ -67,6 +89,8 @@ class ModelPage(QWidget):
         self.user_info_label = QLabel("当前用户: 未登录")
         user_info_layout.addWidget(self.user_info_label)
         user_info_layout.addStretch()
+        self.usage_label = QLabel("")
+        user_info_layout.addWidget(self.usage_label)
         main_layout.addLayout(user_info_layout)
 
         # 目录操作按钮
@@ -84,6 +108,29 @@ class ModelPage(QWidget):
         dir_action_layout.addWidget(self.refresh_btn)
         main_layout.addLayout(dir_action_layout)
 
+        # 传输列表（有任务时显示）
+        self.transfer_widget = QWidget()
+        transfer_layout = QVBoxLayout(self.transfer_widget)
+        transfer_layout.setContentsMargins(0, 0, 0, 0)
+        transfer_title_layout = QHBoxLayout()
+        transfer_title_layout.addWidget(QLabel("传输列表"))
+        transfer_title_layout.addStretch()
+        self.throughput_label = QLabel("")
+        transfer_title_layout.addWidget(self.throughput_label)
+        self.clear_transfers_btn = ToolButton(FluentIcon.BROOM)
+        self.clear_transfers_btn.setToolTip("清除已结束的传输")
+        self.clear_transfers_btn.clicked.connect(self.clear_finished_transfers)
+        transfer_title_layout.addWidget(self.clear_transfers_btn)
+        transfer_layout.addLayout(transfer_title_layout)
+
+        self.transfer_table = TableWidget()
+        self.transfer_table.setColumnCount(5)
+        self.transfer_table.setHorizontalHeaderLabels(["名称", "类型", "状态", "进度", "操作"])
+        self.transfer_table.horizontalHeader().setSectionResizeMode(QHeaderView.Stretch)
+        transfer_layout.addWidget(self.transfer_table)
+        self.transfer_widget.hide()
+        main_layout.addWidget(self.transfer_widget)
+
         # 模型列表
         model_card_layout = QVBoxLayout()
         model_card_layout.setSpacing(10)
@@ -108,11 +155,29 @@ class ModelPage(QWidget):
         """刷新视图"""
         if not self.current_user:
             self.user_info_label.setText("当前用户: 未登录")
+            self.usage_label.setText("")
             return
 
         self.user_info_label.setText(f"当前用户: {self.current_user.username}")
+        self.load_storage_usage()
         self.load_model_list()
 
+    def load_storage_usage(self):
+        """显示存储用量和配额"""
+        usage = get_storage_usage(self.current_user)
+        if usage is None:
+            self.usage_label.setText("存储用量: 未知")
+            return
+
+        text = f"存储用量: {self.format_file_size(usage['bytes'])}"
+        if usage.get('quota_bytes'):
+            percent = usage['bytes'] / usage['quota_bytes'] * 100
+            text += f" / {self.format_file_size(usage['quota_bytes'])} ({percent:.0f}%)"
+        text += f"，{usage['files']} 个文件"
+        if usage.get('quota_files'):
+            text += f" / {usage['quota_files']}"
+        self.usage_label.setText(text)
+
     def load_model_list(self):
         """加载模型列表"""
         self.model_table.setRowCount(0)
@@ -166,45 +231,31 @@ class ModelPage(QWidget):
             )
             return
 
-        file_path, _ = QFileDialog.getOpenFileName(
+        file_paths, _ = QFileDialog.getOpenFileNames(
             self,
             "选择模型文件",
             "",
             "模型文件 (*.h5 *.pt *.pth *.pkl *.onnx);;所有文件 (*)"
         )
 
-        if not file_path:
+        if not file_paths:
             return
 
-        # 获取模型描述
+        # 获取模型描述（选择多个文件时用于所有文件）
         description, ok = QInputDialog.getText(self, "模型描述", "请输入模型描述（可选）:")
         if not ok:
             description = None
 
-        # 上传模型文件
-        try:
-            with session_scope() as session:
-                model = upload_model_file(
-                    session=session,
-                    user=self.current_user,
-                    local_file_path=file_path,
-                    description=description
-                )
+        # 加入传输队列，在后台上传，完成后刷新模型列表
+        for file_path in file_paths:
+            self.transfer_manager.upload(self.current_user, file_path, description=description)
 
-            InfoBar.success(
-                title="上传成功",
-                content=f"模型文件 '{model.name}' 已上传并记录",
-                parent=self,
-                position=InfoBarPosition.TOP_RIGHT
-            )
-            self.refresh_view()
-        except Exception as e:
-            InfoBar.error(
-                title="上传失败",
-                content=f"上传模型文件时发生错误: {str(e)}",
-                parent=self,
-                position=InfoBarPosition.TOP_RIGHT
-            )
+        InfoBar.info(
+            title="已加入传输队列",
+            content=f"{len(file_paths)} 个模型文件将在后台上传",
+            parent=self,
+            position=InfoBarPosition.TOP_RIGHT
+        )
 
     def download_model(self, model):
         """下载模型文件"""
@@ -228,38 +279,126 @@ class ModelPage(QWidget):
         if not file_path:
             return
 
-        # 下载模型文件
-        try:
-            with session_scope() as session:
-                success = download_model_file(
-                    session=session,
-                    user=self.current_user,
-                    model_id=model.id,
-                    local_file_path=file_path
-                )
+        # 加入传输队列，在后台下载，传输列表中显示进度，可以暂停、取消
+        self.transfer_manager.download(self.current_user, model.id, model.name, file_path)
 
-            if success:
+    def pause_or_resume_transfer(self, transfer_id: int):
+        """暂停进行中/排队的传输，或继续已暂停的传输"""
+        transfer = self.transfer_manager.get(transfer_id)
+        if transfer is None:
+            return
+        if transfer.state == transferManager.PAUSED:
+            self.transfer_manager.resume(transfer_id)
+        else:
+            self.transfer_manager.pause(transfer_id)
+
+    def cancel_transfer(self, transfer_id: int):
+        """取消传输"""
+        self.transfer_manager.cancel(transfer_id)
+
+    def retry_transfer(self, transfer_id: int):
+        """重试失败或已取消的传输"""
+        self.transfer_manager.retry(transfer_id)
+
+    def clear_finished_transfers(self):
+        """从传输列表中移除已结束的传输"""
+        self.transfer_manager.clear_finished()
+        self.transfer_table.setRowCount(0)
+        self._transfer_rows.clear()
+        for transfer in self.transfer_manager.transfers():
+            self._render_transfer(transfer)
+        self.transfer_widget.setVisible(bool(self._transfer_rows))
+
+    def _render_transfer(self, transfer: Transfer):
+        """新增或更新传输列表中的一行"""
+        row = self._transfer_rows.get(transfer.id)
+        if row is None:
+            row = self.transfer_table.rowCount()
+            self.transfer_table.insertRow(row)
+            self._transfer_rows[transfer.id] = row
+            self.transfer_table.setItem(row, 0, QTableWidgetItem(transfer.name))
+            self.transfer_table.setItem(row, 1, QTableWidgetItem("上传" if transfer.kind == 'upload' else "下载"))
+            self.transfer_table.setCellWidget(row, 3, ProgressBar())
+        status = self.TRANSFER_STATE_NAMES.get(transfer.state, transfer.state)
+        if transfer.state == transferManager.FAILED and transfer.error:
+            status += f": {transfer.error}"
+        self.transfer_table.setItem(row, 2, QTableWidgetItem(status))
+        self._update_transfer_progress(row, transfer.done, transfer.total,
+                                       finished=transfer.state == transferManager.DONE)
+
+        # 操作按钮随状态变化
+        btn_layout = QHBoxLayout()
+        if transfer.state in (transferManager.QUEUED, transferManager.RUNNING, transferManager.PAUSED):
+            paused = transfer.state == transferManager.PAUSED
+            pause_btn = ToolButton(FluentIcon.PLAY if paused else FluentIcon.PAUSE)
+            pause_btn.setToolTip("继续" if paused else "暂停")
+            pause_btn.clicked.connect(partial(self.pause_or_resume_transfer, transfer.id))
+            cancel_btn = ToolButton(FluentIcon.CLOSE)
+            cancel_btn.setToolTip("取消")
+            cancel_btn.clicked.connect(partial(self.cancel_transfer, transfer.id))
+            btn_layout.addWidget(pause_btn)
+            btn_layout.addWidget(cancel_btn)
+        elif transfer.state in (transferManager.FAILED, transferManager.CANCELLED):
+            retry_btn = ToolButton(FluentIcon.SYNC)
+            retry_btn.setToolTip("重试")
+            retry_btn.clicked.connect(partial(self.retry_transfer, transfer.id))
+            btn_layout.addWidget(retry_btn)
+        btn_widget = QWidget()
+        btn_widget.setLayout(btn_layout)
+        self.transfer_table.setCellWidget(row, 4, btn_widget)
+        self.transfer_widget.show()
+
+    def _update_transfer_progress(self, row: int, done: int, total: Optional[int], rate: float = 0.0,
+                                  finished: bool = False):
+        progress_bar = self.transfer_table.cellWidget(row, 3)
+        if finished:
+            progress_bar.setValue(100)
+        elif total:
+            progress_bar.setValue(int(done * 100 / total))
+        text = self.format_file_size(done)
+        if total:
+            text += f" / {self.format_file_size(total)}"
+        if rate:
+            text += f"（{self.format_file_size(rate)}/s）"
+        progress_bar.setToolTip(text)
+
+    def _on_transfer_changed(self, transfer: Transfer):
+        """传输加入或状态变化"""
+        self._render_transfer(transfer)
+        if transfer.state == transferManager.DONE:
+            if transfer.kind == 'upload':
                 InfoBar.success(
-                    title="下载成功",
-                    content=f"模型文件 '{model.name}' 已下载到 {file_path}",
+                    title="上传成功",
+                    content=f"模型文件 '{transfer.name}' 已上传并记录",
                     parent=self,
                     position=InfoBarPosition.TOP_RIGHT
                 )
+                self.refresh_view()
             else:
-                InfoBar.error(
-                    title="下载失败",
-                    content=f"下载模型文件 '{model.name}' 失败",
+                InfoBar.success(
+                    title="下载成功",
+                    content=f"模型文件 '{transfer.name}' 已下载到 {transfer.local_file_path}",
                     parent=self,
                     position=InfoBarPosition.TOP_RIGHT
                 )
-        except Exception as e:
+        elif transfer.state == transferManager.FAILED:
             InfoBar.error(
-                title="下载失败",
-                content=f"下载模型文件时发生错误: {str(e)}",
+                title="上传失败" if transfer.kind == 'upload' else "下载失败",
+                content=f"模型文件 '{transfer.name}': {transfer.error}",
                 parent=self,
                 position=InfoBarPosition.TOP_RIGHT
             )
 
+    def _on_transfer_progress(self, transfer_id: int, done: int, total: Optional[int], rate: float):
+        """更新传输进度"""
+        row = self._transfer_rows.get(transfer_id)
+        if row is not None:
+            self._update_transfer_progress(row, done, total, rate)
+
+    def _on_throughput_changed(self, rate: float):
+        """显示所有进行中传输的总速度"""
+        self.throughput_label.setText(f"总速度: {self.format_file_size(rate)}/s" if rate else "")
+
     def toggle_model_permission(self, model):
         """切换模型权限"""
         try:
@@ -318,13 +457,14 @@ class ModelPage(QWidget):
         user_manager = UserManager.get_instance()
         return user_manager.is_admin()
 
-    def save_trained_model(self, model_name: str, model_data: bytes, sub_directory: str = "", description: str = None):
+    def save_trained_model(self, model_name: str, model_data: ModelData, sub_directory: str = "",
+                           description: str = None):
         """
         保存训练好的模型到远程服务器
 
         Args:
             model_name: 模型名称
-            model_data: 模型数据（字节）
+            model_data: 模型数据（字节、文件对象或字节块的迭代器，流式上传）
             sub_directory: 子目录路径（可选）
             description: 模型描述（可选）
         """
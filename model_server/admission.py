@@ -0,0 +1,157 @@
+"""
+上传的准入控制
+
+限制同时进行的上传数和在途字节数（全局和每个用户），超出时在读取请求体之前返回429，
+客户端按Retry-After退避后重试，避免大量训练任务同时结束时服务器接收全部上传而磁盘抖动。
+
+在途的上传记录在SQLite中，gunicorn的多个worker进程共享同一份计数。
+进程异常退出时遗留的记录在下次准入时清理（POSIX上检查进程是否存在，其他平台按时间）。
+"""
+
+from __future__ import annotations
+
+import os
+import sqlite3
+import time
+from pathlib import Path
+from typing import Dict, Optional
+
+from model_server.db import connect, transaction
+
+DEFAULT_RETRY_AFTER = 2  # 秒
+STALE_TRANSFER_AGE = 6 * 3600  # 超过该时间的在途记录视为遗留
+
+
+class AdmissionRejected(Exception):
+    """服务器繁忙，retry_after秒后重试"""
+
+    def __init__(self, message: str, retry_after: int):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def process_alive(pid: int) -> bool:
+    """进程是否存在（仅POSIX）"""
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class AdmissionController:
+    """按并发数和在途字节数准入上传"""
+
+    def __init__(self, db_path: Path, max_transfers: Optional[int] = None, max_bytes: Optional[int] = None,
+                 max_user_transfers: Optional[int] = None, max_user_bytes: Optional[int] = None,
+                 retry_after: int = DEFAULT_RETRY_AFTER):
+        """
+        Args:
+            db_path: 在途记录数据库文件路径
+            max_transfers: 全局同时上传数上限，None表示不限制
+            max_bytes: 全局在途字节数上限
+            max_user_transfers: 每个用户同时上传数上限
+            max_user_bytes: 每个用户在途字节数上限
+            retry_after: 拒绝时建议客户端等待的秒数
+        """
+        self.db_path = Path(db_path)
+        self.max_transfers = max_transfers
+        self.max_bytes = max_bytes
+        self.max_user_transfers = max_user_transfers
+        self.max_user_bytes = max_user_bytes
+        self.retry_after = retry_after
+        if not self.enabled:
+            return
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        conn = self._connect()
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+        finally:
+            conn.close()
+        with transaction(self._connect) as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS transfer ("
+                " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+                " username TEXT NOT NULL,"
+                " bytes INTEGER NOT NULL,"
+                " pid INTEGER NOT NULL,"
+                " started REAL NOT NULL)"
+            )
+
+    @property
+    def enabled(self) -> bool:
+        return any(limit is not None for limit in
+                   (self.max_transfers, self.max_bytes, self.max_user_transfers, self.max_user_bytes))
+
+    def _connect(self) -> sqlite3.Connection:
+        return connect(self.db_path)
+
+    def _reap(self, conn: sqlite3.Connection) -> None:
+        """清理异常退出的进程遗留的在途记录"""
+        conn.execute("DELETE FROM transfer WHERE started < ?", (time.time() - STALE_TRANSFER_AGE,))
+        if os.name != "posix":
+            return
+        pids = [row[0] for row in conn.execute("SELECT DISTINCT pid FROM transfer WHERE pid != ?", (os.getpid(),))]
+        for pid in pids:
+            if not process_alive(pid):
+                conn.execute("DELETE FROM transfer WHERE pid = ?", (pid,))
+
+    @staticmethod
+    def _over(limit: Optional[int], active: int, value: int, add: int) -> bool:
+        # 没有其他在途上传时总是放行，单个超过字节上限的上传不会永远被拒绝
+        return limit is not None and active > 0 and value + add > limit
+
+    def acquire(self, username: str, size: int) -> Optional[int]:
+        """
+        登记一个即将接收size字节的上传
+
+        Returns:
+            在途记录ID（上传结束后传给release）；未启用准入控制时返回None
+
+        Raises:
+            AdmissionRejected: 超出并发数或在途字节数上限
+        """
+        if not self.enabled:
+            return None
+        size = max(0, int(size or 0))
+        with transaction(self._connect) as conn:
+            self._reap(conn)
+            count, total = conn.execute("SELECT COUNT(*), COALESCE(SUM(bytes), 0) FROM transfer").fetchone()
+            user_count, user_total = conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(bytes), 0) FROM transfer WHERE username = ?", (username,)
+            ).fetchone()
+            if self._over(self.max_transfers, count, count, 1):
+                raise AdmissionRejected(f"Too many concurrent uploads ({count})", self.retry_after)
+            if self._over(self.max_bytes, count, total, size):
+                raise AdmissionRejected(f"Too many bytes in flight ({total} + {size})", self.retry_after)
+            if self._over(self.max_user_transfers, user_count, user_count, 1):
+                raise AdmissionRejected(f"Too many concurrent uploads for {username} ({user_count})",
+                                        self.retry_after)
+            if self._over(self.max_user_bytes, user_count, user_total, size):
+                raise AdmissionRejected(f"Too many bytes in flight for {username} ({user_total} + {size})",
+                                        self.retry_after)
+            cursor = conn.execute(
+                "INSERT INTO transfer (username, bytes, pid, started) VALUES (?, ?, ?, ?)",
+                (username, size, os.getpid(), time.time())
+            )
+            return cursor.lastrowid
+
+    def release(self, ticket: Optional[int]) -> None:
+        """上传结束（无论成功与否）后释放在途记录"""
+        if ticket is None:
+            return
+        with transaction(self._connect) as conn:
+            conn.execute("DELETE FROM transfer WHERE id = ?", (ticket,))
+
+    def status(self) -> Dict[str, int]:
+        """当前全局在途的上传数和字节数"""
+        if not self.enabled:
+            return {"transfers": 0, "bytes": 0}
+        conn = self._connect()
+        try:
+            count, total = conn.execute("SELECT COUNT(*), COALESCE(SUM(bytes), 0) FROM transfer").fetchone()
+        finally:
+            conn.close()
+        return {"transfers": count, "bytes": total}
@@ -0,0 +1,120 @@
+"""
+目录的流式打包
+
+边读文件边生成tar/zip数据块，不生成临时归档文件，内存占用与文件数量和大小无关。
+tar（默认）可以被客户端边下载边解包；zip的目录在末尾，只能下载完成后解压，
+但方便直接用系统工具打开。
+"""
+
+from __future__ import annotations
+
+import io
+import tarfile
+import time
+import zipfile
+from contextlib import ExitStack
+from typing import Callable, ContextManager, Iterable, Iterator, NamedTuple, BinaryIO
+
+READ_BLOCK_SIZE = 1024 * 1024
+TAR_BLOCK_SIZE = tarfile.BLOCKSIZE
+FORMATS = ("tar", "zip")
+
+
+class ArchiveEntry(NamedTuple):
+    """归档中的一个文件"""
+    name: str  # 归档内路径（以/分隔）
+    size: int  # 逻辑大小
+    mtime: float
+    open: Callable[[], ContextManager[BinaryIO]]  # 打开文件的逻辑内容
+
+
+def _iter_content(stream: BinaryIO, size: int) -> Iterator[bytes]:
+    """读取恰好size字节；文件比记录短时用0补足，保证归档结构完整"""
+    remaining = size
+    while remaining > 0:
+        block = stream.read(min(READ_BLOCK_SIZE, remaining))
+        if not block:
+            yield b"\0" * remaining
+            return
+        remaining -= len(block)
+        yield block
+
+
+def iter_tar(entries: Iterable[ArchiveEntry]) -> Iterator[bytes]:
+    """生成tar流（PAX格式，支持长路径和超过8GB的文件）"""
+    for entry in entries:
+        with ExitStack() as stack:
+            try:
+                stream = stack.enter_context(entry.open())
+            except FileNotFoundError:
+                # 打包过程中被删除的文件跳过
+                continue
+            info = tarfile.TarInfo(entry.name)
+            info.size = entry.size
+            info.mtime = int(entry.mtime)
+            info.mode = 0o644
+            yield info.tobuf(format=tarfile.PAX_FORMAT)
+            yield from _iter_content(stream, entry.size)
+            padding = -entry.size % TAR_BLOCK_SIZE
+            if padding:
+                yield b"\0" * padding
+    # 归档结束标记：两个全0块
+    yield b"\0" * (TAR_BLOCK_SIZE * 2)
+
+
+class _ChunkSink(io.RawIOBase):
+    """zipfile写入的目标：只记录写入的数据，由生成器取走（不可seek，zipfile因此使用数据描述符）"""
+
+    def __init__(self):
+        super().__init__()
+        self._chunks = []
+        self._position = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._position
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def iter_zip(entries: Iterable[ArchiveEntry]) -> Iterator[bytes]:
+    """生成zip流（不压缩存储，文件较大时自动使用ZIP64）"""
+    sink = _ChunkSink()
+    with zipfile.ZipFile(sink, mode="w", compression=zipfile.ZIP_STORED, allowZip64=True) as archive:
+        for entry in entries:
+            with ExitStack() as stack:
+                try:
+                    stream = stack.enter_context(entry.open())
+                except FileNotFoundError:
+                    continue
+                info = zipfile.ZipInfo(entry.name, time.localtime(entry.mtime)[:6])
+                info.file_size = entry.size
+                info.external_attr = 0o644 << 16
+                with archive.open(info, mode="w") as member:
+                    for block in _iter_content(stream, entry.size):
+                        member.write(block)
+                        data = sink.drain()
+                        if data:
+                            yield data
+            data = sink.drain()
+            if data:
+                yield data
+    yield sink.drain()
+
+
+def iter_archive(archive_format: str, entries: Iterable[ArchiveEntry]) -> Iterator[bytes]:
+    if archive_format == "tar":
+        return iter_tar(entries)
+    if archive_format == "zip":
+        return iter_zip(entries)
+    raise ValueError(f"Unsupported archive format: {archive_format}")
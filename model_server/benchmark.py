@@ -0,0 +1,135 @@
+"""
+模型服务吞吐量基准测试
+
+分别以dev（Flask开发服务器）和prod（gunicorn）模式在临时目录上启动remote_model_server.py，
+测量并发上传和并发下载的吞吐量：
+
+    poetry run python -m model_server.benchmark --size-mb 64 --concurrency 8
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import requests
+
+SERVER_SCRIPT = Path(__file__).resolve().parent.parent / "remote_model_server.py"
+BENCH_USER = "benchmark"
+
+
+def _start_server(mode: str, port: int, base_path: Path, workers: int, threads: int) -> subprocess.Popen:
+    env = dict(os.environ, MODEL_SERVER_BASE_PATH=str(base_path))
+    cmd = [sys.executable, str(SERVER_SCRIPT), "--mode", mode, "--host", "127.0.0.1", "--port", str(port),
+           "--workers", str(workers), "--threads", str(threads)]
+    # 独立进程组，停止时连同dev模式reloader的子进程一起结束
+    process = subprocess.Popen(cmd, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                               start_new_session=(os.name == "posix"))
+
+    url = f"http://127.0.0.1:{port}/models/list"
+    deadline = time.time() + 30
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"{mode}模式服务启动失败")
+        try:
+            requests.get(url, params={"username": BENCH_USER}, timeout=1)
+            return process
+        except requests.RequestException:
+            time.sleep(0.2)
+    _stop_server(process)
+    raise RuntimeError(f"{mode}模式服务启动超时")
+
+
+def _stop_server(process: subprocess.Popen) -> None:
+    if os.name == "posix":
+        os.killpg(process.pid, signal.SIGTERM)
+    else:
+        process.terminate()
+    process.wait(timeout=60)
+
+
+def _upload(base_url: str, name: str, payload: bytes) -> None:
+    response = requests.post(
+        f"{base_url}/models/upload",
+        files={"file": (name, payload)},
+        data={"username": BENCH_USER, "model_name": name},
+        timeout=600
+    )
+    response.raise_for_status()
+
+
+def _download(base_url: str, server_path: str) -> int:
+    received = 0
+    with requests.get(f"{base_url}/models/download",
+                      params={"username": BENCH_USER, "server_path": server_path},
+                      stream=True, timeout=600) as response:
+        response.raise_for_status()
+        for block in response.iter_content(1024 * 1024):
+            received += len(block)
+    return received
+
+
+def run_benchmark(mode: str, port: int, size_mb: int, concurrency: int, rounds: int,
+                  workers: int, threads: int) -> dict:
+    """
+    对一种服务模式执行上传/下载测试
+
+    Returns:
+        {'upload': MB/s, 'download': MB/s}
+    """
+    base_url = f"http://127.0.0.1:{port}"
+    payload = os.urandom(size_mb * 1024 * 1024)
+    with tempfile.TemporaryDirectory(prefix=f"model-bench-{mode}-") as tmp_dir:
+        process = _start_server(mode, port, Path(tmp_dir) / "models", workers, threads)
+        try:
+            # 每个文件加不同的前缀，避免被去重存储合并
+            names = [f"bench_{i}.bin" for i in range(concurrency)]
+            start = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=concurrency) as executor:
+                list(executor.map(lambda n: _upload(base_url, n, n.encode() + payload), names))
+            upload_elapsed = time.perf_counter() - start
+
+            start = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=concurrency) as executor:
+                jobs = [f"{BENCH_USER}/{n}" for n in names] * rounds
+                total_bytes = sum(executor.map(lambda p: _download(base_url, p), jobs))
+            download_elapsed = time.perf_counter() - start
+        finally:
+            _stop_server(process)
+
+    return {
+        "upload": size_mb * concurrency / upload_elapsed,
+        "download": total_bytes / (1024 * 1024) / download_elapsed,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="模型服务dev/prod模式吞吐量对比")
+    parser.add_argument("--size-mb", type=int, default=64, help="每个文件的大小（MB）")
+    parser.add_argument("--concurrency", type=int, default=8, help="并发客户端数量")
+    parser.add_argument("--rounds", type=int, default=3, help="每个文件下载的轮数")
+    parser.add_argument("--workers", type=int, default=4, help="prod模式worker进程数")
+    parser.add_argument("--threads", type=int, default=8, help="prod模式每个worker的线程数")
+    parser.add_argument("--port", type=int, default=18765)
+    parser.add_argument("--modes", default="dev,prod", help="要测试的模式，逗号分隔")
+    args = parser.parse_args()
+
+    results = {}
+    for offset, mode in enumerate(args.modes.split(",")):
+        results[mode] = run_benchmark(mode, args.port + offset, args.size_mb, args.concurrency,
+                                      args.rounds, args.workers, args.threads)
+
+    print(f"{'模式':<8}{'上传 MB/s':>14}{'下载 MB/s':>14}")
+    for mode, result in results.items():
+        print(f"{mode:<8}{result['upload']:>14.1f}{result['download']:>14.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,505 @@
+"""
+内容寻址的去重存储
+
+每份内容按SHA-256只保存一个blob，用户目录下的文件是指向blob的硬链接
+（文件系统不支持硬链接时退化为复制），因此下载、列表等按路径访问的逻辑不受影响。
+路径到摘要的引用关系记录在SQLite中，最后一个引用释放时删除blob。
+blob可以压缩存储（encoding列记录编码），摘要和size始终对应解压后的逻辑内容。
+
+配置冷层目录后blob可以在热层（objects）和冷层之间迁移：冷层可能在另一个文件系统上，
+不能硬链接，因此冷层blob的用户路径是指向冷层文件的符号链接，客户端使用的路径不变。
+
+目录结构：
+    <root>/objects/<前两位>/<sha256>       blob文件（热层）
+    <root>/tmp/                            上传中的临时文件
+    <root>/index.db                        blob与引用索引
+    <cold_root>/objects/<前两位>/<sha256>  冷层blob文件
+    <cold_root>/tmp/                       迁入冷层时的临时文件
+"""
+
+from __future__ import annotations
+
+import hashlib
+import os
+import shutil
+import sqlite3
+import time
+import uuid
+from pathlib import Path
+from typing import BinaryIO, Dict, List, Optional, Tuple
+
+from model_server.chunked_upload import atomic_move
+from model_server.db import connect, transaction
+
+HASH_BUFFER_SIZE = 1024 * 1024
+COLD = "cold"  # blob表tier列的取值，NULL表示热层
+
+
+class ChecksumMismatch(Exception):
+    """接收到的内容与客户端声明的SHA-256不一致（传输中损坏）"""
+
+    def __init__(self, expected: str, actual: str):
+        super().__init__(f"Checksum mismatch: expected sha256 {expected}, received {actual}")
+        self.expected = expected
+        self.actual = actual
+
+
+def verify_digest(expected: Optional[str], actual: str) -> None:
+    """
+    客户端声明了SHA-256时与接收时计算的摘要比较
+
+    Raises:
+        ChecksumMismatch: 不一致
+    """
+    if expected and expected.lower() != actual:
+        raise ChecksumMismatch(expected, actual)
+
+
+def hash_file(path: Path) -> Tuple[str, int]:
+    """计算文件的SHA-256，返回(十六进制摘要, 字节数)"""
+    digest = hashlib.sha256()
+    size = 0
+    with open(path, 'rb') as f:
+        while True:
+            block = f.read(HASH_BUFFER_SIZE)
+            if not block:
+                break
+            digest.update(block)
+            size += len(block)
+    return digest.hexdigest(), size
+
+
+def copy_stream_hashed(stream: BinaryIO, dst_path: Path) -> Tuple[str, int]:
+    """将流写入文件，同时计算SHA-256，返回(十六进制摘要, 字节数)"""
+    digest = hashlib.sha256()
+    size = 0
+    with open(dst_path, 'wb') as f:
+        while True:
+            block = stream.read(HASH_BUFFER_SIZE)
+            if not block:
+                break
+            digest.update(block)
+            f.write(block)
+            size += len(block)
+    return digest.hexdigest(), size
+
+
+class HashingTempFile:
+    """
+    边写入边计算SHA-256的临时文件
+
+    作为multipart解析器的文件容器使用时，上传内容直接落到存储的临时目录，
+    解析完成时摘要也已算好，不需要再复制或重新读取一遍。
+    """
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self.size = 0
+        self._hash = hashlib.sha256()
+        self._file = open(self.path, 'w+b')
+
+    def write(self, data: bytes) -> int:
+        self._hash.update(data)
+        self.size += len(data)
+        return self._file.write(data)
+
+    def hexdigest(self) -> str:
+        return self._hash.hexdigest()
+
+    def __getattr__(self, name):
+        # read/seek/readline/flush/close等委托给底层文件
+        return getattr(self._file, name)
+
+
+def copy_durable(src_path: Path, dst_path: Path) -> None:
+    """复制文件并fsync，rename到最终位置后即使断电内容也已落盘"""
+    with open(src_path, 'rb') as src, open(dst_path, 'wb') as dst:
+        shutil.copyfileobj(src, dst, HASH_BUFFER_SIZE)
+        dst.flush()
+        os.fsync(dst.fileno())
+
+
+def is_valid_digest(digest: str) -> bool:
+    return (isinstance(digest, str) and len(digest) == 64
+            and all(c in "0123456789abcdef" for c in digest))
+
+
+class BlobStore:
+    """
+    按SHA-256去重的blob存储
+
+    引用计数的变更与blob的链接/删除在同一个SQLite写事务中完成，
+    多个服务器进程并发写入时也不会删掉正在被链接的blob。
+    """
+
+    def __init__(self, root: Path, cold_root: Optional[Path] = None, models_root: Optional[Path] = None):
+        """
+        Args:
+            root: 存储根目录，必须与模型目录位于同一文件系统才能使用硬链接
+            cold_root: 冷层目录（可以是另一个文件系统），None表示不分层
+            models_root: 模型目录，迁移blob时按引用路径重建用户文件的链接，分层时必须提供
+        """
+        self.root = Path(root)
+        self.objects_path = self.root / "objects"
+        self.tmp_path = self.root / "tmp"
+        self.objects_path.mkdir(parents=True, exist_ok=True)
+        self.tmp_path.mkdir(parents=True, exist_ok=True)
+        self.db_path = self.root / "index.db"
+        self.cold_root = Path(cold_root) if cold_root else None
+        self.models_root = Path(models_root) if models_root else None
+        if self.cold_root:
+            if self.models_root is None:
+                raise ValueError("models_root is required for tiered storage")
+            self.cold_objects_path = self.cold_root / "objects"
+            self.cold_tmp_path = self.cold_root / "tmp"
+            self.cold_objects_path.mkdir(parents=True, exist_ok=True)
+            self.cold_tmp_path.mkdir(parents=True, exist_ok=True)
+
+        with transaction(self._connect) as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS blob ("
+                " digest TEXT PRIMARY KEY, size INTEGER NOT NULL, created REAL NOT NULL)"
+            )
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS ref ("
+                " path TEXT PRIMARY KEY, digest TEXT NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS ix_ref_digest ON ref (digest)")
+            columns = {row[1] for row in conn.execute("PRAGMA table_info(blob)")}
+            if "encoding" not in columns:
+                conn.execute("ALTER TABLE blob ADD COLUMN encoding TEXT")
+            # 分层：tier为NULL表示热层；stored_size为磁盘上的大小（压缩存储时小于size）；accessed为最近下载时间
+            for column, definition in (("tier", "TEXT"), ("stored_size", "INTEGER"), ("accessed", "REAL")):
+                if column not in columns:
+                    conn.execute(f"ALTER TABLE blob ADD COLUMN {column} {definition}")
+            conn.execute("CREATE INDEX IF NOT EXISTS ix_blob_tier_accessed ON blob (tier, accessed)")
+
+    def _connect(self) -> sqlite3.Connection:
+        return connect(self.db_path)
+
+    def blob_path(self, digest: str) -> Path:
+        return self.objects_path / digest[:2] / digest
+
+    def cold_blob_path(self, digest: str) -> Path:
+        return self.cold_objects_path / digest[:2] / digest
+
+    def _stored_path(self, digest: str, tier: Optional[str]) -> Path:
+        return self.cold_blob_path(digest) if tier == COLD else self.blob_path(digest)
+
+    def new_temp_path(self) -> Path:
+        """返回一个位于存储内的临时文件路径，用于接收上传数据"""
+        return self.tmp_path / uuid.uuid4().hex
+
+    def has(self, digest: str, size: Optional[int] = None) -> bool:
+        """判断blob是否存在（指定size时大小也必须一致）"""
+        if not is_valid_digest(digest):
+            return False
+        conn = self._connect()
+        try:
+            row = conn.execute("SELECT size, tier FROM blob WHERE digest = ?", (digest,)).fetchone()
+        finally:
+            conn.close()
+        if row is None or not self._stored_path(digest, row[1]).exists():
+            return False
+        return size is None or row[0] == size
+
+    def digest_of(self, rel_path: str) -> Optional[str]:
+        """返回路径当前引用的摘要"""
+        conn = self._connect()
+        try:
+            row = conn.execute("SELECT digest FROM ref WHERE path = ?", (rel_path,)).fetchone()
+        finally:
+            conn.close()
+        return row[0] if row else None
+
+    def describe(self, rel_path: str) -> Optional[Tuple[str, int, Optional[str]]]:
+        """
+        返回路径引用内容的(摘要, 逻辑大小, 存储编码)，不在存储中时返回None
+
+        存储编码为None表示按原样存储。
+        """
+        conn = self._connect()
+        try:
+            row = conn.execute(
+                "SELECT blob.digest, blob.size, blob.encoding FROM ref"
+                " JOIN blob ON blob.digest = ref.digest WHERE ref.path = ?",
+                (rel_path,)
+            ).fetchone()
+        finally:
+            conn.close()
+        return tuple(row) if row else None
+
+    def _tier_row(self, conn: sqlite3.Connection, digest: str) -> Optional[tuple]:
+        row = conn.execute("SELECT tier FROM blob WHERE digest = ?", (digest,)).fetchone()
+        return row
+
+    def _ingest(self, conn: sqlite3.Connection, src_path: Path, digest: str, size: int,
+                encoding: Optional[str]) -> Optional[Path]:
+        """
+        收入临时文件；内容已在冷层时用它直接作为热层副本（写入总是落在热层）
+
+        Returns:
+            提交后需要删除的冷层文件
+        """
+        row = self._tier_row(conn, digest)
+        if row is not None and row[0] == COLD and not self.blob_path(digest).exists():
+            atomic_move(Path(src_path), self.blob_path(digest))
+            conn.execute("UPDATE blob SET tier = NULL, accessed = ? WHERE digest = ?", (time.time(), digest))
+            self._relink_refs(conn, digest)
+            return self.cold_blob_path(digest)
+
+        blob_path = self.blob_path(digest)
+        if blob_path.exists():
+            os.unlink(src_path)
+        else:
+            stored_size = os.path.getsize(src_path)
+            atomic_move(Path(src_path), blob_path)
+            conn.execute(
+                "INSERT OR IGNORE INTO blob (digest, size, created, encoding, stored_size) VALUES (?, ?, ?, ?, ?)",
+                (digest, size, time.time(), encoding, stored_size)
+            )
+        return None
+
+    @staticmethod
+    def _place(blob_path: Path, target_path: Path, symlink: bool = False) -> None:
+        """让用户路径指向blob（原子替换）：热层用硬链接，冷层用符号链接"""
+        target_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = target_path.with_name(f".{target_path.name}.{uuid.uuid4().hex}.tmp")
+        if symlink:
+            os.symlink(blob_path, tmp_path)
+        else:
+            try:
+                os.link(blob_path, tmp_path)
+            except OSError:
+                # 不支持硬链接（如跨文件系统）时复制，失去去重但保证可用
+                shutil.copyfile(blob_path, tmp_path)
+        os.replace(tmp_path, target_path)
+        if os.path.lexists(tmp_path):
+            # 目标已是同一blob的硬链接时rename什么也不做，临时链接需要自己删除
+            os.unlink(tmp_path)
+
+    def _relink_refs(self, conn: sqlite3.Connection, digest: str) -> None:
+        """blob迁移后让所有引用它的用户路径指向新位置"""
+        row = self._tier_row(conn, digest)
+        cold = row is not None and row[0] == COLD
+        blob_path = self._stored_path(digest, row[0] if row else None)
+        for (rel_path,) in conn.execute("SELECT path FROM ref WHERE digest = ?", (digest,)).fetchall():
+            self._place(blob_path, self.models_root / rel_path, symlink=cold)
+
+    def _link(self, conn: sqlite3.Connection, digest: str, target_path: Path, rel_path: str) -> None:
+        row = self._tier_row(conn, digest)
+        cold = row is not None and row[0] == COLD
+        blob_path = self._stored_path(digest, row[0] if row else None)
+        if not blob_path.exists():
+            raise FileNotFoundError(f"Blob not found: {digest}")
+        self._place(blob_path, target_path, symlink=cold)
+
+        row = conn.execute("SELECT digest FROM ref WHERE path = ?", (rel_path,)).fetchone()
+        conn.execute("INSERT OR REPLACE INTO ref (path, digest) VALUES (?, ?)", (rel_path, digest))
+        if row and row[0] != digest:
+            self._drop_if_unreferenced(conn, row[0])
+
+    def add(self, src_path: Path, digest: str, size: int, target_path: Path, rel_path: str,
+            encoding: Optional[str] = None) -> bool:
+        """
+        将临时文件收入存储并链接到用户路径（原子替换已有文件）
+
+        内容已存在时直接丢弃临时文件，只新增一个链接。
+
+        Args:
+            src_path: 已写完的临时文件（位于存储内）
+            digest: 逻辑内容摘要
+            size: 逻辑内容大小
+            target_path: 用户目录下的文件路径
+            rel_path: 相对模型根目录的路径，作为引用键
+            encoding: src_path的压缩编码，None表示未压缩
+
+        Returns:
+            内容是否已存在（即本次被去重）
+        """
+        with transaction(self._connect) as conn:
+            row = self._tier_row(conn, digest)
+            existed = row is not None and self._stored_path(digest, row[0]).exists()
+            stale_path = self._ingest(conn, Path(src_path), digest, size, encoding)
+            self._link(conn, digest, Path(target_path), rel_path)
+        if stale_path is not None and stale_path.exists():
+            os.unlink(stale_path)
+        return existed
+
+    def link(self, digest: str, target_path: Path, rel_path: str) -> None:
+        """
+        让用户路径指向已存在的blob（原子替换已有文件），并记录引用
+
+        Raises:
+            FileNotFoundError: blob不存在
+        """
+        with transaction(self._connect) as conn:
+            self._link(conn, digest, Path(target_path), rel_path)
+
+    def release(self, rel_path: str, file_path: Path) -> bool:
+        """
+        删除用户路径并释放引用，最后一个引用释放时删除blob
+
+        Returns:
+            文件是否存在并被删除
+        """
+        with transaction(self._connect) as conn:
+            return self._release(conn, rel_path, file_path)
+
+    def release_many(self, items: List[Tuple[str, Path]]) -> List[bool]:
+        """
+        批量删除用户路径，在同一个事务中完成
+
+        Args:
+            items: [(server_path, 文件路径)]
+
+        Returns:
+            每个文件是否存在并被删除
+        """
+        with transaction(self._connect) as conn:
+            return [self._release(conn, rel_path, file_path) for rel_path, file_path in items]
+
+    def _release(self, conn: sqlite3.Connection, rel_path: str, file_path: Path) -> bool:
+        # 冷层文件的用户路径是符号链接，冷层文件丢失时也要删除链接本身
+        existed = Path(file_path).is_file() or Path(file_path).is_symlink()
+        if existed:
+            os.unlink(file_path)
+        row = conn.execute("SELECT digest FROM ref WHERE path = ?", (rel_path,)).fetchone()
+        if row:
+            conn.execute("DELETE FROM ref WHERE path = ?", (rel_path,))
+            self._drop_if_unreferenced(conn, row[0])
+        return existed
+
+    def _drop_if_unreferenced(self, conn: sqlite3.Connection, digest: str) -> None:
+        count = conn.execute("SELECT COUNT(*) FROM ref WHERE digest = ?", (digest,)).fetchone()[0]
+        if count == 0:
+            conn.execute("DELETE FROM blob WHERE digest = ?", (digest,))
+            blob_paths = [self.blob_path(digest)]
+            if self.cold_root:
+                blob_paths.append(self.cold_blob_path(digest))
+            for blob_path in blob_paths:
+                if blob_path.exists():
+                    os.unlink(blob_path)
+
+    def collect_garbage(self, max_temp_age: float = 24 * 3600) -> int:
+        """
+        清理没有引用的blob（如进程在写入引用前崩溃）和过期的临时文件
+
+        Returns:
+            清理的文件数量
+        """
+        removed = 0
+        now = time.time()
+        with transaction(self._connect) as conn:
+            rows = conn.execute(
+                "SELECT digest FROM blob WHERE created < ?"
+                " AND digest NOT IN (SELECT DISTINCT digest FROM ref)",
+                (now - max_temp_age,)
+            ).fetchall()
+            for (digest,) in rows:
+                self._drop_if_unreferenced(conn, digest)
+                removed += 1
+
+        tmp_dirs = [self.tmp_path, self.cold_tmp_path] if self.cold_root else [self.tmp_path]
+        for tmp_dir in tmp_dirs:
+            for tmp_file in tmp_dir.iterdir():
+                try:
+                    if now - tmp_file.stat().st_mtime > max_temp_age:
+                        tmp_file.unlink()
+                        removed += 1
+                except FileNotFoundError:
+                    pass
+        return removed
+
+    def tier_usage(self) -> Dict[str, int]:
+        """热层和冷层blob占用的磁盘字节数"""
+        conn = self._connect()
+        try:
+            rows = conn.execute(
+                "SELECT COALESCE(tier, 'hot'), COALESCE(SUM(COALESCE(stored_size, size)), 0)"
+                " FROM blob GROUP BY COALESCE(tier, 'hot')"
+            ).fetchall()
+        finally:
+            conn.close()
+        usage = {"hot": 0, COLD: 0}
+        usage.update(dict(rows))
+        return usage
+
+    def least_recently_used(self, limit: int) -> List[Tuple[str, int]]:
+        """热层中最久未下载的blob，返回[(摘要, 磁盘上的大小)]（从未下载的按创建时间）"""
+        conn = self._connect()
+        try:
+            return conn.execute(
+                "SELECT digest, COALESCE(stored_size, size) FROM blob WHERE tier IS NULL"
+                " ORDER BY COALESCE(accessed, created) LIMIT ?",
+                (limit,)
+            ).fetchall()
+        finally:
+            conn.close()
+
+    def touch(self, accesses: Dict[str, float]) -> None:
+        """批量记录blob的最近下载时间 {摘要: 时间}"""
+        if not accesses:
+            return
+        with transaction(self._connect) as conn:
+            conn.executemany("UPDATE blob SET accessed = MAX(COALESCE(accessed, 0), ?) WHERE digest = ?",
+                             [(accessed, digest) for digest, accessed in accesses.items()])
+
+    def demote(self, digest: str) -> bool:
+        """
+        把热层blob迁到冷层，用户路径改为指向冷层的符号链接
+
+        复制在事务外进行，事务内只做rename和重建链接；提交后才删除热层文件，
+        进行中的下载持有已打开的文件不受影响。
+
+        Returns:
+            是否迁移（blob已不在热层或已被删除时返回False）
+        """
+        hot_path = self.blob_path(digest)
+        tmp_path = self.cold_tmp_path / uuid.uuid4().hex
+        try:
+            try:
+                copy_durable(hot_path, tmp_path)
+            except FileNotFoundError:
+                return False
+            with transaction(self._connect) as conn:
+                row = self._tier_row(conn, digest)
+                if row is None or row[0] == COLD or not hot_path.exists():
+                    return False
+                cold_path = self.cold_blob_path(digest)
+                cold_path.parent.mkdir(parents=True, exist_ok=True)
+                os.replace(tmp_path, cold_path)
+                conn.execute("UPDATE blob SET tier = ? WHERE digest = ?", (COLD, digest))
+                self._relink_refs(conn, digest)
+            os.unlink(hot_path)
+            return True
+        finally:
+            if tmp_path.exists():
+                tmp_path.unlink()
+
+    def promote(self, digest: str) -> bool:
+        """
+        把冷层blob迁回热层，用户路径恢复为硬链接
+
+        Returns:
+            是否迁移（blob已在热层或已被删除时返回False）
+        """
+        cold_path = self.cold_blob_path(digest)
+        tmp_path = self.new_temp_path()
+        try:
+            try:
+                copy_durable(cold_path, tmp_path)
+            except FileNotFoundError:
+                return False
+            with transaction(self._connect) as conn:
+                row = self._tier_row(conn, digest)
+                if row is None or row[0] != COLD:
+                    return False
+                atomic_move(tmp_path, self.blob_path(digest))
+                conn.execute("UPDATE blob SET tier = NULL, accessed = ? WHERE digest = ?", (time.time(), digest))
+                self._relink_refs(conn, digest)
+            os.unlink(cold_path)
+            return True
+        finally:
+            if tmp_path.exists():
+                tmp_path.unlink()
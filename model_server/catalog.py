@@ -0,0 +1,503 @@
+"""
+模型文件元数据目录
+
+用SQLite记录每个用户文件的路径、大小、修改时间和摘要，上传和删除时增量更新，
+/models/list 直接查询索引而不再遍历磁盘。分页使用基于(排序列, path)的游标，
+翻到第几页的代价都与文件总数无关。每个用户有一个随文件变化递增的版本号，
+用于列表的ETag/Last-Modified；用户的文件数和总字节数随上传/删除在同一事务中增量维护，
+查询用量不需要遍历目录。
+
+每次写入或删除同时在change表中追加一条变更（同一事务），序号全局单调递增，
+客户端保存最后处理的序号，之后只需查询该序号之后的变更即可更新本地的文件列表。
+重建索引或清理过期变更后，早于保留范围的序号无法再增量同步，查询时返回reset要求全量重新列出。
+"""
+
+from __future__ import annotations
+
+import base64
+import json
+import os
+import sqlite3
+import time
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+
+from model_server.db import connect, transaction
+from model_server.versions import VERSIONS_DIR
+
+SORT_COLUMNS = ("path", "name", "size", "modified")
+MAX_PAGE_SIZE = 1000
+MAX_CHANGES = 1000  # 一次查询最多返回的变更数
+DEFAULT_CHANGE_RETENTION = 7 * 24 * 3600  # 秒
+CHANGE_PRUNE_INTERVAL = 3600  # 秒
+SQL_BATCH_SIZE = 500  # 批量查询时每条IN语句的参数个数（SQLite默认上限999）
+
+
+class CatalogError(Exception):
+    """查询参数错误"""
+
+
+def _encode_cursor(values: list) -> str:
+    return base64.urlsafe_b64encode(json.dumps(values).encode("utf8")).decode("ascii")
+
+
+def _decode_cursor(cursor: str) -> list:
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")).decode("utf8"))
+    except (ValueError, UnicodeError):
+        raise CatalogError("Invalid cursor")
+    if not isinstance(values, list) or len(values) != 2:
+        raise CatalogError("Invalid cursor")
+    return values
+
+
+class ModelCatalog:
+    """
+    基于SQLite的文件索引
+
+    每次操作使用独立连接，可以在多线程/多进程的服务器中共享同一个数据库文件。
+    """
+
+    def __init__(self, db_path: Path, base_path: Path, change_retention: Optional[float] = DEFAULT_CHANGE_RETENTION):
+        """
+        Args:
+            db_path: 索引数据库文件路径
+            base_path: 模型根目录（用于首次建立索引）
+            change_retention: 变更记录的保留时间（秒），None表示永久保留
+        """
+        self.db_path = Path(db_path)
+        self.base_path = Path(base_path)
+        self.change_retention = change_retention
+        self._pruned_at = 0.0
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+
+        # WAL模式下读不阻塞写，列表查询不会被上传时的索引更新卡住
+        conn = self._connect()
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+        finally:
+            conn.close()
+
+        with transaction(self._connect) as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS file ("
+                " path TEXT PRIMARY KEY,"
+                " username TEXT NOT NULL,"
+                " name TEXT NOT NULL,"
+                " size INTEGER NOT NULL,"
+                " modified REAL NOT NULL,"
+                " sha256 TEXT)"
+            )
+            for column in ("name", "size", "modified"):
+                conn.execute(
+                    f"CREATE INDEX IF NOT EXISTS ix_file_user_{column} ON file (username, {column}, path)"
+                )
+            conn.execute("CREATE INDEX IF NOT EXISTS ix_file_user_path ON file (username, path)")
+            conn.execute("CREATE TABLE IF NOT EXISTS state (key TEXT PRIMARY KEY, value TEXT)")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS user_state ("
+                " username TEXT PRIMARY KEY,"
+                " version INTEGER NOT NULL,"
+                " modified REAL NOT NULL,"
+                " bytes INTEGER NOT NULL DEFAULT 0,"
+                " files INTEGER NOT NULL DEFAULT 0)"
+            )
+            # 旧索引没有用量列：补上后按现有记录统计一次
+            columns = {row[1] for row in conn.execute("PRAGMA table_info(user_state)")}
+            if "bytes" not in columns:
+                conn.execute("ALTER TABLE user_state ADD COLUMN bytes INTEGER NOT NULL DEFAULT 0")
+                conn.execute("ALTER TABLE user_state ADD COLUMN files INTEGER NOT NULL DEFAULT 0")
+                self._recount_usage(conn)
+            # AUTOINCREMENT保证序号不会因为删除旧记录而被复用
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS change ("
+                " seq INTEGER PRIMARY KEY AUTOINCREMENT,"
+                " username TEXT NOT NULL,"
+                " path TEXT NOT NULL,"
+                " op TEXT NOT NULL,"
+                " size INTEGER,"
+                " modified REAL,"
+                " sha256 TEXT,"
+                " time REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS ix_change_user_seq ON change (username, seq)")
+            conn.execute("CREATE INDEX IF NOT EXISTS ix_change_time ON change (time)")
+
+    def _connect(self) -> sqlite3.Connection:
+        return connect(self.db_path, sqlite3.Row)
+
+    def ensure_built(self, size_lookup: Optional[Callable[[str], Optional[int]]] = None) -> bool:
+        """
+        首次使用时遍历模型目录建立索引（只执行一次）
+
+        Args:
+            size_lookup: 按server_path返回逻辑大小的函数（压缩存储的文件磁盘大小不是逻辑大小），
+                返回None时使用磁盘大小
+
+        Returns:
+            本次是否执行了全量建立
+        """
+        with transaction(self._connect) as conn:
+            row = conn.execute("SELECT value FROM state WHERE key = 'built'").fetchone()
+            if row:
+                return False
+            self._rebuild(conn, size_lookup)
+            conn.execute("INSERT OR REPLACE INTO state (key, value) VALUES ('built', ?)", (str(time.time()),))
+            return True
+
+    def rebuild(self, size_lookup: Optional[Callable[[str], Optional[int]]] = None) -> None:
+        """丢弃索引并重新遍历模型目录（文件在服务之外被修改后使用）"""
+        with transaction(self._connect) as conn:
+            self._rebuild(conn, size_lookup)
+            conn.execute("INSERT OR REPLACE INTO state (key, value) VALUES ('built', ?)", (str(time.time()),))
+
+    def _rebuild(self, conn: sqlite3.Connection,
+                 size_lookup: Optional[Callable[[str], Optional[int]]]) -> None:
+        conn.execute("DELETE FROM file")
+        # 版本号重新开始，state中的built时间变化保证ETag不会与重建前相同
+        conn.execute("DELETE FROM user_state")
+        # 重建前的变更不再能描述索引内容：插入一条标记使序号前进，之前的所有序号都需要全量同步
+        conn.execute("INSERT INTO change (username, path, op, time) VALUES ('', '', 'reset', ?)", (time.time(),))
+        conn.execute("DELETE FROM change")
+        self._set_change_floor(conn, self._last_seq(conn))
+        if not self.base_path.exists():
+            return
+        for user_dir in self.base_path.iterdir():
+            if not user_dir.is_dir():
+                continue
+            for root, dirs, filenames in os.walk(user_dir):
+                # 版本内容目录不出现在列表中
+                dirs[:] = [name for name in dirs if name != VERSIONS_DIR]
+                for filename in filenames:
+                    file_path = Path(root) / filename
+                    relative_path = str(file_path.relative_to(self.base_path))
+                    stat = file_path.stat()
+                    size = size_lookup(relative_path) if size_lookup else None
+                    conn.execute(
+                        "INSERT OR REPLACE INTO file (path, username, name, size, modified, sha256)"
+                        " VALUES (?, ?, ?, ?, ?, NULL)",
+                        (relative_path, user_dir.name, filename,
+                         stat.st_size if size is None else size, stat.st_mtime)
+                    )
+        self._recount_usage(conn)
+
+    @staticmethod
+    def _recount_usage(conn: sqlite3.Connection) -> None:
+        """按file表重新统计所有用户的用量"""
+        conn.execute(
+            "INSERT INTO user_state (username, version, modified, bytes, files)"
+            " SELECT username, 0, ?, SUM(size), COUNT(*) FROM file WHERE 1 GROUP BY username"
+            " ON CONFLICT(username) DO UPDATE SET bytes = excluded.bytes, files = excluded.files",
+            (time.time(),)
+        )
+
+    @staticmethod
+    def _touch_user(conn: sqlite3.Connection, username: str, bytes_delta: int = 0, files_delta: int = 0) -> None:
+        """递增用户的版本号并累加用量"""
+        conn.execute(
+            "INSERT INTO user_state (username, version, modified, bytes, files) VALUES (?, 1, ?, ?, ?)"
+            " ON CONFLICT(username) DO UPDATE SET version = version + 1, modified = excluded.modified,"
+            " bytes = bytes + excluded.bytes, files = files + excluded.files",
+            (username, time.time(), bytes_delta, files_delta)
+        )
+
+    def upsert(self, path: str, username: str, size: int, modified: Optional[float] = None,
+               sha256: Optional[str] = None) -> None:
+        """记录（或覆盖）一个文件"""
+        with transaction(self._connect) as conn:
+            old = conn.execute("SELECT size FROM file WHERE path = ?", (path,)).fetchone()
+            conn.execute(
+                "INSERT OR REPLACE INTO file (path, username, name, size, modified, sha256)"
+                " VALUES (?, ?, ?, ?, ?, ?)",
+                (path, username, Path(path).name, size,
+                 modified if modified is not None else time.time(), sha256)
+            )
+            if old is None:
+                self._touch_user(conn, username, size, 1)
+            else:
+                self._touch_user(conn, username, size - old["size"], 0)
+            self._log_change(conn, username, path, "upsert", size, modified, sha256)
+        self._prune_changes_if_due()
+
+    def remove(self, path: str) -> None:
+        """删除一个文件的记录"""
+        self.remove_many([path])
+
+    def remove_many(self, paths: List[str]) -> None:
+        """在同一个事务中删除多个文件的记录"""
+        with transaction(self._connect) as conn:
+            deltas: Dict[str, list] = {}
+            for path in paths:
+                row = conn.execute("SELECT username, size FROM file WHERE path = ?", (path,)).fetchone()
+                if row is None:
+                    continue
+                conn.execute("DELETE FROM file WHERE path = ?", (path,))
+                delta = deltas.setdefault(row["username"], [0, 0])
+                delta[0] -= row["size"]
+                delta[1] -= 1
+                self._log_change(conn, row["username"], path, "delete")
+            for username, (bytes_delta, files_delta) in deltas.items():
+                self._touch_user(conn, username, bytes_delta, files_delta)
+
+    @staticmethod
+    def _log_change(conn: sqlite3.Connection, username: str, path: str, op: str, size: Optional[int] = None,
+                    modified: Optional[float] = None, sha256: Optional[str] = None) -> None:
+        now = time.time()
+        conn.execute(
+            "INSERT INTO change (username, path, op, size, modified, sha256, time) VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (username, path, op, size, (modified if modified is not None else now) if op == "upsert" else None,
+             sha256, now)
+        )
+
+    @staticmethod
+    def _last_seq(conn: sqlite3.Connection) -> int:
+        # sqlite_sequence记录AUTOINCREMENT用过的最大值，change表清空后也不会回退
+        row = conn.execute("SELECT seq FROM sqlite_sequence WHERE name = 'change'").fetchone()
+        return row[0] if row else 0
+
+    @staticmethod
+    def _change_floor(conn: sqlite3.Connection) -> int:
+        row = conn.execute("SELECT value FROM state WHERE key = 'change_floor'").fetchone()
+        return int(row[0]) if row else 0
+
+    @staticmethod
+    def _set_change_floor(conn: sqlite3.Connection, seq: int) -> None:
+        conn.execute("INSERT OR REPLACE INTO state (key, value) VALUES ('change_floor', ?)", (str(seq),))
+
+    def _prune_changes_if_due(self) -> None:
+        if self.change_retention is None or time.time() - self._pruned_at < CHANGE_PRUNE_INTERVAL:
+            return
+        self._pruned_at = time.time()
+        self.prune_changes()
+
+    def prune_changes(self, max_age: Optional[float] = None) -> int:
+        """
+        删除超过保留时间的变更记录
+
+        Args:
+            max_age: 保留时间（秒），None表示使用change_retention
+
+        Returns:
+            删除的记录数
+        """
+        max_age = self.change_retention if max_age is None else max_age
+        if max_age is None:
+            return 0
+        with transaction(self._connect) as conn:
+            row = conn.execute("SELECT MAX(seq) FROM change WHERE time < ?", (time.time() - max_age,)).fetchone()
+            if row[0] is None:
+                return 0
+            removed = conn.execute("DELETE FROM change WHERE seq <= ?", (row[0],)).rowcount
+            self._set_change_floor(conn, max(row[0], self._change_floor(conn)))
+            return removed
+
+    def latest_seq(self) -> int:
+        """当前最新的变更序号"""
+        conn = self._connect()
+        try:
+            return self._last_seq(conn)
+        finally:
+            conn.close()
+
+    def changes_since(self, username: str, since: int,
+                      limit: int = MAX_CHANGES) -> Tuple[List[dict], int, bool]:
+        """
+        查询用户在序号since之后的变更
+
+        Args:
+            username: 用户名
+            since: 客户端已处理到的序号
+            limit: 最多返回的变更数
+
+        Returns:
+            Tuple[按序号排列的变更, 下次查询使用的序号, 是否需要全量重新同步]；
+            需要全量同步时变更列表为空，客户端应先记下返回的序号再重新列出文件
+        """
+        if limit <= 0 or limit > MAX_CHANGES:
+            raise CatalogError(f"limit must be between 1 and {MAX_CHANGES}")
+        conn = self._connect()
+        try:
+            # 同一个读事务中查询变更和最新序号，两者对应同一个快照
+            conn.execute("BEGIN")
+            last_seq = self._last_seq(conn)
+            if since < self._change_floor(conn) or since > last_seq:
+                conn.execute("COMMIT")
+                return [], last_seq, True
+            rows = [dict(row) for row in conn.execute(
+                "SELECT seq, op, path, size, modified, sha256 FROM change"
+                " WHERE username = ? AND seq > ? ORDER BY seq LIMIT ?",
+                (username, since, limit)
+            )]
+            conn.execute("COMMIT")
+        finally:
+            conn.close()
+        for row in rows:
+            row["name"] = Path(row["path"]).name
+            if row["op"] == "delete":
+                for key in ("size", "modified", "sha256"):
+                    del row[key]
+        # 没有更多变更时直接跳到最新序号，其他用户的变更不需要再扫描
+        next_seq = rows[-1]["seq"] if len(rows) == limit else last_seq
+        return rows, next_seq, False
+
+    def wait_for_change(self, timeout: float, interval: float = 0.25,
+                        stop: Optional[Callable[[], bool]] = None) -> bool:
+        """
+        等待数据库被其他连接修改（用于长轮询）
+
+        PRAGMA data_version在其他连接提交写事务后改变，轮询它只读内存中的计数，不读取任何表。
+
+        Args:
+            timeout: 最长等待时间（秒）
+            interval: 检查间隔（秒）
+            stop: 返回True时提前结束等待
+
+        Returns:
+            是否在超时前发生了修改
+        """
+        deadline = time.monotonic() + timeout
+        conn = self._connect()
+        try:
+            version = conn.execute("PRAGMA data_version").fetchone()[0]
+            while time.monotonic() < deadline:
+                time.sleep(min(interval, max(0.0, deadline - time.monotonic())))
+                if conn.execute("PRAGMA data_version").fetchone()[0] != version:
+                    return True
+                if stop is not None and stop():
+                    return False
+        finally:
+            conn.close()
+        return False
+
+    def usage(self, username: str) -> Dict[str, int]:
+        """
+        用户的存储用量（逻辑大小，去重和压缩前）
+
+        Returns:
+            {"bytes": 总字节数, "files": 文件数}
+        """
+        conn = self._connect()
+        try:
+            row = conn.execute("SELECT bytes, files FROM user_state WHERE username = ?", (username,)).fetchone()
+        finally:
+            conn.close()
+        return {"bytes": row["bytes"], "files": row["files"]} if row else {"bytes": 0, "files": 0}
+
+    def user_version(self, username: str) -> Tuple[str, float]:
+        """
+        用户文件列表的版本
+
+        Returns:
+            Tuple[版本标识（任何文件变化或重建索引后都会改变）, 最后变化时间]
+        """
+        conn = self._connect()
+        try:
+            built = conn.execute("SELECT value FROM state WHERE key = 'built'").fetchone()
+            row = conn.execute(
+                "SELECT version, modified FROM user_state WHERE username = ?", (username,)
+            ).fetchone()
+        finally:
+            conn.close()
+        built_at = float(built[0]) if built else 0.0
+        if row is None:
+            return f"{built_at}:0", built_at
+        return f"{built_at}:{row['version']}", row["modified"]
+
+    def get(self, path: str) -> Optional[dict]:
+        """查询单个文件的记录"""
+        conn = self._connect()
+        try:
+            row = conn.execute(
+                "SELECT path, name, size, modified, sha256 FROM file WHERE path = ?", (path,)
+            ).fetchone()
+        finally:
+            conn.close()
+        return dict(row) if row else None
+
+    def get_many(self, paths: List[str]) -> Dict[str, dict]:
+        """
+        批量查询文件记录
+
+        Returns:
+            {path: 记录}，不存在的路径不在结果中
+        """
+        result = {}
+        conn = self._connect()
+        try:
+            for i in range(0, len(paths), SQL_BATCH_SIZE):
+                batch = paths[i:i + SQL_BATCH_SIZE]
+                rows = conn.execute(
+                    "SELECT path, name, size, modified, sha256 FROM file"
+                    f" WHERE path IN ({', '.join('?' * len(batch))})", batch
+                )
+                result.update((row["path"], dict(row)) for row in rows)
+        finally:
+            conn.close()
+        return result
+
+    def list_files(self, username: str, sub_directory: str = "", prefix: str = "",
+                   sort: str = "path", descending: bool = False,
+                   limit: Optional[int] = None,
+                   cursor: Optional[str] = None) -> Tuple[List[dict], Optional[str]]:
+        """
+        分页列出用户文件
+
+        Args:
+            username: 用户名
+            sub_directory: 只列出该子目录（含下级目录）中的文件
+            prefix: 文件名前缀过滤
+            sort: 排序列，path/name/size/modified
+            descending: 是否降序
+            limit: 每页数量，None表示不分页
+            cursor: 上一页返回的游标
+
+        Returns:
+            Tuple[文件列表, 下一页游标（没有更多时为None）]
+        """
+        if sort not in SORT_COLUMNS:
+            raise CatalogError(f"Invalid sort column: {sort}")
+        if limit is not None and (limit <= 0 or limit > MAX_PAGE_SIZE):
+            raise CatalogError(f"limit must be between 1 and {MAX_PAGE_SIZE}")
+
+        clauses = ["username = ?"]
+        params: list = [username]
+
+        # 子目录过滤用path范围查询，可以走(username, path)索引
+        if sub_directory:
+            dir_prefix = str(Path(username) / sub_directory) + os.sep
+            clauses.append("path >= ? AND path < ?")
+            params.extend([dir_prefix, dir_prefix + "\U0010ffff"])
+        if prefix:
+            clauses.append("name >= ? AND name < ?")
+            params.extend([prefix, prefix + "\U0010ffff"])
+
+        op = "<" if descending else ">"
+        if cursor:
+            last_value, last_path = _decode_cursor(cursor)
+            if sort == "path":
+                clauses.append(f"path {op} ?")
+                params.append(last_path)
+            else:
+                clauses.append(f"({sort} {op} ? OR ({sort} = ? AND path {op} ?))")
+                params.extend([last_value, last_value, last_path])
+
+        direction = "DESC" if descending else "ASC"
+        order = f"path {direction}" if sort == "path" else f"{sort} {direction}, path {direction}"
+        sql = (f"SELECT path, name, size, modified, sha256 FROM file WHERE {' AND '.join(clauses)}"
+               f" ORDER BY {order}")
+        if limit is not None:
+            sql += " LIMIT ?"
+            params.append(limit + 1)
+
+        conn = self._connect()
+        try:
+            rows = [dict(row) for row in conn.execute(sql, params)]
+        finally:
+            conn.close()
+
+        next_cursor = None
+        if limit is not None and len(rows) > limit:
+            rows = rows[:limit]
+            last = rows[-1]
+            next_cursor = _encode_cursor([last[sort], last["path"]])
+        return rows, next_cursor
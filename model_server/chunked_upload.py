@@ -0,0 +1,319 @@
+"""
+分块上传会话存储
+
+大文件上传拆分为：创建会话 -> 按序号PUT分块 -> 查询已接收分块 -> 提交。
+每个分块直接写入会话临时文件中的对应偏移，提交时原子重命名到目标路径，
+中断后客户端只需补传缺失的分块。
+
+会话目录结构：
+    <root>/<session_id>/session.json   会话元数据
+    <root>/<session_id>/data.part      预分配的临时数据文件
+    <root>/<session_id>/chunks/<index> 已落盘分块的标记文件（内容为本次写入的随机令牌）
+
+分块按顺序到达同一进程时，SHA-256随写入一起滚动计算，提交时不需要再读一遍文件；
+乱序、重传或分块落在不同worker进程时无法滚动计算，提交方退回到重新读取文件计算。
+"""
+
+from __future__ import annotations
+
+import errno
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+import uuid
+from pathlib import Path
+from typing import BinaryIO, Dict, Optional
+
+COPY_BUFFER_SIZE = 1024 * 1024  # 从请求流写入磁盘的缓冲区大小
+DEFAULT_CHUNK_SIZE = 64 * 1024 * 1024
+MAX_CHUNK_SIZE = 512 * 1024 * 1024
+
+
+class UploadSessionError(Exception):
+    """分块上传会话错误，status为对应的HTTP状态码"""
+
+    def __init__(self, message: str, status: int = 400):
+        super().__init__(message)
+        self.status = status
+
+
+def atomic_move(src: Path, dst: Path) -> None:
+    """
+    将文件原子地移动到目标路径
+
+    同一文件系统内直接rename；跨文件系统时先复制到目标目录下的临时文件再rename，
+    保证目标路径上不会出现写了一半的文件。
+    """
+    dst.parent.mkdir(parents=True, exist_ok=True)
+    try:
+        os.replace(src, dst)
+    except OSError as e:
+        if e.errno != errno.EXDEV:
+            raise
+        tmp_path = dst.with_name(f".{dst.name}.{uuid.uuid4().hex}.tmp")
+        try:
+            shutil.copyfile(src, tmp_path)
+            os.replace(tmp_path, dst)
+        finally:
+            if tmp_path.exists():
+                tmp_path.unlink()
+        os.unlink(src)
+
+
+class ChunkedUploadStore:
+    """
+    分块上传会话管理器
+
+    会话状态全部保存在磁盘上（分块标记为独立文件），多线程/多进程的服务器
+    worker可以并发写入同一会话的不同分块，服务重启后会话依然可以继续。
+    """
+
+    def __init__(self, root: Path, session_ttl: float = 24 * 3600):
+        """
+        Args:
+            root: 会话根目录，应与模型目录位于同一文件系统以保证提交时rename是原子的
+            session_ttl: 会话过期时间（秒），过期未提交的会话会被清理
+        """
+        self.root = Path(root)
+        self.session_ttl = session_ttl
+        self.root.mkdir(parents=True, exist_ok=True)
+        # {会话ID: (已按顺序写入的前缀的SHA-256, 这些分块的写入令牌)}，仅在本进程内有效
+        self._digests: Dict[str, tuple] = {}
+        self._digests_lock = threading.Lock()
+
+    def _session_dir(self, session_id: str) -> Path:
+        # 会话ID只允许十六进制字符，防止路径穿越
+        if not session_id or not all(c in "0123456789abcdef" for c in session_id):
+            raise UploadSessionError("Invalid session id", 400)
+        return self.root / session_id
+
+    def _load_meta(self, session_id: str) -> dict:
+        meta_path = self._session_dir(session_id) / "session.json"
+        try:
+            with open(meta_path, "r", encoding="utf8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            raise UploadSessionError("Upload session not found", 404)
+
+    def _write_meta(self, session_dir: Path, meta: dict) -> None:
+        tmp_path = session_dir / "session.json.tmp"
+        with open(tmp_path, "w", encoding="utf8") as f:
+            json.dump(meta, f)
+        os.replace(tmp_path, session_dir / "session.json")
+
+    @staticmethod
+    def chunk_count(total_size: int, chunk_size: int) -> int:
+        """计算分块数量（空文件视为0个分块）"""
+        return (total_size + chunk_size - 1) // chunk_size
+
+    def _expected_chunk_length(self, meta: dict, index: int) -> int:
+        offset = index * meta["chunk_size"]
+        return min(meta["chunk_size"], meta["total_size"] - offset)
+
+    def received_chunks(self, session_id: str) -> list:
+        """返回已落盘的分块序号列表（升序）"""
+        chunks_dir = self._session_dir(session_id) / "chunks"
+        if not chunks_dir.exists():
+            return []
+        return sorted(int(name) for name in os.listdir(chunks_dir) if name.isdigit())
+
+    def create_session(self, username: str, model_name: str, sub_directory: str,
+                       total_size: int, chunk_size: int = DEFAULT_CHUNK_SIZE,
+                       resume_key: Optional[str] = None) -> dict:
+        """
+        创建上传会话
+
+        如果提供了resume_key，同一用户相同resume_key的会话会被复用，
+        客户端重启后也能找回之前已上传的分块。
+
+        Returns:
+            会话信息字典
+        """
+        if total_size < 0:
+            raise UploadSessionError("Invalid total_size", 400)
+        if chunk_size <= 0 or chunk_size > MAX_CHUNK_SIZE:
+            raise UploadSessionError("Invalid chunk_size", 400)
+
+        self.cleanup_expired()
+
+        if resume_key:
+            digest = hashlib.sha256(f"{username}\0{resume_key}".encode("utf8")).hexdigest()
+            session_id = digest[:32]
+        else:
+            session_id = uuid.uuid4().hex
+
+        session_dir = self._session_dir(session_id)
+        meta = {
+            "session_id": session_id,
+            "username": username,
+            "model_name": model_name,
+            "sub_directory": sub_directory,
+            "total_size": total_size,
+            "chunk_size": chunk_size,
+            "created": time.time(),
+        }
+
+        if session_dir.exists():
+            try:
+                existing = self._load_meta(session_id)
+            except (UploadSessionError, ValueError):
+                existing = None
+            keys = ("username", "model_name", "sub_directory", "total_size", "chunk_size")
+            if existing and all(existing.get(k) == meta[k] for k in keys):
+                return self.describe(session_id)
+            # 参数不一致，旧会话作废
+            shutil.rmtree(session_dir, ignore_errors=True)
+
+        (session_dir / "chunks").mkdir(parents=True, exist_ok=True)
+        with open(session_dir / "data.part", "wb") as f:
+            f.truncate(total_size)
+        self._write_meta(session_dir, meta)
+        return self.describe(session_id)
+
+    def describe(self, session_id: str) -> dict:
+        """返回会话元数据及已接收的分块"""
+        meta = self._load_meta(session_id)
+        received = self.received_chunks(session_id)
+        meta["chunk_count"] = self.chunk_count(meta["total_size"], meta["chunk_size"])
+        meta["received"] = received
+        meta["received_bytes"] = sum(self._expected_chunk_length(meta, i) for i in received)
+        return meta
+
+    def check_owner(self, session_id: str, username: str) -> dict:
+        """校验会话属于指定用户，返回会话元数据"""
+        meta = self._load_meta(session_id)
+        if meta.get("username") != username:
+            raise UploadSessionError("Access denied", 403)
+        return meta
+
+    def write_chunk(self, session_id: str, index: int, stream: BinaryIO) -> int:
+        """
+        将请求流中的一个分块写入临时文件的对应偏移
+
+        分块长度必须与预期一致；写入并fsync成功后才会记录分块标记，
+        因此中途断开的分块会被视为缺失，由客户端重传。
+        分块恰好接在本进程已计算的前缀之后时，边写入边更新整个文件的SHA-256。
+
+        Returns:
+            写入的字节数
+        """
+        meta = self._load_meta(session_id)
+        count = self.chunk_count(meta["total_size"], meta["chunk_size"])
+        if index < 0 or index >= count:
+            raise UploadSessionError("Chunk index out of range", 416)
+
+        expected = self._expected_chunk_length(meta, index)
+        session_dir = self._session_dir(session_id)
+        with self._digests_lock:
+            state = self._digests.get(session_id)
+            if index == 0:
+                digest, tokens = hashlib.sha256(), []
+            elif state is not None and len(state[1]) == index:
+                digest, tokens = state[0].copy(), state[1]
+            else:
+                digest, tokens = None, None
+        written = 0
+        with open(session_dir / "data.part", "r+b") as f:
+            f.seek(index * meta["chunk_size"])
+            while True:
+                block = stream.read(min(COPY_BUFFER_SIZE, expected - written + 1))
+                if not block:
+                    break
+                written += len(block)
+                if written > expected:
+                    raise UploadSessionError("Chunk larger than expected", 400)
+                f.write(block)
+                if digest is not None:
+                    digest.update(block)
+            if written != expected:
+                raise UploadSessionError(
+                    f"Incomplete chunk: expected {expected} bytes, got {written}", 400)
+            f.flush()
+            os.fsync(f.fileno())
+
+        token = uuid.uuid4().hex
+        marker_path = session_dir / "chunks" / str(index)
+        tmp_marker = marker_path.with_name(f".{index}.{token}.tmp")
+        tmp_marker.write_text(token, encoding="utf8")
+        os.replace(tmp_marker, marker_path)
+        if digest is not None:
+            with self._digests_lock:
+                self._digests[session_id] = (digest, tokens + [token])
+        return written
+
+    def streamed_digest(self, session_id: str) -> Optional[str]:
+        """
+        返回写入时滚动计算的整个文件的SHA-256（应在commit之前调用）
+
+        只有本进程按顺序写入了全部分块，且这些分块之后没有被其他请求重写时才有结果，
+        否则返回None，调用方需要读取文件计算。
+        """
+        with self._digests_lock:
+            state = self._digests.pop(session_id, None)
+        if state is None:
+            return None
+        meta = self._load_meta(session_id)
+        digest, tokens = state
+        if len(tokens) != self.chunk_count(meta["total_size"], meta["chunk_size"]):
+            return None
+        chunks_dir = self._session_dir(session_id) / "chunks"
+        for index, token in enumerate(tokens):
+            try:
+                if (chunks_dir / str(index)).read_text(encoding="utf8") != token:
+                    return None
+            except FileNotFoundError:
+                return None
+        return digest.hexdigest()
+
+    def commit(self, session_id: str, target_path: Path) -> Path:
+        """
+        所有分块到齐后将临时文件原子地重命名为目标文件，并删除会话
+
+        Returns:
+            目标文件路径
+        """
+        meta = self._load_meta(session_id)
+        count = self.chunk_count(meta["total_size"], meta["chunk_size"])
+        missing = set(range(count)) - set(self.received_chunks(session_id))
+        if missing:
+            raise UploadSessionError(f"Missing {len(missing)} chunks", 409)
+
+        session_dir = self._session_dir(session_id)
+        with self._digests_lock:
+            self._digests.pop(session_id, None)
+        atomic_move(session_dir / "data.part", Path(target_path))
+        shutil.rmtree(session_dir, ignore_errors=True)
+        return Path(target_path)
+
+    def abort(self, session_id: str) -> None:
+        """放弃会话并删除临时数据"""
+        session_dir = self._session_dir(session_id)
+        if not session_dir.exists():
+            raise UploadSessionError("Upload session not found", 404)
+        with self._digests_lock:
+            self._digests.pop(session_id, None)
+        shutil.rmtree(session_dir, ignore_errors=True)
+
+    def cleanup_expired(self) -> int:
+        """清理过期会话，返回清理数量"""
+        now = time.time()
+        removed = 0
+        for session_dir in self.root.iterdir():
+            if not session_dir.is_dir():
+                continue
+            try:
+                mtime = max(
+                    (session_dir / "chunks").stat().st_mtime,
+                    (session_dir / "session.json").stat().st_mtime,
+                )
+            except FileNotFoundError:
+                mtime = session_dir.stat().st_mtime
+            if now - mtime > self.session_ttl:
+                shutil.rmtree(session_dir, ignore_errors=True)
+                with self._digests_lock:
+                    self._digests.pop(session_dir.name, None)
+                removed += 1
+        return removed
@@ -0,0 +1,110 @@
+"""
+模型文件的流式压缩/解压
+
+优先使用zstd（需要安装zstandard，即可选依赖server或zstd），不可用时退化为gzip。所有操作都是按块流式进行的，
+内存占用与文件大小无关。
+"""
+
+from __future__ import annotations
+
+import gzip
+import zlib
+from pathlib import Path
+from typing import BinaryIO, Iterator, List
+
+try:
+    import zstandard
+except ImportError:  # zstd为可选依赖
+    zstandard = None
+
+ZSTD = "zstd"
+GZIP = "gzip"
+
+BLOCK_SIZE = 1024 * 1024
+ZSTD_LEVEL = 3
+GZIP_LEVEL = 6
+
+# 通常能压缩2-4倍的模型/数据文件类型；已压缩的格式（zip/npz/gz等）不在此列
+COMPRESSIBLE_SUFFIXES = {
+    ".pkl", ".pickle", ".joblib", ".h5", ".hdf5", ".pt", ".pth", ".ckpt",
+    ".onnx", ".bin", ".safetensors", ".pb", ".json", ".csv", ".txt",
+}
+
+
+def supported_encodings() -> List[str]:
+    """本机可用的编码，按优先级排列"""
+    return [ZSTD, GZIP] if zstandard is not None else [GZIP]
+
+
+def resolve_encoding(name: str) -> str:
+    """将配置的编码名解析为本机可用的编码（zstd不可用时退化为gzip）"""
+    name = (name or "").strip().lower()
+    if name not in (ZSTD, GZIP):
+        raise ValueError(f"Unsupported encoding: {name}")
+    return name if name in supported_encodings() else GZIP
+
+
+def is_compressible(filename: str) -> bool:
+    return Path(filename).suffix.lower() in COMPRESSIBLE_SUFFIXES
+
+
+def _compressobj(encoding: str):
+    if encoding == ZSTD:
+        return zstandard.ZstdCompressor(level=ZSTD_LEVEL).compressobj()
+    # wbits=31: 带gzip头和尾
+    return zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)
+
+
+def open_decompressing_reader(stream: BinaryIO, encoding: str) -> BinaryIO:
+    """
+    包装一个压缩数据流，read(n)返回解压后的数据（每次最多n字节，防止解压炸弹占满内存）
+    """
+    if encoding == ZSTD:
+        if zstandard is None:
+            raise ValueError("zstd is not supported")
+        return zstandard.ZstdDecompressor().stream_reader(stream, read_across_frames=True)
+    if encoding == GZIP:
+        return gzip.GzipFile(fileobj=stream, mode="rb")
+    raise ValueError(f"Unsupported encoding: {encoding}")
+
+
+def iter_compressed(file_path: Path, encoding: str) -> Iterator[bytes]:
+    """按块读取文件并压缩输出"""
+    compressor = _compressobj(encoding)
+    with open(file_path, "rb") as f:
+        while True:
+            block = f.read(BLOCK_SIZE)
+            if not block:
+                break
+            data = compressor.compress(block)
+            if data:
+                yield data
+    tail = compressor.flush()
+    if tail:
+        yield tail
+
+
+def iter_decompressed(file_path: Path, encoding: str) -> Iterator[bytes]:
+    """按块读取压缩文件并输出解压后的数据"""
+    with open(file_path, "rb") as f:
+        reader = open_decompressing_reader(f, encoding)
+        while True:
+            block = reader.read(BLOCK_SIZE)
+            if not block:
+                break
+            yield block
+
+
+def compress_file(src_path: Path, dst_path: Path, encoding: str) -> int:
+    """
+    压缩文件
+
+    Returns:
+        压缩后的字节数
+    """
+    size = 0
+    with open(dst_path, "wb") as f:
+        for block in iter_compressed(src_path, encoding):
+            f.write(block)
+            size += len(block)
+    return size
@@ -0,0 +1,42 @@
+"""
+各SQLite索引（去重存储、元数据索引、版本、上传准入，以及客户端的本地缓存）共用的连接和事务
+
+连接使用自动提交模式，写操作在transaction中以BEGIN IMMEDIATE开始，立即取得写锁，
+避免两个进程先读后写时在提交时才发现冲突；多个进程同时写入时按timeout等待。
+"""
+
+from __future__ import annotations
+
+import sqlite3
+from contextlib import contextmanager
+from typing import Callable, Iterator, Optional
+
+BUSY_TIMEOUT = 30
+
+
+def connect(db_path, row_factory: Optional[Callable] = None) -> sqlite3.Connection:
+    """打开自动提交模式的连接"""
+    conn = sqlite3.connect(db_path, timeout=BUSY_TIMEOUT, isolation_level=None)
+    if row_factory is not None:
+        conn.row_factory = row_factory
+    return conn
+
+
+@contextmanager
+def transaction(open_connection: Callable[[], sqlite3.Connection]) -> Iterator[sqlite3.Connection]:
+    """
+    用open_connection()打开一个自动提交模式的连接并在其中执行写事务，正常退出时提交，异常时回滚
+
+    Args:
+        open_connection: 返回自动提交模式连接的函数（如connect的偏函数或存储的_connect方法）
+    """
+    conn = open_connection()
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        yield conn
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    finally:
+        conn.close()
@@ -0,0 +1,173 @@
+"""
+rsync式增量上传的服务端部分
+
+服务器把已有文件（基准）按固定大小分块，为每块计算弱校验（Adler-32）和强校验（BLAKE2b-128），
+客户端据此找出新文件中与基准相同的块，只上传变化的字节和一份重建指令：
+
+    [["c", 起始块号, 块数], ["l", 字节数], ...]
+
+"c"从基准复制连续的块，"l"从上传的字面数据中顺序取出若干字节。服务器按指令重建新文件，
+并用客户端提供的SHA-256校验结果。签名按内容摘要缓存，基准内容不变时只计算一次。
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import zlib
+from pathlib import Path
+from typing import BinaryIO, Iterable, Iterator, List, Tuple
+
+DEFAULT_BLOCK_SIZE = 256 * 1024
+MIN_BLOCK_SIZE = 4 * 1024
+MAX_BLOCK_SIZE = 16 * 1024 * 1024
+COPY_BUFFER_SIZE = 1024 * 1024
+
+
+class DeltaError(Exception):
+    """重建指令无效或重建结果与声明不符"""
+
+
+def strong_checksum(block: bytes) -> str:
+    return hashlib.blake2b(block, digest_size=16).hexdigest()
+
+
+def iter_blocks(stream: BinaryIO, block_size: int) -> Iterator[bytes]:
+    """按block_size读取流（最后一块可能较短）"""
+    while True:
+        block = stream.read(block_size)
+        while block and len(block) < block_size:
+            more = stream.read(block_size - len(block))
+            if not more:
+                break
+            block += more
+        if not block:
+            return
+        yield block
+
+
+def compute_signatures(blocks: Iterable[bytes]) -> List[Tuple[int, str]]:
+    """计算每块的(弱校验, 强校验)"""
+    return [(zlib.adler32(block), strong_checksum(block)) for block in blocks]
+
+
+class SignatureCache:
+    """
+    按(内容摘要, 块大小)缓存签名的JSON文件
+
+    内容寻址的缓存不会过期，只按数量淘汰最久未写入的条目（包括已删除内容的签名）。
+    """
+
+    def __init__(self, root: Path, max_entries: int = 1000):
+        self.root = Path(root)
+        self.max_entries = max_entries
+        self.root.mkdir(parents=True, exist_ok=True)
+
+    def _path(self, digest: str, block_size: int) -> Path:
+        return self.root / f"{digest}-{block_size}.json"
+
+    def get(self, digest: str, block_size: int, open_stream) -> List[Tuple[int, str]]:
+        """
+        读取缓存的签名，没有时用open_stream()打开基准内容（逻辑内容）计算并缓存
+
+        Args:
+            digest: 基准内容的SHA-256
+            block_size: 块大小
+            open_stream: 返回可读二进制流的函数
+        """
+        cache_path = self._path(digest, block_size)
+        try:
+            with open(cache_path, "r", encoding="utf8") as f:
+                return [tuple(item) for item in json.load(f)]
+        except (OSError, ValueError):
+            pass
+
+        with open_stream() as stream:
+            signatures = compute_signatures(iter_blocks(stream, block_size))
+        tmp_path = cache_path.with_name(cache_path.name + f".{os.getpid()}.tmp")
+        with open(tmp_path, "w", encoding="utf8") as f:
+            json.dump(signatures, f)
+        os.replace(tmp_path, cache_path)
+        self._evict()
+        return signatures
+
+    def _evict(self) -> None:
+        entries = []
+        for entry in os.scandir(self.root):
+            try:
+                entries.append((entry.stat().st_mtime, entry.path))
+            except FileNotFoundError:
+                pass
+        if len(entries) <= self.max_entries:
+            return
+        entries.sort()
+        for _, path in entries[:len(entries) - self.max_entries]:
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+
+
+def _copy_exact(src: BinaryIO, dst: BinaryIO, length: int, digest) -> None:
+    remaining = length
+    while remaining > 0:
+        block = src.read(min(COPY_BUFFER_SIZE, remaining))
+        if not block:
+            raise DeltaError("Unexpected end of data")
+        dst.write(block)
+        digest.update(block)
+        remaining -= len(block)
+
+
+def apply_delta(base_path: Path, base_size: int, block_size: int, ops: list,
+                literals: BinaryIO, dst_path: Path, expected_size: int) -> Tuple[str, int]:
+    """
+    按重建指令用基准文件和字面数据生成新文件
+
+    Args:
+        base_path: 基准文件（未压缩的逻辑内容）
+        base_size: 基准文件大小
+        block_size: 签名使用的块大小
+        ops: 重建指令
+        literals: 字面数据流
+        dst_path: 输出文件
+        expected_size: 声明的新文件大小，指令生成的数据超出时立即停止
+
+    Returns:
+        Tuple[新文件的SHA-256, 大小]
+
+    Raises:
+        DeltaError: 指令越界、字面数据不足、有多余数据或大小与声明不符
+    """
+    block_count = (base_size + block_size - 1) // block_size
+    digest = hashlib.sha256()
+    size = 0
+    with open(base_path, "rb") as base, open(dst_path, "wb") as dst:
+        for op in ops:
+            if not isinstance(op, list) or not op:
+                raise DeltaError(f"Invalid op: {op!r}")
+            if op[0] == "c" and len(op) == 3:
+                start, count = int(op[1]), int(op[2])
+                if start < 0 or count <= 0 or start + count > block_count:
+                    raise DeltaError(f"Block range out of bounds: {op!r}")
+                offset = start * block_size
+                length = min((start + count) * block_size, base_size) - offset
+                source = base
+                base.seek(offset)
+            elif op[0] == "l" and len(op) == 2:
+                length = int(op[1])
+                if length <= 0:
+                    raise DeltaError(f"Invalid literal length: {op!r}")
+                source = literals
+            else:
+                raise DeltaError(f"Invalid op: {op!r}")
+            size += length
+            if size > expected_size:
+                raise DeltaError("Reconstructed file exceeds declared size")
+            _copy_exact(source, dst, length, digest)
+        if literals.read(1):
+            raise DeltaError("Unused literal data")
+        dst.flush()
+        os.fsync(dst.fileno())
+    return digest.hexdigest(), size
@@ -0,0 +1,227 @@
+"""
+Prometheus文本格式的指标
+
+不依赖prometheus_client：指标值保存在进程内存中，记录一次只是加锁后更新字典，
+对传输路径的开销可以忽略。gunicorn的每个worker进程由后台线程每秒把自己的指标写入
+<snapshot_dir>/<pid>-<进程标识>.json，/metrics 落在任意worker上都会合并所有进程的快照：
+计数器和直方图累加（已退出进程的快照保留，计数不会倒退），仪表只累加仍存活的进程。
+进程标识在每个进程中随机生成，进程号被复用时新进程也不会覆盖已退出进程的快照。
+"""
+
+from __future__ import annotations
+
+import bisect
+import json
+import os
+import threading
+import time
+import uuid
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+from model_server.admission import process_alive
+
+FLUSH_INTERVAL = 1.0  # 秒
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    parts = [f'{name}="{_escape(str(value))}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _format_value(value: float) -> str:
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, registry: "MetricsRegistry", name: str, documentation: str, labelnames: Sequence[str]):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = registry._lock
+        self._registry = registry
+        # {标签值元组: 值}（直方图为[各桶计数..., 总和, 次数]）
+        self.values: Dict[tuple, object] = {}
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, labels: tuple = (), amount: float = 1) -> None:
+        with self._lock:
+            self.values[labels] = self.values.get(labels, 0) + amount
+            self._registry._dirty = True
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def add(self, labels: tuple = (), amount: float = 1) -> None:
+        with self._lock:
+            self.values[labels] = self.values.get(labels, 0) + amount
+            self._registry._dirty = True
+
+    def set(self, labels: tuple = (), value: float = 0) -> None:
+        with self._lock:
+            self.values[labels] = value
+            self._registry._dirty = True
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, registry: "MetricsRegistry", name: str, documentation: str, labelnames: Sequence[str],
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(registry, name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, labels: tuple = ()) -> None:
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self.values.get(labels)
+            if state is None:
+                state = self.values[labels] = [0] * (len(self.buckets) + 2)
+            if index < len(self.buckets):
+                state[index] += 1
+            state[-2] += value
+            state[-1] += 1
+            self._registry._dirty = True
+
+
+class MetricsRegistry:
+    """指标注册表，多进程时通过快照目录合并"""
+
+    def __init__(self, snapshot_dir: Optional[Path] = None, reset: bool = False):
+        """
+        Args:
+            snapshot_dir: 多进程共享快照的目录，None表示只导出本进程的指标
+            reset: 清空快照目录（服务启动时调用，丢弃上次运行遗留的快照）
+        """
+        self.snapshot_dir = Path(snapshot_dir) if snapshot_dir else None
+        self._metrics: List[_Metric] = []
+        self._lock = threading.Lock()
+        self._dirty = False
+        self._flusher_pid = None
+        self._process_id: Optional[Tuple[int, str]] = None
+        if self.snapshot_dir:
+            self.snapshot_dir.mkdir(parents=True, exist_ok=True)
+            if reset:
+                for entry in os.scandir(self.snapshot_dir):
+                    os.unlink(entry.path)
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(self, name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self._register(Gauge(self, name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram(self, name, documentation, labelnames, buckets))
+
+    def _register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def _snapshot(self) -> dict:
+        with self._lock:
+            return {metric.name: [[list(labels), list(value) if isinstance(value, list) else value]
+                                  for labels, value in metric.values.items()]
+                    for metric in self._metrics}
+
+    def start_flusher(self) -> None:
+        """确保本进程有写快照的后台线程（fork出的worker中首次调用时启动）"""
+        if self.snapshot_dir is None or self._flusher_pid == os.getpid():
+            return
+        self._flusher_pid = os.getpid()
+        threading.Thread(target=self._flush_loop, name="metrics-flusher", daemon=True).start()
+
+    def _flush_loop(self) -> None:
+        while True:
+            time.sleep(FLUSH_INTERVAL)
+            if self._dirty:
+                self.flush()
+
+    def _snapshot_name(self) -> str:
+        """本进程的快照文件名（fork出的进程重新生成标识）"""
+        if self._process_id is None or self._process_id[0] != os.getpid():
+            self._process_id = (os.getpid(), uuid.uuid4().hex)
+        pid, token = self._process_id
+        return f"{pid}-{token}.json"
+
+    def flush(self) -> None:
+        """把本进程的指标写入快照文件"""
+        if self.snapshot_dir is None:
+            return
+        path = self.snapshot_dir / self._snapshot_name()
+        tmp_path = path.with_name(path.name + ".tmp")
+        self._dirty = False
+        with open(tmp_path, "w", encoding="utf8") as f:
+            json.dump(self._snapshot(), f)
+        os.replace(tmp_path, path)
+
+    def _other_snapshots(self) -> Iterable[Tuple[bool, dict]]:
+        """返回其他进程的(是否存活, 快照)"""
+        if self.snapshot_dir is None:
+            return
+        own_name = self._snapshot_name()
+        for entry in os.scandir(self.snapshot_dir):
+            name = entry.name
+            pid, _, token = name[:-5].partition("-")
+            if not name.endswith(".json") or not pid.isdigit() or not token or name == own_name:
+                continue
+            try:
+                with open(entry.path, "r", encoding="utf8") as f:
+                    snapshot = json.load(f)
+            except (OSError, ValueError):
+                continue
+            yield os.name == "posix" and process_alive(int(pid)), snapshot
+
+    def render(self) -> str:
+        """合并所有进程的指标并输出Prometheus文本格式"""
+        merged = {name: {tuple(labels): value for labels, value in entries}
+                  for name, entries in self._snapshot().items()}
+        kinds = {metric.name: metric.kind for metric in self._metrics}
+        for alive, snapshot in self._other_snapshots():
+            for name, entries in snapshot.items():
+                if name not in kinds or (kinds[name] == "gauge" and not alive):
+                    continue
+                target = merged.setdefault(name, {})
+                for labels, value in entries:
+                    labels = tuple(labels)
+                    current = target.get(labels)
+                    if current is None:
+                        target[labels] = value
+                    elif isinstance(value, list):
+                        target[labels] = [a + b for a, b in zip(current, value)]
+                    else:
+                        target[labels] = current + value
+
+        lines = []
+        for metric in self._metrics:
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for labels, value in sorted(merged.get(metric.name, {}).items()):
+                if metric.kind != "histogram":
+                    lines.append(f"{metric.name}{_format_labels(metric.labelnames, labels)} {_format_value(value)}")
+                    continue
+                # 桶中保存的是各区间的计数，输出时转为累计值；+Inf桶等于总次数
+                cumulative = 0
+                for bound, count in zip(metric.buckets, value[:-2]):
+                    cumulative += count
+                    le = f'le="{_format_value(bound)}"'
+                    lines.append(f"{metric.name}_bucket{_format_labels(metric.labelnames, labels, le)} {cumulative}")
+                le = 'le="+Inf"'
+                lines.append(f"{metric.name}_bucket{_format_labels(metric.labelnames, labels, le)} {value[-1]}")
+                lines.append(f"{metric.name}_sum{_format_labels(metric.labelnames, labels)} {_format_value(value[-2])}")
+                lines.append(f"{metric.name}_count{_format_labels(metric.labelnames, labels)} {value[-1]}")
+        return "\n".join(lines) + "\n"
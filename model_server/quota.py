@@ -0,0 +1,78 @@
+"""
+用户存储配额
+
+配额按逻辑大小（去重和压缩前）计算，与 /models/usage 返回的用量一致。
+默认配额对所有用户生效，可以用JSON文件为个别用户单独设置：
+
+    {"alice": {"bytes": 10737418240, "files": 10000}, "admin": {"bytes": null}}
+
+值为null或不设置表示不限制（单独设置的用户不继承默认配额中未列出的项）。
+"""
+
+from __future__ import annotations
+
+import json
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+
+class QuotaExceeded(Exception):
+    """上传会使用户超出配额"""
+
+    def __init__(self, message: str, usage: Dict[str, int], limits: Dict[str, Optional[int]]):
+        super().__init__(message)
+        self.usage = usage
+        self.limits = limits
+
+
+class QuotaPolicy:
+    """按用户查询和检查配额"""
+
+    def __init__(self, max_bytes: Optional[int] = None, max_files: Optional[int] = None,
+                 overrides: Optional[Dict[str, dict]] = None):
+        """
+        Args:
+            max_bytes: 默认字节数上限，None表示不限制
+            max_files: 默认文件数上限，None表示不限制
+            overrides: {用户名: {'bytes': 上限, 'files': 上限}}
+        """
+        self.max_bytes = max_bytes
+        self.max_files = max_files
+        self.overrides = overrides or {}
+
+    @classmethod
+    def load(cls, max_bytes: Optional[int] = None, max_files: Optional[int] = None,
+             overrides_path: Optional[Path] = None) -> "QuotaPolicy":
+        """创建配额策略，overrides_path为按用户设置的JSON文件（可选）"""
+        overrides = {}
+        if overrides_path:
+            with open(overrides_path, "r", encoding="utf8") as f:
+                overrides = json.load(f)
+        return cls(max_bytes, max_files, overrides)
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_bytes is not None or self.max_files is not None or bool(self.overrides)
+
+    def limits(self, username: str) -> Tuple[Optional[int], Optional[int]]:
+        """返回用户的(字节数上限, 文件数上限)"""
+        if username in self.overrides:
+            override = self.overrides[username]
+            return override.get("bytes"), override.get("files")
+        return self.max_bytes, self.max_files
+
+    def check(self, username: str, usage: Dict[str, int], add_bytes: int, add_files: int) -> None:
+        """
+        检查增加add_bytes字节、add_files个文件后是否超出配额
+
+        Raises:
+            QuotaExceeded: 超出配额
+        """
+        max_bytes, max_files = self.limits(username)
+        limits = {"bytes": max_bytes, "files": max_files}
+        if max_bytes is not None and add_bytes > 0 and usage["bytes"] + add_bytes > max_bytes:
+            raise QuotaExceeded(
+                f"Storage quota exceeded: {usage['bytes']} + {add_bytes} > {max_bytes} bytes", usage, limits)
+        if max_files is not None and add_files > 0 and usage["files"] + add_files > max_files:
+            raise QuotaExceeded(
+                f"File count quota exceeded: {usage['files']} + {add_files} > {max_files} files", usage, limits)
@@ -0,0 +1,316 @@
+"""
+模型目录的存储操作
+
+路径校验、配额检查、去重存储、文件索引和版本记录在这里组合成完整的写入/删除操作。
+远程模型服务的各接口和客户端的本地存储后端（单机部署时直接读写模型目录，不经过HTTP）
+都通过ModelRepository修改模型目录，去重引用计数、文件索引（含变更记录）和版本记录始终一致。
+各索引都是SQLite，写入在事务中完成，多个进程可以同时打开同一个目录。
+
+配置与服务器相同，来自MODEL_SERVER_*环境变量（from_env）。
+"""
+
+from __future__ import annotations
+
+import os
+import time
+from pathlib import Path
+from typing import Callable, List, Optional, Tuple
+
+from model_server.blob_store import BlobStore, verify_digest
+from model_server.catalog import DEFAULT_CHANGE_RETENTION, ModelCatalog
+from model_server.compression import compress_file, is_compressible, resolve_encoding
+from model_server.quota import QuotaPolicy
+from model_server.versions import VersionStore, is_version_storage, parse_version_path, version_file
+
+# 默认的模型目录（与remote_model_server.py同级的models）
+DEFAULT_BASE_PATH = Path(__file__).resolve().parent.parent / "models"
+VERSION_SWEEP_INTERVAL = 3600  # 按保留天数清理所有路径的间隔（秒），在新版本写入时顺带执行
+COMPRESS_MIN_RATIO = 0.9  # 压缩后不小于原大小的90%则按原样存储
+
+
+def resolve_keep_link(path: Path) -> Path:
+    """规范化路径，但不跟随最后一级的符号链接（冷层文件的用户路径是指向冷层的符号链接）"""
+    path = Path(path)
+    if path.name in ('', '.', '..'):
+        return path.resolve()
+    return path.parent.resolve() / path.name
+
+
+class ModelRepository:
+    """
+    一个模型目录及其元数据（去重存储、文件索引、版本、配额）
+
+    所有上传方式最终都经过store_file/link_existing，删除经过remove_file/remove_files。
+    """
+
+    def __init__(self, base_path: Path, meta_path: Optional[Path] = None, cold_root: Optional[Path] = None,
+                 keep_versions: Optional[int] = None, version_max_age: Optional[float] = None,
+                 change_retention: Optional[float] = DEFAULT_CHANGE_RETENTION, quota: Optional[QuotaPolicy] = None,
+                 compress_at_rest: Optional[str] = None,
+                 on_disk_write: Optional[Callable[[str, int], None]] = None,
+                 on_store: Optional[Callable[[float], None]] = None):
+        """
+        Args:
+            base_path: 模型目录
+            meta_path: 元数据目录，须与模型目录在同一文件系统内（默认为 <模型目录>_meta）
+            cold_root: 冷层目录，None表示不分层
+            keep_versions: 每个路径保留的版本数，None表示不限制
+            version_max_age: 旧版本的保留时间（秒），None表示不限制
+            change_retention: 变更记录的保留时间（秒），None表示永久保留
+            quota: 用户配额，None表示不限制
+            compress_at_rest: 可压缩类型的新内容的存储编码（zstd/gzip），None表示原样存储
+            on_disk_write: 写入磁盘的回调 on_disk_write(类型, 字节数)（用于指标）
+            on_store: 存入耗时的回调 on_store(秒)（用于指标）
+        """
+        self.base_path = Path(base_path)
+        self.base_path.mkdir(parents=True, exist_ok=True)
+        self.meta_path = Path(meta_path) if meta_path else \
+            self.base_path.parent / (self.base_path.name + "_meta")
+        self.compress_at_rest = compress_at_rest
+        self.quota = quota or QuotaPolicy()
+        self._on_disk_write = on_disk_write
+        self._on_store = on_store
+        self._last_version_sweep = 0.0
+
+        # 内容去重存储：用户路径是指向blob的硬链接，相同内容只占一份磁盘空间
+        self.blob_store = BlobStore(self.meta_path / "blobs", cold_root=cold_root, models_root=self.base_path)
+        # 文件元数据索引：上传/删除时增量更新，列表查询不再遍历磁盘；同时记录变更
+        self.catalog = ModelCatalog(self.meta_path / "catalog.db", self.base_path, change_retention=change_retention)
+        # 不可变版本：同一路径每次上传新内容生成新版本，可按版本数和保留天数清理旧版本（最新版本始终保留）
+        self.versions = VersionStore(self.meta_path / "versions.db", keep=keep_versions, max_age=version_max_age)
+        self.catalog.ensure_built(size_lookup=self.logical_size)
+
+    @classmethod
+    def from_env(cls, base_path: Optional[Path] = None, **kwargs) -> "ModelRepository":
+        """
+        按MODEL_SERVER_*环境变量创建（与远程模型服务的配置一致）
+
+        Args:
+            base_path: 模型目录，默认为MODEL_SERVER_BASE_PATH
+            **kwargs: 传给构造函数的其他参数（如指标回调）
+        """
+        base_path = Path(base_path or os.getenv('MODEL_SERVER_BASE_PATH', DEFAULT_BASE_PATH))
+        compress = os.getenv('MODEL_SERVER_COMPRESS_AT_REST')
+        return cls(
+            base_path,
+            meta_path=os.getenv('MODEL_SERVER_META_PATH') or None,
+            cold_root=os.getenv('MODEL_SERVER_COLD_TIER_PATH') or None,
+            keep_versions=int(os.getenv('MODEL_SERVER_KEEP_VERSIONS', 0)) or None,
+            version_max_age=float(os.getenv('MODEL_SERVER_VERSION_MAX_AGE_DAYS', 0)) * 86400 or None,
+            change_retention=float(os.getenv('MODEL_SERVER_CHANGE_RETENTION_DAYS', 7)) * 86400 or None,
+            # 用户配额（逻辑字节数/文件数），MODEL_SERVER_QUOTA_FILE为按用户设置的JSON文件
+            quota=QuotaPolicy.load(
+                max_bytes=int(os.getenv('MODEL_SERVER_QUOTA_BYTES', 0)) or None,
+                max_files=int(os.getenv('MODEL_SERVER_QUOTA_FILES', 0)) or None,
+                overrides_path=os.getenv('MODEL_SERVER_QUOTA_FILE') or None
+            ),
+            # 压缩存储：设置为zstd/gzip时，可压缩类型的新内容压缩后落盘（zstd不可用时使用gzip）
+            compress_at_rest=resolve_encoding(compress) if compress else None,
+            **kwargs
+        )
+
+    def logical_size(self, relative_path: str) -> Optional[int]:
+        info = self.blob_store.describe(relative_path)
+        return info[1] if info else None
+
+    # ---- 路径 ----
+
+    def relative_path(self, file_path: Path) -> str:
+        """返回文件相对模型根目录的路径（即客户端使用的server_path）"""
+        return str(resolve_keep_link(file_path).relative_to(self.base_path.resolve()))
+
+    def resolve_target_path(self, username: str, sub_directory: str, model_name: str) -> Optional[Path]:
+        """
+        计算上传文件的目标路径
+
+        Returns:
+            目标路径；如果路径逃逸出用户目录则返回None
+        """
+        user_path = (self.base_path / username).resolve()
+        target_dir = user_path / sub_directory if sub_directory else user_path
+        target_path = resolve_keep_link(target_dir / model_name)
+        if user_path != target_path and user_path not in target_path.parents:
+            return None
+        if is_version_storage(str(target_path.relative_to(user_path))):
+            return None
+        return target_path
+
+    def resolve_server_path(self, username: str, server_path: str) -> Optional[Path]:
+        """
+        计算server_path对应的文件路径
+
+        Returns:
+            文件路径；如果不在用户目录下则返回None
+        """
+        user_path = (self.base_path / username).resolve()
+        file_path = resolve_keep_link(self.base_path / server_path)
+        if user_path not in file_path.parents or is_version_storage(str(file_path.relative_to(user_path))):
+            return None
+        return file_path
+
+    def resolve_version(self, username: str, server_path: str):
+        """
+        计算版本路径（<server_path>@v<版本号>）对应的版本内容文件
+
+        Returns:
+            (文件路径, 版本号)；不是版本路径时返回None；越权或版本不存在时返回(None, 版本号)
+        """
+        parsed = parse_version_path(server_path)
+        if parsed is None:
+            return None
+        base_path, version = parsed
+        file_path = self.resolve_server_path(username, base_path)
+        if file_path is None:
+            return None, version
+        relative_path = self.relative_path(file_path)
+        if self.versions.get(relative_path, version) is None:
+            return None, version
+        return self.base_path / version_file(relative_path, version), version
+
+    def stat_version(self, server_path: str, file_path: Optional[Path], version: int) -> dict:
+        """版本路径的文件信息（resolve_version的结果），与批量查询的逐项结果格式一致"""
+        if file_path is None:
+            return {'server_path': server_path, 'exists': False}
+        base_path = parse_version_path(server_path)[0]
+        record = self.versions.get(self.relative_path(self.base_path / base_path), version)
+        if record is None:
+            return {'server_path': server_path, 'exists': False}
+        return {
+            'server_path': server_path,
+            'exists': True,
+            'name': Path(base_path).name,
+            'size': record['size'],
+            'modified': record['created'],
+            'sha256': record['sha256'],
+            'version': version
+        }
+
+    # ---- 写入和删除 ----
+
+    def check_quota(self, username: str, add_bytes: int, add_files: int = 1, target_path: Path = None) -> None:
+        """
+        检查写入后是否超出用户配额；指定target_path时按覆盖已有文件后的净增量计算
+
+        Raises:
+            QuotaExceeded: 超出配额
+        """
+        if not self.quota.enabled:
+            return
+        if target_path is not None:
+            existing = self.catalog.get(self.relative_path(target_path))
+            if existing:
+                add_bytes -= existing['size']
+                add_files = 0
+        self.quota.check(username, self.catalog.usage(username), add_bytes, add_files)
+
+    def _release_versions(self, removed: list) -> None:
+        """删除已从版本索引中移除的版本内容"""
+        if removed:
+            files = [version_file(path, version) for path, version in removed]
+            self.blob_store.release_many([(rel, self.base_path / rel) for rel in files])
+
+    def _preserve_unversioned(self, relative_path: str) -> None:
+        """启用版本之前上传的文件在第一次被覆盖前记录为版本1"""
+        if self.versions.latest(relative_path) is not None:
+            return
+        info = self.blob_store.describe(relative_path)
+        if info is not None:
+            self._record_version(relative_path, info[0], info[1])
+
+    def _record_version(self, relative_path: str, digest: str, size: int) -> int:
+        """
+        记录路径的新内容为一个不可变版本（内容未变化时返回当前版本），并按保留策略清理旧版本
+
+        Returns:
+            版本号
+        """
+        version, created = self.versions.add(relative_path, digest, size)
+        if not created:
+            return version
+        rel = version_file(relative_path, version)
+        try:
+            self.blob_store.link(digest, self.base_path / rel, rel)
+        except Exception:
+            self.versions.remove(relative_path, version)
+            raise
+        self._release_versions(self.versions.prune(relative_path))
+        if self.versions.max_age is not None and time.time() - self._last_version_sweep > VERSION_SWEEP_INTERVAL:
+            self._last_version_sweep = time.time()
+            self._release_versions(self.versions.prune())
+        return version
+
+    def store_file(self, tmp_path: Path, target_path: Path, digest: str, size: int,
+                   expected_digest: str = None) -> Tuple[str, int]:
+        """
+        将接收完成的临时文件（位于blob_store.new_temp_path()）存入目标路径
+
+        digest是接收时边写入边计算的SHA-256；调用方声明了expected_digest时先比较，
+        不一致说明传输中损坏，文件不会被保存。保存后记录为该路径的新版本。
+
+        Returns:
+            (server_path, 版本号)
+
+        Raises:
+            ChecksumMismatch: 内容与声明的SHA-256不一致
+            QuotaExceeded: 超出配额
+        """
+        verify_digest(expected_digest, digest)
+        relative_path = self.relative_path(target_path)
+        self.check_quota(Path(relative_path).parts[0], size, target_path=target_path)
+
+        self._preserve_unversioned(relative_path)
+        start = time.perf_counter()
+        encoding = None
+        if self.compress_at_rest and is_compressible(target_path.name) and not self.blob_store.has(digest):
+            packed_path = self.blob_store.new_temp_path()
+            try:
+                packed_size = compress_file(tmp_path, packed_path, self.compress_at_rest)
+                if self._on_disk_write is not None:
+                    self._on_disk_write('compress', packed_size)
+                if packed_size < size * COMPRESS_MIN_RATIO:
+                    os.replace(packed_path, tmp_path)
+                    encoding = self.compress_at_rest
+            finally:
+                if packed_path.exists():
+                    packed_path.unlink()
+
+        self.blob_store.add(tmp_path, digest, size, target_path, relative_path, encoding=encoding)
+        self.catalog.upsert(relative_path, Path(relative_path).parts[0], size, sha256=digest)
+        version = self._record_version(relative_path, digest, size)
+        if self._on_store is not None:
+            self._on_store(time.perf_counter() - start)
+        return relative_path, version
+
+    def link_existing(self, digest: str, size: int, target_path: Path) -> Tuple[str, int]:
+        """
+        让目标路径直接引用已存在的内容（秒传）
+
+        Returns:
+            (server_path, 版本号)
+
+        Raises:
+            FileNotFoundError: 内容已不存在
+            QuotaExceeded: 超出配额
+        """
+        relative_path = self.relative_path(target_path)
+        self.check_quota(Path(relative_path).parts[0], size, target_path=target_path)
+        self._preserve_unversioned(relative_path)
+        self.blob_store.link(digest, target_path, relative_path)
+        self.catalog.upsert(relative_path, Path(relative_path).parts[0], size, sha256=digest)
+        return relative_path, self._record_version(relative_path, digest, size)
+
+    def remove_file(self, file_path: Path) -> bool:
+        """删除用户文件及其所有版本并释放引用的内容，返回文件是否存在"""
+        relative_path = self.relative_path(file_path)
+        existed = self.blob_store.release(relative_path, file_path)
+        self.catalog.remove(relative_path)
+        self._release_versions(self.versions.remove_all([relative_path]))
+        return existed
+
+    def remove_files(self, file_paths: List[Path]) -> List[bool]:
+        """批量删除用户文件及其所有版本（索引更新各在一个事务中完成），返回每个文件是否存在"""
+        relative_paths = [self.relative_path(p) for p in file_paths]
+        existed = self.blob_store.release_many(list(zip(relative_paths, file_paths)))
+        self.catalog.remove_many(relative_paths)
+        self._release_versions(self.versions.remove_all(relative_paths))
+        return existed
@@ -0,0 +1,64 @@
+"""
+模型服务的生产模式启动
+
+使用gunicorn的gthread worker：多进程 × 多线程，SIGTERM时在graceful_timeout内
+处理完正在进行的传输再退出。下载通过wsgi.file_wrapper交给gunicorn，
+由os.sendfile在内核中零拷贝发送。gunicorn不支持Windows，属于可选依赖server：
+    poetry install --extras server
+"""
+
+from __future__ import annotations
+
+import multiprocessing
+from typing import Optional
+
+
+def default_workers() -> int:
+    """默认worker进程数：CPU核数，最多8个（传输以IO为主，更多进程收益有限）"""
+    return min(multiprocessing.cpu_count(), 8)
+
+
+def run_production(app, host: str = "0.0.0.0", port: int = 8000,
+                   workers: Optional[int] = None, threads: int = 8,
+                   graceful_timeout: int = 30, timeout: int = 120) -> None:
+    """
+    以gunicorn启动WSGI应用（阻塞直到服务退出）
+
+    Args:
+        app: WSGI应用
+        host: 监听地址
+        port: 监听端口
+        workers: worker进程数，默认见default_workers()
+        threads: 每个worker的线程数（即每个进程可同时处理的传输数）
+        graceful_timeout: 收到SIGTERM后等待进行中请求完成的秒数
+        timeout: worker无响应多少秒后被重启
+    """
+    try:
+        from gunicorn.app.base import BaseApplication
+    except ImportError:
+        raise RuntimeError("生产模式需要gunicorn（仅支持Linux/macOS），请先安装: poetry install --extras server")
+
+    options = {
+        "bind": f"{host}:{port}",
+        "workers": workers or default_workers(),
+        "worker_class": "gthread",
+        "threads": threads,
+        "graceful_timeout": graceful_timeout,
+        "timeout": timeout,
+        "keepalive": 5,
+        # 下载走sendfile零拷贝
+        "sendfile": True,
+        # 主进程加载应用后再fork，索引初始化等只执行一次
+        "preload_app": True,
+        "accesslog": "-",
+    }
+
+    class _ModelServerApplication(BaseApplication):
+        def load_config(self):
+            for key, value in options.items():
+                self.cfg.set(key, value)
+
+        def load(self):
+            return app
+
+    _ModelServerApplication().run()
@@ -0,0 +1,188 @@
+"""
+热/冷分层存储
+
+新写入的内容总是落在热层（快速的本地SSD），后台迁移线程在热层占用超过高水位时
+按最近下载时间把最久未下载的blob迁到冷层（更大更慢的挂载点），直到降到低水位；
+下载冷层文件时立即从冷层发送，同时排队把它迁回热层。
+
+blob的迁移由BlobStore完成，用户路径（客户端使用的server_path）始终不变。
+下载时间先记在内存中，由迁移线程批量写入索引，不在下载路径上写数据库。
+gunicorn的多个worker各自运行迁移线程，降级由文件锁保证同一时间只有一个进程执行。
+"""
+
+from __future__ import annotations
+
+import os
+import shutil
+import threading
+import time
+from pathlib import Path
+from typing import Callable, Dict, Optional, Set
+
+from model_server.blob_store import COLD, BlobStore
+
+DEFAULT_HIGH_WATERMARK = 0.9
+DEFAULT_LOW_WATERMARK = 0.75
+DEFAULT_INTERVAL = 30.0  # 秒
+DEMOTE_BATCH_SIZE = 100
+
+
+class TierManager:
+    """热层容量管理：LRU降级到冷层，冷层文件被下载时升级回热层"""
+
+    def __init__(self, blob_store: BlobStore, hot_capacity: Optional[int] = None,
+                 cold_capacity: Optional[int] = None, high_watermark: float = DEFAULT_HIGH_WATERMARK,
+                 low_watermark: float = DEFAULT_LOW_WATERMARK, interval: float = DEFAULT_INTERVAL,
+                 on_move: Optional[Callable[[str, int], None]] = None):
+        """
+        Args:
+            blob_store: 配置了冷层目录的blob存储
+            hot_capacity: 热层容量（字节），None表示热层所在文件系统的总大小
+            cold_capacity: 冷层容量（字节），None表示不限制
+            high_watermark: 热层占用超过容量的该比例时开始降级
+            low_watermark: 降级到热层占用不超过容量的该比例为止
+            interval: 迁移线程检查的间隔（秒）
+            on_move: 每迁移一个blob调用一次 on_move(方向, 字节数)，方向为promote/demote
+        """
+        if blob_store.cold_root is None:
+            raise ValueError("blob_store has no cold tier")
+        if not 0 < low_watermark <= high_watermark <= 1:
+            raise ValueError("Watermarks must satisfy 0 < low <= high <= 1")
+        self.blob_store = blob_store
+        self.hot_capacity = hot_capacity or shutil.disk_usage(blob_store.root).total
+        self.cold_capacity = cold_capacity
+        self.high_watermark = high_watermark
+        self.low_watermark = low_watermark
+        self.interval = interval
+        self.on_move = on_move
+        self.last_error: Optional[str] = None
+        self._lock = threading.Lock()
+        self._accesses: Dict[str, float] = {}
+        self._promotions: Set[str] = set()
+        self._wake = threading.Event()
+        self._thread_pid = None
+        self._lock_path = blob_store.root / "tiering.lock"
+
+    def record_download(self, digest: str, cold: bool = False) -> None:
+        """
+        记录一次下载（只更新内存），cold为True时排队迁回热层
+
+        Args:
+            digest: 内容摘要
+            cold: 文件当前在冷层（用户路径是符号链接）
+        """
+        with self._lock:
+            self._accesses[digest] = time.time()
+            if cold:
+                self._promotions.add(digest)
+        if cold:
+            self._wake.set()
+
+    def start(self) -> None:
+        """确保本进程有迁移线程（fork出的worker中首次调用时启动）"""
+        if self._thread_pid == os.getpid():
+            return
+        self._thread_pid = os.getpid()
+        threading.Thread(target=self._loop, name="tier-mover", daemon=True).start()
+
+    def _loop(self) -> None:
+        while True:
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            try:
+                self.run_once()
+                self.last_error = None
+            except Exception as e:
+                # 迁移失败不影响服务，下一轮重试
+                self.last_error = str(e)
+
+    def run_once(self) -> Dict[str, int]:
+        """
+        执行一轮：写入下载时间、升级排队的冷层blob、热层超过高水位时降级
+
+        Returns:
+            {'promoted': 升级数, 'demoted': 降级数}
+        """
+        with self._lock:
+            accesses, self._accesses = self._accesses, {}
+            promotions, self._promotions = self._promotions, set()
+        self.blob_store.touch(accesses)
+
+        promoted = 0
+        for digest in promotions:
+            if self.blob_store.promote(digest):
+                promoted += 1
+                self._moved("promote", digest)
+        return {"promoted": promoted, "demoted": self._demote_if_needed()}
+
+    def _demote_if_needed(self) -> int:
+        usage = self.blob_store.tier_usage()
+        if usage["hot"] <= self.hot_capacity * self.high_watermark:
+            return 0
+        lock_file = self._try_lock()
+        if lock_file is False:
+            return 0  # 其他进程正在降级
+        try:
+            target = self.hot_capacity * self.low_watermark
+            hot, cold = usage["hot"], usage[COLD]
+            demoted = 0
+            while hot > target:
+                candidates = self.blob_store.least_recently_used(DEMOTE_BATCH_SIZE)
+                if not candidates:
+                    break
+                demoted_before = demoted
+                for digest, size in candidates:
+                    if hot <= target:
+                        break
+                    if self.cold_capacity is not None and cold + size > self.cold_capacity:
+                        self.last_error = "Cold tier is full"
+                        return demoted
+                    if self.blob_store.demote(digest):
+                        demoted += 1
+                        hot -= size
+                        cold += size
+                        self._moved("demote", digest, size)
+                    else:
+                        # 已被删除或由其他进程迁移，按实际用量重新计算
+                        usage = self.blob_store.tier_usage()
+                        hot, cold = usage["hot"], usage[COLD]
+                if demoted == demoted_before:
+                    break  # 整批都无法迁移（如热层文件丢失），避免反复重试同一批
+            return demoted
+        finally:
+            if lock_file:
+                lock_file.close()
+
+    def _moved(self, direction: str, digest: str, size: Optional[int] = None) -> None:
+        if self.on_move is None:
+            return
+        if size is None:
+            try:
+                size = os.path.getsize(self.blob_store.blob_path(digest))
+            except OSError:
+                size = 0
+        self.on_move(direction, size)
+
+    def _try_lock(self):
+        """
+        获取降级的进程间文件锁
+
+        Returns:
+            持有锁的文件对象（关闭即释放）；被其他进程持有时返回False；不支持flock的平台返回None
+        """
+        try:
+            import fcntl
+        except ImportError:
+            return None
+        lock_file = open(self._lock_path, "a")
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock_file.close()
+            return False
+        return lock_file
+
+    @staticmethod
+    def is_cold(file_path: Path) -> bool:
+        """用户路径是否指向冷层（冷层blob的用户路径是符号链接）"""
+        return os.path.islink(file_path)
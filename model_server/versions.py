@@ -0,0 +1,181 @@
+"""
+模型文件的不可变版本
+
+每次上传到同一server_path且内容变化时生成一个新版本（版本号按路径从1递增），
+同一内容重复上传不产生新版本。server_path本身始终指向最新版本，
+版本路径 "<server_path>@v<版本号>" 指向的内容永远不变，客户端可以按版本永久缓存。
+
+版本内容保存在用户目录下的隐藏目录中（同样是指向blob的链接，不额外占用空间）：
+    <user>/.versions/<server_path去掉用户名部分>/<版本号>
+该目录不出现在文件列表中，也不能通过上传/删除接口直接访问。
+
+版本记录保存在SQLite中，(path, version)为主键，查询最新版本只需一次索引查找。
+每个路径用过的最大版本号单独记录，文件删除后重新上传也不会复用旧版本号。
+保留策略：每个路径最多保留keep个版本、删除超过max_age秒的版本，最新版本始终保留。
+"""
+
+from __future__ import annotations
+
+import re
+import sqlite3
+import time
+from pathlib import PurePosixPath
+from typing import Dict, List, Optional, Tuple
+
+from model_server.db import connect, transaction
+
+VERSIONS_DIR = ".versions"
+_VERSION_PATH = re.compile(r"^(?P<path>.+)@v(?P<version>[1-9][0-9]*)$")
+
+
+def version_path(server_path: str, version: int) -> str:
+    """客户端使用的版本路径"""
+    return f"{server_path}@v{version}"
+
+
+def parse_version_path(server_path: str) -> Optional[Tuple[str, int]]:
+    """解析版本路径，返回(server_path, 版本号)；不是版本路径时返回None"""
+    match = _VERSION_PATH.match(server_path or "")
+    if match is None:
+        return None
+    return match.group("path"), int(match.group("version"))
+
+
+def version_file(server_path: str, version: int) -> str:
+    """版本内容在模型目录中的相对路径"""
+    parts = PurePosixPath(server_path).parts
+    return str(PurePosixPath(parts[0], VERSIONS_DIR, *parts[1:], str(version)))
+
+
+def is_version_storage(relative_path: str) -> bool:
+    """路径是否位于版本目录内（只能由版本管理读写）"""
+    return VERSIONS_DIR in PurePosixPath(relative_path).parts
+
+
+class VersionStore:
+    """按server_path记录的版本索引"""
+
+    def __init__(self, db_path, keep: Optional[int] = None, max_age: Optional[float] = None):
+        """
+        Args:
+            db_path: 版本索引数据库文件路径
+            keep: 每个路径最多保留的版本数，None表示不限制
+            max_age: 版本的最长保留时间（秒），None表示不限制
+        """
+        self.db_path = db_path
+        self.keep = keep
+        self.max_age = max_age
+        with transaction(self._connect) as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS version ("
+                " path TEXT NOT NULL,"
+                " version INTEGER NOT NULL,"
+                " sha256 TEXT NOT NULL,"
+                " size INTEGER NOT NULL,"
+                " created REAL NOT NULL,"
+                " PRIMARY KEY (path, version))"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS ix_version_created ON version (created)")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS counter ("
+                " path TEXT PRIMARY KEY, last_version INTEGER NOT NULL)"
+            )
+
+    def _connect(self) -> sqlite3.Connection:
+        return connect(self.db_path)
+
+    def _query(self, sql: str, params: tuple) -> List[tuple]:
+        conn = self._connect()
+        try:
+            return conn.execute(sql, params).fetchall()
+        finally:
+            conn.close()
+
+    @staticmethod
+    def _record(row: tuple) -> Dict:
+        return {"version": row[0], "sha256": row[1], "size": row[2], "created": row[3]}
+
+    def add(self, path: str, sha256: str, size: int) -> Tuple[int, bool]:
+        """
+        记录path的新内容
+
+        Returns:
+            (版本号, 是否新建)；内容与最新版本相同时返回最新版本号和False
+        """
+        with transaction(self._connect) as conn:
+            row = conn.execute(
+                "SELECT version, sha256 FROM version WHERE path = ? ORDER BY version DESC LIMIT 1", (path,)
+            ).fetchone()
+            if row is not None and row[1] == sha256:
+                return row[0], False
+            counter = conn.execute("SELECT last_version FROM counter WHERE path = ?", (path,)).fetchone()
+            version = (counter[0] if counter else 0) + 1
+            conn.execute("INSERT OR REPLACE INTO counter (path, last_version) VALUES (?, ?)", (path, version))
+            conn.execute(
+                "INSERT INTO version (path, version, sha256, size, created) VALUES (?, ?, ?, ?, ?)",
+                (path, version, sha256, size, time.time())
+            )
+            return version, True
+
+    def get(self, path: str, version: int) -> Optional[Dict]:
+        rows = self._query("SELECT version, sha256, size, created FROM version WHERE path = ? AND version = ?",
+                           (path, version))
+        return self._record(rows[0]) if rows else None
+
+    def latest(self, path: str) -> Optional[Dict]:
+        rows = self._query("SELECT version, sha256, size, created FROM version WHERE path = ?"
+                           " ORDER BY version DESC LIMIT 1", (path,))
+        return self._record(rows[0]) if rows else None
+
+    def list(self, path: str, limit: Optional[int] = None) -> List[Dict]:
+        """path的版本，从新到旧"""
+        rows = self._query("SELECT version, sha256, size, created FROM version WHERE path = ?"
+                           " ORDER BY version DESC LIMIT ?", (path, -1 if limit is None else limit))
+        return [self._record(row) for row in rows]
+
+    def remove(self, path: str, version: int) -> None:
+        with transaction(self._connect) as conn:
+            conn.execute("DELETE FROM version WHERE path = ? AND version = ?", (path, version))
+
+    def remove_all(self, paths: List[str]) -> List[Tuple[str, int]]:
+        """删除路径的所有版本记录（文件被删除时），返回被删除的(path, 版本号)"""
+        removed = []
+        with transaction(self._connect) as conn:
+            for path in paths:
+                rows = conn.execute("SELECT version FROM version WHERE path = ?", (path,)).fetchall()
+                conn.execute("DELETE FROM version WHERE path = ?", (path,))
+                removed.extend((path, version) for (version,) in rows)
+        return removed
+
+    def prune(self, path: Optional[str] = None) -> List[Tuple[str, int]]:
+        """
+        按保留策略删除版本记录，最新版本始终保留
+
+        Args:
+            path: 只处理该路径（新版本写入后调用）；None表示按max_age处理所有路径
+
+        Returns:
+            被删除的(path, 版本号)，调用方负责删除对应的版本内容
+        """
+        removed = []
+        with transaction(self._connect) as conn:
+            if path is not None:
+                paths = [path]
+            elif self.max_age is not None:
+                paths = [row[0] for row in conn.execute(
+                    "SELECT DISTINCT path FROM version WHERE created < ?", (time.time() - self.max_age,))]
+            else:
+                paths = []
+            for current in paths:
+                removed.extend((current, version) for version in self._drop_expired(conn, current))
+        return removed
+
+    def _drop_expired(self, conn: sqlite3.Connection, path: str) -> List[int]:
+        rows = conn.execute("SELECT version, created FROM version WHERE path = ? ORDER BY version DESC",
+                            (path,)).fetchall()
+        cutoff = time.time() - self.max_age if self.max_age is not None else None
+        drop = [version for i, (version, created) in enumerate(rows)
+                if i > 0 and ((self.keep is not None and i >= self.keep)
+                              or (cutoff is not None and created < cutoff))]
+        conn.executemany("DELETE FROM version WHERE path = ? AND version = ?", [(path, v) for v in drop])
+        return drop
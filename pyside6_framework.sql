@@ -92,6 +92,8 @@ CREATE TABLE `model`  (
   `description` varchar(512) CHARACTER SET utf8mb4 COLLATE utf8mb4_0900_ai_ci NULL DEFAULT NULL,
   `file_path` varchar(256) CHARACTER SET utf8mb4 COLLATE utf8mb4_0900_ai_ci NOT NULL,
   `file_size` bigint NOT NULL,
+  `sha256` varchar(64) CHARACTER SET utf8mb4 COLLATE utf8mb4_0900_ai_ci NULL DEFAULT NULL,
+  `version` int NULL DEFAULT NULL,
   `is_public` tinyint(1) NOT NULL,
   `owner_id` int NOT NULL,
   `created_at` datetime NOT NULL,
@@ -104,7 +106,28 @@ CREATE TABLE `model`  (
 -- ----------------------------
 -- Records of model
 -- ----------------------------
-INSERT INTO `model` VALUES (1, '新建 文本文档.txt', '', 'a\\新建 文本文档.txt', 0, 0, 2, '2025-11-10 05:33:45', '2025-11-10 05:33:45');
+INSERT INTO `model` VALUES (1, '新建 文本文档.txt', '', 'a\\新建 文本文档.txt', 0, NULL, NULL, 0, 2, '2025-11-10 05:33:45', '2025-11-10 05:33:45');
+
+-- ----------------------------
+-- Table structure for model_version
+-- ----------------------------
+DROP TABLE IF EXISTS `model_version`;
+CREATE TABLE `model_version`  (
+  `id` int NOT NULL AUTO_INCREMENT,
+  `model_id` int NOT NULL,
+  `version` int NOT NULL,
+  `version_path` varchar(280) CHARACTER SET utf8mb4 COLLATE utf8mb4_0900_ai_ci NOT NULL,
+  `file_size` bigint NOT NULL,
+  `sha256` varchar(64) CHARACTER SET utf8mb4 COLLATE utf8mb4_0900_ai_ci NULL DEFAULT NULL,
+  `created_at` datetime NOT NULL,
+  PRIMARY KEY (`id`) USING BTREE,
+  UNIQUE INDEX `model_id`(`model_id` ASC, `version` ASC) USING BTREE,
+  CONSTRAINT `model_version_ibfk_1` FOREIGN KEY (`model_id`) REFERENCES `model` (`id`) ON DELETE CASCADE ON UPDATE RESTRICT
+) ENGINE = InnoDB AUTO_INCREMENT = 1 CHARACTER SET = utf8mb4 COLLATE = utf8mb4_0900_ai_ci ROW_FORMAT = Dynamic;
+
+-- ----------------------------
+-- Records of model_version
+-- ----------------------------
 
 -- ----------------------------
 -- Table structure for user
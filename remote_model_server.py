@@ -3,17 +3,516 @@
 这是一个简单的Flask应用，演示如何实现远程模型存储服务API
 """
 
-from flask import Flask, request, jsonify, send_file
+from flask import Flask, Request, Response, g, request, jsonify, send_file
+from werkzeug.wsgi import wrap_file
+import argparse
+import hashlib
+import io
+import json
 import os
+import threading
+import time
+from contextlib import contextmanager
+from functools import partial
 from pathlib import Path
+from urllib.parse import quote
+
+from model_server.chunked_upload import ChunkedUploadStore, UploadSessionError, DEFAULT_CHUNK_SIZE
+from model_server.blob_store import ChecksumMismatch, HashingTempFile, copy_stream_hashed, hash_file, is_valid_digest
+from model_server.catalog import CatalogError, MAX_CHANGES, MAX_PAGE_SIZE as MAX_CATALOG_PAGE_SIZE
+from model_server.serving import default_workers, run_production
+from model_server.quota import QuotaExceeded
+from model_server.repository import ModelRepository
+from model_server.admission import AdmissionController, AdmissionRejected
+from model_server.metrics import MetricsRegistry
+from model_server.versions import version_path
+from model_server.tiering import DEFAULT_HIGH_WATERMARK, DEFAULT_INTERVAL, DEFAULT_LOW_WATERMARK, TierManager
+from model_server.archive import FORMATS as ARCHIVE_FORMATS, ArchiveEntry, iter_archive
+from model_server.delta import (DEFAULT_BLOCK_SIZE as DEFAULT_DELTA_BLOCK_SIZE, MAX_BLOCK_SIZE as MAX_DELTA_BLOCK_SIZE,
+                                MIN_BLOCK_SIZE as MIN_DELTA_BLOCK_SIZE, DeltaError, SignatureCache, apply_delta)
+from model_server.compression import (is_compressible, iter_compressed, iter_decompressed, open_decompressing_reader,
+                                      supported_encodings)
+
+# 模型目录（MODEL_SERVER_BASE_PATH，默认在当前目录下创建models文件夹）及其元数据：
+# 去重存储（用户路径是指向blob的硬链接）、文件元数据索引（含变更记录，保留MODEL_SERVER_CHANGE_RETENTION_DAYS天）、
+# 不可变版本、用户配额和压缩存储，配置见ModelRepository.from_env；指标回调在指标定义之后才会被调用
+repository = ModelRepository.from_env(
+    on_disk_write=lambda kind, size: DISK_WRITE_BYTES.inc((kind,), size),
+    on_store=lambda seconds: STORE_LATENCY.observe(seconds)
+)
+BASE_MODEL_PATH = repository.base_path
+# 服务端元数据目录（上传会话等），须与models目录在同一文件系统内以保证rename和硬链接可用
+META_PATH = repository.meta_path
+blob_store = repository.blob_store
+catalog = repository.catalog
+versions = repository.versions
+quota = repository.quota
+COMPRESS_AT_REST = repository.compress_at_rest
+
+UPLOAD_SESSION_TTL = float(os.getenv('MODEL_UPLOAD_SESSION_TTL', 24 * 3600))
+upload_sessions = ChunkedUploadStore(META_PATH / "uploads", session_ttl=UPLOAD_SESSION_TTL)
+# 冷层目录（可以是另一个挂载点），设置后启用热/冷分层：热层超过高水位时把最久未下载的内容迁到冷层
+COLD_TIER_PATH = os.getenv('MODEL_SERVER_COLD_TIER_PATH') or None
+# 变更长轮询：最长等待时间（秒），以及每个进程同时等待的请求数上限（等待会占用一个worker线程）
+MAX_CHANGE_WAIT = 30
+MAX_CHANGE_WAITERS = int(os.getenv('MODEL_SERVER_MAX_CHANGE_WAITERS', 4))
+_change_waiters = threading.BoundedSemaphore(MAX_CHANGE_WAITERS) if MAX_CHANGE_WAITERS > 0 else None
+
+# 对未压缩存储的文件，在完整下载（非Range）时按Accept-Encoding实时压缩，会占用服务器CPU
+WIRE_COMPRESSION = os.getenv('MODEL_SERVER_WIRE_COMPRESSION', '') == '1'
+WIRE_COMPRESSION_MIN_SIZE = 1024 * 1024
+
+# 增量上传的分块签名缓存（按内容摘要，内容不变时不需要重新计算）
+delta_signatures = SignatureCache(META_PATH / "signatures")
+
+# 上传准入：同时进行的上传数和在途字节数（全局/每用户），超出时返回429和Retry-After，未设置时不限制
+admission = AdmissionController(
+    META_PATH / "admission.db",
+    max_transfers=int(os.getenv('MODEL_SERVER_MAX_UPLOADS', 0)) or None,
+    max_bytes=int(os.getenv('MODEL_SERVER_MAX_INFLIGHT_BYTES', 0)) or None,
+    max_user_transfers=int(os.getenv('MODEL_SERVER_MAX_USER_UPLOADS', 0)) or None,
+    max_user_bytes=int(os.getenv('MODEL_SERVER_MAX_USER_INFLIGHT_BYTES', 0)) or None,
+    retry_after=int(os.getenv('MODEL_SERVER_RETRY_AFTER', 2))
+)
+# 接收请求体的上传接口（秒传、提交等不传输文件内容的接口不受准入限制）
+UPLOAD_ENDPOINTS = ('upload_model', 'batch_upload_models', 'upload_model_delta', 'put_upload_chunk')
+
+# Prometheus指标（/metrics），gunicorn的各worker通过快照目录合并
+metrics = MetricsRegistry(META_PATH / "metrics", reset=True)
+TIER_MOVES = metrics.counter('model_server_tier_moves_total', '热/冷层之间迁移的blob数', ('direction',))
+TIER_MOVED_BYTES = metrics.counter('model_server_tier_moved_bytes_total', '热/冷层之间迁移的字节数', ('direction',))
+REQUEST_COUNT = metrics.counter('model_server_requests_total', '按路由和状态码统计的请求数',
+                                ('route', 'method', 'status'))
+REQUEST_LATENCY = metrics.histogram('model_server_request_duration_seconds',
+                                    '请求耗时（到响应体发送完毕）', ('route', 'method'))
+UPLOADED_BYTES = metrics.counter('model_server_uploaded_bytes_total', '接收的上传请求体字节数', ('route',))
+DOWNLOADED_BYTES = metrics.counter('model_server_downloaded_bytes_total', '发送的下载响应体字节数', ('route',))
+TRANSFERS_IN_FLIGHT = metrics.gauge('model_server_transfers_in_flight', '进行中的传输数', ('direction',))
+DISK_WRITE_BYTES = metrics.counter('model_server_disk_write_bytes_total',
+                                   '写入磁盘的字节数（upload: multipart临时文件, chunk: 分块, '
+                                   'delta: 增量重建, compress: 压缩存储）', ('kind',))
+STORE_LATENCY = metrics.histogram('model_server_store_duration_seconds', '接收完成后存入存储（压缩、入库、索引）的耗时')
+LIST_SCAN_LATENCY = metrics.histogram('model_server_list_scan_seconds', '/models/list 查询索引的耗时',
+                                      buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5))
+# 计入传输的接口及方向
+TRANSFER_DIRECTIONS = {
+    'upload_model': 'upload', 'batch_upload_models': 'upload', 'upload_model_delta': 'upload',
+    'put_upload_chunk': 'upload', 'download_model': 'download', 'download_archive': 'download',
+}
+
+
+
+def _record_tier_move(direction: str, size: int) -> None:
+    TIER_MOVES.inc((direction,))
+    TIER_MOVED_BYTES.inc((direction,), size)
+
+
+# 热层容量默认为热层所在文件系统的大小，冷层容量默认不限制
+tiers = TierManager(
+    blob_store,
+    hot_capacity=int(os.getenv('MODEL_SERVER_HOT_TIER_BYTES', 0)) or None,
+    cold_capacity=int(os.getenv('MODEL_SERVER_COLD_TIER_BYTES', 0)) or None,
+    high_watermark=float(os.getenv('MODEL_SERVER_TIER_HIGH_WATERMARK', DEFAULT_HIGH_WATERMARK)),
+    low_watermark=float(os.getenv('MODEL_SERVER_TIER_LOW_WATERMARK', DEFAULT_LOW_WATERMARK)),
+    interval=float(os.getenv('MODEL_SERVER_TIER_INTERVAL', DEFAULT_INTERVAL)),
+    on_move=_record_tier_move
+) if COLD_TIER_PATH else None
+
+FILE_READ_BUFFER_SIZE = 1024 * 1024  # 不能使用sendfile时每次从磁盘读取的大小
+
+# 由前置web服务器直接发送文件（零拷贝），未配置时由本服务发送
+# nginx: internal location的URL前缀，如 /protected-models/ （alias到模型目录）
+X_ACCEL_REDIRECT_PREFIX = os.getenv('MODEL_SERVER_X_ACCEL_PREFIX', '')
+# Apache mod_xsendfile / lighttpd
+USE_X_SENDFILE = os.getenv('MODEL_SERVER_X_SENDFILE', '') == '1'
+
+# 批量接口每个请求最多处理的条目数
+MAX_BATCH_ITEMS = int(os.getenv('MODEL_SERVER_MAX_BATCH_ITEMS', 10000))
+
+
+class ModelRequest(Request):
+    """
+    multipart上传的文件直接写入去重存储的临时目录并同时计算SHA-256，
+    不经过werkzeug默认的临时文件，省去一次复制和一次读取
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.model_temp_files = []
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        stream = HashingTempFile(blob_store.new_temp_path())
+        self.model_temp_files.append(stream)
+        return stream
+
 
 app = Flask(__name__)
+app.request_class = ModelRequest
+app.config['USE_X_SENDFILE'] = USE_X_SENDFILE
+# 批量上传时每个文件还带一个model_names字段
+app.config['MAX_FORM_PARTS'] = MAX_BATCH_ITEMS * 2 + 16
+
+
+class _CountingIterable:
+    """流式响应体：边发送边累计字节数，close()传给原响应体"""
+
+    def __init__(self, iterable, route: str):
+        self._iterable = iterable
+        self._route = route
+
+    def __iter__(self):
+        sent = 0
+        try:
+            for block in self._iterable:
+                sent += len(block)
+                yield block
+        finally:
+            DOWNLOADED_BYTES.inc((self._route,), sent)
+
+    def close(self):
+        if hasattr(self._iterable, 'close'):
+            self._iterable.close()
+
+
+def _call_after_close(body, callback) -> None:
+    close = getattr(body, 'close', None)
+
+    def closing():
+        try:
+            if close is not None:
+                close()
+        finally:
+            callback()
+
+    try:
+        body.close = closing
+    except AttributeError:
+        callback()
+
+
+@app.before_request
+def _start_request_metrics():
+    g.metrics_start = time.perf_counter()
+    direction = TRANSFER_DIRECTIONS.get(request.endpoint)
+    if direction:
+        g.metrics_direction = direction
+        TRANSFERS_IN_FLIGHT.add((direction,), 1)
+    return None
+
+
+@app.after_request
+def _finish_request_metrics(response: Response) -> Response:
+    """记录请求数、字节数；耗时和进行中的传输在响应体发送完毕（close）时记录"""
+    route = request.url_rule.rule if request.url_rule else 'unmatched'
+    method = request.method
+    REQUEST_COUNT.inc((route, method, str(response.status_code)))
+
+    direction = g.pop('metrics_direction', None)
+    if direction == 'upload':
+        received = request.content_length if request.content_length is not None else g.get('received_bytes')
+        if received is None:
+            # 分块传输编码的multipart上传按写入临时文件的大小计入
+            received = sum(stream.size for stream in getattr(request, 'model_temp_files', []))
+        if received:
+            UPLOADED_BYTES.inc((route,), received)
+    elif direction == 'download' and response.status_code in (200, 206) and method != 'HEAD':
+        # 已知长度（含sendfile的文件包装器）直接按Content-Length计数，不包装响应体以免失去零拷贝
+        if response.content_length is not None:
+            DOWNLOADED_BYTES.inc((route,), response.content_length)
+        elif response.is_streamed:
+            response.response = _CountingIterable(response.response, route)
+
+    start = g.get('metrics_start', time.perf_counter())
+
+    def finish():
+        REQUEST_LATENCY.observe(time.perf_counter() - start, (route, method))
+        if direction:
+            TRANSFERS_IN_FLIGHT.add((direction,), -1)
+
+    if response.direct_passthrough:
+        # 直通的文件包装器不经过call_on_close，挂在包装器的close上（服务器发送完后调用）
+        _call_after_close(response.response, finish)
+    else:
+        response.call_on_close(finish)
+    metrics.start_flusher()
+    if tiers is not None:
+        tiers.start()
+    return response
+
+
+@app.teardown_request
+def _cleanup_temp_files(exc=None):
+    """删除请求中未被存入存储的上传临时文件"""
+    received = 0
+    for stream in getattr(request, 'model_temp_files', []):
+        received += stream.size
+        stream.close()
+        if stream.path.exists():
+            stream.path.unlink()
+    if received:
+        DISK_WRITE_BYTES.inc(('upload',), received)
+
+
+def _checksum_error(e: ChecksumMismatch):
+    return jsonify({
+        'success': False,
+        'error': str(e),
+        'checksum_mismatch': True,
+        'sha256': e.actual
+    }), 422
+
+
+def _quota_error(e: QuotaExceeded):
+    return jsonify({
+        'success': False,
+        'error': str(e),
+        'quota_exceeded': True,
+        'usage': e.usage,
+        'quota': e.limits
+    }), 413
+
+
+def _declared_size():
+    """
+    上传内容的大小（仅用于提前估算，存入前按实际大小再检查）
+
+    优先使用客户端在查询参数size中声明的文件大小：multipart请求的Content-Length还包含表单的
+    边界和字段，按它估算会拒绝恰好不超出配额的上传。没有size时退回Content-Length。
+    """
+    size = request.args.get('size', type=int)
+    if size is not None and size >= 0:
+        return size
+    return request.content_length
+
+
+@app.before_request
+def _reject_over_quota():
+    """
+    在读取请求体之前按Content-Length（或声明的size）拒绝超出配额的上传
+
+    需要客户端在查询参数中提供username（以及model_name/sub_directory以按覆盖计算），
+    没有时在接收完成、存入之前再检查。
+    """
+    size = _declared_size()
+    if request.endpoint not in ('upload_model', 'batch_upload_models') or not size:
+        return None
+    username = request.args.get('username')
+    if not username:
+        return None
+
+    target_path = None
+    model_name = request.args.get('model_name')
+    if request.endpoint == 'upload_model' and model_name:
+        target_path = repository.resolve_target_path(username, request.args.get('sub_directory', ''), model_name)
+    try:
+        repository.check_quota(username, size,
+                               add_files=1 if request.endpoint == 'upload_model' else 0, target_path=target_path)
+    except QuotaExceeded as e:
+        return _quota_error(e)
+    return None
+
+
+@app.before_request
+def _admit_upload():
+    """
+    在读取请求体之前登记上传，超出并发数或在途字节数上限时返回429
+
+    按查询参数中的username计算每用户的限制（没有时只受全局限制），
+    在途字节数按Content-Length（或声明的size）计算（压缩传输的分块按会话的分块大小计算）。
+    """
+    if request.endpoint not in UPLOAD_ENDPOINTS or not admission.enabled:
+        return None
+    username = request.args.get('username', '')
+    size = _declared_size()
+    if size is None and request.endpoint == 'put_upload_chunk':
+        try:
+            size = upload_sessions.check_owner(request.view_args['session_id'], username)['chunk_size']
+        except UploadSessionError:
+            size = 0  # 会话错误由接口本身返回
+    try:
+        g.admission_ticket = admission.acquire(username, size or 0)
+    except AdmissionRejected as e:
+        response = jsonify({'success': False, 'error': str(e), 'server_busy': True, 'retry_after': e.retry_after})
+        response.status_code = 429
+        response.headers['Retry-After'] = str(e.retry_after)
+        return response
+    return None
+
+
+@app.teardown_request
+def _release_admission(exc=None):
+    admission.release(g.pop('admission_ticket', None))
+
+
+def _record_download(file_path: Path, digest) -> None:
+    """记录下载时间供热层LRU使用，冷层文件排队迁回热层"""
+    if tiers is not None and digest:
+        tiers.record_download(digest, cold=TierManager.is_cold(file_path))
+
+
+def _version_fields(relative_path: str, version: int) -> dict:
+    return {'version': version, 'version_path': version_path(relative_path, version)}
+
+
+class _RangeFile:
+    """
+    文件的[start, end)区间
+
+    通过wsgi.file_wrapper返回：gunicorn按fileno和Content-Length用sendfile零拷贝发送，
+    其他服务器按块read()，读到区间末尾即结束。
+    """
+
+    def __init__(self, file_path: Path, start: int, end: int):
+        self._file = open(file_path, 'rb')
+        self._file.seek(start)
+        self._remaining = end - start
+
+    def read(self, size: int = -1) -> bytes:
+        if self._remaining <= 0:
+            return b''
+        if size is None or size < 0 or size > self._remaining:
+            size = self._remaining
+        data = self._file.read(size)
+        self._remaining -= len(data)
+        return data
+
+    def fileno(self) -> int:
+        return self._file.fileno()
+
+    def close(self) -> None:
+        self._file.close()
+
+
+def _not_modified(etag, last_modified) -> bool:
+    """
+    按If-None-Match/If-Modified-Since判断客户端缓存是否仍然有效
+
+    有If-None-Match时只比较ETag（弱比较），否则比较秒级的Last-Modified。
+    """
+    if request.if_none_match:
+        return etag is not None and request.if_none_match.contains_weak(etag)
+    if request.if_modified_since and last_modified is not None:
+        return int(last_modified) <= request.if_modified_since.timestamp()
+    return False
+
+
+def _set_validators(response: Response, etag, last_modified, digest=None) -> Response:
+    if etag:
+        response.set_etag(etag)
+    if last_modified is not None:
+        response.last_modified = int(last_modified)
+    if digest:
+        # 解码后完整内容的SHA-256，客户端下载时边写入边校验
+        response.headers['X-Content-SHA256'] = digest
+    return response
+
+
+def _range_still_valid(etag, last_modified) -> bool:
+    """If-Range与当前版本不一致时应忽略Range返回完整文件，避免拼接出新旧混合的内容"""
+    if_range = request.if_range
+    if if_range.etag is not None:
+        return etag is not None and if_range.etag == etag
+    if if_range.date is not None:
+        return last_modified is not None and int(last_modified) <= if_range.date.timestamp()
+    return True
 
-# 获取当前脚本文件的目录
-CURRENT_DIR = Path(__file__).parent
-BASE_MODEL_PATH = CURRENT_DIR / "models"  # 在当前目录下创建models文件夹存储模型
-BASE_MODEL_PATH.mkdir(parents=True, exist_ok=True)
 
+def _send_model_file(file_path: Path):
+    """
+    发送模型文件，支持单个字节范围的Range请求（GET和POST均可）
+
+    - 无Range头或多段Range：返回完整文件（200）
+    - 单段可满足的Range：返回206及Content-Range
+    - 单段不可满足的Range：返回416
+
+    配置了X-Accel-Redirect/X-Sendfile时交给前置服务器发送（Range也由其处理）。
+
+    压缩存储的文件忽略Range：客户端接受该编码时原样发送（带Content-Encoding），
+    否则实时解压后发送。
+
+    ETag为内容的SHA-256（压缩发送时加上编码后缀，每种表示的ETag不同），
+    If-None-Match/If-Modified-Since命中时返回304，If-Range不匹配时忽略Range。
+    X-Content-SHA256始终为解码后内容的SHA-256，供客户端校验下载结果。
+    """
+    relative_path = repository.relative_path(file_path)
+    info = blob_store.describe(relative_path)
+    digest, logical_size, stored_encoding = info if info else (None, None, None)
+    record = catalog.get(relative_path)
+    last_modified = record['modified'] if record else file_path.stat().st_mtime
+    file_size = file_path.stat().st_size if logical_size is None else logical_size
+
+    byte_range = request.range
+    if byte_range is not None and not _range_still_valid(digest, last_modified):
+        byte_range = None
+    single_range = (byte_range is not None and byte_range.units == 'bytes'
+                    and len(byte_range.ranges) == 1 and not stored_encoding)
+
+    # 确定要发送的编码，它决定了ETag
+    send_encoding = None
+    if stored_encoding:
+        send_encoding = stored_encoding if request.accept_encodings[stored_encoding] else None
+    elif (WIRE_COMPRESSION and not single_range and not X_ACCEL_REDIRECT_PREFIX and not USE_X_SENDFILE
+          and file_size >= WIRE_COMPRESSION_MIN_SIZE and is_compressible(file_path.name)):
+        send_encoding = request.accept_encodings.best_match(supported_encodings())
+    etag = f"{digest}.{send_encoding}" if digest and send_encoding else digest
+
+    if _not_modified(etag, last_modified):
+        response = Response(status=304)
+        if stored_encoding or send_encoding:
+            response.headers['Vary'] = 'Accept-Encoding'
+        return _set_validators(response, etag, last_modified, digest)
+
+    _record_download(file_path, digest)
+    if stored_encoding:
+        headers = {'Vary': 'Accept-Encoding', 'X-Content-Length': str(file_size)}
+        if send_encoding:
+            response = send_file(file_path, mimetype='application/octet-stream', conditional=False, etag=False)
+            response.headers['Content-Encoding'] = stored_encoding
+            response.headers.update(headers)
+        else:
+            response = Response(iter_decompressed(file_path, stored_encoding),
+                                mimetype='application/octet-stream', headers=headers)
+        return _set_validators(response, etag, last_modified, digest)
+
+    if X_ACCEL_REDIRECT_PREFIX:
+        location = X_ACCEL_REDIRECT_PREFIX.rstrip('/') + '/' + quote(Path(relative_path).as_posix())
+        response = Response(mimetype='application/octet-stream', headers={'X-Accel-Redirect': location})
+        return _set_validators(response, etag, last_modified, digest)
+    if USE_X_SENDFILE:
+        response = send_file(file_path, as_attachment=True, conditional=False, etag=False)
+        return _set_validators(response, etag, last_modified, digest)
+
+    if not single_range:
+        if send_encoding:
+            response = Response(iter_compressed(file_path, send_encoding), mimetype='application/octet-stream',
+                                headers={'Content-Encoding': send_encoding, 'Vary': 'Accept-Encoding',
+                                         'X-Content-Length': str(file_size)})
+            return _set_validators(response, etag, last_modified, digest)
+
+        response = send_file(file_path, as_attachment=True, conditional=False, etag=False)
+        response.headers['Accept-Ranges'] = 'bytes'
+        return _set_validators(response, etag, last_modified, digest)
+
+    span = byte_range.range_for_length(file_size)
+    if span is None:
+        return Response(status=416, headers={
+            'Content-Range': f'bytes */{file_size}',
+            'Accept-Ranges': 'bytes'
+        })
+
+    start, end = span
+    response = Response(
+        wrap_file(request.environ, _RangeFile(file_path, start, end), FILE_READ_BUFFER_SIZE),
+        status=206,
+        mimetype='application/octet-stream',
+        headers={
+            'Content-Range': f'bytes {start}-{end - 1}/{file_size}',
+            'Content-Length': str(end - start),
+            'Accept-Ranges': 'bytes'
+        },
+        direct_passthrough=True
+    )
+    return _set_validators(response, etag, last_modified, digest)
 
 
 @app.route('/models/upload', methods=['POST'])
@@ -29,32 +528,368 @@ def upload_model():
         username = request.form.get('username')
         model_name = request.form.get('model_name')
         sub_directory = request.form.get('sub_directory', '')
+        expected_digest = request.form.get('sha256')
         
         if not username or not model_name:
             return jsonify({'success': False, 'error': 'Missing username or model_name'}), 400
             
-        # 创建用户目录
-        user_path = BASE_MODEL_PATH / username
-        user_path.mkdir(parents=True, exist_ok=True)
-        
-        # 创建子目录（如果指定）
-        if sub_directory:
-            target_dir = user_path / sub_directory
-            target_dir.mkdir(parents=True, exist_ok=True)
+        target_path = repository.resolve_target_path(username, sub_directory, model_name)
+        if target_path is None:
+            return jsonify({'success': False, 'error': 'Access denied'}), 403
+
+        if isinstance(file.stream, HashingTempFile):
+            # 解析请求时文件已写入临时目录并算好摘要
+            file.stream.close()
+            digest, size = file.stream.hexdigest(), file.stream.size
+            relative_path, version = repository.store_file(file.stream.path, target_path, digest, size, expected_digest)
         else:
-            target_dir = user_path
-            
-        # 保存文件
-        target_path = target_dir / model_name
-        file.save(target_path)
-        
-        # 计算相对路径
-        relative_path = target_path.relative_to(BASE_MODEL_PATH)
+            tmp_path = blob_store.new_temp_path()
+            try:
+                digest, size = copy_stream_hashed(file.stream, tmp_path)
+                relative_path, version = repository.store_file(tmp_path, target_path, digest, size, expected_digest)
+            finally:
+                if tmp_path.exists():
+                    tmp_path.unlink()
+
+        return jsonify({
+            'success': True,
+            'server_path': str(relative_path),
+            **_version_fields(relative_path, version),
+            'sha256': digest,
+            'size': size,
+            'message': 'File uploaded successfully'
+        })
+    except ChecksumMismatch as e:
+        return _checksum_error(e)
+    except QuotaExceeded as e:
+        return _quota_error(e)
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+
+@app.route('/models/upload/by-hash', methods=['POST'])
+def upload_model_by_hash():
+    """
+    按内容摘要秒传：服务器已有相同SHA-256和大小的内容时直接链接到目标路径，
+    不需要传输文件；没有时返回404，客户端再走正常上传
+    """
+    try:
+        data = request.get_json()
+        username = data.get('username')
+        model_name = data.get('model_name')
+        sub_directory = data.get('sub_directory', '')
+        digest = data.get('sha256')
+        size = data.get('size')
+
+        if not username or not model_name or not digest or size is None:
+            return jsonify({'success': False, 'error': 'Missing username, model_name, sha256 or size'}), 400
+        if not is_valid_digest(digest):
+            return jsonify({'success': False, 'error': 'Invalid sha256'}), 400
+
+        target_path = repository.resolve_target_path(username, sub_directory, model_name)
+        if target_path is None:
+            return jsonify({'success': False, 'error': 'Access denied'}), 403
+
+        if not blob_store.has(digest, int(size)):
+            return jsonify({'success': False, 'exists': False, 'error': 'Content not found'}), 404
+
+        try:
+            relative_path, version = repository.link_existing(digest, int(size), target_path)
+        except FileNotFoundError:
+            # 判断存在之后内容恰好被删除
+            return jsonify({'success': False, 'exists': False, 'error': 'Content not found'}), 404
+
+        return jsonify({
+            'success': True,
+            'exists': True,
+            'server_path': relative_path,
+            **_version_fields(relative_path, version),
+            'sha256': digest,
+            'size': int(size),
+            'message': 'File linked to existing content'
+        })
+    except QuotaExceeded as e:
+        return _quota_error(e)
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@contextmanager
+def _open_logical(file_path: Path, encoding):
+    """打开用户文件的逻辑内容（压缩存储的文件边读边解压）"""
+    with open(file_path, 'rb') as f:
+        yield open_decompressing_reader(f, encoding) if encoding else f
+
+
+def _delta_base(username: str, server_path: str):
+    """
+    定位增量上传的基准文件
+
+    Returns:
+        Tuple[文件路径, (摘要, 逻辑大小, 存储编码)]；不存在时返回(None, None)，越权时返回(False, None)
+    """
+    file_path = repository.resolve_server_path(username, server_path)
+    if file_path is None:
+        return False, None
+    if not file_path.is_file():
+        return None, None
+    info = blob_store.describe(repository.relative_path(file_path))
+    if info is None:
+        # 去重存储之前的文件没有记录摘要
+        digest, size = hash_file(file_path)
+        info = (digest, size, None)
+    return file_path, info
+
+
+@app.route('/models/delta/signatures', methods=['GET'])
+def get_delta_signatures():
+    """
+    返回已有文件的分块签名，供客户端计算增量
+
+    参数：username、server_path、block_size（可选）
+    """
+    try:
+        username = request.args.get('username')
+        server_path = request.args.get('server_path')
+        if not username or not server_path:
+            return jsonify({'success': False, 'error': 'Missing username or server_path'}), 400
+        block_size = int(request.args.get('block_size') or DEFAULT_DELTA_BLOCK_SIZE)
+        if not MIN_DELTA_BLOCK_SIZE <= block_size <= MAX_DELTA_BLOCK_SIZE:
+            return jsonify({'success': False, 'error': 'Invalid block_size'}), 400
+
+        file_path, info = _delta_base(username, server_path)
+        if file_path is False:
+            return jsonify({'success': False, 'error': 'Access denied'}), 403
+        if file_path is None:
+            return jsonify({'success': False, 'error': 'File not found'}), 404
+
+        digest, size, encoding = info
+        signatures = delta_signatures.get(digest, block_size, lambda: _open_logical(file_path, encoding))
+        return jsonify({
+            'success': True,
+            'server_path': server_path,
+            'sha256': digest,
+            'size': size,
+            'block_size': block_size,
+            'blocks': signatures
+        })
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+
+@app.route('/models/upload/delta', methods=['POST'])
+def upload_model_delta():
+    """
+    增量上传：按重建指令用已有文件和上传的变化字节生成新文件
+
+    multipart表单：
+        recipe: JSON，{username, model_name, sub_directory, base_path, base_sha256,
+                block_size, size, sha256, ops}
+        literals: 指令中"l"操作依次使用的字面数据（可以为空）
+    基准文件在获取签名后被修改时返回409，客户端应改为完整上传。
+    """
+    try:
+        recipe = json.loads(request.form.get('recipe') or 'null')
+        if not isinstance(recipe, dict):
+            return jsonify({'success': False, 'error': 'Missing recipe'}), 400
+        username = recipe.get('username')
+        model_name = recipe.get('model_name')
+        base_path = recipe.get('base_path')
+        expected_digest = recipe.get('sha256')
+        if not username or not model_name or not base_path or not is_valid_digest(expected_digest or ''):
+            return jsonify({'success': False, 'error': 'Missing username, model_name, base_path or sha256'}), 400
+
+        target_path = repository.resolve_target_path(username, recipe.get('sub_directory', ''), model_name)
+        if target_path is None:
+            return jsonify({'success': False, 'error': 'Access denied'}), 403
+
+        file_path, info = _delta_base(username, base_path)
+        if file_path is False:
+            return jsonify({'success': False, 'error': 'Access denied'}), 403
+        if file_path is None or info[0] != recipe.get('base_sha256'):
+            return jsonify({'success': False, 'error': 'Base file changed'}), 409
+        base_digest, base_size, base_encoding = info
+        expected_size = int(recipe.get('size'))
+        block_size = int(recipe.get('block_size'))
+        if not MIN_DELTA_BLOCK_SIZE <= block_size <= MAX_DELTA_BLOCK_SIZE:
+            return jsonify({'success': False, 'error': 'Invalid block_size'}), 400
+        repository.check_quota(username, expected_size, target_path=target_path)
+
+        literals = request.files.get('literals')
+        literals_stream = literals.stream if literals else io.BytesIO()
+
+        tmp_path = blob_store.new_temp_path()
+        plain_base = blob_store.new_temp_path() if base_encoding else None
+        try:
+            if plain_base is not None:
+                with open(plain_base, 'wb') as f:
+                    for block in iter_decompressed(file_path, base_encoding):
+                        f.write(block)
+                DISK_WRITE_BYTES.inc(('delta',), base_size)
+            digest, size = apply_delta(plain_base or file_path, base_size, block_size,
+                                       recipe.get('ops') or [], literals_stream, tmp_path, expected_size)
+            DISK_WRITE_BYTES.inc(('delta',), size)
+            if digest != expected_digest or size != expected_size:
+                return jsonify({'success': False, 'error': 'Reconstructed file does not match sha256/size'}), 422
+            relative_path, version = repository.store_file(tmp_path, target_path, digest, size)
+        finally:
+            for path in (tmp_path, plain_base):
+                if path is not None and path.exists():
+                    path.unlink()
+
+        return jsonify({
+            'success': True,
+            'server_path': relative_path,
+            **_version_fields(relative_path, version),
+            'sha256': digest,
+            'size': size,
+            'message': 'File reconstructed from delta'
+        })
+    except (DeltaError, ValueError, TypeError) as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    except QuotaExceeded as e:
+        return _quota_error(e)
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+
+@app.route('/models/upload/sessions', methods=['POST'])
+def create_upload_session():
+    """创建分块上传会话（相同resume_key的会话会被复用以支持断点续传）"""
+    try:
+        data = request.get_json()
+        username = data.get('username')
+        model_name = data.get('model_name')
+        sub_directory = data.get('sub_directory', '')
+        total_size = data.get('total_size')
+
+        if not username or not model_name or total_size is None:
+            return jsonify({'success': False, 'error': 'Missing username, model_name or total_size'}), 400
+
+        target_path = repository.resolve_target_path(username, sub_directory, model_name)
+        if target_path is None:
+            return jsonify({'success': False, 'error': 'Access denied'}), 403
+        # 在传输任何分块之前检查配额（提交时会再检查一次）
+        repository.check_quota(username, int(total_size), target_path=target_path)
+
+        session = upload_sessions.create_session(
+            username, model_name, sub_directory,
+            total_size=int(total_size),
+            chunk_size=int(data.get('chunk_size') or DEFAULT_CHUNK_SIZE),
+            resume_key=data.get('resume_key')
+        )
+        # 分块可以用这些Content-Encoding压缩传输
+        return jsonify({'success': True, 'accept_encodings': supported_encodings(), **session})
+    except UploadSessionError as e:
+        return jsonify({'success': False, 'error': str(e)}), e.status
+    except QuotaExceeded as e:
+        return _quota_error(e)
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+
+@app.route('/models/upload/sessions/<session_id>', methods=['GET'])
+def get_upload_session(session_id):
+    """查询上传会话状态及服务器已接收的分块"""
+    try:
+        username = request.args.get('username')
+        if not username:
+            return jsonify({'success': False, 'error': 'Missing username'}), 400
+
+        upload_sessions.check_owner(session_id, username)
+        return jsonify({'success': True, **upload_sessions.describe(session_id)})
+    except UploadSessionError as e:
+        return jsonify({'success': False, 'error': str(e)}), e.status
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+
+@app.route('/models/upload/sessions/<session_id>/chunks/<int:index>', methods=['PUT'])
+def put_upload_chunk(session_id, index):
+    """上传一个分块，请求体为分块的原始字节（可带Content-Encoding压缩）"""
+    try:
+        username = request.args.get('username')
+        if not username:
+            return jsonify({'success': False, 'error': 'Missing username'}), 400
+
+        upload_sessions.check_owner(session_id, username)
+
+        stream = request.stream
+        content_encoding = request.headers.get('Content-Encoding', 'identity').lower()
+        if content_encoding != 'identity':
+            if content_encoding not in supported_encodings():
+                return jsonify({'success': False, 'error': f'Unsupported Content-Encoding: {content_encoding}'}), 415
+            stream = open_decompressing_reader(stream, content_encoding)
+
+        written = upload_sessions.write_chunk(session_id, index, stream)
+        DISK_WRITE_BYTES.inc(('chunk',), written)
+        if request.content_length is None:
+            g.received_bytes = written  # chunked编码的压缩分块按解压后的大小计入
+        return jsonify({'success': True, 'index': index, 'size': written})
+    except UploadSessionError as e:
+        return jsonify({'success': False, 'error': str(e)}), e.status
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+
+@app.route('/models/upload/sessions/<session_id>/commit', methods=['POST'])
+def commit_upload_session(session_id):
+    """所有分块到齐后提交会话，文件原子地出现在目标路径"""
+    try:
+        data = request.get_json()
+        username = data.get('username')
+        if not username:
+            return jsonify({'success': False, 'error': 'Missing username'}), 400
+
+        meta = upload_sessions.check_owner(session_id, username)
+        target_path = repository.resolve_target_path(username, meta['sub_directory'], meta['model_name'])
+        if target_path is None:
+            return jsonify({'success': False, 'error': 'Access denied'}), 403
+
+        # 分块按顺序写入本进程时摘要已在写入时算好，否则提交时读取文件计算
+        digest = upload_sessions.streamed_digest(session_id)
+        tmp_path = blob_store.new_temp_path()
+        try:
+            upload_sessions.commit(session_id, tmp_path)
+            if digest is None:
+                digest, size = hash_file(tmp_path)
+            else:
+                size = meta['total_size']
+            relative_path, version = repository.store_file(tmp_path, target_path, digest, size, data.get('sha256'))
+        finally:
+            if tmp_path.exists():
+                tmp_path.unlink()
+
         return jsonify({
             'success': True,
             'server_path': str(relative_path),
+            **_version_fields(relative_path, version),
+            'sha256': digest,
+            'size': size,
             'message': 'File uploaded successfully'
         })
+    except UploadSessionError as e:
+        return jsonify({'success': False, 'error': str(e)}), e.status
+    except ChecksumMismatch as e:
+        return _checksum_error(e)
+    except QuotaExceeded as e:
+        return _quota_error(e)
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+
+@app.route('/models/upload/sessions/<session_id>', methods=['DELETE'])
+def abort_upload_session(session_id):
+    """放弃上传会话"""
+    try:
+        username = request.args.get('username')
+        if not username:
+            return jsonify({'success': False, 'error': 'Missing username'}), 400
+
+        upload_sessions.check_owner(session_id, username)
+        upload_sessions.abort(session_id)
+        return jsonify({'success': True, 'message': 'Upload session aborted'})
+    except UploadSessionError as e:
+        return jsonify({'success': False, 'error': str(e)}), e.status
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
@@ -70,17 +905,14 @@ def delete_model():
         if not username or not server_path:
             return jsonify({'success': False, 'error': 'Missing username or server_path'}), 400
             
-        # 构建文件路径
-        file_path = BASE_MODEL_PATH / server_path
-        
-        # 确保文件在用户的目录下
-        user_path = BASE_MODEL_PATH / username
-        if not str(file_path).startswith(str(user_path)):
+        # 确保文件在用户的目录下（版本内容不可删除，随文件一起删除或按保留策略清理）
+        file_path = repository.resolve_server_path(username, server_path)
+        if file_path is None:
             return jsonify({'success': False, 'error': 'Access denied'}), 403
             
         # 删除文件
         if file_path.exists() and file_path.is_file():
-            file_path.unlink()
+            repository.remove_file(file_path)
             return jsonify({'success': True, 'message': 'File deleted successfully'})
         else:
             return jsonify({'success': False, 'error': 'File not found'}), 404
@@ -89,6 +921,170 @@ def delete_model():
         return jsonify({'success': False, 'error': str(e)}), 500
 
 
+def _get_batch_paths(data: dict):
+    """读取并校验批量请求的username和server_paths，出错时返回(None, 错误响应)"""
+    username = data.get('username')
+    server_paths = data.get('server_paths')
+    if not username or not isinstance(server_paths, list):
+        return None, (jsonify({'success': False, 'error': 'Missing username or server_paths'}), 400)
+    if len(server_paths) > MAX_BATCH_ITEMS:
+        return None, (jsonify({'success': False, 'error': f'At most {MAX_BATCH_ITEMS} items per request'}), 413)
+    return (username, server_paths), None
+
+
+@app.route('/models/batch/delete', methods=['POST'])
+def batch_delete_models():
+    """
+    批量删除模型文件
+
+    请求体：{username, server_paths: [...]}，结果按顺序逐项返回，单项失败不影响其他项
+    """
+    try:
+        parsed, error = _get_batch_paths(request.get_json() or {})
+        if error:
+            return error
+        username, server_paths = parsed
+
+        results = [None] * len(server_paths)
+        to_remove = []
+        for i, server_path in enumerate(server_paths):
+            file_path = repository.resolve_server_path(username, str(server_path))
+            if file_path is None:
+                results[i] = {'server_path': server_path, 'success': False, 'error': 'Access denied'}
+            elif not file_path.is_file():
+                results[i] = {'server_path': server_path, 'success': False, 'error': 'File not found'}
+            else:
+                to_remove.append((i, file_path))
+
+        if to_remove:
+            existed = repository.remove_files([file_path for _, file_path in to_remove])
+            for (i, _), removed in zip(to_remove, existed):
+                results[i] = {'server_path': server_paths[i], 'success': removed}
+                if not removed:
+                    results[i]['error'] = 'File not found'
+
+        return jsonify({
+            'success': True,
+            'deleted': sum(1 for r in results if r['success']),
+            'results': results
+        })
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+
+@app.route('/models/batch/stat', methods=['POST'])
+def batch_stat_models():
+    """
+    批量查询模型文件信息（查询元数据索引）
+
+    请求体：{username, server_paths: [...]}，不存在的文件exists为False
+    """
+    try:
+        parsed, error = _get_batch_paths(request.get_json() or {})
+        if error:
+            return error
+        username, server_paths = parsed
+
+        allowed = {}
+        version_results = {}
+        for server_path in server_paths:
+            resolved = repository.resolve_version(username, str(server_path))
+            if resolved is not None:
+                version_results[server_path] = repository.stat_version(str(server_path), *resolved)
+                continue
+            file_path = repository.resolve_server_path(username, str(server_path))
+            if file_path is not None:
+                allowed[server_path] = repository.relative_path(file_path)
+        records = catalog.get_many(list(set(allowed.values())))
+
+        results = []
+        for server_path in server_paths:
+            if server_path in version_results:
+                results.append(version_results[server_path])
+                continue
+            if server_path not in allowed:
+                results.append({'server_path': server_path, 'exists': False, 'error': 'Access denied'})
+                continue
+            record = records.get(allowed[server_path])
+            if record is None:
+                results.append({'server_path': server_path, 'exists': False})
+            else:
+                results.append({
+                    'server_path': server_path,
+                    'exists': True,
+                    'name': record['name'],
+                    'size': record['size'],
+                    'modified': record['modified'],
+                    'sha256': record['sha256']
+                })
+        return jsonify({'success': True, 'results': results})
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+
+@app.route('/models/batch/upload', methods=['POST'])
+def batch_upload_models():
+    """
+    一个multipart请求上传多个文件
+
+    表单字段：username、sub_directory、多个files文件，可选与files一一对应的多个model_names
+    （不提供时使用上传的文件名）和多个sha256（不一致的文件不保存）。结果按顺序逐项返回
+    """
+    try:
+        files = request.files.getlist('files')
+        username = request.form.get('username')
+        sub_directory = request.form.get('sub_directory', '')
+        model_names = request.form.getlist('model_names')
+        expected_digests = request.form.getlist('sha256')
+
+        if not username or not files:
+            return jsonify({'success': False, 'error': 'Missing username or files'}), 400
+        if len(files) > MAX_BATCH_ITEMS:
+            return jsonify({'success': False, 'error': f'At most {MAX_BATCH_ITEMS} items per request'}), 413
+        if model_names and len(model_names) != len(files):
+            return jsonify({'success': False, 'error': 'model_names must match files'}), 400
+        if expected_digests and len(expected_digests) != len(files):
+            return jsonify({'success': False, 'error': 'sha256 must match files'}), 400
+
+        results = []
+        for i, file in enumerate(files):
+            model_name = model_names[i] if model_names else file.filename
+            expected_digest = expected_digests[i] if expected_digests else None
+            try:
+                target_path = repository.resolve_target_path(username, sub_directory, model_name) \
+                    if model_name else None
+                if target_path is None:
+                    results.append({'model_name': model_name, 'success': False, 'error': 'Access denied'})
+                    continue
+
+                if isinstance(file.stream, HashingTempFile):
+                    file.stream.close()
+                    digest, size = file.stream.hexdigest(), file.stream.size
+                    relative_path, version = repository.store_file(file.stream.path, target_path, digest, size,
+                                                                   expected_digest)
+                else:
+                    tmp_path = blob_store.new_temp_path()
+                    try:
+                        digest, size = copy_stream_hashed(file.stream, tmp_path)
+                        relative_path, version = repository.store_file(tmp_path, target_path, digest, size,
+                                                                       expected_digest)
+                    finally:
+                        if tmp_path.exists():
+                            tmp_path.unlink()
+                results.append({'model_name': model_name, 'success': True, 'server_path': relative_path,
+                                **_version_fields(relative_path, version), 'sha256': digest, 'size': size})
+            except Exception as e:
+                results.append({'model_name': model_name, 'success': False, 'error': str(e)})
+
+        return jsonify({
+            'success': True,
+            'uploaded': sum(1 for r in results if r['success']),
+            'results': results
+        })
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+
 @app.route('/models/download', methods=['GET', 'POST'])
 def download_model():
     """下载模型文件"""
@@ -104,29 +1100,170 @@ def download_model():
         
         if not username or not server_path:
             return jsonify({'success': False, 'error': 'Missing username or server_path'}), 400
+
+        # 版本路径：内容永远不变
+        resolved = repository.resolve_version(username, server_path)
+        if resolved is not None:
+            file_path, version = resolved
+            if file_path is None or not file_path.is_file():
+                return jsonify({'success': False, 'error': 'Version not found'}), 404
+            response = _send_model_file(file_path)
+            response.headers['X-Model-Version'] = str(version)
+            return response
             
-        # 构建文件路径
-        file_path = BASE_MODEL_PATH / server_path
-        
         # 确保文件在用户的目录下
-        user_path = BASE_MODEL_PATH / username
-        if not str(file_path).startswith(str(user_path)):
+        file_path = repository.resolve_server_path(username, server_path)
+        if file_path is None:
             return jsonify({'success': False, 'error': 'Access denied'}), 403
             
         # 检查文件是否存在
         if not file_path.exists() or not file_path.is_file():
             return jsonify({'success': False, 'error': 'File not found'}), 404
             
-        # 发送文件
-        return send_file(file_path, as_attachment=True)
+        # 发送文件（支持Range断点/分段下载），带上当前的版本号
+        response = _send_model_file(file_path)
+        latest = versions.latest(repository.relative_path(file_path))
+        if latest is not None:
+            response.headers['X-Model-Version'] = str(latest['version'])
+        return response
         
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
 
+@app.route('/models/versions', methods=['GET'])
+def list_model_versions():
+    """
+    查询文件的版本（从新到旧），latest为最新版本
+
+    参数：username, server_path, limit（可选，只返回最新的limit个）
+    """
+    try:
+        username = request.args.get('username')
+        server_path = request.args.get('server_path')
+        limit = request.args.get('limit', type=int)
+        if not username or not server_path:
+            return jsonify({'success': False, 'error': 'Missing username or server_path'}), 400
+
+        file_path = repository.resolve_server_path(username, server_path)
+        if file_path is None:
+            return jsonify({'success': False, 'error': 'Access denied'}), 403
+        relative_path = repository.relative_path(file_path)
+        records = versions.list(relative_path, limit=limit)
+        if not records:
+            return jsonify({'success': False, 'error': 'File not found'}), 404
+        for record in records:
+            record['version_path'] = version_path(relative_path, record['version'])
+        return jsonify({
+            'success': True,
+            'server_path': relative_path,
+            'latest': records[0],
+            'versions': records
+        })
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+
+@app.route('/models/usage', methods=['GET'])
+def get_usage():
+    """查询用户的存储用量和配额（读取增量维护的计数，不遍历目录）"""
+    try:
+        username = request.args.get('username')
+        if not username:
+            return jsonify({'success': False, 'error': 'Missing username'}), 400
+
+        usage = catalog.usage(username)
+        max_bytes, max_files = quota.limits(username)
+        return jsonify({
+            'success': True,
+            'username': username,
+            'bytes': usage['bytes'],
+            'files': usage['files'],
+            'quota_bytes': max_bytes,
+            'quota_files': max_files
+        })
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+
+def _iter_catalog(username: str, sub_directory: str):
+    """按页遍历用户（子目录下）的所有文件记录"""
+    cursor = None
+    while True:
+        rows, cursor = catalog.list_files(username, sub_directory=sub_directory,
+                                          limit=MAX_CATALOG_PAGE_SIZE, cursor=cursor)
+        yield from rows
+        if not cursor:
+            return
+
+
+def _archive_entries(username: str, sub_directory: str, root_name: str):
+    """生成目录中每个文件的归档条目，归档内路径为 root_name/相对子目录的路径"""
+    dir_prefix = Path(username) / sub_directory if sub_directory else Path(username)
+    for record in _iter_catalog(username, sub_directory):
+        file_path = BASE_MODEL_PATH / record['path']
+        info = blob_store.describe(record['path'])
+        encoding = info[2] if info else None
+        if info:
+            _record_download(file_path, info[0])
+        name = (Path(root_name) / Path(record['path']).relative_to(dir_prefix)).as_posix()
+        yield ArchiveEntry(name, record['size'], record['modified'],
+                           partial(_open_logical, file_path, encoding))
+
+
+@app.route('/models/archive', methods=['GET'])
+def download_archive():
+    """
+    把用户目录（或其中一个sub_directory）打包成tar/zip流式下载
+
+    参数：username、sub_directory（可选）、format=tar|zip（默认tar）。
+    归档边读边生成，服务器不创建临时文件；tar可以被客户端边下载边解包。
+    """
+    try:
+        username = request.args.get('username')
+        sub_directory = (request.args.get('sub_directory') or '').strip('/')
+        archive_format = request.args.get('format', 'tar')
+        if not username:
+            return jsonify({'success': False, 'error': 'Missing username'}), 400
+        if archive_format not in ARCHIVE_FORMATS:
+            return jsonify({'success': False, 'error': f'Unsupported format: {archive_format}'}), 400
+
+        user_path = (BASE_MODEL_PATH / username).resolve()
+        dir_path = (user_path / sub_directory).resolve()
+        if dir_path != user_path and user_path not in dir_path.parents:
+            return jsonify({'success': False, 'error': 'Access denied'}), 403
+        sub_directory = str(dir_path.relative_to(user_path)) if dir_path != user_path else ''
+        if not dir_path.is_dir():
+            return jsonify({'success': False, 'error': 'Directory not found'}), 404
+
+        root_name = dir_path.name
+        filename = quote(f"{root_name}.{archive_format}")
+        return Response(
+            iter_archive(archive_format, _archive_entries(username, sub_directory, root_name)),
+            mimetype='application/x-tar' if archive_format == 'tar' else 'application/zip',
+            headers={'Content-Disposition': f"attachment; filename*=UTF-8''{filename}"}
+        )
+    except CatalogError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+
 @app.route('/models/list', methods=['GET', 'POST'])
 def list_models():
-    """列出用户的所有模型文件"""
+    """
+    列出用户的模型文件（查询元数据索引，不遍历磁盘）
+
+    可选参数：
+        sub_directory: 只列出该子目录下的文件
+        prefix: 文件名前缀
+        sort: 排序列 path/name/size/modified，默认path
+        order: asc/desc
+        limit: 每页数量，不指定时返回全部
+        cursor: 上一页返回的next_cursor
+
+    ETag由用户列表版本和查询参数决定，If-None-Match/If-Modified-Since命中时返回304。
+    """
     try:
         # 根据请求方法获取数据
         if request.method == 'POST':
@@ -138,40 +1275,118 @@ def list_models():
         
         if not username:
             return jsonify({'success': False, 'error': 'Missing username'}), 400
-            
-        # 获取用户目录
-        user_path = BASE_MODEL_PATH / username
-        
-        # 列出所有文件
-        files = []
-        if user_path.exists():
-            for root, dirs, filenames in os.walk(user_path):
-                for filename in filenames:
-                    file_path = Path(root) / filename
-                    relative_path = file_path.relative_to(BASE_MODEL_PATH)
-                    stat = file_path.stat()
-                    
-                    files.append({
-                        'name': filename,
-                        'path': str(relative_path),
-                        'size': stat.st_size,
-                        'modified': stat.st_mtime
-                    })
+
+        limit = data.get('limit')
+        query = [data.get(key) or '' for key in ('sub_directory', 'prefix', 'sort', 'order', 'limit', 'cursor')]
+        version, last_modified = catalog.user_version(username)
+        etag = hashlib.sha256(json.dumps([version, username, *map(str, query)]).encode('utf8')).hexdigest()
+        if _not_modified(etag, last_modified):
+            return _set_validators(Response(status=304), etag, last_modified)
+
+        start = time.perf_counter()
+        files, next_cursor = catalog.list_files(
+            username,
+            sub_directory=data.get('sub_directory') or '',
+            prefix=data.get('prefix') or '',
+            sort=data.get('sort') or 'path',
+            descending=(data.get('order') == 'desc'),
+            limit=int(limit) if limit else None,
+            cursor=data.get('cursor')
+        )
+        LIST_SCAN_LATENCY.observe(time.perf_counter() - start)
         
-        return jsonify({
+        response = jsonify({
             'success': True,
-            'files': files
+            'files': [{
+                'name': f['name'],
+                'path': f['path'],
+                'size': f['size'],
+                'modified': f['modified']
+            } for f in files],
+            'next_cursor': next_cursor
         })
-        
+        return _set_validators(response, etag, last_modified)
+    except (CatalogError, ValueError) as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
 
-if __name__ == '__main__':
-    app.run(host='0.0.0.0', port=8000, debug=True)
+@app.route('/models/changes', methods=['GET'])
+def list_changes():
+    """
+    查询用户文件的变更（上传/覆盖为upsert，删除为delete），按序号递增
 
+    参数：
+        username: 用户名
+        since: 已处理到的序号，不指定时只返回当前最新序号（先记下序号再全量列出，之后从该序号增量同步）
+        limit: 最多返回的变更数
+        wait: 没有新变更时最多等待的秒数（长轮询），有变更立即返回
 
+    返回的next_seq用作下一次的since；reset为true表示since已早于保留的变更（或索引被重建），
+    客户端需要重新全量列出。等待的请求数超过上限时立即返回，并通过Retry-After建议下次轮询的间隔。
+    """
+    try:
+        username = request.args.get('username')
+        since = request.args.get('since', type=int)
+        limit = request.args.get('limit', MAX_CHANGES, type=int)
+        wait = min(max(request.args.get('wait', 0, type=float), 0.0), MAX_CHANGE_WAIT)
+        if not username:
+            return jsonify({'success': False, 'error': 'Missing username'}), 400
+        if since is None:
+            return jsonify({'success': True, 'changes': [], 'next_seq': catalog.latest_seq(), 'reset': False})
+
+        changes, next_seq, reset = catalog.changes_since(username, since, limit)
+        busy = False
+        if not changes and not reset and wait > 0:
+            if _change_waiters is not None and _change_waiters.acquire(blocking=False):
+                try:
+                    deadline = time.monotonic() + wait
+                    # 其他用户的写入也会唤醒等待，查询后没有本用户的变更则继续等到超时
+                    while not changes and not reset and time.monotonic() < deadline:
+                        if catalog.wait_for_change(deadline - time.monotonic()):
+                            changes, next_seq, reset = catalog.changes_since(username, since, limit)
+                finally:
+                    _change_waiters.release()
+            else:
+                busy = True
+
+        response = jsonify({'success': True, 'changes': changes, 'next_seq': next_seq, 'reset': reset})
+        if busy:
+            response.headers['Retry-After'] = str(admission.retry_after)
+        return response
+    except CatalogError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
 
 
+@app.route('/metrics', methods=['GET'])
+def get_metrics():
+    """Prometheus文本格式的指标（合并所有worker进程）"""
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4; charset=utf-8')
 
 
+def main():
+    parser = argparse.ArgumentParser(description="远程模型存储服务")
+    parser.add_argument('--mode', choices=['dev', 'prod'], default=os.getenv('MODEL_SERVER_MODE', 'dev'),
+                        help="dev: Flask开发服务器；prod: gunicorn多进程多线程")
+    parser.add_argument('--host', default=os.getenv('MODEL_SERVER_HOST', '0.0.0.0'))
+    parser.add_argument('--port', type=int, default=int(os.getenv('MODEL_SERVER_PORT', 8000)))
+    parser.add_argument('--workers', type=int, default=int(os.getenv('MODEL_SERVER_WORKERS', default_workers())),
+                        help="worker进程数（仅prod）")
+    parser.add_argument('--threads', type=int, default=int(os.getenv('MODEL_SERVER_THREADS', 8)),
+                        help="每个worker的线程数（仅prod）")
+    parser.add_argument('--graceful-timeout', type=int, default=int(os.getenv('MODEL_SERVER_GRACEFUL_TIMEOUT', 30)),
+                        help="收到SIGTERM后等待进行中传输完成的秒数（仅prod）")
+    args = parser.parse_args()
+
+    if args.mode == 'prod':
+        run_production(app, host=args.host, port=args.port, workers=args.workers,
+                       threads=args.threads, graceful_timeout=args.graceful_timeout)
+    else:
+        app.run(host=args.host, port=args.port, debug=True)
+
+
+if __name__ == '__main__':
+    main()
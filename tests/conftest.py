@@ -0,0 +1,28 @@
+import importlib
+import os
+import sys
+
+import pytest
+
+
+@pytest.fixture(scope="session")
+def server_module(tmp_path_factory):
+    """导入remote_model_server，模型目录和元数据目录位于临时目录中（整个测试会话共用，各测试使用不同的用户名）"""
+    base_path = tmp_path_factory.mktemp("server") / "models"
+    previous = os.environ.get("MODEL_SERVER_BASE_PATH")
+    os.environ["MODEL_SERVER_BASE_PATH"] = str(base_path)
+    try:
+        sys.modules.pop("remote_model_server", None)
+        module = importlib.import_module("remote_model_server")
+    finally:
+        if previous is None:
+            os.environ.pop("MODEL_SERVER_BASE_PATH", None)
+        else:
+            os.environ["MODEL_SERVER_BASE_PATH"] = previous
+    module.app.config["TESTING"] = True
+    return module
+
+
+@pytest.fixture
+def client(server_module):
+    return server_module.app.test_client()
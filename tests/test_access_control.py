@@ -0,0 +1,52 @@
+import io
+
+import pytest
+
+
+def _upload(client, username, model_name, data):
+    response = client.post("/models/upload", data={
+        "username": username,
+        "model_name": model_name,
+        "file": (io.BytesIO(data), model_name),
+    }, content_type="multipart/form-data")
+    assert response.status_code == 200, response.get_json()
+    return response.get_json()["server_path"]
+
+
+@pytest.fixture
+def victims(client):
+    """用户bob和ab各有一个文件"""
+    return [_upload(client, "acl_bob", "m.pt", b"bob's model"), _upload(client, "acl_ab", "m.pt", b"ab's model")]
+
+
+@pytest.mark.parametrize("username, server_path", [
+    ("acl_alice", "acl_alice/../acl_bob/m.pt"),  # 路径穿越
+    ("acl_a", "acl_ab/m.pt"),  # 用户名是另一个用户名的前缀
+    ("acl_alice", "acl_alice/.versions/m.pt/1"),  # 版本目录
+])
+def test_download_outside_user_directory_is_denied(client, victims, username, server_path):
+    response = client.get("/models/download", query_string={"username": username, "server_path": server_path})
+    assert response.status_code == 403
+
+
+@pytest.mark.parametrize("username, server_path", [
+    ("acl_alice", "acl_alice/../acl_bob/m.pt"),
+    ("acl_a", "acl_ab/m.pt"),
+])
+def test_delete_outside_user_directory_is_denied(client, victims, username, server_path):
+    response = client.delete("/models/delete", json={"username": username, "server_path": server_path})
+    assert response.status_code == 403
+    for owner, path in (("acl_bob", victims[0]), ("acl_ab", victims[1])):
+        assert client.get("/models/download", query_string={"username": owner, "server_path": path}).status_code \
+            == 200
+
+
+def test_owner_can_download_and_delete(client):
+    path = _upload(client, "acl_owner", "m.pt", b"own model")
+    response = client.get("/models/download", query_string={"username": "acl_owner", "server_path": path})
+    assert response.status_code == 200
+    assert response.get_data() == b"own model"
+    response.close()
+    assert client.delete("/models/delete", json={"username": "acl_owner", "server_path": path}).status_code == 200
+    assert client.get("/models/download", query_string={"username": "acl_owner", "server_path": path}).status_code \
+        == 404
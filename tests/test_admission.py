@@ -0,0 +1,124 @@
+import io
+import subprocess
+import sys
+import time
+
+import pytest
+
+from model_server.admission import STALE_TRANSFER_AGE, AdmissionController, AdmissionRejected
+
+
+def _controller(tmp_path, **limits):
+    return AdmissionController(tmp_path / "admission.db", retry_after=7, **limits)
+
+
+def _dead_pid() -> int:
+    process = subprocess.Popen([sys.executable, "-c", "pass"])
+    process.wait()
+    return process.pid
+
+
+def _insert(controller, username, size, pid, started=None):
+    conn = controller._connect()
+    try:
+        conn.execute("INSERT INTO transfer (username, bytes, pid, started) VALUES (?, ?, ?, ?)",
+                     (username, size, pid, time.time() if started is None else started))
+    finally:
+        conn.close()
+
+
+def test_disabled_without_limits(tmp_path):
+    controller = _controller(tmp_path)
+    assert not controller.enabled
+    assert controller.acquire("alice", 10 ** 12) is None
+    assert not (tmp_path / "admission.db").exists()
+
+
+def test_single_transfer_is_always_admitted(tmp_path):
+    controller = _controller(tmp_path, max_bytes=100, max_user_bytes=100)
+    # 单个超过字节上限的上传在没有其他在途上传时放行
+    ticket = controller.acquire("alice", 1000)
+    assert ticket is not None
+    with pytest.raises(AdmissionRejected) as exc_info:
+        controller.acquire("bob", 1)
+    assert exc_info.value.retry_after == 7
+    controller.release(ticket)
+    controller.release(controller.acquire("bob", 1000))
+    assert controller.status() == {"transfers": 0, "bytes": 0}
+
+
+def test_user_limits_do_not_affect_other_users(tmp_path):
+    controller = _controller(tmp_path, max_user_transfers=1, max_transfers=3)
+    controller.acquire("alice", 10)
+    with pytest.raises(AdmissionRejected, match="for alice"):
+        controller.acquire("alice", 10)
+    controller.acquire("bob", 10)
+    controller.acquire("carol", 10)
+    # 全局上限
+    with pytest.raises(AdmissionRejected, match="Too many concurrent uploads \\(3\\)"):
+        controller.acquire("dave", 10)
+    assert controller.status() == {"transfers": 3, "bytes": 30}
+
+
+def test_inflight_bytes_per_user_and_global(tmp_path):
+    controller = _controller(tmp_path, max_bytes=250, max_user_bytes=150)
+    controller.acquire("alice", 100)
+    with pytest.raises(AdmissionRejected, match="bytes in flight for alice"):
+        controller.acquire("alice", 51)
+    controller.acquire("alice", 50)
+    with pytest.raises(AdmissionRejected, match="Too many bytes in flight \\(150"):
+        controller.acquire("bob", 101)
+    controller.acquire("bob", 100)
+
+
+@pytest.mark.skipif(sys.platform == "win32", reason="按进程是否存在清理仅在POSIX上进行")
+def test_rows_of_dead_processes_are_reaped(tmp_path):
+    controller = _controller(tmp_path, max_transfers=1)
+    _insert(controller, "alice", 100, _dead_pid())
+    ticket = controller.acquire("bob", 10)
+    assert controller.status() == {"transfers": 1, "bytes": 10}
+    controller.release(ticket)
+
+
+def test_stale_rows_are_reaped(tmp_path):
+    controller = _controller(tmp_path, max_transfers=1)
+    _insert(controller, "alice", 100, 1, started=time.time() - STALE_TRANSFER_AGE - 1)
+    controller.acquire("bob", 10)
+    assert controller.status() == {"transfers": 1, "bytes": 10}
+
+
+def test_rows_of_live_processes_are_kept(tmp_path):
+    controller = _controller(tmp_path, max_transfers=1)
+    _insert(controller, "alice", 100, 1)  # init进程总是存在
+    with pytest.raises(AdmissionRejected):
+        controller.acquire("bob", 10)
+
+
+def _upload(client, username, data=b"weights", with_file=True):
+    fields = {"username": username, "model_name": "admitted.bin"}
+    if with_file:
+        fields["file"] = (io.BytesIO(data), "admitted.bin")
+    return client.post("/models/upload", query_string={"username": username, "size": len(data)},
+                       data=fields, content_type="multipart/form-data")
+
+
+def test_upload_is_throttled_and_ticket_released(client, server_module, tmp_path, monkeypatch):
+    controller = _controller(tmp_path, max_user_transfers=1)
+    monkeypatch.setattr(server_module, "admission", controller)
+    username = "admission_user"
+
+    in_flight = controller.acquire(username, 100)
+    response = _upload(client, username)
+    assert response.status_code == 429
+    assert response.headers["Retry-After"] == "7"
+    assert response.get_json()["server_busy"]
+    controller.release(in_flight)
+
+    assert _upload(client, username).status_code == 200
+    assert controller.status()["transfers"] == 0
+    # 接口返回错误时同样释放
+    assert _upload(client, username, with_file=False).status_code == 400
+    assert controller.status()["transfers"] == 0
+    # 不接收文件内容的接口不受限制
+    controller.acquire(username, 100)
+    assert client.post("/models/list", json={"username": username}).status_code == 200
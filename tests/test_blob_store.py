@@ -0,0 +1,78 @@
+import hashlib
+import os
+
+import pytest
+
+from model_server.blob_store import BlobStore
+
+
+@pytest.fixture()
+def store(tmp_path):
+    models_root = tmp_path / "models"
+    models_root.mkdir()
+    return BlobStore(tmp_path / "blobs", models_root=models_root)
+
+
+def _add(store, rel_path, data):
+    tmp_path = store.new_temp_path()
+    tmp_path.write_bytes(data)
+    digest = hashlib.sha256(data).hexdigest()
+    existed = store.add(tmp_path, digest, len(data), store.models_root / rel_path, rel_path)
+    return digest, existed
+
+
+def _ref_count(store, digest):
+    conn = store._connect()
+    try:
+        return conn.execute("SELECT COUNT(*) FROM ref WHERE digest = ?", (digest,)).fetchone()[0]
+    finally:
+        conn.close()
+
+
+def test_identical_content_is_stored_once(store):
+    digest, existed = _add(store, "alice/a.bin", b"same weights")
+    assert not existed
+    assert _add(store, "bob/b.bin", b"same weights") == (digest, True)
+
+    assert list(store.objects_path.rglob("*")) == [store.blob_path(digest).parent, store.blob_path(digest)]
+    assert _ref_count(store, digest) == 2
+    # blob本身加上两个用户路径
+    assert os.stat(store.blob_path(digest)).st_nlink == 3
+    assert (store.models_root / "bob/b.bin").read_bytes() == b"same weights"
+    assert not list(store.tmp_path.iterdir())
+
+
+def test_blob_is_collected_with_its_last_reference(store):
+    digest, _ = _add(store, "alice/a.bin", b"shared")
+    _add(store, "bob/b.bin", b"shared")
+
+    assert store.release("alice/a.bin", store.models_root / "alice/a.bin")
+    assert not (store.models_root / "alice/a.bin").exists()
+    assert store.has(digest) and _ref_count(store, digest) == 1
+    assert (store.models_root / "bob/b.bin").read_bytes() == b"shared"
+
+    assert store.release("bob/b.bin", store.models_root / "bob/b.bin")
+    assert not store.has(digest)
+    assert not store.blob_path(digest).exists()
+    assert _ref_count(store, digest) == 0
+
+
+def test_overwrite_releases_previous_content(store):
+    old_digest, _ = _add(store, "alice/a.bin", b"v1")
+    _add(store, "alice/copy.bin", b"v1")
+    new_digest, _ = _add(store, "alice/a.bin", b"v2")
+
+    assert store.digest_of("alice/a.bin") == new_digest
+    assert _ref_count(store, old_digest) == 1
+    assert store.has(old_digest)
+
+    # 覆盖最后一个引用旧内容的路径时旧blob被回收
+    _add(store, "alice/copy.bin", b"v2")
+    assert not store.has(old_digest)
+    assert not store.blob_path(old_digest).exists()
+    assert _ref_count(store, new_digest) == 2
+    assert (store.models_root / "alice/a.bin").read_bytes() == b"v2"
+
+
+def test_release_of_unknown_path(store):
+    assert not store.release("alice/missing.bin", store.models_root / "alice/missing.bin")
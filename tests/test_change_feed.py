@@ -0,0 +1,138 @@
+import pytest
+
+from app.db.models import User
+from app.services.localModelStorageService import LocalModelStorageService
+from app.services.modelStorageService import ModelListMirror
+from model_server.catalog import ModelCatalog
+
+
+@pytest.fixture()
+def catalog(tmp_path):
+    return ModelCatalog(tmp_path / "catalog.db", tmp_path / "models")
+
+
+def _replay(catalog, username, since, limit):
+    """按页拉取变更直到没有更多，返回(全部变更, 最后的序号)"""
+    changes = []
+    while True:
+        page, since, reset = catalog.changes_since(username, since, limit)
+        assert not reset
+        changes.extend(page)
+        if len(page) < limit:
+            return changes, since
+
+
+def test_paged_changes_are_continuous(catalog):
+    start = catalog.latest_seq()
+    for i in range(7):
+        catalog.upsert(f"alice/m{i}.bin", "alice", i, sha256=f"{i:064x}")
+        catalog.upsert(f"bob/m{i}.bin", "bob", i)
+    catalog.remove("alice/m3.bin")
+
+    changes, next_seq = _replay(catalog, "alice", start, limit=3)
+    assert [(c["op"], c["path"]) for c in changes] == (
+        [("upsert", f"alice/m{i}.bin") for i in range(7)] + [("delete", "alice/m3.bin")])
+    seqs = [c["seq"] for c in changes]
+    assert seqs == sorted(set(seqs))
+    assert next_seq == catalog.latest_seq()
+    assert changes[2]["sha256"] == f"{2:064x}" and changes[2]["name"] == "m2.bin"
+    assert set(changes[-1]) == {"seq", "op", "path", "name"}
+
+    # 从中间的序号继续时只返回之后的变更
+    assert [c["seq"] for c in _replay(catalog, "alice", seqs[4], limit=3)[0]] == seqs[5:]
+    assert catalog.changes_since("alice", next_seq) == ([], next_seq, False)
+
+
+def test_reset_when_cursor_is_outside_retained_changes(catalog):
+    catalog.upsert("alice/a.bin", "alice", 1)
+    cursor = catalog.latest_seq()
+    catalog.upsert("alice/b.bin", "alice", 1)
+    catalog.upsert("alice/c.bin", "alice", 1)
+
+    assert catalog.prune_changes(max_age=-1) == 3
+    latest = catalog.latest_seq()
+    assert catalog.changes_since("alice", cursor) == ([], latest, True)
+    # 早于保留范围的变更已删除，但从最新序号继续不需要重新同步
+    assert catalog.changes_since("alice", latest) == ([], latest, False)
+    # 比最新序号还新（如索引被重建）同样需要重新同步
+    assert catalog.changes_since("alice", latest + 10) == ([], latest, True)
+
+    catalog.upsert("alice/d.bin", "alice", 1)
+    assert [c["path"] for c in catalog.changes_since("alice", latest)[0]] == ["alice/d.bin"]
+
+
+@pytest.fixture()
+def storage(tmp_path):
+    return LocalModelStorageService(str(tmp_path / "models"))
+
+
+def _save(storage, user, name, data, sub_directory="sub"):
+    success, server_path, error, _, _ = storage.save_model_file(user, name, data, sub_directory=sub_directory)
+    assert success, error
+    return server_path
+
+
+def test_mirror_applies_upserts_and_deletes(storage):
+    user = User(username="mirror_user")
+    kept = _save(storage, user, "kept.bin", b"kept")
+    removed = _save(storage, user, "removed.bin", b"removed")
+    _save(storage, user, "outside.bin", b"outside", sub_directory="other")
+
+    mirror = ModelListMirror(storage, user, "sub")
+    assert sorted(c["path"] for c in mirror.sync()) == [kept, removed]
+
+    assert storage.delete_model_file(user, removed)
+    added = _save(storage, user, "added.bin", b"added!")
+    changed = _save(storage, user, "kept.bin", b"kept v2")
+    _save(storage, user, "outside2.bin", b"outside", sub_directory="other")
+    _save(storage, User(username="mirror_other"), "kept.bin", b"other user", sub_directory="sub")
+
+    assert [(c["op"], c["path"]) for c in mirror.sync()] == [("delete", removed), ("upsert", added),
+                                                             ("upsert", changed)]
+    assert [(f["path"], f["size"]) for f in mirror.files()] == [(added, 6), (kept, 7)]
+    assert mirror.get(kept)["sha256"] is not None
+    assert mirror.sync() == []
+
+
+def test_mirror_resyncs_after_reset(storage):
+    user = User(username="mirror_reset")
+    first = _save(storage, user, "first.bin", b"1")
+    mirror = ModelListMirror(storage, user, "sub")
+    mirror.sync()
+
+    second = _save(storage, user, "second.bin", b"2")
+    storage.delete_model_file(user, first)
+    storage.repository.catalog.prune_changes(max_age=-1)
+
+    assert [(c["op"], c["path"]) for c in mirror.sync()] == [("delete", first), ("upsert", second)]
+    assert [f["path"] for f in mirror.files()] == [second]
+    assert mirror.seq == storage.repository.catalog.latest_seq()
+
+
+class _WindowsServer:
+    """服务器运行在Windows上时server_path使用反斜杠"""
+
+    def __init__(self):
+        self.changes = []
+
+    def get_changes(self, user, since=None, wait=0):
+        if since is None:
+            return {"changes": [], "next_seq": 0, "reset": False, "retry_after": None}
+        return {"changes": self.changes, "next_seq": len(self.changes), "reset": False, "retry_after": None}
+
+    def list_user_files_page(self, user, sub_directory="", cursor=None):
+        return [], None
+
+
+@pytest.mark.parametrize("sub_directory", ["a/b", "a\\b", "/a/b/"])
+def test_mirror_matches_server_path_separators(sub_directory):
+    server = _WindowsServer()
+    mirror = ModelListMirror(server, User(username="alice"), sub_directory)
+    mirror.sync()
+    server.changes = [
+        {"seq": 1, "op": "upsert", "path": "alice\\a\\b\\m.bin", "name": "m.bin", "size": 1, "modified": 1.0},
+        {"seq": 2, "op": "upsert", "path": "alice\\a\\bc\\m.bin", "name": "m.bin", "size": 1, "modified": 1.0},
+        {"seq": 3, "op": "upsert", "path": "alice/a/b/n.bin", "name": "n.bin", "size": 1, "modified": 1.0},
+    ]
+    assert [c["seq"] for c in mirror.sync()] == [1, 3]
+    assert [f["path"] for f in mirror.files()] == ["alice/a/b/n.bin", "alice\\a\\b\\m.bin"]
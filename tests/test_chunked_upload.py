@@ -0,0 +1,164 @@
+import hashlib
+import os
+
+import pytest
+
+from model_server.chunked_upload import ChunkedUploadStore, UploadSessionError
+
+CHUNK_SIZE = 4096
+DATA = os.urandom(3 * CHUNK_SIZE + 100)  # 4个分块，最后一块较短
+
+
+def _create(client, username, model_name="model.bin", total_size=len(DATA), resume_key=None):
+    response = client.post("/models/upload/sessions", json={
+        "username": username,
+        "model_name": model_name,
+        "total_size": total_size,
+        "chunk_size": CHUNK_SIZE,
+        "resume_key": resume_key,
+    })
+    assert response.status_code == 200, response.get_json()
+    return response.get_json()
+
+
+def _put(client, username, session_id, index, body):
+    return client.put(f"/models/upload/sessions/{session_id}/chunks/{index}", query_string={"username": username},
+                      data=body, content_type="application/octet-stream")
+
+
+def _chunk(index):
+    return DATA[index * CHUNK_SIZE:(index + 1) * CHUNK_SIZE]
+
+
+def _commit(client, username, session_id, sha256=None):
+    return client.post(f"/models/upload/sessions/{session_id}/commit",
+                       json={"username": username, "sha256": sha256})
+
+
+def _download(client, username, server_path):
+    response = client.get("/models/download", query_string={"username": username, "server_path": server_path})
+    assert response.status_code == 200
+    data = response.get_data()
+    response.close()
+    return data
+
+
+def test_interrupted_upload_resumes_from_received_chunks(client):
+    username = "chunked_resume"
+    session = _create(client, username, resume_key="local/model.bin")
+    assert session["chunk_count"] == 4 and session["received"] == []
+
+    assert _put(client, username, session["session_id"], 0, _chunk(0)).status_code == 200
+    # 连接在分块中途断开：分块不完整，不计为已接收
+    assert _put(client, username, session["session_id"], 1, _chunk(1)[:1000]).status_code == 400
+    assert _put(client, username, session["session_id"], 2, _chunk(2)).status_code == 200
+
+    # 客户端重启后用相同的resume_key找回会话，只补传服务器没有的分块
+    resumed = _create(client, username, resume_key="local/model.bin")
+    assert resumed["session_id"] == session["session_id"]
+    assert resumed["received"] == [0, 2]
+    assert resumed["received_bytes"] == 2 * CHUNK_SIZE
+    for index in set(range(resumed["chunk_count"])) - set(resumed["received"]):
+        assert _put(client, username, session["session_id"], index, _chunk(index)).status_code == 200
+
+    response = _commit(client, username, session["session_id"], hashlib.sha256(DATA).hexdigest())
+    assert response.status_code == 200, response.get_json()
+    result = response.get_json()
+    assert (result["sha256"], result["size"]) == (hashlib.sha256(DATA).hexdigest(), len(DATA))
+    assert _download(client, username, result["server_path"]) == DATA
+    # 提交后会话被删除
+    assert client.get(f"/models/upload/sessions/{session['session_id']}",
+                      query_string={"username": username}).status_code == 404
+
+
+def test_in_order_upload_uses_streamed_digest(client):
+    username = "chunked_in_order"
+    session = _create(client, username)
+    for index in range(session["chunk_count"]):
+        assert _put(client, username, session["session_id"], index, _chunk(index)).status_code == 200
+    response = _commit(client, username, session["session_id"])
+    assert response.get_json()["sha256"] == hashlib.sha256(DATA).hexdigest()
+    assert _download(client, username, response.get_json()["server_path"]) == DATA
+
+
+@pytest.mark.parametrize("index, body, status", [
+    (4, b"x", 416),  # 超出分块数
+    (-1, b"x", 404),  # 路由不接受负数
+    (0, _chunk(0) + b"extra", 400),  # 比预期长
+    (3, _chunk(3)[:-1], 400),  # 最后一块比预期短
+])
+def test_chunk_at_wrong_position_or_length_is_rejected(client, index, body, status):
+    username = "chunked_wrong"
+    session = _create(client, username, model_name=f"wrong_{index}_{len(body)}.bin")
+    assert _put(client, username, session["session_id"], index, body).status_code == status
+    assert _create(client, username, model_name=f"wrong_{index}_{len(body)}.bin")["received"] == []
+
+
+def test_commit_with_missing_chunks_is_rejected(client):
+    username = "chunked_missing"
+    session = _create(client, username)
+    _put(client, username, session["session_id"], 0, _chunk(0))
+    response = _commit(client, username, session["session_id"])
+    assert response.status_code == 409
+
+
+def test_final_digest_mismatch_is_not_stored(client):
+    username = "chunked_digest"
+    session = _create(client, username)
+    for index in range(session["chunk_count"]):
+        _put(client, username, session["session_id"], index, _chunk(index))
+    response = _commit(client, username, session["session_id"], "0" * 64)
+    assert response.status_code == 422
+    assert response.get_json()["sha256"] == hashlib.sha256(DATA).hexdigest()
+    listed = client.post("/models/list", json={"username": username}).get_json()
+    assert listed["files"] == []
+
+
+def test_session_belongs_to_its_user(client):
+    session = _create(client, "chunked_owner")
+    assert _put(client, "chunked_intruder", session["session_id"], 0, _chunk(0)).status_code == 403
+    assert client.get(f"/models/upload/sessions/{session['session_id']}",
+                      query_string={"username": "chunked_intruder"}).status_code == 403
+    assert client.get("/models/upload/sessions/../../etc", query_string={"username": "chunked_owner"}) \
+        .status_code in (400, 404)
+
+
+def test_expired_session_is_removed(client, server_module, monkeypatch):
+    username = "chunked_expired"
+    session = _create(client, username)
+    _put(client, username, session["session_id"], 0, _chunk(0))
+    session_dir = server_module.upload_sessions.root / session["session_id"]
+    old = os.path.getmtime(session_dir / "session.json") - 3600
+    for path in (session_dir, session_dir / "chunks", session_dir / "session.json"):
+        os.utime(path, (old, old))
+    monkeypatch.setattr(server_module.upload_sessions, "session_ttl", 60)
+
+    # 创建新会话时清理过期会话
+    _create(client, username, model_name="other.bin")
+    assert client.get(f"/models/upload/sessions/{session['session_id']}",
+                      query_string={"username": username}).status_code == 404
+    assert _put(client, username, session["session_id"], 1, _chunk(1)).status_code == 404
+
+
+def test_resume_key_with_different_parameters_starts_over(tmp_path):
+    store = ChunkedUploadStore(tmp_path / "sessions")
+    session = store.create_session("alice", "m.bin", "", total_size=10, chunk_size=4, resume_key="k")
+    store.write_chunk(session["session_id"], 0, _Reader(b"abcd"))
+    assert store.describe(session["session_id"])["received"] == [0]
+
+    # 本地文件大小变了：旧分块作废
+    changed = store.create_session("alice", "m.bin", "", total_size=12, chunk_size=4, resume_key="k")
+    assert changed["session_id"] == session["session_id"]
+    assert changed["received"] == []
+    with pytest.raises(UploadSessionError) as exc_info:
+        store.write_chunk(session["session_id"], 3, _Reader(b"x"))
+    assert exc_info.value.status == 416
+
+
+class _Reader:
+    def __init__(self, data: bytes):
+        self._data = data
+
+    def read(self, size: int) -> bytes:
+        data, self._data = self._data[:size], self._data[size:]
+        return data
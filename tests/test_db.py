@@ -0,0 +1,24 @@
+import sqlite3
+from functools import partial
+
+import pytest
+
+from model_server.db import connect, transaction
+
+
+def test_transaction_commits_and_rolls_back(tmp_path):
+    open_connection = partial(connect, tmp_path / "test.db")
+    with transaction(open_connection) as conn:
+        conn.execute("CREATE TABLE item (name TEXT PRIMARY KEY)")
+        conn.execute("INSERT INTO item VALUES ('kept')")
+
+    with pytest.raises(sqlite3.IntegrityError):
+        with transaction(open_connection) as conn:
+            conn.execute("INSERT INTO item VALUES ('discarded')")
+            conn.execute("INSERT INTO item VALUES ('kept')")
+
+    conn = connect(tmp_path / "test.db", sqlite3.Row)
+    try:
+        assert [row["name"] for row in conn.execute("SELECT name FROM item")] == ["kept"]
+    finally:
+        conn.close()
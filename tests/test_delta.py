@@ -0,0 +1,109 @@
+import hashlib
+import io
+import random
+
+import pytest
+
+from app.services.deltaEncoder import DeltaEncoder
+from model_server.delta import DeltaError, apply_delta, compute_signatures, iter_blocks
+
+BLOCK_SIZE = 64
+
+
+def _round_trip(tmp_path, base: bytes, new: bytes, block_size: int = BLOCK_SIZE):
+    """客户端按基准签名编码，服务器按指令重建，返回(重建的内容, 重建指令, 字面数据字节数)"""
+    signatures = compute_signatures(iter_blocks(io.BytesIO(base), block_size))
+    ops, literals, literal_bytes = DeltaEncoder(signatures, block_size, len(base)).encode(new)
+    assert literal_bytes == sum(len(piece) for piece in literals)
+
+    base_path = tmp_path / "base.bin"
+    base_path.write_bytes(base)
+    dst_path = tmp_path / "new.bin"
+    digest, size = apply_delta(base_path, len(base), block_size, ops, io.BytesIO(b"".join(literals)),
+                               dst_path, len(new))
+    assert size == len(new)
+    assert digest == hashlib.sha256(new).hexdigest()
+    return dst_path.read_bytes(), ops, literal_bytes
+
+
+def _mutate(rng: random.Random, data: bytes) -> bytes:
+    """随机插入、删除或修改一段字节"""
+    kind = rng.choice(("insert", "delete", "modify"))
+    pos = rng.randint(0, len(data))
+    length = rng.randint(1, 3 * BLOCK_SIZE)
+    if kind == "insert":
+        return data[:pos] + rng.randbytes(length) + data[pos:]
+    if kind == "delete":
+        return data[:pos] + data[pos + length:]
+    return data[:pos] + rng.randbytes(length) + data[pos + length:]
+
+
+@pytest.mark.parametrize("seed", range(100))
+def test_random_edits_round_trip(tmp_path, seed):
+    rng = random.Random(seed)
+    base = rng.randbytes(rng.randint(0, 40 * BLOCK_SIZE))
+    new = base
+    for _ in range(rng.randint(1, 4)):
+        new = _mutate(rng, new)
+    assert _round_trip(tmp_path, base, new)[0] == new
+
+
+@pytest.mark.parametrize("base_blocks, tail", [(8, 0), (8, 17), (1, 0), (0, 5)])
+@pytest.mark.parametrize("edit", ["insert", "delete", "modify", "append", "truncate"])
+def test_block_boundary_edits(tmp_path, base_blocks, tail, edit):
+    rng = random.Random(f"{base_blocks}-{tail}-{edit}")
+    base = rng.randbytes(base_blocks * BLOCK_SIZE + tail)
+    boundary = (base_blocks // 2) * BLOCK_SIZE
+    if edit == "insert":
+        new = base[:boundary] + b"x" * BLOCK_SIZE + base[boundary:]
+    elif edit == "delete":
+        new = base[:boundary] + base[boundary + BLOCK_SIZE:]
+    elif edit == "modify":
+        new = base[:boundary] + bytes(b ^ 0xff for b in base[boundary:boundary + BLOCK_SIZE]) \
+            + base[boundary + BLOCK_SIZE:]
+    elif edit == "append":
+        new = base + b"y" * (BLOCK_SIZE + 1)
+    else:
+        new = base[:boundary]
+    assert _round_trip(tmp_path, base, new)[0] == new
+
+
+def test_unchanged_content_sends_no_literals(tmp_path):
+    base = random.Random(1).randbytes(10 * BLOCK_SIZE + 7)
+    restored, ops, literal_bytes = _round_trip(tmp_path, base, base)
+    assert restored == base
+    assert literal_bytes == 0
+    assert ops == [["c", 0, 11]]
+
+
+def test_small_insert_realigns(tmp_path):
+    base = random.Random(2).randbytes(20 * BLOCK_SIZE)
+    new = base[:3] + b"abc" + base[3:]
+    _, _, literal_bytes = _round_trip(tmp_path, base, new)
+    # 只有插入点所在的块作为字面数据发送
+    assert literal_bytes < 2 * BLOCK_SIZE
+
+
+@pytest.mark.parametrize("base, new", [(b"", b""), (b"", b"new content"), (b"old content", b"")])
+def test_empty_base_or_new(tmp_path, base, new):
+    restored, _, literal_bytes = _round_trip(tmp_path, base, new)
+    assert restored == new
+    if not base:
+        assert literal_bytes == len(new)
+
+
+@pytest.mark.parametrize("ops, literals, expected_size", [
+    ([["c", 0, 3]], b"", 3 * BLOCK_SIZE),  # 越界
+    ([["c", -1, 1]], b"", BLOCK_SIZE),
+    ([["l", 10]], b"short", 10),  # 字面数据不足
+    ([["l", 2]], b"abc", 2),  # 多余的字面数据
+    ([["c", 0, 2]], b"", BLOCK_SIZE),  # 超出声明的大小
+    ([["x", 1]], b"", 1),
+    (["c"], b"", 1),
+])
+def test_invalid_ops_are_rejected(tmp_path, ops, literals, expected_size):
+    base_path = tmp_path / "base.bin"
+    base_path.write_bytes(b"b" * 2 * BLOCK_SIZE)
+    with pytest.raises(DeltaError):
+        apply_delta(base_path, 2 * BLOCK_SIZE, BLOCK_SIZE, ops, io.BytesIO(literals), tmp_path / "new.bin",
+                    expected_size)
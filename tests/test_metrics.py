@@ -0,0 +1,73 @@
+import json
+import subprocess
+import sys
+
+from model_server.metrics import MetricsRegistry
+
+
+def _registry(snapshot_dir, reset=False):
+    registry = MetricsRegistry(snapshot_dir, reset=reset)
+    counter = registry.counter("requests_total", "请求数", ("route",))
+    gauge = registry.gauge("in_flight", "进行中的传输数")
+    histogram = registry.histogram("duration_seconds", "耗时", buckets=(1, 10))
+    return registry, counter, gauge, histogram
+
+
+def _dead_pid() -> int:
+    process = subprocess.Popen([sys.executable, "-c", "pass"])
+    process.wait()
+    return process.pid
+
+
+def test_render_without_snapshots():
+    registry, counter, gauge, histogram = _registry(None)
+    counter.inc(("upload",), 2)
+    gauge.add(amount=3)
+    histogram.observe(0.5)
+    histogram.observe(20)
+    assert registry.render().splitlines() == [
+        "# HELP requests_total 请求数",
+        "# TYPE requests_total counter",
+        'requests_total{route="upload"} 2',
+        "# HELP in_flight 进行中的传输数",
+        "# TYPE in_flight gauge",
+        "in_flight 3",
+        "# HELP duration_seconds 耗时",
+        "# TYPE duration_seconds histogram",
+        'duration_seconds_bucket{le="1"} 1',
+        'duration_seconds_bucket{le="10"} 1',
+        'duration_seconds_bucket{le="+Inf"} 2',
+        "duration_seconds_sum 20.5",
+        "duration_seconds_count 2",
+    ]
+
+
+def test_reused_pid_does_not_overwrite_snapshot(tmp_path):
+    # 两个注册表的进程号相同，相当于退出的worker的进程号被新worker复用
+    retired, counter, _, _ = _registry(tmp_path)
+    counter.inc(("upload",), 5)
+    retired.flush()
+
+    current, counter, _, _ = _registry(tmp_path)
+    counter.inc(("upload",), 1)
+    current.flush()
+
+    assert len(list(tmp_path.glob("*.json"))) == 2
+    assert 'requests_total{route="upload"} 6' in current.render()
+
+
+def test_gauges_of_dead_processes_are_dropped(tmp_path):
+    registry, counter, gauge, _ = _registry(tmp_path)
+    counter.inc(("upload",))
+    gauge.add(amount=1)
+    snapshot = {"requests_total": [[["upload"], 4]], "in_flight": [[[], 7]]}
+    (tmp_path / f"{_dead_pid()}-0123abcd.json").write_text(json.dumps(snapshot), encoding="utf8")
+    (tmp_path / "garbage.json").write_text("{}", encoding="utf8")
+
+    text = registry.render()
+    assert 'requests_total{route="upload"} 5' in text
+    assert "in_flight 1\n" in text
+
+    # 服务启动时清空
+    _registry(tmp_path, reset=True)
+    assert list(tmp_path.iterdir()) == []
@@ -0,0 +1,50 @@
+import asyncio
+import hashlib
+import io
+
+from werkzeug.formparser import parse_form_data
+
+from app.services.asyncModelStorageService import _AsyncModelData, _iter_multipart_async
+from app.services.modelStorageService import ModelDataStream, _iter_multipart
+
+BOUNDARY = "test-boundary"
+FIELDS = {"username": "alice", "model_name": "model.bin", "sub_directory": "nested/dir"}
+
+
+def _parse(body: bytes):
+    environ = {
+        "REQUEST_METHOD": "POST",
+        "CONTENT_TYPE": f"multipart/form-data; boundary={BOUNDARY}",
+        "CONTENT_LENGTH": str(len(body)),
+        "wsgi.input": io.BytesIO(body),
+    }
+    _, form, files = parse_form_data(environ)
+    return form, files
+
+
+def _sync_body(content: bytes) -> bytes:
+    stream = ModelDataStream(iter([content[:7], content[7:]]))
+    return b"".join(_iter_multipart(BOUNDARY, FIELDS, "model.bin", stream, lambda: {"sha256": stream.sha256}))
+
+
+async def _async_body(content: bytes) -> bytes:
+    async def chunks():
+        yield content[:7]
+        yield content[7:]
+
+    return b"".join([part async for part in
+                     _iter_multipart_async(BOUNDARY, FIELDS, "model.bin", _AsyncModelData(chunks()))])
+
+
+def test_sync_body_parses_with_trailing_digest():
+    content = b"model content\r\n--not-a-boundary\r\n"
+    form, files = _parse(_sync_body(content))
+    assert {name: form[name] for name in FIELDS} == FIELDS
+    assert form["sha256"] == hashlib.sha256(content).hexdigest()
+    assert files["file"].filename == "model.bin"
+    assert files["file"].read() == content
+
+
+def test_async_body_matches_sync_body():
+    for content in (b"", b"x", b"model content" * 1000):
+        assert asyncio.run(_async_body(content)) == _sync_body(content)
@@ -0,0 +1,61 @@
+import io
+
+import pytest
+
+from model_server.quota import QuotaPolicy
+
+QUOTA_BYTES = 100_000
+
+
+@pytest.fixture
+def quota(server_module, monkeypatch):
+    policy = QuotaPolicy(max_bytes=QUOTA_BYTES)
+    monkeypatch.setattr(server_module.repository, "quota", policy)
+    monkeypatch.setattr(server_module, "quota", policy)
+    return policy
+
+
+def _upload(client, username, size, declare_size=True):
+    """按客户端的方式上传：username等放在查询参数中，size为文件大小"""
+    params = {"username": username, "model_name": "model.bin", "sub_directory": ""}
+    if declare_size:
+        params["size"] = size
+    data = {
+        "username": username,
+        "model_name": "model.bin",
+        "sub_directory": "",
+        "file": (io.BytesIO(b"q" * size), "model.bin"),
+    }
+    return client.post("/models/upload", query_string=params, data=data, content_type="multipart/form-data")
+
+
+@pytest.mark.parametrize("size", [QUOTA_BYTES - 100, QUOTA_BYTES])
+def test_upload_within_quota_is_accepted(client, quota, size):
+    response = _upload(client, f"quota_fit_{size}", size)
+    assert response.status_code == 200, response.get_json()
+    assert response.get_json()["size"] == size
+
+
+def test_upload_over_quota_is_rejected_before_reading_body(client, quota):
+    response = _upload(client, "quota_over", QUOTA_BYTES + 1)
+    assert response.status_code == 413
+    body = response.get_json()
+    assert body["quota_exceeded"] is True
+    assert f"0 + {QUOTA_BYTES + 1} > {QUOTA_BYTES}" in body["error"]
+
+
+def test_content_length_is_used_without_declared_size(client, quota):
+    # 没有size时按Content-Length（含multipart表单开销）估算
+    response = _upload(client, "quota_no_size", QUOTA_BYTES, declare_size=False)
+    assert response.status_code == 413
+
+
+def test_quota_counts_existing_usage(client, quota):
+    username = "quota_usage"
+    assert _upload(client, username, QUOTA_BYTES // 2).status_code == 200
+    # 覆盖同一路径按净增量计算
+    assert _upload(client, username, QUOTA_BYTES).status_code == 200
+    params = {"username": username, "model_name": "other.bin", "size": 1}
+    data = {"username": username, "model_name": "other.bin", "file": (io.BytesIO(b"x"), "other.bin")}
+    response = client.post("/models/upload", query_string=params, data=data, content_type="multipart/form-data")
+    assert response.status_code == 413
@@ -0,0 +1,34 @@
+import re
+from pathlib import Path
+
+import pytest
+
+from app.db.base import Base
+import app.db.models  # noqa: F401  注册模型表
+
+DUMP_PATH = Path(__file__).resolve().parent.parent / "pyside6_framework.sql"
+_CREATE_TABLE = re.compile(r"CREATE TABLE `(?P<table>\w+)`\s*\((?P<body>.*?)\n\)", re.S)
+_COLUMN = re.compile(r"^\s*`(?P<column>\w+)`", re.M)
+
+
+def _dump_tables():
+    text = DUMP_PATH.read_text(encoding="utf8")
+    return {match.group("table"): _COLUMN.findall(match.group("body")) for match in _CREATE_TABLE.finditer(text)}
+
+
+@pytest.mark.parametrize("table", ["user", "menu", "model", "model_version"])
+def test_dump_matches_models(table):
+    """数据库脚本中的表结构与app/db/models.py一致（列名和顺序）"""
+    tables = _dump_tables()
+    assert table in tables
+    assert tables[table] == [column.name for column in Base.metadata.tables[table].columns]
+
+
+def test_dump_records_match_columns():
+    """INSERT语句的值个数与列数一致"""
+    text = DUMP_PATH.read_text(encoding="utf8")
+    tables = _dump_tables()
+    for table in ("user", "menu", "model"):
+        for values in re.findall(rf"^INSERT INTO `{table}` VALUES \((.*)\);$", text, re.M):
+            # 引号内的字符串作为一个值，其余按逗号分隔
+            assert len(re.findall(r"'(?:[^'\\]|\\.)*'|[^,\s][^,]*", values)) == len(tables[table])
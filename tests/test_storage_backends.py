@@ -0,0 +1,257 @@
+"""
+存储后端的一致性测试：http（在临时目录上启动remote_model_server.py）和local（直接读写另一个临时模型目录）
+两种后端执行同一组测试，路径、摘要、版本号、列表和变更都必须与服务器的语义一致
+"""
+
+import hashlib
+import io
+import os
+import socket
+import threading
+import time
+
+import pytest
+
+from app.db.models import User
+from app.services.localModelStorageService import LocalModelStorageService
+from app.services.modelStorageService import HASH_PRECHECK_MIN_SIZE, RemoteModelStorageService
+from app.services.storageBackend import HTTP_BACKEND, LOCAL_BACKEND
+from model_server.benchmark import _start_server, _stop_server
+from model_server.versions import version_path
+
+USERNAME = "backend_check"
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+@pytest.fixture(scope="module", params=[HTTP_BACKEND, LOCAL_BACKEND])
+def backend(request, tmp_path_factory):
+    models_path = tmp_path_factory.mktemp(f"storage-{request.param}") / "models"
+    if request.param == LOCAL_BACKEND:
+        yield LocalModelStorageService(str(models_path))
+        return
+    port = _free_port()
+    process = _start_server("dev", port, models_path, 1, 1)
+    try:
+        yield RemoteModelStorageService(f"http://127.0.0.1:{port}")
+    finally:
+        _stop_server(process)
+
+
+@pytest.fixture
+def user():
+    return User(username=USERNAME)
+
+
+def _sha256(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def _write(path, data: bytes) -> str:
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(data)
+    return str(path)
+
+
+def _read(path) -> bytes:
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+@pytest.mark.parametrize("name, data, wrap", [
+    ("bytes.bin", b"in-memory model", lambda data: data),
+    ("file.bin", b"file object model" * 100, io.BytesIO),
+    ("iter.bin", b"iterator model" * 1000, lambda data: iter([data[:100], data[100:]])),
+    ("large.bin", os.urandom(HASH_PRECHECK_MIN_SIZE + 1), lambda data: data),
+])
+def test_save(backend, user, name, data, wrap):
+    success, server_path, error, sha256, version = backend.save_model_file(user, name, wrap(data),
+                                                                           sub_directory="save")
+    assert success, error
+    assert server_path == f"{USERNAME}/save/{name}"
+    assert sha256 == _sha256(data)
+    assert version == 1
+
+    # 内存中的大数据再次保存到另一个路径：按摘要直接链接
+    success, _, error, sha256, version = backend.save_model_file(user, f"copy_{name}", data, sub_directory="save")
+    assert success, error
+    assert (sha256, version) == (_sha256(data), 1)
+
+
+def test_upload_and_dedup(backend, user, tmp_path):
+    small = _write(tmp_path / "small.bin", b"small local file")
+    large = _write(tmp_path / "large.bin", os.urandom(HASH_PRECHECK_MIN_SIZE * 2))
+    for path in (small, large):
+        success, server_path, error, sha256, version = backend.upload_model_file(user, path, sub_directory="upload")
+        assert success, error
+        assert server_path == f"{USERNAME}/upload/{os.path.basename(path)}"
+        assert (sha256, version) == (_sha256(_read(path)), 1)
+
+    # 相同内容上传到另一个名称（秒传）
+    success, server_path, error, sha256, _ = backend.upload_model_file(user, large, model_name="large_again.bin",
+                                                                       sub_directory="upload")
+    assert success, error
+    assert server_path == f"{USERNAME}/upload/large_again.bin"
+    assert sha256 == _sha256(_read(large))
+
+    assert not backend.upload_model_file(user, str(tmp_path / "missing.bin"))[0]
+
+
+def test_versions(backend, user, tmp_path):
+    first, second = b"version one" * 10, b"version two" * 10
+    path = backend.save_model_file(user, "model.bin", first, sub_directory="versions")[1]
+    assert backend.save_model_file(user, "model.bin", first, sub_directory="versions")[4] == 1  # 内容未变化
+    result = backend.save_model_file(user, "model.bin", second, sub_directory="versions")
+    assert result[0] and result[4] == 2
+
+    records = backend.list_model_versions(user, path)
+    assert [r['version'] for r in records] == [2, 1]
+    assert records[1]['sha256'] == _sha256(first)
+    assert records[0]['version_path'] == version_path(path, 2)
+    assert [r['version'] for r in backend.list_model_versions(user, path, limit=1)] == [2]
+
+    local_path = str(tmp_path / "v1.bin")
+    assert backend.download_model_file(user, version_path(path, 1), local_path)
+    assert _read(local_path) == first
+    assert backend.list_model_versions(user, f"{USERNAME}/versions/missing.bin") is None
+
+
+def test_download(backend, user, tmp_path):
+    data = os.urandom(3 * 1024 * 1024 + 17)
+    path = backend.save_model_file(user, "model.bin", data, sub_directory="download")[1]
+    local_path = str(tmp_path / "nested" / "model.bin")
+    assert backend.download_model_file(user, path, local_path, expected_sha256=_sha256(data))
+    assert _read(local_path) == data
+    assert not os.path.exists(local_path + '.part')
+
+    # 预期摘要不一致：失败且不替换本地文件
+    other_path = _write(tmp_path / "other.bin", b"keep me")
+    assert not backend.download_model_file(user, path, other_path, expected_sha256="0" * 64)
+    assert _read(other_path) == b"keep me"
+
+    assert not backend.download_model_file(user, f"{USERNAME}/download/missing.bin", str(tmp_path / "missing.bin"))
+
+    reported = []
+    assert backend.download_model_file(user, path, str(tmp_path / "progress.bin"),
+                                       progress=lambda done, total, rate: reported.append((done, total)))
+    assert reported[-1] == (len(data), len(data))
+
+
+def test_content_unchanged(backend, user):
+    data = b"unchanged?"
+    path = backend.save_model_file(user, "model.bin", data, sub_directory="unchanged")[1]
+    assert backend.content_unchanged(user, path, _sha256(data)) is True
+    assert backend.content_unchanged(user, path, "0" * 64) is False
+    assert backend.content_unchanged(user, f"{USERNAME}/unchanged/missing.bin", _sha256(data)) is False
+
+
+def test_stat(backend, user):
+    data = b"stat me" * 3
+    path = backend.save_model_file(user, "model.bin", data, sub_directory="stat")[1]
+    missing = f"{USERNAME}/stat/missing.bin"
+    version = version_path(path, 1)
+    stats = backend.stat_model_files(user, [path, missing, version])
+    assert set(stats) == {path, missing, version}
+    assert (stats[path]['name'], stats[path]['size'], stats[path]['sha256']) == ("model.bin", len(data), _sha256(data))
+    assert stats[missing] is None
+    assert stats[version]['sha256'] == _sha256(data)
+
+
+def test_list_and_paging(backend, user):
+    names = [f"m{i}.bin" for i in range(5)] + ["other.txt"]
+    for i, name in enumerate(names):
+        backend.save_model_file(user, name, b"x" * (i + 1), sub_directory="list")
+    backend.save_model_file(user, "deep.bin", b"deep", sub_directory="list/deep")
+
+    files = backend.list_user_files(user, sub_directory="list")
+    assert sorted(f['path'] for f in files) == \
+        sorted([f"{USERNAME}/list/{n}" for n in names] + [f"{USERNAME}/list/deep/deep.bin"])
+    assert all(set(f) >= {'name', 'path', 'size', 'modified'} for f in files)
+    assert len(backend.list_user_files(user, sub_directory="list", prefix="m")) == 5
+
+    pages, cursor = [], None
+    while True:
+        page, cursor = backend.list_user_files_page(user, sub_directory="list", sort="size", descending=True,
+                                                    limit=2, cursor=cursor)
+        pages.append(page)
+        if not cursor:
+            break
+    sizes = [f['size'] for page in pages for f in page]
+    assert [len(page) for page in pages] == [2, 2, 2, 1]
+    assert sizes == sorted(sizes, reverse=True)
+
+
+def test_changes(backend, user):
+    start = backend.get_changes(user)
+    assert start['changes'] == []
+    path = backend.save_model_file(user, "model.bin", b"change", sub_directory="changes")[1]
+    backend.delete_model_file(user, path)
+
+    result = backend.get_changes(user, since=start['next_seq'])
+    assert not result['reset']
+    assert [(c['op'], c['path']) for c in result['changes'] if c['path'] == path] == \
+        [('upsert', path), ('delete', path)]
+    assert result['next_seq'] > start['next_seq']
+
+    # 没有新变更时长轮询等待
+    begin = time.monotonic()
+    empty = backend.get_changes(user, since=result['next_seq'], wait=0.5)
+    assert empty['changes'] == []
+    assert time.monotonic() - begin >= 0.4
+
+
+def test_download_directory(backend, user, tmp_path):
+    contents = {"a.bin": b"a" * 10, "sub/b.bin": b"b" * 20}
+    for name, data in contents.items():
+        sub_directory, _, model_name = f"dir/run1/{name}".rpartition('/')
+        backend.save_model_file(user, model_name, data, sub_directory=sub_directory)
+    local_dir = str(tmp_path / "directory")
+    success, extracted, error = backend.download_directory(user, "dir/run1", local_dir)
+    assert success, error
+    expected = {os.path.join(local_dir, "run1", *name.split('/')): data for name, data in contents.items()}
+    assert sorted(extracted) == sorted(expected)
+    assert all(_read(path) == data for path, data in expected.items())
+    assert not backend.download_directory(user, "dir/missing", local_dir)[0]
+
+
+def test_access_denied(backend, user, tmp_path):
+    assert not backend.save_model_file(user, "escape.bin", b"x", sub_directory="../someone_else")[0]
+    other = f"{USERNAME}_other/model.bin"
+    assert not backend.download_model_file(user, other, str(tmp_path / "denied.bin"))
+    assert not backend.delete_model_file(user, other)
+
+
+def test_delete(backend, user):
+    paths = [backend.save_model_file(user, f"m{i}.bin", f"delete {i}".encode(), sub_directory="delete")[1]
+             for i in range(3)]
+    assert backend.delete_model_file(user, paths[0])
+    assert not backend.delete_model_file(user, paths[0])
+    missing = f"{USERNAME}/delete/missing.bin"
+    assert backend.delete_model_files(user, paths[1:] + [missing]) == {paths[1]: True, paths[2]: True, missing: False}
+    assert backend.list_user_files(user, sub_directory="delete") == []
+    assert backend.list_model_versions(user, paths[0]) is None  # 版本一并删除
+
+
+def test_usage_matches_listing(backend, user):
+    backend.save_model_file(user, "model.bin", b"usage" * 10, sub_directory="usage")
+    usage = backend.get_storage_usage(user)
+    files = backend.list_user_files(user)
+    assert (usage['files'], usage['bytes']) == (len(files), sum(f['size'] for f in files))
+
+
+def test_cancel(backend, user, tmp_path):
+    cancel = threading.Event()
+    cancel.set()
+    path = _write(tmp_path / "model.bin", os.urandom(1024 * 1024))
+    assert not backend.upload_model_file(user, path, sub_directory="cancel", cancel=cancel)[0]
+    assert backend.list_user_files(user, sub_directory="cancel") == []
+
+    server_path = backend.upload_model_file(user, path, sub_directory="cancel")[1]
+    local_path = str(tmp_path / "download.bin")
+    assert not backend.download_model_file(user, server_path, local_path, cancel=cancel)
+    assert not os.path.exists(local_path)
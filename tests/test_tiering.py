@@ -0,0 +1,99 @@
+import hashlib
+import os
+import time
+
+import pytest
+
+from model_server.blob_store import BlobStore
+from model_server.tiering import TierManager
+
+BLOB_SIZE = 100
+
+
+@pytest.fixture()
+def store(tmp_path):
+    models_root = tmp_path / "models"
+    models_root.mkdir()
+    return BlobStore(tmp_path / "hot", cold_root=tmp_path / "cold", models_root=models_root)
+
+
+def _fill(store, names):
+    """每个单字符名字一个BLOB_SIZE字节的文件，下载时间按名字顺序递增，返回{名字: 摘要}"""
+    digests = {}
+    now = time.time()
+    for i, name in enumerate(names):
+        data = name.encode() * BLOB_SIZE
+        tmp_path = store.new_temp_path()
+        tmp_path.write_bytes(data)
+        digest = hashlib.sha256(data).hexdigest()
+        store.add(tmp_path, digest, BLOB_SIZE, store.models_root / "alice" / name, f"alice/{name}")
+        digests[name] = digest
+        store.touch({digest: now - 1000 + i})
+    return digests
+
+
+def _manager(store, moves=None, **kwargs):
+    kwargs.setdefault("hot_capacity", 4 * BLOB_SIZE)
+    kwargs.setdefault("high_watermark", 0.6)
+    kwargs.setdefault("low_watermark", 0.5)
+    on_move = (lambda direction, size: moves.append((direction, size))) if moves is not None else None
+    return TierManager(store, on_move=on_move, **kwargs)
+
+
+def _cold_names(store):
+    return sorted(name for name in os.listdir(store.models_root / "alice")
+                  if TierManager.is_cold(store.models_root / "alice" / name))
+
+
+def test_least_recently_downloaded_blobs_are_demoted(store):
+    _fill(store, ["a", "b", "c", "d"])
+    moves = []
+    manager = _manager(store, moves)
+    # a最早写入，但刚被下载过
+    manager.record_download(store.digest_of("alice/a"))
+
+    # 热层400字节超过高水位240，降到低水位200为止
+    assert manager.run_once() == {"promoted": 0, "demoted": 2}
+    assert _cold_names(store) == ["b", "c"]
+    assert moves == [("demote", BLOB_SIZE), ("demote", BLOB_SIZE)]
+    assert store.tier_usage() == {"hot": 2 * BLOB_SIZE, "cold": 2 * BLOB_SIZE}
+    for name in "abcd":
+        assert (store.models_root / "alice" / name).read_bytes() == name.encode() * BLOB_SIZE
+    assert not store.blob_path(store.digest_of("alice/b")).exists()
+
+    # 已低于高水位，不再迁移
+    assert manager.run_once() == {"promoted": 0, "demoted": 0}
+
+
+def test_downloaded_cold_blob_is_promoted(store):
+    digests = _fill(store, ["a", "b", "c", "d"])
+    manager = _manager(store)
+    manager.run_once()
+    path = store.models_root / "alice" / "a"
+    assert TierManager.is_cold(path)
+
+    manager.record_download(digests["a"], cold=TierManager.is_cold(path))
+    manager.high_watermark = manager.low_watermark = 1.0
+    assert manager.run_once() == {"promoted": 1, "demoted": 0}
+    assert not TierManager.is_cold(path)
+    assert os.stat(path).st_nlink == 2
+    assert not store.cold_blob_path(digests["a"]).exists()
+    assert path.read_bytes() == b"a" * BLOB_SIZE
+
+
+def test_demotion_stops_when_cold_tier_is_full(store):
+    _fill(store, ["a", "b", "c", "d"])
+    manager = _manager(store, cold_capacity=BLOB_SIZE + BLOB_SIZE // 2)
+    assert manager.run_once()["demoted"] == 1
+    assert manager.last_error == "Cold tier is full"
+    assert _cold_names(store) == ["a"]
+
+
+def test_batch_that_cannot_be_demoted_is_not_retried(store):
+    digests = _fill(store, ["a", "b", "c", "d"])
+    # 热层文件丢失（用户路径仍是硬链接）
+    for digest in digests.values():
+        os.unlink(store.blob_path(digest))
+    manager = _manager(store)
+    assert manager.run_once() == {"promoted": 0, "demoted": 0}
+    assert _cold_names(store) == []
@@ -0,0 +1,79 @@
+import os
+import threading
+import time
+
+import pytest
+
+pytest.importorskip("PySide6")
+
+from app.services.transferManager import CANCELLED, FAILED, PAUSED, Transfer, TransferManager  # noqa: E402
+
+RESUME_SUFFIXES = ('.part', '.part.json')
+
+
+@pytest.fixture
+def manager():
+    manager = TransferManager(max_workers=1)
+    yield manager
+    manager.shutdown()
+
+
+def _resume_files(local_file_path):
+    return [suffix for suffix in RESUME_SUFFIXES if os.path.exists(local_file_path + suffix)]
+
+
+def _wait_for_state(manager, transfer_id, state, timeout=5.0):
+    # 信号在工作线程中发出，测试中没有事件循环接收排队的信号，轮询状态
+    deadline = time.monotonic() + timeout
+    while manager.get(transfer_id).state != state:
+        assert time.monotonic() < deadline, f"任务没有进入{state}状态"
+        time.sleep(0.01)
+
+
+def _submit_partial_download(manager, local_file_path, fail=False):
+    """提交一个写入续传文件后等待取消（fail时直接失败）的下载任务"""
+    started = threading.Event()
+
+    def job(transfer, progress, cancel):
+        for suffix in RESUME_SUFFIXES:
+            with open(local_file_path + suffix, 'wb') as f:
+                f.write(b'partial')
+        started.set()
+        if fail:
+            raise Exception("下载失败")
+        cancel.wait(5)
+
+    transfer_id = manager._submit(Transfer(0, 'download', 'model.bin', local_file_path), job)
+    assert started.wait(5)
+    return transfer_id
+
+
+def test_cancel_running_download_removes_resume_files(manager, tmp_path):
+    local_file_path = str(tmp_path / "model.bin")
+    transfer_id = _submit_partial_download(manager, local_file_path)
+    assert manager.cancel(transfer_id)
+    _wait_for_state(manager, transfer_id, CANCELLED)
+    assert _resume_files(local_file_path) == []
+
+
+def test_pause_keeps_resume_files_until_cancelled(manager, tmp_path):
+    local_file_path = str(tmp_path / "model.bin")
+    transfer_id = _submit_partial_download(manager, local_file_path)
+    assert manager.pause(transfer_id)
+    _wait_for_state(manager, transfer_id, PAUSED)
+    assert _resume_files(local_file_path) == list(RESUME_SUFFIXES)
+
+    assert manager.cancel(transfer_id)
+    assert manager.get(transfer_id).state == CANCELLED
+    assert _resume_files(local_file_path) == []
+
+
+def test_clear_finished_removes_resume_files_of_failed_download(manager, tmp_path):
+    local_file_path = str(tmp_path / "model.bin")
+    transfer_id = _submit_partial_download(manager, local_file_path, fail=True)
+    _wait_for_state(manager, transfer_id, FAILED)
+    assert _resume_files(local_file_path) == list(RESUME_SUFFIXES)  # 失败的任务可以重试续传
+
+    manager.clear_finished()
+    assert manager.get(transfer_id) is None
+    assert _resume_files(local_file_path) == []